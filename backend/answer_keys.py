@@ -0,0 +1,213 @@
+"""
+Precompiled answer keys for multiple-choice and fill-in-the-blank grading.
+
+Each challenge's answer key is compiled once, when its challenges are
+published, into normalized lookup tables: every accepted answer of a blank
+(`correct_answer` plus any `correct_answers` alternatives) in normalized
+form, the option lists of blanks that offer choices, and a map from
+normalized option text to option index for multiple choice. Grading an
+attempt is then a handful of dict and set lookups instead of re-deriving the
+key from the raw challenge.
+
+Normalization makes comparisons insensitive to case, surrounding quotes and
+whitespace that does not separate two words ("len( data )" equals
+"len(data)", "not in" stays distinct from "notin"), which removes most
+wrong-but-equivalent rejections.
+"""
+
+import os
+import re
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+from metrics import counter
+
+# Configuration
+ANSWER_KEY_INDEX_SIZE = int(os.getenv('ANSWER_KEY_INDEX_SIZE', 100000))
+
+_SPACE_AROUND_SYMBOL = re.compile(r'\s*([^\w\s])\s*')
+_QUOTES = '\'"`'
+
+# Metrics
+ANSWER_KEY_LOOKUPS = counter(
+    'pqgen_answer_key_lookups_total', 'Answer key lookups by whether the key was precompiled', ['result']
+)
+
+
+def normalize_answer(value: Any) -> str:
+    """Comparable form of an answer: no surrounding quotes, no insignificant whitespace, case-folded"""
+    text = unicodedata.normalize('NFKC', str(value)).strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in _QUOTES:
+        text = text[1:-1].strip()
+    text = _SPACE_AROUND_SYMBOL.sub(r'\1', ' '.join(text.split()))
+    return text.casefold()
+
+
+def _compile_multiple_choice(challenge: Dict[str, Any]) -> Dict[str, Any]:
+    options = challenge.get('options') or []
+    by_text = {}
+    for index, option in enumerate(options):
+        by_text.setdefault(normalize_answer(option), index)
+    try:
+        correct = int(challenge.get('correct_answer', 0))
+    except (TypeError, ValueError):
+        correct = 0
+    return {'type': 'multiple-choice', 'correct': correct, 'option_count': len(options), 'by_text': by_text}
+
+
+def _compile_fill_in_the_blank(challenge: Dict[str, Any]) -> Dict[str, Any]:
+    blanks = []
+    positions = {}  # blank id or number -> position, for answers keyed by blank
+    for position, blank in enumerate(challenge.get('blanks') or []):
+        if not isinstance(blank, dict):
+            blank = {'correct_answer': blank}
+        answers = list(blank.get('correct_answers') or [])
+        if blank.get('correct_answer') not in (None, ''):
+            answers.insert(0, blank['correct_answer'])
+        blanks.append({
+            'accepted': frozenset(normalize_answer(answer) for answer in answers),
+            'options': [normalize_answer(option) for option in blank.get('options') or []]
+        })
+        for name in (blank.get('id'), blank.get('blank_number')):
+            if name not in (None, ''):
+                positions[str(name)] = position
+    return {'type': 'fill-in-the-blank', 'blanks': blanks, 'positions': positions}
+
+
+def compile_answer_key(challenge: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Compiled answer key of a multiple-choice or fill-in-the-blank challenge, else None"""
+    challenge_type = challenge.get('type')
+    if challenge_type == 'multiple-choice':
+        return _compile_multiple_choice(challenge)
+    if challenge_type == 'fill-in-the-blank':
+        return _compile_fill_in_the_blank(challenge)
+    return None
+
+
+def _option_index(submitted: Any) -> Optional[int]:
+    """The index in an explicit {"index": n} answer, else None"""
+    if isinstance(submitted, dict) and set(submitted) == {'index'}:
+        index = submitted['index']
+        if isinstance(index, int) and not isinstance(index, bool):
+            return index
+    return None
+
+
+def grade_multiple_choice(key: Dict[str, Any], submitted: Any) -> Optional[int]:
+    """Index of the chosen option; None if the answer is not one of the options
+
+    A JSON number or {"index": n} is an option index. Text is matched against the
+    options first, so "2" picks the option reading "2"; text that matches no option
+    is taken as an index only if it is a plain integer, as older clients send.
+    """
+    if isinstance(submitted, bool):
+        return None
+    if isinstance(submitted, int):
+        index = submitted
+    elif isinstance(submitted, str):
+        index = key['by_text'].get(normalize_answer(submitted))
+        if index is None and submitted.strip().isdigit():
+            index = int(submitted)
+    else:
+        index = _option_index(submitted)
+    if index is None or index < 0 or (key['option_count'] and index >= key['option_count']):
+        return None
+    return index
+
+
+def grade_fill_in_the_blank(key: Dict[str, Any], submitted: Any) -> Optional[Tuple[int, int]]:
+    """(correct blanks, total blanks) for answers given as a list or keyed by blank; None if malformed
+
+    Each answer is a value compared as text, numbers included. A blank with options
+    also accepts the right option by position, given explicitly as {"index": n}.
+    """
+    if isinstance(submitted, str):
+        try:
+            submitted = json.loads(submitted)
+        except json.JSONDecodeError:
+            return None
+    blanks = key['blanks']
+    if isinstance(submitted, dict):
+        answers = [None] * len(blanks)
+        for name, answer in submitted.items():
+            position = key['positions'].get(str(name))
+            if position is not None:
+                answers[position] = answer
+    elif isinstance(submitted, list):
+        answers = submitted[:len(blanks)]
+    else:
+        return None
+
+    correct = 0
+    for blank, answer in zip(blanks, answers):
+        if answer is None:
+            continue
+        if isinstance(answer, dict):
+            index = _option_index(answer)
+            if index is None or not 0 <= index < len(blank['options']):
+                continue
+            normalized = blank['options'][index]
+        else:
+            normalized = normalize_answer(answer)
+        correct += normalized in blank['accepted']
+    return correct, len(blanks)
+
+
+class AnswerKeyIndex:
+    """Compiled answer keys by challenge id, bounded to the most recently used max_entries
+
+    Keys are compiled when challenges are published; a challenge whose key was
+    evicted (or predates the index) is compiled on its first lookup.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_KEY_INDEX_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()  # challenge id -> compiled key, least recently used first
+        self._stats = {'published': 0, 'hits': 0, 'compiled_on_demand': 0, 'evicted': 0}
+
+    def _store(self, challenge_id: str, key: Dict[str, Any]):
+        self._keys[challenge_id] = key
+        self._keys.move_to_end(challenge_id)
+        while len(self._keys) > self.max_entries:
+            self._keys.popitem(last=False)
+            self._stats['evicted'] += 1
+
+    def publish(self, challenges: List[Dict[str, Any]]) -> int:
+        """Compile the answer keys of newly published challenges; returns how many were compiled"""
+        compiled = [(c['id'], key) for c in challenges if c.get('id') and (key := compile_answer_key(c))]
+        with self._lock:
+            for challenge_id, key in compiled:
+                self._store(challenge_id, key)
+            self._stats['published'] += len(compiled)
+        return len(compiled)
+
+    def get(self, challenge: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        challenge_id = challenge.get('id')
+        with self._lock:
+            key = self._keys.get(challenge_id)
+            if key is not None:
+                self._keys.move_to_end(challenge_id)
+                self._stats['hits'] += 1
+        if key is not None:
+            ANSWER_KEY_LOOKUPS.inc(result='hit')
+            return key
+
+        key = compile_answer_key(challenge)
+        if key is not None and challenge_id:
+            with self._lock:
+                self._store(challenge_id, key)
+                self._stats['compiled_on_demand'] += 1
+            ANSWER_KEY_LOOKUPS.inc(result='compiled_on_demand')
+        return key
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'keys': len(self._keys), 'max_entries': self.max_entries, **self._stats}
+
+
+# Global index
+answer_keys = AnswerKeyIndex()
@@ -1,17 +1,19 @@
 import os
+import re
 import logging
 from flask import Flask, redirect, request, jsonify, send_from_directory, Response, session, url_for
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 import uuid
 import time
 import json
-from concurrent.futures import ThreadPoolExecutor
 import threading
 from datetime import datetime
+from concurrent.futures import wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
 
 # Import your improved modules with correct functions
-from pdf_content_analyzer import extract_text_from_pdf, analyze_pdf_content
+from pdf_content_analyzer import extract_text_from_pdf, analyze_pdf_content, get_topic_snippet, validate_topics
 from llm_challenge_generator import (
     generate_single_challenge,
     generate_short_hint_for_challenge,
@@ -22,10 +24,33 @@ from challenge_generator import generate_fallback_challenges
 
 # Import authentication module
 from auth import (
-    init_firebase, require_auth, get_current_user, register_user, authenticate_user,
+    init_firebase, require_auth, require_admin, get_current_user, register_user, authenticate_user,
     generate_jwt_token, verify_jwt_token, get_user_profile
 )
 from database import is_database_available
+from retention import RetentionManager, DOCUMENT_TTL_SECONDS
+from blob_store import BlobStore, BLOB_DEDUP
+from challenge_bank import ChallengeBank, CHALLENGE_BANK_ENABLED, CHALLENGE_BANK_SHARE_ACROSS_DOCUMENTS, CHALLENGE_TYPES
+from evaluation_cache import evaluation_cache
+from answer_keys import answer_keys, grade_multiple_choice, grade_fill_in_the_blank
+from code_evaluator import submit_debugging_challenge, GRADING_BUDGET_SECONDS
+from sandbox import EvaluationBusy
+from near_duplicates import (
+    MinHashIndex, ServedChallenges, check_challenge, DUPLICATES, DUPLICATE_MAX_REGENERATIONS
+)
+from cancellation import JobCancelled, current_cancel_token, checkpoint
+from job_journal import JobJournal, step_key
+from worker_pools import cpu_pool, io_pool, evaluation_pool, extract_text, analyze_content, get_pool_stats
+from tracing import tracer, traced, set_attributes
+from profiler import profiler, ProfilerBusyError, PROFILE_SAMPLE_INTERVAL
+from upload_ingest import (
+    StreamingUploadRequest, UploadRejected, ingest_upload, iter_zip_pdfs,
+    MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES, MAX_BATCH_FILES, MULTIPART_OVERHEAD_BYTES
+)
+from metrics import gauge, render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE, FALLBACKS, ERRORS
+from job_scheduler import (
+    JobScheduler, QueueFullError, PRIORITY_INTERACTIVE, PRIORITY_EXTRACTION
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -37,6 +62,9 @@ else:
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+# Stream uploaded files straight to disk and cap request bodies
+app.request_class = StreamingUploadRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
 #FRONTEND_DIST = os.path.abspath(
    # os.path.join(os.path.dirname(__file__), "../pqgen-frontend/dist")
 #)
@@ -66,9 +94,11 @@ logger.info("Features: Challenge State Management, Progress Bar, Topic Selection
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'pdf'}
+TOPIC_EXTRACTION_FAILED = "Error extracting topics. Please try again."
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # Global storage for documents and progress
 documents = {}
@@ -76,9 +106,66 @@ document_progress = {}
 document_topics = {}
 document_challenges = {}
 challenge_states = {}
+batches = {}
+
+# Serializes attempt bookkeeping so a batch of attempts is applied all at once
+challenge_state_lock = threading.Lock()
+MAX_BATCH_ATTEMPTS = int(os.getenv('MAX_BATCH_ATTEMPTS', 100))
+
+# Documents of one batch upload extracted at the same time
+BATCH_EXTRACTION_CONCURRENCY = int(os.getenv('BATCH_EXTRACTION_CONCURRENCY', cpu_pool.max_workers))
+
+# Content-addressed uploads shared by documents with identical content
+blob_store = BlobStore(os.path.join(UPLOAD_FOLDER, 'blobs'))
+
+# Retention: per-store TTLs, memory-budget LRU, upload sweeper and blob GC
+retention = RetentionManager(
+    stores={
+        'documents': documents,
+        'document_progress': document_progress,
+        'document_topics': document_topics,
+        'document_challenges': document_challenges,
+        'challenge_states': challenge_states,
+        'batches': batches
+    },
+    ttls={'batches': DOCUMENT_TTL_SECONDS},
+    upload_folder=UPLOAD_FOLDER,
+    blob_store=blob_store
+)
+
+# Bounded priority job queue for background processing
+scheduler = JobScheduler()
+
+# On-disk journal so interrupted jobs are resumed after a restart
+journal = JobJournal()
 
-# Thread pool for parallel processing
-executor = ThreadPoolExecutor(max_workers=3)
+# Pregenerated challenges consulted before the LLM, and the static fallback templates
+challenge_bank = ChallengeBank() if CHALLENGE_BANK_ENABLED else None
+if challenge_bank:
+    challenge_bank.load_static_templates()
+
+# Near-duplicate signatures of the challenges each user has been served
+served_challenges = ServedChallenges()
+
+# Gauges sampled when /metrics is scraped
+gauge('pqgen_job_queue_depth', 'Jobs waiting in the scheduler queue by priority', ['priority']).set_function(
+    lambda: scheduler.stats()['queued_by_priority']
+)
+gauge('pqgen_jobs_running', 'Jobs currently running on scheduler workers').set_function(
+    lambda: scheduler.stats()['running']
+)
+gauge('pqgen_pool_busy_workers', 'Busy workers per executor pool', ['pool']).set_function(
+    lambda: {name: pool['busy'] for name, pool in get_pool_stats().items()}
+)
+gauge('pqgen_pool_queued_tasks', 'Tasks waiting for a worker per executor pool', ['pool']).set_function(
+    lambda: {name: pool['queued'] for name, pool in get_pool_stats().items()}
+)
+gauge('pqgen_store_entries', 'Entries in each in-memory store', ['store']).set_function(
+    lambda: retention.stats()['resident_entries']
+)
+gauge('pqgen_resident_document_bytes', 'Estimated memory held by resident documents').set_function(
+    lambda: retention.stats()['resident_bytes']
+)
 
 @app.route('/')
 def index():
@@ -91,6 +178,37 @@ def serve_static_files(filename):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_request_user_key():
+    """Identify the requesting user for per-user job fairness"""
+    auth_header = request.headers.get('Authorization')
+    token = None
+    if auth_header and auth_header.startswith('Bearer '):
+        token = auth_header.split(' ')[1]
+    if not token:
+        token = session.get('auth_token')
+    if token:
+        payload = verify_jwt_token(token)
+        if payload and payload.get('user_id'):
+            return f"user:{payload['user_id']}"
+    return f"ip:{request.remote_addr}"
+
+def upload_rejected_response(error):
+    """Error response for an upload that broke a size, type or page limit"""
+    if isinstance(error, RequestEntityTooLarge):
+        return jsonify({'error': f'Upload too large; the limit is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB'}), 413
+    return jsonify({'error': str(error)}), error.status_code
+
+@app.errorhandler(RequestEntityTooLarge)
+def handle_request_too_large(error):
+    return upload_rejected_response(error)
+
+def queue_full_response(error):
+    """429 response telling the client when to retry"""
+    return jsonify({
+        'error': f'Server is busy: {error}. Please retry later.',
+        'retry_after': error.retry_after
+    }), 429, {'Retry-After': str(error.retry_after)}
+
 def update_progress(doc_id, status, progress=0, message="", topics=None, challenges=None):
     """Update progress for a document"""
     document_progress[doc_id] = {
@@ -101,45 +219,167 @@ def update_progress(doc_id, status, progress=0, message="", topics=None, challen
         'topics': topics,
         'challenges': challenges
     }
+    retention.touch('document_progress', doc_id)
     logger.info(f"Progress updated for {doc_id}: {status} - {message}")
 
-def extract_topics_async(doc_id, file_path):
+# Uploads with identical content that arrive while their content is being
+# extracted wait for that extraction instead of running their own
+shared_extractions = {}  # content hash -> [(doc_id, user_key)] waiting on the running extraction
+shared_extractions_lock = threading.Lock()
+
+def join_shared_extraction(content_hash, doc_id, user_key):
+    """Wait on a running extraction of the same content; returns False (and leads) when there is none"""
+    with shared_extractions_lock:
+        followers = shared_extractions.get(content_hash)
+        if followers is None:
+            shared_extractions[content_hash] = []
+            return False
+        followers.append((doc_id, user_key))
+        return True
+
+def finish_shared_extraction(content_hash, status, topics=None, message=''):
+    """Hand the leader's outcome to the documents waiting on it"""
+    if not content_hash:
+        return
+    with shared_extractions_lock:
+        followers = shared_extractions.pop(content_hash, [])
+    
+    for index, (doc_id, user_key) in enumerate(followers):
+        if doc_id not in documents:
+            continue
+        if status == 'completed':
+            document_topics[doc_id] = topics
+            retention.touch('document_topics', doc_id)
+            update_progress(doc_id, 'completed', 100, message, topics=topics)
+        elif status == 'error':
+            update_progress(doc_id, 'error', 0, message)
+        else:
+            # The leader was cancelled or rejected: the first follower takes over, the rest keep waiting
+            if index == 0:
+                with shared_extractions_lock:
+                    shared_extractions[content_hash] = followers[1:]
+                try:
+                    queue_topic_extraction(doc_id, user_key)
+                except QueueFullError:
+                    finish_shared_extraction(content_hash, 'error', message='Server is busy; please upload again')
+                    update_progress(doc_id, 'error', 0, 'Server is busy; please upload again')
+                return
+
+def queue_topic_extraction(doc_id, user_key):
+    """Journal and queue topic extraction for an uploaded document; raises QueueFullError"""
+    doc_info = documents[doc_id]
+    update_progress(doc_id, 'queued', 0, 'Waiting in queue...')
+    journal_id = journal.start_job('extract_topics', doc_id, {
+        'document': doc_info,
+        'user_key': user_key
+    })
+    try:
+        return scheduler.submit(
+            extract_topics_async, doc_id, doc_info['file_path'], journal_id=journal_id,
+            priority=PRIORITY_EXTRACTION, user_key=user_key, doc_id=doc_id, kind='extract_topics'
+        )
+    except QueueFullError:
+        journal.finish_job(journal_id, 'rejected')
+        raise
+
+def cancel_pending_extraction(doc_id, journal_id):
+    """Mark a document whose extraction never started as cancelled, releasing identical uploads waiting on it"""
+    journal.finish_job(journal_id, 'cancelled')
+    update_progress(doc_id, 'cancelled', 0, 'Topic extraction cancelled before it started')
+    finish_shared_extraction(documents.get(doc_id, {}).get('content_hash'), 'cancelled')
+
+def discard_uploads(responses, leading, journal_ids=()):
+    """Drop the documents of a request that failed, releasing the extractions they lead to identical uploads"""
+    for response in responses:
+        retention.evict_document(response['document_id'], reason='rejected')
+    for journal_id in journal_ids:
+        journal.finish_job(journal_id, 'rejected')
+    for content_hash in leading:
+        finish_shared_extraction(content_hash, 'rejected')
+
+@traced()
+def extract_batch_async(batch_id, pending):
+    """Extract topics for the documents of a batch upload, several at a time across the worker pools"""
+    set_attributes(batch_id=batch_id, documents=len(pending))
+    cancel_token = current_cancel_token()
+    in_flight = set()
+    
+    for index, (doc_id, journal_id) in enumerate(pending):
+        # Cancellation checkpoint between documents: the ones not started yet are dropped
+        if cancel_token and cancel_token.is_cancelled():
+            for skipped_doc_id, skipped_journal_id in pending[index:]:
+                cancel_token.record_skipped(doc_id=skipped_doc_id)
+                cancel_pending_extraction(skipped_doc_id, skipped_journal_id)
+            break
+        
+        doc_info = documents.get(doc_id)
+        if not doc_info:
+            journal.finish_job(journal_id, 'failed')
+            continue
+        
+        if len(in_flight) >= BATCH_EXTRACTION_CONCURRENCY:
+            _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        in_flight.add(io_pool.submit(extract_topics_async, doc_id, doc_info['file_path'], journal_id=journal_id))
+    
+    wait(in_flight)
+    checkpoint()
+    logger.info(f"Batch {batch_id}: topic extraction finished for {len(pending)} documents")
+
+@traced()
+def extract_topics_async(doc_id, file_path, journal_id=None):
     """Extract topics from PDF in background using improved system"""
+    set_attributes(doc_id=doc_id)
+    retention.pin(doc_id)
+    journal.set_status(journal_id, 'running')
+    journal_status = 'failed'
+    content_hash = documents.get(doc_id, {}).get('content_hash')
+    shared_status, shared_topics, shared_message = 'cancelled', None, ''
     try:
         update_progress(doc_id, 'extracting', 10, 'Extracting text from PDF...')
         
-        # 1. Extract raw text from PDF
-        content = extract_text_from_pdf(file_path)
+        # 1. Extract raw text from PDF (CPU pool), unless identical content was extracted before
+        content = blob_store.load_text(content_hash) if content_hash else None
+        if content is None:
+            content = extract_text(file_path)
+            if content_hash and content:
+                blob_store.save_text(content_hash, content)
         if not content or len(content.strip()) < 10:
-            update_progress(doc_id, 'error', 0, 'Failed to extract meaningful content from PDF')
+            shared_status, shared_message = 'error', 'Failed to extract meaningful content from PDF'
+            update_progress(doc_id, 'error', 0, shared_message)
             return
         
+        checkpoint()
         update_progress(doc_id, 'extracting', 30, 'Analyzing content for topics...')
         
-        # 2. Use improved topic extraction system
+        # 2. Analyze content once in the CPU pool and reuse it for topic extraction
+        analysis = analyze_content(content)
+        checkpoint()
         try:
             # Try enhanced topic extraction first
-            topics = extract_topics_from_content(content, file_path)
+            topics = extract_topics_from_content(content, file_path, analysis=analysis)
             if topics and len(topics) > 0:
                 valid_topics = validate_topics(topics, content)
             else:
                 # Fallback to basic analysis if enhanced extraction fails
-                analysis = analyze_pdf_content(content)
+                FALLBACKS.inc(kind='topics_basic_analysis')
                 raw_topics = analysis.get('topics', [])
                 valid_topics = validate_topics(raw_topics, content)
         except Exception as e:
             logger.warning(f"Enhanced topic extraction failed, using fallback: {e}")
+            FALLBACKS.inc(kind='topics_basic_analysis')
             # Fallback to basic analysis
-            analysis = analyze_pdf_content(content)
             raw_topics = analysis.get('topics', [])
             valid_topics = validate_topics(raw_topics, content)
         
-        # 3. If nothing valid, show error
+        # 3. If nothing valid, show error; otherwise share the result with identical uploads
         if not valid_topics:
-            valid_topics = ["Error extracting topics. Please try again."]
+            valid_topics = [TOPIC_EXTRACTION_FAILED]
+        elif content_hash:
+            blob_store.save_result(content_hash, {'topics': valid_topics})
         
         # 4. Store and report
         document_topics[doc_id] = valid_topics
+        retention.touch('document_topics', doc_id)
         update_progress(
             doc_id,
             'completed',
@@ -147,65 +387,73 @@ def extract_topics_async(doc_id, file_path):
             f'Found {len(valid_topics)} topics',
             topics=valid_topics
         )
+        journal_status = 'completed'
+        shared_status, shared_topics, shared_message = 'completed', valid_topics, f'Found {len(valid_topics)} topics'
         logger.info(f"Topic extraction completed for {doc_id}: {len(valid_topics)} topics found")
         
+    except JobCancelled:
+        journal_status = 'cancelled'
+        logger.info(f"Topic extraction cancelled for {doc_id}")
+        update_progress(doc_id, 'cancelled', 0, 'Topic extraction cancelled')
     except Exception as e:
+        ERRORS.inc(stage='extract_topics_job')
         logger.error(f"Error extracting topics for {doc_id}: {e}")
-        update_progress(doc_id, 'error', 0, f'Error extracting topics: {e}')
+        shared_status, shared_message = 'error', f'Error extracting topics: {e}'
+        update_progress(doc_id, 'error', 0, shared_message)
+    finally:
+        journal.finish_job(journal_id, journal_status)
+        finish_shared_extraction(content_hash, shared_status, shared_topics, shared_message)
+        retention.unpin(doc_id)
+        retention.update_size(doc_id)
 
-def validate_topics(raw_topics, content):
-    """Validate and clean extracted topics"""
-    valid_topics = []
-    
-    for topic in raw_topics:
-        if not topic or not isinstance(topic, str):
-            continue
-            
-        topic = topic.strip()
-        
-        # Skip empty or very short topics
-        if len(topic) < 3:
-            continue
-            
-        # Skip very long topics (likely not actual topics)
-        if len(topic) > 50:
-            continue
-            
-        # Skip topics that are just numbers or special characters
-        if topic.isdigit() or not any(c.isalpha() for c in topic):
-            continue
-            
-        # Clean up the topic
-        topic = topic.replace('_', ' ').title()
-        
-        # Add if not already present
-        if topic not in valid_topics:
-            valid_topics.append(topic)
-    
-    return valid_topics[:10]  # Limit to 10 topics
+def topic_key(topic):
+    """Normalized form used to recognise the same topic across documents"""
+    words = re.sub(r'[^a-z0-9+#]+', ' ', topic.lower()).split()
+    return ' '.join(word[:-1] if len(word) > 3 and word.endswith('s') else word for word in words)
 
-def get_topic_snippet(text: str, topic: str, window_chars: int = 2000) -> str:
+def merge_corpus_topics(topics_by_doc):
     """
-    Return up to `window_chars` of `text` centered on the first occurrence of `topic`.
-    If `topic` isn't found, return the first `window_chars` of the text.
+    Merge per-document topic lists into one corpus-wide list without duplicates.
+    Topics covered by more documents come first, then in order of first appearance.
     """
-    lower = text.lower()
-    idx = lower.find(topic.lower())
-    if idx != -1:
-        half = window_chars // 2
-        start = max(0, idx - half)
-        end = min(len(text), idx + half)
-        return text[start:end]
-    return text[:window_chars]
-
-def generate_challenge_with_improved_system(content, difficulty, topic):
+    merged = {}
+    for doc_id, topics in topics_by_doc.items():
+        for topic in topics or []:
+            if topic == TOPIC_EXTRACTION_FAILED:
+                continue
+            key = topic_key(topic)
+            if not key:
+                continue
+            entry = merged.setdefault(key, {'topic': topic, 'document_ids': [], 'order': len(merged)})
+            if doc_id not in entry['document_ids']:
+                entry['document_ids'].append(doc_id)
+    
+    ordered = sorted(merged.values(), key=lambda entry: (-len(entry['document_ids']), entry['order']))
+    return [
+        {'topic': entry['topic'], 'document_count': len(entry['document_ids']), 'document_ids': entry['document_ids']}
+        for entry in ordered
+    ]
+
+def generate_challenge_with_improved_system(content, difficulty, topic, journal_id=None,
+                                           challenge_types=CHALLENGE_TYPES):
     """Generate challenges using the improved challenge generation system"""
     challenges = []
+    cancel_token = current_cancel_token()
     
-    # Define challenge types to generate
-    challenge_types = ['multiple-choice', 'debugging', 'fill-in-the-blank']
-    
-    for challenge_type in challenge_types:
+    for index, challenge_type in enumerate(challenge_types):
+        # Cancellation checkpoint between challenge types
+        if cancel_token and cancel_token.is_cancelled():
+            for skipped_type in challenge_types[index:]:
+                cancel_token.record_skipped(topic=topic, type=skipped_type)
+            raise JobCancelled(cancel_token.reason or 'cancelled')
+        
+        # Reuse a step already checkpointed before a restart
+        journaled = journal.get_step(journal_id, step_key(topic, challenge_type))
+        if journaled is not None:
+            logger.info(f"Reusing journaled {challenge_type} challenge for {topic}")
+            challenges.append(journaled)
+            continue
+        
         try:
             logger.info(f"Generating {challenge_type} challenge for topic: {topic}")
             
@@ -228,22 +476,96 @@ def generate_challenge_with_improved_system(content, difficulty, topic):
                     hint = generate_short_hint_for_challenge(challenge)
                     challenge['hint'] = hint
                 except Exception as e:
+                    ERRORS.inc(stage='hint_generation')
                     logger.warning(f"Failed to generate hint for {challenge_type}: {e}")
                     challenge['hint'] = f"Think about the key concepts in {topic}."
                 
                 challenges.append(challenge)
+                journal.record_step(journal_id, step_key(topic, challenge_type), challenge)
                 logger.info(f"Successfully generated {challenge_type} challenge for {topic}")
             else:
                 logger.warning(f"Failed to generate {challenge_type} challenge for {topic}")
                 
+        except JobCancelled:
+            cancel_token.record_skipped(topic=topic, type=challenge_type)
+            for skipped_type in challenge_types[index + 1:]:
+                cancel_token.record_skipped(topic=topic, type=skipped_type)
+            raise
         except Exception as e:
             logger.error(f"Error generating {challenge_type} challenge for {topic}: {e}")
             continue
     
     return challenges
 
-def generate_challenges_async(doc_id, selected_topics, difficulty_settings):
+@traced()
+def generate_topic_challenges(full_content, topic, difficulty, journal_id=None,
+                              challenge_types=CHALLENGE_TYPES):
+    """Generate challenges of the given types for one topic on the I/O pool, falling back to static templates"""
+    set_attributes(topic=topic, difficulty=difficulty)
+    cancel_token = current_cancel_token()
+    if cancel_token and cancel_token.is_cancelled():
+        cancel_token.record_skipped(topic=topic)
+        raise JobCancelled(cancel_token.reason or 'cancelled')
+    
+    # 1) Grab a focused snippet for this topic
+    snippet = get_topic_snippet(full_content, topic, window_chars=2000)
+    
+    # 2) Use improved AI generation system
+    if is_model_ready():
+        ai_chals = generate_challenge_with_improved_system(
+            snippet, difficulty, topic, journal_id, challenge_types
+        )
+        if ai_chals:
+            logger.info(f"Generated {len(ai_chals)} challenges for {topic}")
+            return ai_chals
+    
+    # 3) Static fallback if AI fails
+    journaled = journal.get_step(journal_id, step_key(topic, 'fallback'))
+    if journaled is not None:
+        return journaled
+    logger.warning(f"AI generation failed for {topic}, using fallback")
+    set_attributes(fallback=True)
+    FALLBACKS.inc(kind='static_challenges')
+    if challenge_bank:
+        fallback = challenge_bank.static_challenges(topic, difficulty, challenge_types)
+    else:
+        fallback = generate_fallback_challenges([topic], difficulty) or []
+    journal.record_step(journal_id, step_key(topic, 'fallback'), fallback)
+    return fallback
+
+@traced()
+def regenerate_distinct_challenge(full_content, duplicate, seen):
+    """Regenerate a near-duplicate challenge until it differs from the document's others; None if it never does"""
+    topic = duplicate['topic']
+    challenge_type = duplicate['type']
+    difficulty = duplicate['difficulty']
+    set_attributes(topic=topic, type=challenge_type)
+    
+    if is_model_ready():
+        snippet = get_topic_snippet(full_content, topic, window_chars=2000)
+        for _ in range(DUPLICATE_MAX_REGENERATIONS):
+            for challenge in generate_challenge_with_improved_system(
+                snippet, difficulty, topic, None, [challenge_type]
+            ):
+                if check_challenge(seen, challenge) is None:
+                    DUPLICATES.inc(outcome='regenerated')
+                    return challenge
+    
+    DUPLICATES.inc(outcome='dropped')
+    logger.info(f"Dropped a near-duplicate {challenge_type} challenge for {topic}")
+    return None
+
+@traced()
+def generate_challenges_async(doc_id, selected_topics, difficulty_settings, journal_id=None):
     """Generate challenges for selected topics in background using improved system"""
+    set_attributes(
+        doc_id=doc_id, topics=len(selected_topics),
+        journaled_steps=journal.completed_steps(journal_id) if journal_id else 0
+    )
+    cancel_token = current_cancel_token()
+    retention.pin(doc_id)
+    journal.set_status(journal_id, 'running')
+    journal_status = 'failed'
     try:
         update_progress(doc_id, 'generating', 10, 'Starting challenge generation...')
         
@@ -253,45 +575,109 @@ def generate_challenges_async(doc_id, selected_topics, difficulty_settings):
             update_progress(doc_id, 'error', 0, 'Document not found')
             return
         
-        full_content = extract_text_from_pdf(doc_info['file_path'])
+        content_hash = doc_info.get('content_hash')
+        full_content = blob_store.load_text(content_hash) if content_hash else None
+        if full_content is None:
+            full_content = extract_text(doc_info['file_path'])
         if not full_content:
             update_progress(doc_id, 'error', 0, 'Failed to extract document content')
             return
+        checkpoint()
         
         challenges = []
         total = len(selected_topics)
+        user_key = doc_info.get('user_key')
+        
+        # 2) Serve what the challenge bank already holds, skipping questions this user has
+        #    already seen; only the misses go to the LLM
+        banked = [
+            challenge_bank.lookup(
+                topic_info['topic'], topic_info['difficulty'], doc_hash=content_hash,
+                exclude=lambda challenge: served_challenges.was_served(user_key, challenge),
+                cross_document=CHALLENGE_BANK_SHARE_ACROSS_DOCUMENTS
+            )
+            if challenge_bank else {}
+            for topic_info in selected_topics
+        ]
+        hits = [challenge for found in banked for challenge in found.values()]
+        set_attributes(bank_hits=len(hits))
+        if hits:
+            update_progress(doc_id, 'generating', 10, f'{len(hits)} challenges ready from the challenge bank',
+                            challenges=hits)
+        
+        # 3) Fan missing topics out to the I/O pool; results are collected in topic order
+        futures = [
+            io_pool.submit(
+                generate_topic_challenges, full_content, topic_info['topic'], topic_info['difficulty'], journal_id,
+                [t for t in CHALLENGE_TYPES if t not in found]
+            ) if len(found) < len(CHALLENGE_TYPES) else None
+            for topic_info, found in zip(selected_topics, banked)
+        ]
+        
+        # Near-duplicates of a challenge already accepted for this document are regenerated
+        # in the background; their slot in topic order is kept until the replacement arrives
+        seen = MinHashIndex()
+        regenerations = []  # (position in challenges, future)
+        
+        def bank(generated):
+            """Keep newly generated challenges as bank variants, once they passed the duplicate check"""
+            generated = [c for c in generated if c and c.get('generated_by') != 'static']
+            if challenge_bank and generated:
+                challenge_bank.store_generated(content_hash, generated)
+        
+        def accept(new_challenges, generated=False):
+            kept = []
+            for challenge in new_challenges:
+                # Static templates only differ by topic name; they are a fallback, not regenerable
+                if challenge.get('generated_by') != 'static' and check_challenge(seen, challenge):
+                    regenerations.append((len(challenges), io_pool.submit(
+                        regenerate_distinct_challenge, full_content, challenge, seen
+                    )))
+                    challenges.append(None)
+                else:
+                    challenges.append(challenge)
+                    kept.append(challenge)
+            if generated:
+                bank(kept)
         
-        for i, topic_info in enumerate(selected_topics):
+        for i, (topic_info, found, future) in enumerate(zip(selected_topics, banked, futures)):
             topic = topic_info['topic']
-            difficulty = topic_info['difficulty']
+            accept(found.values())
+            if future is None:
+                continue
+            
+            # Cancellation checkpoint between topics: drop work that has not started yet
+            if cancel_token and cancel_token.is_cancelled():
+                for pending_info, pending in zip(selected_topics[i:], futures[i:]):
+                    if pending and pending.cancel():
+                        cancel_token.record_skipped(topic=pending_info['topic'])
+                raise JobCancelled(cancel_token.reason or 'cancelled')
             
             progress = 10 + (i / total) * 80
-            update_progress(doc_id, 'generating', progress, f'Generating challenges for: {topic}')
+            update_progress(doc_id, 'generating', progress, f'Generating challenges for: {topic}',
+                            challenges=[c for c in challenges if c])
             
             try:
-                # 2) Grab a focused snippet for this topic
-                snippet = get_topic_snippet(full_content, topic, window_chars=2000)
-                
-                # 3) Use improved AI generation system
-                if is_model_ready():
-                    ai_chals = generate_challenge_with_improved_system(snippet, difficulty, topic)
-                    if ai_chals:
-                        challenges.extend(ai_chals)
-                        logger.info(f"Generated {len(ai_chals)} challenges for {topic}")
-                        continue
-                
-                # 4) Static fallback if AI fails
-                logger.warning(f"AI generation failed for {topic}, using fallback")
-                fallback = generate_fallback_challenges([topic], difficulty)
-                if fallback:
-                    challenges.extend(fallback)
-                    
+                accept(future.result(), generated=True)
+            except JobCancelled:
+                continue
             except Exception as e:
                 logger.error(f"Error generating challenges for {topic}: {e}")
                 # Continue with next topic instead of failing completely
                 continue
         
-        # 5) Store challenges and init states
+        for position, future in regenerations:
+            try:
+                challenges[position] = future.result()
+                bank([challenges[position]])
+            except JobCancelled:
+                continue
+            except Exception as e:
+                logger.error(f"Error regenerating a near-duplicate challenge: {e}")
+        challenges = [c for c in challenges if c]
+        checkpoint()
+        
+        # 4) Store challenges and init states
         document_challenges[doc_id] = challenges
         for c in challenges:
             cid = c.get('id', str(uuid.uuid4()))
@@ -304,13 +690,101 @@ def generate_challenges_async(doc_id, selected_topics, difficulty_settings):
                 'last_submission': None,
                 'solved_at': None
             }
+        answer_keys.publish(challenges)
+        retention.touch('document_challenges', doc_id)
+        retention.track_challenges(doc_id, [c['id'] for c in challenges])
+        served_challenges.record(user_key, challenges)
         
         update_progress(doc_id, 'completed', 100, f'Generated {len(challenges)} challenges', challenges=challenges)
+        journal_status = 'completed'
         logger.info(f"Challenge generation completed for {doc_id}: {len(challenges)} challenges generated")
         
+    except JobCancelled:
+        journal_status = 'cancelled'
+        skipped = cancel_token.skipped_work() if cancel_token else []
+        logger.info(f"Challenge generation cancelled for {doc_id}: skipped {len(skipped)} units of work")
+        update_progress(doc_id, 'cancelled', 0, f'Challenge generation cancelled ({len(skipped)} steps skipped)')
     except Exception as e:
+        ERRORS.inc(stage='generate_challenges_job')
         logger.error(f"Error in challenge generation for {doc_id}: {e}")
         update_progress(doc_id, 'error', 0, f'Error generating challenges: {e}')
+    finally:
+        journal.finish_job(journal_id, journal_status)
+        retention.unpin(doc_id)
+        retention.update_size(doc_id)
+
+def resume_unfinished_jobs():
+    """Replay jobs whose process stopped before finishing them, skipping their checkpointed steps
+    
+    Runs periodically from the journal's lease thread; a job is claimed by one process only.
+    """
+    for entry in journal.claim_orphaned_jobs():
+        journal_id = entry['journal_id']
+        doc_id = entry['doc_id']
+        payload = entry['payload']
+        doc_info = payload.get('document')
+        
+        if not doc_info or not os.path.exists(doc_info.get('file_path', '')):
+            logger.warning(f"Cannot resume {entry['kind']} job for {doc_id}: upload no longer available")
+            journal.finish_job(journal_id, 'failed')
+            continue
+        
+        documents[doc_id] = doc_info
+        retention.touch('documents', doc_id)
+        
+        try:
+            if entry['kind'] == 'extract_topics':
+                scheduler.submit(
+                    extract_topics_async, doc_id, doc_info['file_path'], journal_id=journal_id,
+                    priority=PRIORITY_EXTRACTION, user_key=payload.get('user_key', 'anonymous'),
+                    doc_id=doc_id, kind='extract_topics'
+                )
+            elif entry['kind'] == 'generate_challenges':
+                scheduler.submit(
+                    generate_challenges_async, doc_id, payload['topics'], {}, journal_id=journal_id,
+                    priority=PRIORITY_INTERACTIVE, user_key=payload.get('user_key', 'anonymous'),
+                    doc_id=doc_id, kind='generate_challenges'
+                )
+            else:
+                journal.finish_job(journal_id, 'failed')
+                continue
+        except QueueFullError:
+            logger.warning(f"Job queue full while resuming {entry['kind']} job for {doc_id}; will retry shortly")
+            journal.release(journal_id)
+            continue
+        
+        done = journal.completed_steps(journal_id)
+        update_progress(doc_id, 'queued', 0, f'Resuming after restart ({done} steps already done)')
+        logger.info(f"Resumed {entry['kind']} job for {doc_id} with {done} checkpointed steps")
+
+services_started = False
+services_lock = threading.Lock()
+
+def start_services():
+    """Start the worker pools, background threads and journal recovery of this serving process
+    
+    Importing this module starts nothing, so tooling and worker processes that import it
+    (e.g. as the main module of a process pool) stay inert. Servers call this once per
+    process: `python app.py` in the process that serves requests, asgi.py at import,
+    and any other WSGI server on the first request.
+    """
+    global services_started
+    with services_lock:
+        if services_started:
+            return
+        cpu_pool.start()
+        evaluation_pool.start()
+        scheduler.start()
+        retention.start()
+        journal.prune()
+        journal.start(resume=resume_unfinished_jobs)
+        services_started = True
+    logger.info("Background services started")
+
+@app.before_request
+def ensure_services_started():
+    if not services_started:
+        start_services()
 
 # Routes for serving frontend
 @app.route('/')
@@ -470,11 +944,79 @@ def get_user_settings():
         logger.error(f"Settings error: {e}")
         return jsonify({'error': 'Failed to get settings'}), 500
 
+def register_upload(file, user_key):
+    """
+    Ingest an uploaded PDF and register it as a document. Identical content
+    that was already extracted is reused at once, and identical content being
+    extracted right now is waited on. Returns (response dict, needs_extraction).
+    """
+    # Generate unique document ID and move the streamed file into place
+    doc_id = str(uuid.uuid4())
+    filename = secure_filename(file.filename)
+    set_attributes(doc_id=doc_id, filename=filename)
+    # Counting pages parses the PDF; do it in the CPU pool, not on the request thread
+    upload = ingest_upload(file, os.path.join(UPLOAD_FOLDER, f"{doc_id}_{filename}"), run=cpu_pool.run)
+    file_path = upload['file_path']
+    content_hash = upload['content_hash']
+    duplicate = blob_store.adopt(file_path, content_hash)
+    set_attributes(size_bytes=upload['size_bytes'], page_count=upload['page_count'], duplicate=duplicate)
+    
+    # Store document info
+    documents[doc_id] = {
+        'id': doc_id,
+        'filename': filename,
+        'file_path': file_path,
+        'content_hash': upload['content_hash'],
+        'size_bytes': upload['size_bytes'],
+        'page_count': upload['page_count'],
+        'upload_time': datetime.now().isoformat(),
+        'user_key': user_key
+    }
+    retention.touch('documents', doc_id)
+    response = {
+        'success': True,
+        'message': 'File uploaded successfully',
+        'document_id': doc_id,
+        'filename': filename,
+        'content_hash': content_hash,
+        'page_count': upload['page_count'],
+        'deduplicated': False,
+        'job_id': None
+    }
+    
+    # Identical content already processed: finish instantly with the shared topics
+    cached = blob_store.load_result(content_hash) if duplicate else None
+    if cached and cached.get('topics'):
+        BLOB_DEDUP.inc(shared='topics')
+        document_topics[doc_id] = cached['topics']
+        retention.touch('document_topics', doc_id)
+        update_progress(doc_id, 'completed', 100, f"Found {len(cached['topics'])} topics", topics=cached['topics'])
+        logger.info(f"File uploaded: {filename} (ID: {doc_id}) reuses topics of identical content {content_hash[:12]}")
+        response['deduplicated'] = True
+        return response, False
+    
+    # Identical content being extracted right now: wait for that extraction
+    if join_shared_extraction(content_hash, doc_id, user_key):
+        BLOB_DEDUP.inc(shared='in_flight')
+        update_progress(doc_id, 'queued', 0, 'Waiting for an identical upload to finish processing...')
+        logger.info(f"File uploaded: {filename} (ID: {doc_id}) waits on extraction of identical content")
+        response['deduplicated'] = True
+        return response, False
+    
+    return response, True
+
 # Document upload and processing routes
 @app.route('/api/upload', methods=['POST'])
+@traced()
 def upload_file():
     """Upload and process PDF file"""
     try:
+        # Reject early when there is no room in the job queue, before the body is read
+        user_key = get_request_user_key()
+        if not scheduler.has_capacity(user_key):
+            return queue_full_response(QueueFullError("Job queue is full", scheduler.retry_after()))
+        
+        # Parsing the form streams the file to disk, hashing and checking it on the way
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
         
@@ -485,35 +1027,228 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type. Only PDF files are allowed.'}), 400
         
-        # Generate unique document ID and save file
-        doc_id = str(uuid.uuid4())
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(UPLOAD_FOLDER, f"{doc_id}_{filename}")
-        file.save(file_path)
-        
-        # Store document info
-        documents[doc_id] = {
-            'id': doc_id,
-            'filename': filename,
-            'file_path': file_path,
-            'upload_time': datetime.now().isoformat()
+        response, needs_extraction = register_upload(file, user_key)
+        doc_id = response['document_id']
+        if not needs_extraction:
+            return jsonify(response)
+        
+        # Queue topic extraction in background
+        try:
+            job = queue_topic_extraction(doc_id, user_key)
+        except QueueFullError as e:
+            finish_shared_extraction(response['content_hash'], 'rejected')
+            retention.evict_document(doc_id, reason='rejected')
+            return queue_full_response(e)
+        
+        logger.info(f"File uploaded successfully: {response['filename']} (ID: {doc_id})")
+        response['job_id'] = job.id
+        return jsonify(response)
+        
+    except (UploadRejected, RequestEntityTooLarge) as e:
+        logger.warning(f"Upload rejected: {str(e)}")
+        return upload_rejected_response(e)
+    except Exception as e:
+        logger.error(f"Upload error: {str(e)}")
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+
+@app.route('/api/upload/batch', methods=['POST'])
+@traced()
+def upload_batch():
+    """Upload many PDFs (or zip archives of PDFs) and extract their topics as one batch"""
+    try:
+        # Reject early when there is no room in the job queue, before the body is read
+        user_key = get_request_user_key()
+        if not scheduler.has_capacity(user_key):
+            return queue_full_response(QueueFullError("Job queue is full", scheduler.retry_after()))
+        
+        # A batch may be much larger than a single upload; each file still streams to disk
+        request.max_content_length = MAX_BATCH_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+        request.defer_upload_errors = True
+        files = [file for file in request.files.getlist('files') if file.filename]
+        if not files:
+            return jsonify({'error': 'No files provided'}), 400
+        
+        batch_id = str(uuid.uuid4())
+        set_attributes(batch_id=batch_id)
+        accepted = []
+        errors = []
+        pending = []
+        pending_jobs = []
+        
+        def add(name, file):
+            if len(accepted) >= MAX_BATCH_FILES:
+                errors.append({'filename': name, 'error': f'Batch limit of {MAX_BATCH_FILES} files reached'})
+                return
+            try:
+                response, needs_extraction = register_upload(file, user_key)
+            except UploadRejected as e:
+                errors.append({'filename': name, 'error': str(e)})
+                return
+            response['filename'] = name
+            accepted.append(response)
+            if needs_extraction:
+                pending.append(response['document_id'])
+        
+        try:
+            for file in files:
+                if file.filename.lower().endswith('.zip'):
+                    try:
+                        for name, member in iter_zip_pdfs(file):
+                            add(name, member)
+                    except UploadRejected as e:
+                        errors.append({'filename': file.filename, 'error': str(e)})
+                elif allowed_file(file.filename):
+                    add(file.filename, file)
+                else:
+                    errors.append({'filename': file.filename, 'error': 'Invalid file type. Only PDF and zip files are allowed.'})
+            
+            if not accepted:
+                return jsonify({'error': 'No valid PDF files in the batch', 'errors': errors}), 400
+            
+            # One scheduler job extracts every new document; identical content is shared
+            job = None
+            if pending:
+                for doc_id in pending:
+                    update_progress(doc_id, 'queued', 0, 'Waiting in queue with its batch...')
+                    pending_jobs.append((doc_id, journal.start_job('extract_topics', doc_id, {
+                        'document': documents[doc_id],
+                        'user_key': user_key
+                    })))
+                job = scheduler.submit(
+                    extract_batch_async, batch_id, pending_jobs,
+                    priority=PRIORITY_EXTRACTION, user_key=user_key, kind='extract_batch'
+                )
+        except Exception as e:
+            # Nothing of a failed batch is kept, and identical uploads do not wait on it
+            discard_uploads(
+                accepted,
+                [r['content_hash'] for r in accepted if r['document_id'] in pending],
+                [journal_id for _, journal_id in pending_jobs]
+            )
+            if isinstance(e, QueueFullError):
+                return queue_full_response(e)
+            raise
+        
+        batches[batch_id] = {
+            'id': batch_id,
+            'user_key': user_key,
+            'files': [{'document_id': r['document_id'], 'filename': r['filename']} for r in accepted],
+            'errors': errors,
+            'job_id': job.id if job else None,
+            'created': datetime.now().isoformat()
+        }
+        retention.touch('batches', batch_id)
+        logger.info(f"Batch {batch_id} uploaded: {len(accepted)} files ({len(pending)} to extract), {len(errors)} rejected")
+        
+        return jsonify({
+            'success': True,
+            'batch_id': batch_id,
+            'job_id': job.id if job else None,
+            'documents': accepted,
+            'errors': errors
+        })
+        
+    except (UploadRejected, RequestEntityTooLarge) as e:
+        logger.warning(f"Batch upload rejected: {str(e)}")
+        return upload_rejected_response(e)
+    except Exception as e:
+        logger.error(f"Batch upload error: {str(e)}")
+        return jsonify({'error': f'Batch upload failed: {str(e)}'}), 500
+
+@app.route('/api/upload/batch/<batch_id>/progress', methods=['GET'])
+def get_batch_progress(batch_id):
+    """Get aggregate and per-file progress of a batch, with topics merged across its documents"""
+    try:
+        batch = batches.get(batch_id)
+        if not batch:
+            return jsonify({'error': 'Batch not found'}), 404
+        retention.touch('batches', batch_id)
+        
+        files = []
+        counts = {}
+        topics_by_doc = {}
+        for file_info in batch['files']:
+            doc_id = file_info['document_id']
+            progress_data = document_progress.get(doc_id)
+            if progress_data:
+                retention.touch_document(doc_id)
+            status = progress_data['status'] if progress_data else 'expired'
+            counts[status] = counts.get(status, 0) + 1
+            topics_by_doc[doc_id] = document_topics.get(doc_id)
+            files.append({
+                'document_id': doc_id,
+                'filename': file_info['filename'],
+                'status': status,
+                'progress': progress_data['progress'] if progress_data else 0,
+                'message': progress_data['message'] if progress_data else 'Document expired',
+                'topics': len(topics_by_doc[doc_id] or [])
+            })
+        
+        finished = sum(counts.get(status, 0) for status in ('completed', 'error', 'cancelled', 'expired'))
+        if finished < len(files):
+            status = 'processing'
+        elif counts.get('completed', 0) == len(files):
+            status = 'completed'
+        elif counts.get('cancelled', 0) == len(files):
+            status = 'cancelled'
+        else:
+            status = 'completed_with_errors'
+        
+        response_data = {
+            'batch_id': batch_id,
+            'status': status,
+            'progress': round(sum(f['progress'] for f in files) / len(files), 1) if files else 100,
+            'files_total': len(files),
+            'files_finished': finished,
+            'counts': counts,
+            'files': files,
+            'errors': batch['errors'],
+            'merged_topics': merge_corpus_topics(topics_by_doc)
         }
+        job = scheduler.get_job(batch['job_id']) if batch.get('job_id') else None
+        if job:
+            response_data['job_id'] = job.id
+            response_data['job_status'] = job.status
+        
+        return jsonify(response_data)
         
-        # Start topic extraction in background
-        executor.submit(extract_topics_async, doc_id, file_path)
+    except Exception as e:
+        logger.error(f"Error getting batch progress for {batch_id}: {str(e)}")
+        return jsonify({'error': f'Failed to get batch progress: {str(e)}'}), 500
+
+@app.route('/api/upload/batch/<batch_id>', methods=['DELETE'])
+def cancel_batch(batch_id):
+    """Cancel the topic extraction of a batch; documents already extracted keep their topics"""
+    try:
+        batch = batches.get(batch_id)
+        job = scheduler.get_job(batch['job_id']) if batch and batch.get('job_id') else None
+        if not job:
+            return jsonify({'error': 'Batch job not found'}), 404
         
-        logger.info(f"File uploaded successfully: {filename} (ID: {doc_id})")
+        if job.status in ('completed', 'failed', 'cancelled'):
+            return jsonify({
+                'success': False,
+                'message': f'Batch job already {job.status}',
+                'job': job.to_dict()
+            }), 409
+        
+        job = scheduler.cancel(job.id)
+        if job.status == 'cancelled':
+            # Cancelled before it started; a running batch cancels its remaining documents itself
+            for doc_id, journal_id in job.args[1]:
+                cancel_pending_extraction(doc_id, journal_id)
+        
+        logger.info(f"Cancelled batch {batch_id} (job status: {job.status})")
         
         return jsonify({
             'success': True,
-            'message': 'File uploaded successfully',
-            'document_id': doc_id,
-            'filename': filename
+            'message': f'Batch job {job.status}',
+            'job': job.to_dict()
         })
         
     except Exception as e:
-        logger.error(f"Upload error: {str(e)}")
-        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+        logger.error(f"Error cancelling batch {batch_id}: {str(e)}")
+        return jsonify({'error': f'Failed to cancel batch: {str(e)}'}), 500
 
 @app.route('/api/documents/<doc_id>/progress', methods=['GET'])
 def get_progress(doc_id):
@@ -527,6 +1262,7 @@ def get_progress(doc_id):
             }), 404
         
         progress_data = document_progress[doc_id]
+        retention.touch_document(doc_id)
         
         # Return current progress as JSON
         response_data = {
@@ -544,6 +1280,21 @@ def get_progress(doc_id):
         if progress_data.get('challenges'):
             response_data['challenges'] = progress_data['challenges']
         
+        # Include queue position and ETA while the job is waiting
+        job = scheduler.job_for_document(doc_id)
+        if job:
+            response_data['job_id'] = job.id
+            response_data['job_status'] = job.status
+            if job.status in ('cancelling', 'cancelled'):
+                response_data['skipped'] = job.cancel_token.skipped_work()
+            position = scheduler.queue_position(job.id) if job.status == 'queued' else None
+            if position:
+                response_data.update(position)
+                response_data['message'] = (
+                    f"Waiting in queue (position {position['queue_position']}, "
+                    f"about {int(position['eta_seconds'])}s)"
+                )
+        
         return jsonify(response_data)
         
     except Exception as e:
@@ -562,6 +1313,7 @@ def get_topics(doc_id):
             return jsonify({'error': 'Topics not found or still processing'}), 404
         
         topics = document_topics[doc_id]
+        retention.touch_document(doc_id)
         return jsonify({
             'success': True,
             'topics': topics,
@@ -573,8 +1325,10 @@ def get_topics(doc_id):
         return jsonify({'error': f'Failed to get topics: {str(e)}'}), 500
 
 @app.route('/api/documents/<doc_id>/generate', methods=['POST'])
+@traced()
 def generate_challenges(doc_id):
     """Generate challenges for selected topics"""
+    set_attributes(doc_id=doc_id)
     try:
         data = request.get_json()
         selected_topics = data.get('topics', [])
@@ -584,19 +1338,73 @@ def generate_challenges(doc_id):
         
         logger.info(f"Starting challenge generation for {doc_id} with {len(selected_topics)} topics")
         
-        # Start challenge generation in background
-        executor.submit(generate_challenges_async, doc_id, selected_topics, {})
+        # Queue challenge generation in background
+        user_key = get_request_user_key()
+        previous_progress = document_progress.get(doc_id)
+        update_progress(doc_id, 'queued', 0, 'Waiting in queue...')
+        journal_id = journal.start_job('generate_challenges', doc_id, {
+            'document': documents.get(doc_id),
+            'topics': selected_topics,
+            'user_key': user_key
+        })
+        try:
+            job = scheduler.submit(
+                generate_challenges_async, doc_id, selected_topics, {}, journal_id=journal_id,
+                priority=PRIORITY_INTERACTIVE, user_key=user_key,
+                doc_id=doc_id, kind='generate_challenges'
+            )
+        except QueueFullError as e:
+            journal.finish_job(journal_id, 'rejected')
+            if previous_progress is not None:
+                document_progress[doc_id] = previous_progress
+            return queue_full_response(e)
         
         return jsonify({
             'success': True,
             'message': f'Started generating challenges for {len(selected_topics)} topics',
-            'document_id': doc_id
+            'document_id': doc_id,
+            'job_id': job.id
         })
         
     except Exception as e:
         logger.error(f"Error starting challenge generation for {doc_id}: {str(e)}")
         return jsonify({'error': f'Failed to start generation: {str(e)}'}), 500
 
+@app.route('/api/documents/<doc_id>/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(doc_id, job_id):
+    """Cancel a queued or running topic extraction / challenge generation job"""
+    try:
+        job = scheduler.get_job(job_id)
+        if not job or job.doc_id != doc_id:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        if job.status in ('completed', 'failed', 'cancelled'):
+            return jsonify({
+                'success': False,
+                'message': f'Job already {job.status}',
+                'job': job.to_dict()
+            }), 409
+        
+        job = scheduler.cancel(job_id)
+        if job.status == 'cancelled':
+            # Cancelled before it started; a running job reports its own progress
+            journal.finish_job(job.kwargs.get('journal_id'), 'cancelled')
+            update_progress(doc_id, 'cancelled', 0, 'Job cancelled before it started')
+            if job.kind == 'extract_topics':
+                finish_shared_extraction(documents.get(doc_id, {}).get('content_hash'), 'cancelled')
+        
+        logger.info(f"Cancelled job {job_id} for {doc_id} (status: {job.status})")
+        
+        return jsonify({
+            'success': True,
+            'message': f'Job {job.status}',
+            'job': job.to_dict()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error cancelling job {job_id} for {doc_id}: {str(e)}")
+        return jsonify({'error': f'Failed to cancel job: {str(e)}'}), 500
+
 # NEW ENDPOINT: Load generated challenges
 @app.route('/api/documents/<doc_id>/challenges', methods=['GET'])
 def get_challenges(doc_id):
@@ -606,6 +1414,7 @@ def get_challenges(doc_id):
             return jsonify({'error': 'Challenges not found or still generating'}), 404
         
         challenges = document_challenges[doc_id]
+        retention.touch_document(doc_id)
         
         # 1) Mark each challenge as AI-generated
         for challenge in challenges:
@@ -635,6 +1444,110 @@ def get_challenges(doc_id):
         return jsonify({'error': f'Failed to get challenges: {e}'}), 500
 
 
+def find_challenges(challenge_ids):
+    """Map each of the ids to its challenge, in one pass over all documents"""
+    wanted = set(challenge_ids)
+    found = {}
+    for challenges in list(document_challenges.values()):
+        for c in challenges:
+            if c.get('id') in wanted:
+                found[c['id']] = c
+        if len(found) == len(wanted):
+            break
+    return found
+
+def start_debugging_evaluation(challenge, submitted_answer):
+    """Start running a debugging fix in the evaluation sandbox; None if there is nothing to run"""
+    if challenge.get('type') != 'debugging' or not isinstance(submitted_answer, str) or not submitted_answer.strip():
+        return None
+    return submit_debugging_challenge(challenge, submitted_answer)
+
+def grade_answer(challenge, submitted_answer, evaluation=None):
+    """Grade an answer; debugging challenges need the sandbox evaluation of the fix"""
+    is_correct = False
+    ungradable = False
+    score = 0
+    feedback = ""
+    test_results = None
+    
+    challenge_type = challenge.get('type', '')
+    
+    if challenge_type == 'multiple-choice':
+        key = answer_keys.get(challenge)
+        submitted_index = grade_multiple_choice(key, submitted_answer)
+        if submitted_index is None:
+            feedback = "Invalid answer format. Please select a valid option."
+        else:
+            is_correct = submitted_index == key['correct']
+            score = 100 if is_correct else 0
+            if is_correct:
+                feedback = challenge.get('explanation', 'Correct!')
+            else:
+                feedback = f"Incorrect. The correct answer is option {key['correct'] + 1}."
+    
+    elif challenge_type == 'debugging':
+        if evaluation is None:
+            feedback = "Submit your fixed version of the code."
+        else:
+            is_correct = evaluation['status'] == 'correct'
+            # Nothing to check the fix against; that is not the student's fault
+            ungradable = evaluation['status'] == 'ungradable'
+            score = 100 if is_correct else 0
+            test_results = evaluation.get('test_results')
+            if is_correct:
+                feedback = challenge.get('fix_explanation', 'Good job fixing the bug!')
+            else:
+                feedback = evaluation['feedback']
+    
+    elif challenge_type == 'fill-in-the-blank':
+        # For fill-in-the-blank, look each blank up in the compiled answer key
+        key = answer_keys.get(challenge)
+        if key['blanks']:
+            counts = grade_fill_in_the_blank(key, submitted_answer)
+            if counts is None:
+                feedback = "Invalid answer format for fill-in-the-blank question."
+            else:
+                correct_count, total_blanks = counts
+                score = (correct_count / total_blanks) * 100
+                is_correct = score >= 80  # 80% threshold for "correct"
+                feedback = f"You got {correct_count}/{total_blanks} blanks correct."
+        else:
+            feedback = "No answer key available for this question."
+    
+    return {'correct': is_correct, 'ungradable': ungradable, 'score': score, 'feedback': feedback,
+            'test_results': test_results}
+
+def record_attempt(state, submitted_answer, graded):
+    """Apply a graded attempt to a challenge state; call with challenge_state_lock held
+    
+    An ungradable attempt is not counted against the student's attempts.
+    """
+    if not graded['ungradable']:
+        state['attempts'] += 1
+    state['last_submission'] = submitted_answer
+    if graded['correct']:
+        state['status'] = 'solved'
+        state['solved_at'] = datetime.now().isoformat()
+        state['best_score'] = max(state['best_score'], graded['score'])
+    
+    result = {
+        'success': True,
+        'correct': graded['correct'],
+        'score': graded['score'],
+        'feedback': graded['feedback'],
+        'attempts': state['attempts'],
+        'max_attempts': state['max_attempts'],
+        'status': state['status']
+    }
+    if graded['ungradable']:
+        result['ungradable'] = True
+    if graded['test_results'] is not None:
+        result['test_results'] = graded['test_results']
+    return result
+
+def attempts_exhausted(state):
+    return state['attempts'] >= state['max_attempts'] and state['status'] != 'solved'
+
 @app.route('/api/challenges/<challenge_id>/attempt', methods=['POST'])
 def submit_attempt(challenge_id):
     """Submit an attempt for a challenge"""
@@ -646,9 +1559,10 @@ def submit_attempt(challenge_id):
             return jsonify({'error': 'Challenge not found'}), 404
         
         state = challenge_states[challenge_id]
+        retention.touch_challenge(challenge_id)
         
         # Check if max attempts reached
-        if state['attempts'] >= state['max_attempts'] and state['status'] != 'solved':
+        if attempts_exhausted(state):
             return jsonify({
                 'success': False,
                 'message': 'Maximum attempts reached',
@@ -657,97 +1571,129 @@ def submit_attempt(challenge_id):
             })
         
         # Find the challenge
-        challenge = None
-        for doc_id, challenges in document_challenges.items():
-            for c in challenges:
-                if c.get('id') == challenge_id:
-                    challenge = c
-                    break
-            if challenge:
-                break
-        
+        challenge = find_challenges([challenge_id]).get(challenge_id)
         if not challenge:
             return jsonify({'error': 'Challenge not found'}), 404
         
-        # Increment attempts
-        state['attempts'] += 1
-        state['last_submission'] = submitted_answer
-        
-        # Check answer based on challenge type
-        is_correct = False
-        score = 0
-        feedback = ""
-        
-        challenge_type = challenge.get('type', '')
-        
-        if challenge_type == 'multiple-choice':
-            correct_answer = challenge.get('correct_answer', 0)
+        # Run a debugging fix in the evaluation sandbox. The wait is bounded so a
+        # busy pool cannot stall the request; a late result still lands in the
+        # evaluation cache, so resubmitting the same fix returns at once.
+        evaluation = None
+        pending = start_debugging_evaluation(challenge, submitted_answer)
+        if pending is not None:
             try:
-                submitted_index = int(submitted_answer)
-                is_correct = submitted_index == correct_answer
-                score = 100 if is_correct else 0
-                if is_correct:
-                    feedback = challenge.get('explanation', 'Correct!')
-                else:
-                    feedback = f"Incorrect. The correct answer is option {correct_answer + 1}."
-            except (ValueError, TypeError):
-                feedback = "Invalid answer format. Please select a valid option."
-        
-        elif challenge_type == 'debugging':
-            # For debugging challenges, check if the submitted code fixes the bug
-            # This is a simplified check - in a real system you'd want to run the code
-            bug_keywords = ['=', '==', '<=', '>=', '!=', 'range', 'len', 'append']
-            submitted_lower = submitted_answer.lower()
-            
-            if any(keyword in submitted_lower for keyword in bug_keywords):
-                is_correct = True
-                score = 100
-                feedback = challenge.get('fix_explanation', 'Good job fixing the bug!')
-            else:
-                feedback = "Try to identify the specific bug in the code. Look at the error message and expected output."
+                evaluation = pending.result(timeout=GRADING_BUDGET_SECONDS)
+            except (FutureTimeoutError, EvaluationBusy):
+                ERRORS.inc(stage='debugging_grading_timeout')
+                return jsonify({
+                    'success': False,
+                    'message': 'Grading is taking longer than usual. Please submit again; this attempt was not counted.',
+                    'attempts': state['attempts'],
+                    'max_attempts': state['max_attempts']
+                }), 503
         
-        elif challenge_type == 'fill-in-the-blank':
-            # For fill-in-the-blank, check against correct answers
-            blanks = challenge.get('blanks', [])
-            if blanks:
-                try:
-                    submitted_answers = json.loads(submitted_answer) if isinstance(submitted_answer, str) else submitted_answer
-                    correct_count = 0
-                    total_blanks = len(blanks)
-                    
-                    for i, blank in enumerate(blanks):
-                        if i < len(submitted_answers):
-                            if submitted_answers[i] == blank.get('correct_answer'):
-                                correct_count += 1
-                    
-                    score = (correct_count / total_blanks) * 100
-                    is_correct = score >= 80  # 80% threshold for "correct"
-                    feedback = f"You got {correct_count}/{total_blanks} blanks correct."
-                    
-                except (json.JSONDecodeError, TypeError, IndexError):
-                    feedback = "Invalid answer format for fill-in-the-blank question."
-            else:
-                feedback = "No answer key available for this question."
+        graded = grade_answer(challenge, submitted_answer, evaluation)
+        with challenge_state_lock:
+            return jsonify(record_attempt(state, submitted_answer, graded))
         
-        # Update state
-        if is_correct:
-            state['status'] = 'solved'
-            state['solved_at'] = datetime.now().isoformat()
-            state['best_score'] = max(state['best_score'], score)
+    except Exception as e:
+        logger.error(f"Error submitting attempt for {challenge_id}: {str(e)}")
+        return jsonify({'error': f'Failed to submit attempt: {str(e)}'}), 500
+
+@app.route('/api/challenges/attempts', methods=['POST'])
+def submit_attempts():
+    """Submit attempts for many challenges at once, e.g. a finished quiz
+    
+    Body: {"attempts": [{"challenge_id": ..., "answer": ...}, ...]}. Debugging fixes
+    are evaluated concurrently under one shared grading budget, then every state
+    update is applied at once: if any fix cannot be graded in time, no attempt of
+    the batch is counted.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        attempts = data.get('attempts')
+        if not isinstance(attempts, list) or not attempts:
+            return jsonify({'error': 'Expected a non-empty "attempts" list'}), 400
+        if len(attempts) > MAX_BATCH_ATTEMPTS:
+            return jsonify({'error': f'At most {MAX_BATCH_ATTEMPTS} attempts per request'}), 413
+        
+        results = [None] * len(attempts)
+        accepted = []  # (index, challenge_id, answer)
+        seen = set()
+        for index, attempt in enumerate(attempts):
+            challenge_id = attempt.get('challenge_id') if isinstance(attempt, dict) else None
+            if not challenge_id or challenge_id not in challenge_states:
+                results[index] = {'challenge_id': challenge_id, 'success': False, 'error': 'Challenge not found'}
+            elif challenge_id in seen:
+                results[index] = {'challenge_id': challenge_id, 'success': False, 'error': 'Duplicate attempt in batch'}
+            else:
+                seen.add(challenge_id)
+                accepted.append((index, challenge_id, attempt.get('answer', '')))
+        
+        challenges = find_challenges(challenge_id for _, challenge_id, _ in accepted)
+        pending = {}
+        for index, challenge_id, answer in accepted:
+            retention.touch_challenge(challenge_id)
+            challenge = challenges.get(challenge_id)
+            state = challenge_states.get(challenge_id)
+            if challenge is None or state is None:
+                results[index] = {'challenge_id': challenge_id, 'success': False, 'error': 'Challenge not found'}
+            elif not attempts_exhausted(state):
+                future = start_debugging_evaluation(challenge, answer)
+                if future is not None:
+                    pending[index] = future
+        
+        # The fixes run side by side on the evaluation workers under one deadline
+        deadline = time.monotonic() + GRADING_BUDGET_SECONDS
+        evaluations = {}
+        try:
+            for index, future in pending.items():
+                evaluations[index] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except (FutureTimeoutError, EvaluationBusy):
+            ERRORS.inc(stage='debugging_grading_timeout')
+            return jsonify({
+                'success': False,
+                'message': 'Grading is taking longer than usual. Please submit again; no attempt was counted.'
+            }), 503
+        
+        graded = {}
+        for index, challenge_id, answer in accepted:
+            if results[index] is None:
+                graded[index] = grade_answer(challenges[challenge_id], answer, evaluations.get(index))
+        
+        with challenge_state_lock:
+            for index, challenge_id, answer in accepted:
+                if results[index] is not None:
+                    continue
+                state = challenge_states.get(challenge_id)
+                if state is None:
+                    results[index] = {'challenge_id': challenge_id, 'success': False, 'error': 'Challenge not found'}
+                elif attempts_exhausted(state):
+                    results[index] = {
+                        'challenge_id': challenge_id,
+                        'success': False,
+                        'message': 'Maximum attempts reached',
+                        'attempts': state['attempts'],
+                        'max_attempts': state['max_attempts']
+                    }
+                else:
+                    results[index] = {'challenge_id': challenge_id, **record_attempt(state, answer, graded[index])}
         
+        recorded = [result for result in results if result.get('success')]
         return jsonify({
             'success': True,
-            'correct': is_correct,
-            'score': score,
-            'feedback': feedback,
-            'attempts': state['attempts'],
-            'max_attempts': state['max_attempts'],
-            'status': state['status']
+            'results': results,
+            'summary': {
+                'submitted': len(attempts),
+                'recorded': len(recorded),
+                'correct': sum(1 for result in recorded if result['correct']),
+                'score': round(sum(result['score'] for result in recorded) / len(recorded), 1) if recorded else 0
+            }
         })
         
     except Exception as e:
-        logger.error(f"Error submitting attempt for {challenge_id}: {str(e)}")
-        return jsonify({'error': f'Failed to submit attempt: {str(e)}'}), 500
+        logger.error(f"Error submitting attempt batch: {str(e)}")
+        return jsonify({'error': f'Failed to submit attempts: {str(e)}'}), 500
 
 @app.route('/api/challenges/<challenge_id>/hint', methods=['GET'])
 def get_hint(challenge_id):
@@ -774,6 +1720,7 @@ def get_hint(challenge_id):
                 # Cache the hint for future use
                 challenge['hint'] = hint
             except Exception as e:
+                ERRORS.inc(stage='hint_generation')
                 logger.warning(f"Failed to generate hint for {challenge_id}: {e}")
                 hint = f"Think about the key concepts in {challenge.get('topic', 'this topic')}."
         
@@ -793,7 +1740,8 @@ def get_challenge_state(challenge_id):
         if challenge_id not in challenge_states:
             return jsonify({'error': 'Challenge not found'}), 404
         
-        state = challenge_states[challenge_id]
+        with challenge_state_lock:
+            state = dict(challenge_states[challenge_id])
         return jsonify({
             'success': True,
             'state': state
@@ -803,6 +1751,196 @@ def get_challenge_state(challenge_id):
         logger.error(f"Error getting state for {challenge_id}: {str(e)}")
         return jsonify({'error': f'Failed to get challenge state: {str(e)}'}), 500
 
+@app.route('/api/admin/retention', methods=['GET'])
+@require_admin
+def get_retention_stats():
+    """Get eviction counters and resident sizes of the in-memory stores"""
+    try:
+        return jsonify({
+            'success': True,
+            'retention': retention.stats()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting retention stats: {str(e)}")
+        return jsonify({'error': f'Failed to get retention stats: {str(e)}'}), 500
+
+@app.route('/api/admin/blobs', methods=['GET'])
+@require_admin
+def get_blob_stats():
+    """Get deduplication counters and disk usage of the content-addressed upload store"""
+    try:
+        return jsonify({
+            'success': True,
+            'blobs': blob_store.stats()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting blob stats: {str(e)}")
+        return jsonify({'error': f'Failed to get blob stats: {str(e)}'}), 500
+
+@app.route('/api/admin/challenge-bank', methods=['GET'])
+@require_admin
+def get_challenge_bank_stats():
+    """Get hit/miss counters and contents of the pregenerated challenge bank"""
+    try:
+        if not challenge_bank:
+            return jsonify({'success': True, 'enabled': False})
+        return jsonify({
+            'success': True,
+            'enabled': True,
+            'challenge_bank': challenge_bank.stats()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting challenge bank stats: {str(e)}")
+        return jsonify({'error': f'Failed to get challenge bank stats: {str(e)}'}), 500
+
+@app.route('/api/admin/evaluation-cache', methods=['GET'])
+@require_admin
+def get_evaluation_cache_stats():
+    """Get hit rate and size of the submission evaluation cache"""
+    try:
+        return jsonify({
+            'success': True,
+            'evaluation_cache': evaluation_cache.stats()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting evaluation cache stats: {str(e)}")
+        return jsonify({'error': f'Failed to get evaluation cache stats: {str(e)}'}), 500
+
+@app.route('/api/admin/answer-keys', methods=['GET'])
+@require_admin
+def get_answer_key_stats():
+    """Get size and hit counts of the compiled answer key index"""
+    try:
+        return jsonify({
+            'success': True,
+            'answer_keys': answer_keys.stats()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting answer key stats: {str(e)}")
+        return jsonify({'error': f'Failed to get answer key stats: {str(e)}'}), 500
+
+@app.route('/api/admin/jobs', methods=['GET'])
+@require_admin
+def get_job_stats():
+    """Get job queue depth and worker utilization"""
+    try:
+        return jsonify({
+            'success': True,
+            'jobs': scheduler.stats(),
+            'pools': get_pool_stats()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting job stats: {str(e)}")
+        return jsonify({'error': f'Failed to get job stats: {str(e)}'}), 500
+
+@app.route('/api/admin/traces/<doc_id>', methods=['GET'])
+@require_admin
+def get_document_traces(doc_id):
+    """Get the recorded spans and critical paths of every trace for a document"""
+    try:
+        traces = tracer.traces_for_document(doc_id)
+        if not traces:
+            return jsonify({'error': 'No traces recorded for this document'}), 404
+        
+        return jsonify({
+            'success': True,
+            'doc_id': doc_id,
+            'traces': traces
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting traces for {doc_id}: {str(e)}")
+        return jsonify({'error': f'Failed to get traces: {str(e)}'}), 500
+
+@app.route('/api/admin/profile', methods=['POST'])
+@require_admin
+def start_profile():
+    """Profile the whole process for N seconds, or a document's running/next job"""
+    try:
+        data = request.get_json() or {}
+        interval = float(data.get('interval', PROFILE_SAMPLE_INTERVAL))
+        if interval <= 0:
+            return jsonify({'error': 'interval must be positive'}), 400
+        
+        if data.get('doc_id'):
+            doc_id = data['doc_id']
+            job = scheduler.job_for_document(doc_id)
+            running_job = job if job and job.status == 'running' else None
+            profile = profiler.profile_document(doc_id, data.get('kind'), interval, running_job=running_job)
+        elif data.get('seconds'):
+            seconds = float(data['seconds'])
+            if seconds <= 0:
+                return jsonify({'error': 'seconds must be positive'}), 400
+            profile = profiler.profile_process(seconds, interval)
+        else:
+            return jsonify({'error': 'Provide doc_id or seconds'}), 400
+        
+        return jsonify({
+            'success': True,
+            'profile': profile.to_dict()
+        }), 202
+        
+    except ProfilerBusyError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        logger.error(f"Error starting profile: {str(e)}")
+        return jsonify({'error': f'Failed to start profile: {str(e)}'}), 500
+
+@app.route('/api/admin/profile', methods=['GET'])
+@require_admin
+def list_profiles():
+    """List recent profile sessions"""
+    try:
+        return jsonify({
+            'success': True,
+            'profiles': profiler.sessions()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error listing profiles: {str(e)}")
+        return jsonify({'error': f'Failed to list profiles: {str(e)}'}), 500
+
+@app.route('/api/admin/profile/<session_id>', methods=['GET'])
+@require_admin
+def get_profile_session(session_id):
+    """Get the status, output files and top functions of a profile session"""
+    try:
+        profile = profiler.get_session(session_id)
+        if not profile:
+            return jsonify({'error': 'Profile not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'profile': profile.to_dict()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting profile {session_id}: {str(e)}")
+        return jsonify({'error': f'Failed to get profile: {str(e)}'}), 500
+
+@app.route('/metrics', methods=['GET'])
+@require_admin
+def get_metrics():
+    """Prometheus text exposition of latency histograms, counters and gauges
+    
+    Scrapers authenticate with the ADMIN_API_TOKEN bearer token.
+    """
+    try:
+        return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+        
+    except Exception as e:
+        logger.error(f"Error rendering metrics: {str(e)}")
+        return jsonify({'error': f'Failed to render metrics: {str(e)}'}), 500
+
 if __name__ == '__main__':
+    # The reloader's parent process only watches files; the child it starts serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_services()
     app.run(host='0.0.0.0', port=5000, debug=True)
 
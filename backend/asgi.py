@@ -0,0 +1,184 @@
+"""
+ASGI serving mode for the PQGen backend.
+
+Run with an ASGI server, for example:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+Async views (register/login) are awaited directly on the server's event loop,
+so their Firestore and bcrypt work (offloaded to threads in database.py and
+auth.py) overlaps across concurrent requests instead of each request spinning
+up its own loop. All other routes are the unchanged Flask views, run in a
+thread pool so polls and uploads do not block the loop. Request bodies are
+held to the app's upload size limits while they arrive. Endpoints and JSON
+contracts are identical to the WSGI app.
+"""
+
+import os
+import asyncio
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from asgiref.wsgi import WsgiToAsgiInstance
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+
+from app import app, start_services, upload_rejected_response
+from upload_ingest import MAX_BATCH_UPLOAD_BYTES, MULTIPART_OVERHEAD_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 32))
+
+# Thread pool for the synchronous Flask views
+wsgi_executor = ThreadPoolExecutor(max_workers=ASGI_WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+
+# Pools, background threads and journal recovery of this serving process
+start_services()
+
+
+def _body_limit(scope) -> int:
+    """Largest request body the route accepts; batch uploads get the larger batch limit"""
+    if scope['path'] == '/api/upload/batch':
+        return MAX_BATCH_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+    return app.config['MAX_CONTENT_LENGTH']
+
+
+async def _read_body(receive, limit: int) -> SpooledTemporaryFile:
+    """Collect the request body from http.request messages, stopping once it passes `limit` bytes"""
+    body = SpooledTemporaryFile(max_size=65536)
+    received = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        received += len(chunk)
+        if received > limit:
+            body.close()
+            raise RequestEntityTooLarge()
+        body.write(chunk)
+        if not message.get('more_body'):
+            break
+    body.seek(0)
+    return body
+
+
+def _build_environ(scope, body) -> dict:
+    """Translate an ASGI HTTP scope into a WSGI environ"""
+    instance = WsgiToAsgiInstance(app)
+    instance.scope = scope
+    return instance.build_environ(scope, body)
+
+
+def _match_async_view(scope):
+    """Return (view, view_args) when the request targets an `async def` view"""
+    if scope['method'] == 'OPTIONS':
+        return None, None
+    adapter = app.url_map.bind('localhost', script_name=scope.get('root_path') or None)
+    try:
+        endpoint, view_args = adapter.match(scope['path'], method=scope['method'])
+    except HTTPException:
+        return None, None
+    view = app.view_functions.get(endpoint)
+    if view is not None and inspect.iscoroutinefunction(view):
+        return view, view_args
+    return None, None
+
+
+async def _send_response(send, status: int, headers, body_chunks):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+    })
+    for chunk in body_chunks:
+        if chunk:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _send_too_large(send, error: RequestEntityTooLarge):
+    """Answer an oversized body with the same 413 the Flask views give"""
+    with app.app_context():
+        response = app.make_response(upload_rejected_response(error))
+    await _send_response(send, response.status_code, response.headers.items(), [response.get_data()])
+
+
+async def _call_async_view(scope, body, send, view, view_args):
+    """Run an async Flask view natively on the event loop"""
+    environ = _build_environ(scope, body)
+    with app.request_context(environ):
+        try:
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await view(**view_args)
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            response = app.finalize_request(rv)
+        except Exception as e:
+            response = app.handle_exception(e)
+        await _send_response(send, response.status_code, response.headers.items(), [response.get_data()])
+
+
+def _run_wsgi(environ):
+    """Run the Flask WSGI app in a worker thread and buffer its response"""
+    result = {}
+
+    def start_response(status, headers, exc_info=None):
+        result['status'] = int(status.split(' ', 1)[0])
+        result['headers'] = headers
+
+    iterable = app(environ, start_response)
+    try:
+        chunks = [chunk for chunk in iterable]
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    return result['status'], result['headers'], chunks
+
+
+async def _call_wsgi_view(scope, body, send):
+    """Run a synchronous Flask view in the WSGI thread pool"""
+    environ = _build_environ(scope, body)
+    loop = asyncio.get_running_loop()
+    status, headers, chunks = await loop.run_in_executor(wsgi_executor, _run_wsgi, environ)
+    await _send_response(send, status, headers, chunks)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            logger.info("ASGI serving mode started")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            wsgi_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI application entry point"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    # The size limits apply while reading: an oversized body is never buffered in full
+    try:
+        body = await _read_body(receive, _body_limit(scope))
+    except RequestEntityTooLarge as e:
+        await _send_too_large(send, e)
+        return
+
+    view, view_args = _match_async_view(scope)
+    with body:
+        if view is not None:
+            await _call_async_view(scope, body, send, view, view_args)
+        else:
+            await _call_wsgi_view(scope, body, send)
@@ -4,7 +4,9 @@ User Authentication and Management with Firestore Integration
 
 import os
 import jwt
+import hmac
 import bcrypt
+import asyncio
 import logging
 from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Tuple
@@ -23,6 +25,10 @@ logger = logging.getLogger(__name__)
 JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24 * 7  # 7 days
+# Accounts allowed on the /api/admin endpoints, by email
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv('ADMIN_EMAILS', '').split(',') if email.strip()}
+# Static bearer token for the admin endpoints, for scrapers and scripts that cannot log in
+ADMIN_API_TOKEN = os.getenv('ADMIN_API_TOKEN', '')
 
 class AuthManager:
     """Handles user authentication and session management"""
@@ -51,8 +57,10 @@ class AuthManager:
                 if any(user.get('email') == email for user in self.users.values()):
                     return False, "Email already registered", None
             
-            # Hash password
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            # Hash password (CPU-heavy; keep it off the event loop)
+            password_hash = (await asyncio.to_thread(
+                bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt()
+            )).decode('utf-8')
             
             # Create user data
             user_data = {
@@ -115,8 +123,11 @@ class AuthManager:
             if not user:
                 return False, "Invalid email or password", None
             
-            # Check password
-            if not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+            # Check password (CPU-heavy; keep it off the event loop)
+            password_ok = await asyncio.to_thread(
+                bcrypt.checkpw, password.encode('utf-8'), user['password_hash'].encode('utf-8')
+            )
+            if not password_ok:
                 return False, "Invalid email or password", None
             
             # Check if user is active
@@ -248,6 +259,26 @@ def require_auth(f):
     
     return decorated_function
 
+def require_admin(f):
+    """Decorator to require an admin: the ADMIN_API_TOKEN bearer token, or a user listed in ADMIN_EMAILS"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        auth_header = request.headers.get('Authorization') or ''
+        if ADMIN_API_TOKEN and auth_header.startswith('Bearer '):
+            if hmac.compare_digest(auth_header.split(' ', 1)[1].encode(), ADMIN_API_TOKEN.encode()):
+                return f(*args, **kwargs)
+        
+        @require_auth
+        def admin_only():
+            user = get_current_user()
+            if (user.get('email') or '').lower() not in ADMIN_EMAILS:
+                return jsonify({'error': 'Admin access required'}), 403
+            return f(*args, **kwargs)
+        
+        return admin_only()
+    
+    return decorated_function
+
 def get_current_user() -> Optional[Dict]:
     """Get current authenticated user from request context"""
     return getattr(request, 'current_user', None)
@@ -0,0 +1,283 @@
+"""
+Benchmarks for the text analysis and LLM-output parsing hot paths.
+
+Every function is run against deterministic synthetic inputs (see
+synthetic.py): code-heavy and prose-heavy course texts from 10 KB up to
+10 MB, malformed model replies and noisy topic lists. For each case the
+median wall time, throughput and peak traced memory are reported and
+compared against a stored baseline; a case whose best time or memory grew
+by more than the threshold is flagged as a regression and the run exits 1.
+Best times are compared after dividing out the run's machine speed factor
+(the median slowdown across all cases), so a machine that is momentarily
+slower across the board is not reported as a regression; flagged cases are
+re-run before they are reported.
+
+Everything runs offline on the CPU, no API key needed:
+
+    python benchmarks/run_benchmarks.py                   # 10 KB - 1 MB texts
+    python benchmarks/run_benchmarks.py --full            # adds the 10 MB texts
+    python benchmarks/run_benchmarks.py --save-baseline   # record a new baseline
+
+Baselines are machine specific; record one on the machine you compare on.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import statistics
+import tracemalloc
+from typing import Dict, List, Any, Callable, Tuple
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+import synthetic
+
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+QUICK_SIZES = ('10KB', '100KB', '1MB')
+JSON_EXPECTED_KEYS = ['question', 'options', 'correct_answer', 'explanation']
+
+# (name, function, args, work units per call, unit)
+Case = Tuple[str, Callable, tuple, float, str]
+
+
+def load_functions() -> Dict[str, Callable]:
+    """Import the functions under test"""
+    import pdf_content_analyzer
+    import llm_challenge_generator
+
+    # Per-call log lines would dominate the timings of the small cases
+    logging.disable(logging.WARNING)
+    return {
+        'analyze_pdf_content': pdf_content_analyzer.analyze_pdf_content,
+        'extract_topics_from_headings': pdf_content_analyzer.extract_topics_from_headings,
+        'extract_code_snippets': pdf_content_analyzer.extract_code_snippets,
+        'extract_and_parse_json': llm_challenge_generator.extract_and_parse_json,
+        'validate_topics': pdf_content_analyzer.validate_topics,
+        'validate_topics_llm': llm_challenge_generator.validate_topics,
+        'get_topic_snippet': pdf_content_analyzer.get_topic_snippet,
+    }
+
+
+def build_cases(functions: Dict[str, Callable], sizes: List[str]) -> List[Case]:
+    cases = []
+    for kind in synthetic.COURSE_KINDS:
+        for label in sizes:
+            text = synthetic.course_text(synthetic.COURSE_SIZES[label], kind)
+            for name in ('analyze_pdf_content', 'extract_topics_from_headings', 'extract_code_snippets'):
+                cases.append((f"{name}[{kind}-{label}]", functions[name], (text,), len(text), 'B'))
+            # Topic near the end of the text, and a topic that never occurs (full scan plus fallback)
+            tail_topic = text[-200:].split()[0]
+            cases.append((f"get_topic_snippet[{kind}-{label}-found]", functions['get_topic_snippet'],
+                          (text, tail_topic), len(text), 'B'))
+            cases.append((f"get_topic_snippet[{kind}-{label}-missing]", functions['get_topic_snippet'],
+                          (text, 'Quantum Annealing'), len(text), 'B'))
+
+    for case_name, reply in synthetic.llm_outputs():
+        cases.append((f"extract_and_parse_json[{case_name}]", functions['extract_and_parse_json'],
+                      (reply, JSON_EXPECTED_KEYS), len(reply), 'B'))
+
+    topics = synthetic.raw_topics()
+    content = synthetic.course_text(synthetic.COURSE_SIZES['10KB'], 'code')
+    cases.append(("validate_topics[app-1000]", functions['validate_topics'], (topics, content), len(topics), 'topics'))
+    cases.append(("validate_topics[llm-1000]", functions['validate_topics_llm'], (topics,), len(topics), 'topics'))
+    return cases
+
+
+def time_case(func: Callable, args: tuple, min_time: float, max_repeats: int) -> List[float]:
+    """Wall time of repeated calls; repeats until min_time has elapsed or max_repeats is hit"""
+    func(*args)  # warm regex caches and lazy imports
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_repeats:
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+        if time.perf_counter() - started >= min_time and len(timings) >= 3:
+            break
+        if timings[0] >= min_time:
+            break  # a single call is already slower than the budget
+    return timings
+
+
+def peak_memory(func: Callable, args: tuple) -> int:
+    """Peak bytes allocated by one call, as seen by tracemalloc"""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_cases(cases: List[Case], min_time: float, max_repeats: int) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for name, func, args, work, unit in cases:
+        timings = time_case(func, args, min_time, max_repeats)
+        median = statistics.median(timings)
+        results[name] = {
+            'best_seconds': min(timings),
+            'median_seconds': median,
+            'throughput': work / median if median > 0 else 0.0,
+            'unit': f"{unit}/s",
+            'peak_bytes': peak_memory(func, args),
+            'repeats': len(timings)
+        }
+        print(f"  {name:<60} {format_seconds(min(timings)):>10} {format_seconds(median):>10}  "
+              f"{format_throughput(results[name]):>14}  "
+              f"{format_bytes(results[name]['peak_bytes']):>10}", flush=True)
+    return results
+
+
+def speed_factor(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]) -> float:
+    """Median best-time ratio against the baseline, i.e. how much slower the machine is right now"""
+    ratios = [result['best_seconds'] / baseline[name]['best_seconds']
+              for name, result in results.items() if baseline.get(name, {}).get('best_seconds')]
+    if len(ratios) < 5:
+        return 1.0  # too few cases to tell machine drift from a regression
+    return statistics.median(ratios)
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float, memory_threshold: float, factor: float = 1.0) -> List[Tuple[str, str]]:
+    """(case, message) for every case slower or hungrier than the baseline allows"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        time_ratio = result['best_seconds'] / (base['best_seconds'] * factor) if base['best_seconds'] else 1.0
+        memory_ratio = result['peak_bytes'] / base['peak_bytes'] if base['peak_bytes'] else 1.0
+        if time_ratio > 1 + threshold:
+            regressions.append((name, f"{name}: {time_ratio:.2f}x slower "
+                               f"({format_seconds(base['best_seconds'])} -> {format_seconds(result['best_seconds'])})"))
+        if memory_ratio > 1 + memory_threshold:
+            regressions.append((name, f"{name}: {memory_ratio:.2f}x more memory "
+                               f"({format_bytes(base['peak_bytes'])} -> {format_bytes(result['peak_bytes'])})"))
+    return regressions
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f}us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f}ms"
+    return f"{seconds:.2f}s"
+
+
+def format_bytes(size: float) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+def format_throughput(result: Dict[str, Any]) -> str:
+    if result['unit'] == 'B/s':
+        return f"{format_bytes(result['throughput'])}/s"
+    return f"{result['throughput']:.0f} {result['unit']}"
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, results: Dict[str, Dict[str, Any]]):
+    cases = load_baseline(path).get('cases', {})
+    cases.update(results)  # a quick run keeps the stored 10 MB cases
+    baseline = {
+        'python': platform.python_version(),
+        'machine': f"{platform.system()} {platform.machine()}",
+        'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'cases': dict(sorted(cases.items()))
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+        f.write('\n')
+    print(f"Baseline with {len(cases)} cases written to {path}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the PQGen analysis and parsing hot paths')
+    parser.add_argument('--full', action='store_true', help='include the 10 MB course texts')
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this string')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown before flagging (0.25 = 25%%)')
+    parser.add_argument('--memory-threshold', type=float, default=0.10, help='allowed peak-memory growth before flagging')
+    parser.add_argument('--min-time', type=float, default=0.5, help='seconds to spend timing each case')
+    parser.add_argument('--max-repeats', type=int, default=200, help='upper bound on timed calls per case')
+    parser.add_argument('--no-normalize', action='store_true', help='compare raw times without the machine speed factor')
+    parser.add_argument('--confirm', type=int, default=2, help='times to re-run flagged cases before reporting them')
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args(argv)
+    # load_functions() changes the working directory
+    args.baseline = os.path.abspath(args.baseline)
+    args.output = os.path.abspath(args.output) if args.output else None
+
+    sizes = list(synthetic.COURSE_SIZES) if args.full else list(QUICK_SIZES)
+    cases = [case for case in build_cases(load_functions(), sizes) if args.filter in case[0]]
+    print(f"Running {len(cases)} benchmark cases ({', '.join(sizes)} course texts)")
+    print(f"  {'case':<60} {'best':>10} {'median':>10}  {'throughput':>14}  {'peak mem':>10}")
+    results = run_cases(cases, args.min_time, args.max_repeats)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+    if baseline.get('machine') != f"{platform.system()} {platform.machine()}":
+        print(f"Warning: baseline was recorded on {baseline.get('machine')}; timings may not be comparable")
+
+    factor = 1.0
+    if args.no_normalize or args.filter:
+        print("Comparing raw times (a filtered run may share one regression, so no speed factor)")
+    else:
+        factor = speed_factor(results, baseline.get('cases', {}))
+        print(f"Machine speed factor vs baseline: {factor:.2f} (divided out of every comparison)")
+    regressions = compare(results, baseline.get('cases', {}), args.threshold, args.memory_threshold, factor)
+
+    # Re-time flagged cases so a one-off stall on a shared machine is not reported
+    for _ in range(args.confirm):
+        flagged = {name for name, _ in regressions}
+        if not flagged:
+            break
+        print(f"Re-running {len(flagged)} flagged cases to confirm")
+        for name, result in run_cases([case for case in cases if case[0] in flagged],
+                                      args.min_time, args.max_repeats).items():
+            results[name]['best_seconds'] = min(results[name]['best_seconds'], result['best_seconds'])
+            results[name]['peak_bytes'] = min(results[name]['peak_bytes'], result['peak_bytes'])
+        regressions = compare(results, baseline.get('cases', {}), args.threshold, args.memory_threshold, factor)
+    missing = [name for name in results if name not in baseline.get('cases', {})]
+    if missing:
+        print(f"{len(missing)} cases have no baseline entry yet")
+    if regressions:
+        print(f"\n{len(regressions)} regressions against {args.baseline}:")
+        for _, message in regressions:
+            print(f"  {message}")
+        return 1
+    print(f"\nNo regressions against {args.baseline} (threshold {args.threshold:.0%} time, "
+          f"{args.memory_threshold:.0%} memory)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Deterministic synthetic inputs for the benchmark suite.
+
+Course texts are assembled from headings, prose paragraphs, fenced and
+indented code blocks and inline code, in proportions that make them either
+code-heavy or prose-heavy. LLM outputs cover every branch of
+parse_json_with_strategies, from clean JSON to replies that only the manual
+key extraction (or nothing) can recover.
+"""
+
+import json
+import random
+from typing import Dict, List, Tuple
+
+TOPICS = [
+    'Functions', 'Loops', 'Recursion', 'Classes', 'Inheritance', 'Exceptions',
+    'Lists', 'Dictionaries', 'Sorting', 'Binary Search', 'Linked Lists',
+    'Stacks and Queues', 'Hash Tables', 'File Handling', 'Generators',
+    'Decorators', 'Dynamic Programming', 'Graph Traversal', 'String Methods',
+    'Variables and Data Types'
+]
+
+WORDS = (
+    'the a program value function variable loop list element index return call '
+    'student example memory time data structure algorithm input output result '
+    'object method parameter argument condition iteration case step simple each '
+    'when then because therefore notice important following before after this'
+).split()
+
+CODE_TEMPLATES = [
+    "def {name}(items):\n    total = 0\n    for item in items:\n        if item > 0:\n            total += item\n    return total\n",
+    "class {cls}:\n    def __init__(self, value):\n        self.value = value\n\n    def {name}(self):\n        return self.value * 2\n",
+    "def {name}(n):\n    if n <= 1:\n        return n\n    return {name}(n - 1) + {name}(n - 2)\n",
+    "try:\n    result = {name}(data)\nexcept ValueError as error:\n    print(error)\nfinally:\n    cleanup()\n",
+    "import json\n\nwith open('data.json') as f:\n    records = json.load(f)\nfor key, value in records.items():\n    print(key, value)\n",
+    "while low <= high:\n    mid = (low + high) // 2\n    if items[mid] == target:\n        return mid\n    low = mid + 1\n",
+]
+
+COURSE_KINDS = ('code', 'prose')
+COURSE_SIZES = {'10KB': 10_000, '100KB': 100_000, '1MB': 1_000_000, '10MB': 10_000_000}
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 18))]
+    if rng.random() < 0.3:
+        words.insert(rng.randrange(len(words)), rng.choice(TOPICS).lower())
+    return ' '.join(words).capitalize() + '.'
+
+
+def _paragraph(rng: random.Random) -> str:
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+
+
+def _code(rng: random.Random) -> str:
+    template = rng.choice(CODE_TEMPLATES)
+    return template.format(name=f"helper_{rng.randint(1, 999)}", cls=f"Node{rng.randint(1, 99)}")
+
+
+def _heading(rng: random.Random, section: int) -> str:
+    topic = rng.choice(TOPICS)
+    style = rng.randrange(4)
+    if style == 0:
+        return f"# {topic}"
+    if style == 1:
+        return f"{section}. {topic} in Python"
+    if style == 2:
+        return f"{topic.upper()}"
+    return f"{topic}:"
+
+
+def course_text(size: int, kind: str = 'code', seed: int = 0) -> str:
+    """Course notes of roughly `size` characters; kind is 'code' or 'prose'"""
+    if kind not in COURSE_KINDS:
+        raise ValueError(f"Unknown course kind {kind!r}; expected one of {COURSE_KINDS}")
+    rng = random.Random(f"{kind}-{size}-{seed}")
+    code_ratio = 0.6 if kind == 'code' else 0.08
+    parts = []
+    length = 0
+    section = 1
+    while length < size:
+        if rng.random() < 0.15:
+            block = _heading(rng, section)
+            section += 1
+        elif rng.random() < code_ratio:
+            code = _code(rng)
+            if rng.random() < 0.5:
+                block = f"```python\n{code}```"
+            else:
+                block = '\n'.join('    ' + line for line in code.splitlines())
+        else:
+            block = _paragraph(rng)
+            if kind == 'code' and rng.random() < 0.4:
+                block += f" Use `return {rng.choice(WORDS)}` to exit early."
+        parts.append(block)
+        length += len(block) + 2
+    return '\n\n'.join(parts)[:size]
+
+
+def _challenge(rng: random.Random, padding: int = 0) -> Dict[str, str]:
+    topic = rng.choice(TOPICS)
+    return {
+        'question': f"Which statement about {topic.lower()} is correct? " + _paragraph(rng) * (1 + padding),
+        'options': [_sentence(rng) for _ in range(4)],
+        'correct_answer': 'A',
+        'explanation': _paragraph(rng)
+    }
+
+
+def llm_outputs(seed: int = 0) -> List[Tuple[str, str]]:
+    """(case name, raw model reply) pairs exercising every JSON parsing strategy"""
+    rng = random.Random(f"llm-{seed}")
+    challenge = _challenge(rng)
+    clean = json.dumps(challenge, indent=2)
+    large = json.dumps(_challenge(rng, padding=200), indent=2)
+
+    single_quoted = "{" + ", ".join(f"'{key}': '{value}'" for key, value in challenge.items() if isinstance(value, str)) + ",}"
+    truncated = clean[:len(clean) * 2 // 3]
+
+    return [
+        ('direct', clean),
+        ('direct_large', large),
+        ('code_block', f"Here is the challenge you asked for:\n```json\n{clean}\n```\nLet me know if you need more."),
+        ('prose_wrapped', f"{_paragraph(rng)}\n{clean}\n{_paragraph(rng)}"),
+        ('trailing_commas', clean.replace('"\n}', '",\n}').replace('"\n  ]', '",\n  ]')),
+        ('single_quotes', single_quoted),
+        ('truncated', truncated),
+        ('prose_large', '\n'.join(_paragraph(rng) for _ in range(400)) + '\n' + large),
+        ('garbage', ' '.join(_paragraph(rng) for _ in range(20))),
+    ]
+
+
+def raw_topics(count: int = 1000, seed: int = 0) -> List[str]:
+    """Topic candidates as an LLM or the heuristics might return them, noise included"""
+    rng = random.Random(f"topics-{seed}")
+    noise = ['', '  ', '42', '--', 'ok', None, 'x' * 80, '## 1.2']
+    topics = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.2:
+            topics.append(rng.choice(noise))
+        elif roll < 0.5:
+            topics.append(rng.choice(TOPICS).lower().replace(' ', '_'))
+        else:
+            topics.append(f"  {rng.choice(TOPICS)} ")
+    return topics
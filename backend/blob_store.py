@@ -0,0 +1,177 @@
+"""
+Content-addressed store for uploaded PDFs and the results derived from them.
+
+Every upload is stored once, as blobs/<aa>/<sha256>.pdf. A document's own
+upload path (uploads/<doc_id>_<filename>) is a hard link to that blob, so
+identical uploads use no extra disk and the filesystem link count is the
+blob's reference count: deleting a document's file (retention eviction)
+releases its reference without any bookkeeping. Next to each blob the store
+keeps the extracted text (<sha256>.txt) and the topic result
+(<sha256>.json), so documents with identical content share one extraction.
+
+collect_garbage() deletes blobs no document links to any more, together
+with their cached results, once they have been unreferenced for a grace
+period (a re-upload within the grace period still finishes instantly).
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+BLOB_GC_GRACE_SECONDS = int(os.getenv('BLOB_GC_GRACE_SECONDS', 3600))
+
+# Metrics
+BLOB_DEDUP = counter('pqgen_blob_dedup_total', 'Uploads whose content was already known, by what was shared', ['shared'])
+
+
+class BlobStore:
+    """Uploads keyed by content hash, shared between documents through hard links"""
+
+    def __init__(self, folder: str, gc_grace: int = BLOB_GC_GRACE_SECONDS):
+        self.folder = folder
+        self.gc_grace = gc_grace
+        self._lock = threading.Lock()
+        self._stats = {'stored': 0, 'deduplicated': 0, 'bytes_saved': 0, 'copied': 0, 'collected': 0}
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, content_hash: str, suffix: str) -> str:
+        return os.path.join(self.folder, content_hash[:2], f"{content_hash}{suffix}")
+
+    def blob_path(self, content_hash: str) -> str:
+        return self._path(content_hash, '.pdf')
+
+    def adopt(self, file_path: str, content_hash: str) -> bool:
+        """
+        Make file_path a reference to the blob for content_hash, storing the file
+        as that blob when the content is new. Returns True if the content was
+        already stored (the upload was a duplicate).
+        """
+        blob = self.blob_path(content_hash)
+        with self._lock:
+            if os.path.exists(blob):
+                # Swap the freshly written copy for a link to the existing blob
+                size = os.path.getsize(file_path)
+                temp_path = f"{file_path}.link"
+                self._link(blob, temp_path)
+                os.replace(temp_path, file_path)
+                self._stats['deduplicated'] += 1
+                self._stats['bytes_saved'] += size
+                BLOB_DEDUP.inc(shared='blob')
+                return True
+
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            self._link(file_path, blob)
+            self._stats['stored'] += 1
+            return False
+
+    def _link(self, src: str, dest: str):
+        try:
+            os.link(src, dest)
+        except OSError as e:
+            # Filesystems without hard links get a copy: correct, just not deduplicated
+            logger.warning(f"Hard link {src} -> {dest} failed ({e}); copying instead")
+            shutil.copyfile(src, dest)
+            self._stats['copied'] += 1
+
+    def refcount(self, content_hash: str) -> int:
+        """Number of documents whose upload links to the blob"""
+        try:
+            return os.stat(self.blob_path(content_hash)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    # Shared results
+    def _write_atomic(self, path: str, data: str):
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def save_text(self, content_hash: str, text: str):
+        """Cache the text extracted from a blob"""
+        if os.path.exists(self.blob_path(content_hash)):
+            self._write_atomic(self._path(content_hash, '.txt'), text)
+
+    def load_text(self, content_hash: str) -> Optional[str]:
+        try:
+            with open(self._path(content_hash, '.txt'), encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def save_result(self, content_hash: str, result: Dict[str, Any]):
+        """Cache the topic-extraction result for a blob"""
+        if os.path.exists(self.blob_path(content_hash)):
+            self._write_atomic(self._path(content_hash, '.json'), json.dumps(result))
+
+    def load_result(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(content_hash, '.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Discarding unreadable cached result for {content_hash}: {e}")
+            return None
+
+    # Garbage collection
+    def collect_garbage(self, now: Optional[float] = None) -> int:
+        """Delete blobs (and their cached results) that no document has linked to for gc_grace seconds"""
+        now = now or time.time()
+        removed = 0
+        for shard in os.scandir(self.folder):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith('.pdf'):
+                    continue
+                content_hash = entry.name[:-len('.pdf')]
+                with self._lock:
+                    try:
+                        st = os.stat(entry.path)
+                    except FileNotFoundError:
+                        continue
+                    # ctime changes whenever a link is added or removed
+                    if st.st_nlink > 1 or now - st.st_ctime < self.gc_grace:
+                        continue
+                    for suffix in ('.json', '.txt', '.pdf'):
+                        try:
+                            os.remove(self._path(content_hash, suffix))
+                        except FileNotFoundError:
+                            pass
+                    self._stats['collected'] += 1
+                removed += 1
+            with self._lock:
+                try:
+                    os.rmdir(shard.path)  # only succeeds once the shard is empty
+                except OSError:
+                    pass
+        if removed:
+            logger.info(f"Collected {removed} unreferenced blobs")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        blobs = 0
+        blob_bytes = 0
+        referenced = 0
+        for shard in os.scandir(self.folder):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.pdf'):
+                    st = entry.stat()
+                    blobs += 1
+                    blob_bytes += st.st_size
+                    referenced += st.st_nlink > 1
+        with self._lock:
+            return dict(self._stats, blobs=blobs, referenced_blobs=referenced, blob_bytes=blob_bytes,
+                        gc_grace=self.gc_grace)
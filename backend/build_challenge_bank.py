@@ -0,0 +1,291 @@
+"""
+Offline builder for the challenge bank.
+
+Walks a directory of course PDFs, extracts and analyzes each one, and
+generates challenges for its top topics with the LLM, storing every
+challenge in the challenge bank as soon as it exists. Generation runs on a
+bounded pool of threads behind a rate limiter, overlapping with the text
+extraction of the next PDF. Re-running the same command resumes an
+interrupted build: finished documents are skipped and only missing
+challenges are generated.
+
+    python build_challenge_bank.py ~/courses/cs101 --difficulties easy,medium,hard --concurrency 4 --rate 120
+
+Set OPENAI_API_KEY (or replay a cassette, see cassette.py) before running.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any
+
+from pdf_content_analyzer import extract_text_from_pdf, analyze_pdf_content, get_topic_snippet
+from llm_challenge_generator import generate_single_challenge, generate_short_hint_for_challenge, is_model_ready
+from challenge_bank import ChallengeBank, CHALLENGE_BANK_PATH, CHALLENGE_BANK_MIN_VARIANTS, CHALLENGE_TYPES
+
+
+class RateLimiter:
+    """Spaces calls at least 60 / per_minute seconds apart across all threads"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+        self.waited = 0.0
+
+    def acquire(self) -> float:
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._next - now)
+            self._next = max(now, self._next) + self.interval
+            self.waited += delay
+        if delay:
+            time.sleep(delay)
+        return delay
+
+
+class Build:
+    """Counters and per-document bookkeeping shared by the generation threads"""
+
+    def __init__(self, bank: ChallengeBank):
+        self.bank = bank
+        self.lock = threading.Lock()
+        self.counts = {
+            'documents': 0, 'documents_skipped': 0, 'documents_duplicate': 0, 'documents_completed': 0,
+            'documents_partial': 0, 'documents_empty': 0, 'generated': 0, 'existing': 0, 'failed': 0
+        }
+        self.generation_seconds = 0.0
+        self.extraction_seconds = 0.0
+        self._remaining = {}  # doc_hash -> generation tasks still running
+        self._failures = {}  # doc_hash -> failed tasks
+        self._documents = {}  # doc_hash -> (source, topics)
+
+    def count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.counts[key] += amount
+
+    def start_document(self, doc_hash: str, source: str, topics: List[str], tasks: int):
+        with self.lock:
+            self._remaining[doc_hash] = tasks
+            self._failures[doc_hash] = 0
+            self._documents[doc_hash] = (source, topics)
+        if not tasks:
+            self._finish_document(doc_hash)
+
+    def task_done(self, doc_hash: str, ok: bool, seconds: float):
+        with self.lock:
+            self.counts['generated' if ok else 'failed'] += 1
+            self.generation_seconds += seconds
+            self._failures[doc_hash] += not ok
+            self._remaining[doc_hash] -= 1
+            finished = self._remaining[doc_hash] == 0
+        if finished:
+            self._finish_document(doc_hash)
+
+    def _finish_document(self, doc_hash: str):
+        with self.lock:
+            failures = self._failures.pop(doc_hash)
+            self._remaining.pop(doc_hash)
+            source, topics = self._documents.pop(doc_hash)
+            status = 'partial' if failures else 'completed'
+            self.counts[f'documents_{status}'] += 1
+        # Partial documents are picked up again by the next run
+        self.bank.record_document(doc_hash, source, topics, status)
+        print(f"  {os.path.basename(source)}: {status}" + (f" ({failures} failed)" if failures else ''))
+
+
+def find_pdfs(directory: str) -> List[str]:
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        paths.extend(os.path.join(root, name) for name in sorted(files)
+                     if name.lower().endswith('.pdf') and not name.startswith('.'))
+    return paths
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of the file, the same content hash uploads are keyed by"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def generate_one(build: Build, limiter: RateLimiter, doc_hash: str, snippet: str,
+                 topic: str, challenge_type: str, difficulty: str, variant: int):
+    """Generate and store one challenge; failures are counted and retried by the next run"""
+    limiter.acquire()
+    start = time.perf_counter()
+    ok = False
+    try:
+        challenge = generate_single_challenge(snippet, challenge_type, difficulty, topic)
+        if challenge:
+            challenge['id'] = challenge.get('id', f"{challenge_type}_{uuid.uuid4().hex[:8]}")
+            challenge['type'] = challenge_type
+            challenge['topic'] = topic
+            challenge['difficulty'] = difficulty
+            challenge['hint'] = generate_short_hint_for_challenge(challenge)
+            build.bank.add_challenge(doc_hash, (topic, challenge_type, difficulty, variant), challenge)
+            ok = True
+    except Exception as e:
+        print(f"  {challenge_type} challenge for {topic!r} failed: {e}", file=sys.stderr)
+    finally:
+        build.task_done(doc_hash, ok, time.perf_counter() - start)
+
+
+def build_bank(args, bank: ChallengeBank) -> Dict[str, Any]:
+    types = [t.strip() for t in args.types.split(',') if t.strip()]
+    difficulties = [d.strip() for d in args.difficulties.split(',') if d.strip()]
+    pdfs = find_pdfs(args.directory)
+    print(f"Building challenge bank {bank.path} from {len(pdfs)} PDFs in {args.directory}")
+
+    build = Build(bank)
+    limiter = RateLimiter(args.rate)
+    # Bounds queued generation tasks so extraction does not run far ahead of the LLM
+    slots = threading.BoundedSemaphore(args.concurrency * 2)
+    executor = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix='bank')
+    seen = set()
+    interrupted = False
+    start = time.perf_counter()
+
+    def release(_future):
+        slots.release()
+
+    try:
+        for index, path in enumerate(pdfs, 1):
+            build.count('documents')
+            doc_hash = file_hash(path)
+            if doc_hash in seen:
+                # Copies of a PDF share their challenges
+                build.count('documents_duplicate')
+                continue
+            seen.add(doc_hash)
+            known = bank.get_document(doc_hash)
+            if known and known['status'] == 'completed' and not args.force:
+                build.count('documents_skipped')
+                continue
+
+            print(f"[{index}/{len(pdfs)}] {path}")
+            extract_start = time.perf_counter()
+            text = extract_text_from_pdf(path)
+            topics = analyze_pdf_content(text)['topics'][:args.topics_per_doc] if text else []
+            build.extraction_seconds += time.perf_counter() - extract_start
+            if not topics:
+                build.count('documents_empty')
+                bank.record_document(doc_hash, path, [], 'empty')
+                print("  no topics found")
+                continue
+
+            existing = set() if args.force else bank.existing_keys(doc_hash)
+            tasks = [
+                (topic, challenge_type, difficulty, variant)
+                for topic in topics
+                for challenge_type in types
+                for difficulty in difficulties
+                for variant in range(args.variants)
+                if (topic, challenge_type, difficulty, variant) not in existing
+            ]
+            build.count('existing', len(topics) * len(types) * len(difficulties) * args.variants - len(tasks))
+            bank.record_document(doc_hash, path, topics, 'in_progress')
+            build.start_document(doc_hash, path, topics, len(tasks))
+
+            snippets = {topic: get_topic_snippet(text, topic, window_chars=2000) for topic in topics}
+            for topic, challenge_type, difficulty, variant in tasks:
+                slots.acquire()
+                future = executor.submit(generate_one, build, limiter, doc_hash, snippets[topic],
+                                         topic, challenge_type, difficulty, variant)
+                future.add_done_callback(release)
+    except KeyboardInterrupt:
+        # Everything stored so far is kept; the next run picks up the rest
+        interrupted = True
+        print("\nInterrupted: finishing running generations, dropping queued ones")
+        executor.shutdown(wait=True, cancel_futures=True)
+    else:
+        executor.shutdown(wait=True)
+
+    elapsed = time.perf_counter() - start
+    counts = dict(build.counts)
+    return {
+        'bank': bank.path,
+        'interrupted': interrupted,
+        'elapsed_seconds': elapsed,
+        'counts': counts,
+        'challenges_per_minute': counts['generated'] / elapsed * 60 if elapsed else 0.0,
+        'mean_generation_seconds': build.generation_seconds / max(1, counts['generated'] + counts['failed']),
+        'extraction_seconds': build.extraction_seconds,
+        'rate_limit_wait_seconds': limiter.waited,
+        'concurrency': args.concurrency,
+        'rate_per_minute': args.rate,
+        'bank_stats': bank.stats()
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    counts = report['counts']
+    print(f"\n{'Interrupted' if report['interrupted'] else 'Finished'} in {report['elapsed_seconds']:.1f}s")
+    print(f"Documents: {counts['documents']} seen, {counts['documents_skipped']} already complete, "
+          f"{counts['documents_duplicate']} duplicates, {counts['documents_completed']} completed, "
+          f"{counts['documents_partial']} partial, "
+          f"{counts['documents_empty']} without topics")
+    print(f"Challenges: {counts['generated']} generated, {counts['existing']} already in the bank, "
+          f"{counts['failed']} failed")
+    print(f"Throughput: {report['challenges_per_minute']:.1f} challenges/min "
+          f"({report['mean_generation_seconds']:.2f}s per generation, concurrency {report['concurrency']})")
+    print(f"Time spent extracting PDFs: {report['extraction_seconds']:.1f}s, "
+          f"waiting on the rate limit: {report['rate_limit_wait_seconds']:.1f}s")
+    print(f"Bank now holds {report['bank_stats']['challenges']} challenges")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pregenerate challenges for a directory of PDFs into the challenge bank")
+    parser.add_argument('directory', help="Directory searched recursively for PDFs")
+    parser.add_argument('--bank', default=CHALLENGE_BANK_PATH, help="Challenge bank database")
+    parser.add_argument('--topics-per-doc', type=int, default=5, help="Top topics to generate challenges for")
+    parser.add_argument('--types', default=','.join(CHALLENGE_TYPES), help="Comma-separated challenge types")
+    parser.add_argument('--difficulties', default='medium', help="Comma-separated difficulties")
+    parser.add_argument('--variants', type=int, default=CHALLENGE_BANK_MIN_VARIANTS,
+                        help="Challenges per topic, type and difficulty (the bank serves a key once it has "
+                             "CHALLENGE_BANK_MIN_VARIANTS)")
+    parser.add_argument('--concurrency', type=int, default=4, help="LLM requests in flight")
+    parser.add_argument('--rate', type=float, default=60.0, help="Max LLM requests per minute (0 = unlimited)")
+    parser.add_argument('--force', action='store_true', help="Regenerate challenges that are already in the bank")
+    parser.add_argument('--json', dest='json_path', default=None, help="Also write the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not os.path.isdir(args.directory):
+        print(f"Not a directory: {args.directory}", file=sys.stderr)
+        return 2
+    if not is_model_ready():
+        print("The LLM is not available: set OPENAI_API_KEY or replay a cassette", file=sys.stderr)
+        return 2
+
+    bank = ChallengeBank(args.bank)
+    try:
+        report = build_bank(args, bank)
+    finally:
+        bank.close()
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json_path}")
+    if report['interrupted']:
+        return 130
+    return 1 if report['counts']['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
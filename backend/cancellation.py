@@ -0,0 +1,78 @@
+"""
+Cooperative cancellation for background jobs.
+
+Each job owns a CancelToken. Long-running code checks the token at safe
+checkpoints (between topics, between challenge types, between streamed LLM
+chunks) and records the work it skipped. The token of the running job is
+available through a context variable so deeply nested code such as
+make_openai_request can observe it without extra parameters.
+"""
+
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional
+
+
+class JobCancelled(Exception):
+    """Raised at a cancellation checkpoint once the job has been cancelled"""
+
+
+class CancelToken:
+    """Cancellation flag plus a record of the work skipped because of it"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self.reason = None
+        self.skipped = []
+
+    def cancel(self, reason: str = 'cancelled'):
+        self.reason = reason
+        self._event.set()
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to `timeout` seconds; returns True as soon as the token is cancelled"""
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        """Cancellation checkpoint"""
+        if self._event.is_set():
+            raise JobCancelled(self.reason or 'cancelled')
+
+    def record_skipped(self, **details):
+        """Remember a unit of work that was not done because of cancellation"""
+        with self._lock:
+            self.skipped.append(details)
+
+    def skipped_work(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self.skipped)
+
+
+_current_token = contextvars.ContextVar('cancel_token', default=None)
+
+
+def current_cancel_token() -> Optional[CancelToken]:
+    """Token of the job running in the current context, if any"""
+    return _current_token.get()
+
+
+@contextmanager
+def use_cancel_token(token: Optional[CancelToken]):
+    """Make `token` the current cancel token for the duration of the block"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def checkpoint():
+    """Raise JobCancelled if the current job has been cancelled"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
@@ -0,0 +1,174 @@
+"""
+Record/replay cassette for OpenAI chat requests.
+
+In record mode every successful make_openai_request call appends one JSON
+line (request fingerprint, request type, model, response text, latency) to
+the cassette file; a path ending in .gz is gzip-compressed. In replay mode
+the recorded responses are served back without touching the network, after
+the original latency multiplied by OPENAI_CASSETTE_LATENCY_SCALE (0 replays
+instantly). This makes parser, generator and pipeline benchmarks
+reproducible, fast and free.
+
+Replay prefers an exact fingerprint match. Several prompts embed a randomly
+chosen scenario, so when there is no exact match the next recording with the
+same request type and model is used instead (a "loose" hit).
+"""
+
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Any, Optional
+
+from cancellation import JobCancelled, current_cancel_token
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+OPENAI_CASSETTE_MODE = os.getenv('OPENAI_CASSETTE_MODE', 'off')  # off | record | replay
+OPENAI_CASSETTE_PATH = os.getenv('OPENAI_CASSETTE_PATH', 'openai_cassette.jsonl.gz')
+OPENAI_CASSETTE_LATENCY_SCALE = float(os.getenv('OPENAI_CASSETTE_LATENCY_SCALE', 1.0))
+
+CASSETTE_MODES = ('off', 'record', 'replay')
+
+
+def request_fingerprint(messages: List[Dict[str, str]], model: str, max_tokens: int, temperature: float) -> str:
+    """Stable hash of everything that determines the model's answer"""
+    canonical = json.dumps(
+        {'messages': messages, 'model': model, 'max_tokens': max_tokens, 'temperature': temperature},
+        sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class Cassette:
+    """Recorded OpenAI responses, indexed by fingerprint and by (request type, model)"""
+
+    def __init__(self, path: str = OPENAI_CASSETTE_PATH, mode: str = OPENAI_CASSETTE_MODE,
+                 latency_scale: float = OPENAI_CASSETTE_LATENCY_SCALE):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}; expected one of {CASSETTE_MODES}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._by_fingerprint = {}  # fingerprint -> recorded entries
+        self._by_type = {}  # (request_type, model) -> recorded entries
+        self._cursors = {}  # index key -> next entry to serve
+        self._stats = {'recorded': 0, 'hits': 0, 'loose_hits': 0, 'misses': 0}
+        if mode == 'replay':
+            self.load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def load(self):
+        entries = 0
+        if os.path.exists(self.path):
+            with _open(self.path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+                        entries += 1
+        else:
+            logger.warning(f"Cassette {self.path} not found; every replayed request will miss")
+        logger.info(f"Loaded {entries} recorded OpenAI responses from {self.path}")
+
+    def _index(self, entry: Dict[str, Any]):
+        self._by_fingerprint.setdefault(entry['fingerprint'], []).append(entry)
+        self._by_type.setdefault((entry['request_type'], entry['model']), []).append(entry)
+
+    # Recording
+    def record(self, messages, model: str, max_tokens: int, temperature: float,
+               request_type: str, content: str, latency: float):
+        entry = {
+            'fingerprint': request_fingerprint(messages, model, max_tokens, temperature),
+            'request_type': request_type,
+            'model': model,
+            'latency': round(latency, 4),
+            'content': content
+        }
+        line = json.dumps(entry, separators=(',', ':'))
+        with self._lock:
+            try:
+                with _open(self.path, 'a') as f:
+                    f.write(line + '\n')
+            except OSError as e:
+                logger.warning(f"Failed to record OpenAI response to {self.path}: {e}")
+                return
+            self._index(entry)
+            self._stats['recorded'] += 1
+
+    # Replay
+    def _next(self, key, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Serve recordings in order, cycling when a key is requested more often than recorded"""
+        index = self._cursors.get(key, 0)
+        self._cursors[key] = index + 1
+        return entries[index % len(entries)]
+
+    def lookup(self, messages, model: str, max_tokens: int, temperature: float,
+               request_type: str) -> Optional[Dict[str, Any]]:
+        fingerprint = request_fingerprint(messages, model, max_tokens, temperature)
+        with self._lock:
+            entries = self._by_fingerprint.get(fingerprint)
+            if entries:
+                self._stats['hits'] += 1
+                return self._next(('fingerprint', fingerprint), entries)
+            entries = self._by_type.get((request_type, model))
+            if entries:
+                self._stats['loose_hits'] += 1
+                return self._next(('type', request_type, model), entries)
+            self._stats['misses'] += 1
+            return None
+
+    def replay(self, messages, model: str, max_tokens: int, temperature: float,
+               request_type: str) -> Optional[str]:
+        """Recorded response text after the (scaled) recorded latency, or None on a miss"""
+        entry = self.lookup(messages, model, max_tokens, temperature, request_type)
+        if entry is None:
+            logger.warning(f"No recorded {request_type} response for model {model}")
+            return None
+
+        delay = entry.get('latency', 0.0) * self.latency_scale
+        if delay > 0:
+            cancel_token = current_cancel_token()
+            if cancel_token is not None:
+                if cancel_token.wait(delay):
+                    raise JobCancelled(cancel_token.reason or 'cancelled')
+            else:
+                time.sleep(delay)
+        return entry['content']
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, mode=self.mode, path=self.path, latency_scale=self.latency_scale,
+                        fingerprints=len(self._by_fingerprint))
+
+
+# Global cassette, configured from the environment
+cassette = Cassette()
+
+
+def get_cassette() -> Cassette:
+    return cassette
+
+def configure_cassette(mode: str, path: str = OPENAI_CASSETTE_PATH,
+                       latency_scale: float = OPENAI_CASSETTE_LATENCY_SCALE) -> Cassette:
+    """Switch cassette mode at runtime (benchmarks, regression runs) and return the new cassette"""
+    global cassette
+    cassette = Cassette(path, mode, latency_scale)
+    return cassette
@@ -0,0 +1,309 @@
+"""
+Persistent bank of pregenerated challenges.
+
+Challenges are generated offline (see build_challenge_bank.py) for the PDFs
+of a course and stored in a small SQLite database, one row per (source
+document hash, topic, challenge type, difficulty, variant). Each row is
+committed as soon as its challenge exists, so an interrupted build resumes
+by generating only the rows that are still missing. The documents table
+records which sources were fully processed.
+
+At serving time the bank is looked up by normalized topic, difficulty and
+type before any LLM call, and challenges generated live are written back.
+Only challenges generated from the same document are served, unless the
+caller opts into sharing across documents, and only once a key holds enough
+variants that students do not all receive the same one. The static
+templates of challenge_generator are stored in the same table under the
+'static' source, so the fallback path is one indexed lookup as well.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import random
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Any, Optional, Set, Tuple, Iterable, Callable
+
+from metrics import counter
+from challenge_generator import generate_static_challenge, TOPIC_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CHALLENGE_BANK_PATH = os.getenv('CHALLENGE_BANK_PATH', 'challenge_bank.db')
+CHALLENGE_BANK_ENABLED = os.getenv('CHALLENGE_BANK_ENABLED', 'true').lower() == 'true'
+CHALLENGE_BANK_MMAP_BYTES = int(os.getenv('CHALLENGE_BANK_MMAP_MB', 256)) * 1024 * 1024
+# Variants a (topic, type, difficulty) key needs before the bank serves it
+CHALLENGE_BANK_MIN_VARIANTS = int(os.getenv('CHALLENGE_BANK_MIN_VARIANTS', 3))
+# Serve challenges generated from other documents on the same topic when a document has none
+CHALLENGE_BANK_SHARE_ACROSS_DOCUMENTS = os.getenv('CHALLENGE_BANK_SHARE_ACROSS_DOCUMENTS', 'false').lower() == 'true'
+
+CHALLENGE_TYPES = ['multiple-choice', 'debugging', 'fill-in-the-blank']
+DIFFICULTIES = ['easy', 'medium', 'hard']
+
+# Sources a challenge can come from; static rows are not tied to a document
+SOURCE_LLM = 'llm'
+SOURCE_STATIC = 'static'
+STATIC_DOC_HASH = ''
+
+# Metrics
+CHALLENGE_BANK_LOOKUPS = counter(
+    'pqgen_challenge_bank_lookups_total', 'Challenge bank lookups by source and result', ['source', 'result']
+)
+
+# (topic, challenge type, difficulty, variant)
+BankKey = Tuple[str, str, str, int]
+
+
+def normalize_topic(topic: str) -> str:
+    """Index key of a topic: '2.1 Binary-Search:' and 'binary_search' both become 'binary search'"""
+    text = re.sub(r'^[\d.\s#*-]+', '', topic.lower())
+    text = re.sub(r'[_\-/]+', ' ', text)
+    text = re.sub(r'[^\w\s+#]', '', text)
+    return ' '.join(text.split())
+
+
+class ChallengeBank:
+    """SQLite-backed store of challenges keyed by source document and topic"""
+
+    def __init__(self, path: str = CHALLENGE_BANK_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(f'PRAGMA mmap_size={CHALLENGE_BANK_MMAP_BYTES}')
+        self._stats = {'hits': 0, 'misses': 0, 'static_hits': 0, 'static_misses': 0, 'stored': 0}
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS challenges (
+                doc_hash TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                challenge_type TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                variant INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                topic_key TEXT NOT NULL DEFAULT '',
+                source TEXT NOT NULL DEFAULT 'llm',
+                PRIMARY KEY (doc_hash, topic, challenge_type, difficulty, variant)
+            )
+        """)
+        self._migrate()
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS challenges_lookup ON challenges (topic_key, difficulty, source, challenge_type)'
+        )
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_hash TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                topics TEXT NOT NULL,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    def _migrate(self):
+        """Add the lookup columns to banks built before they existed"""
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(challenges)')}
+        if 'topic_key' in columns:
+            return
+        self._conn.execute("ALTER TABLE challenges ADD COLUMN topic_key TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("ALTER TABLE challenges ADD COLUMN source TEXT NOT NULL DEFAULT 'llm'")
+        topics = [row[0] for row in self._conn.execute('SELECT DISTINCT topic FROM challenges')]
+        self._conn.execute('BEGIN')
+        for topic in topics:
+            self._conn.execute('UPDATE challenges SET topic_key = ? WHERE topic = ?', (normalize_topic(topic), topic))
+        self._conn.execute('COMMIT')
+        logger.info(f"Indexed {len(topics)} topics of challenge bank {self.path}")
+
+    # Documents
+    def record_document(self, doc_hash: str, source: str, topics: List[str], status: str):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)',
+                (doc_hash, source, json.dumps(topics), status, time.time())
+            )
+
+    def get_document(self, doc_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT source, topics, status, updated_at FROM documents WHERE doc_hash = ?', (doc_hash,)
+            ).fetchone()
+        if not row:
+            return None
+        return {'doc_hash': doc_hash, 'source': row[0], 'topics': json.loads(row[1]),
+                'status': row[2], 'updated_at': row[3]}
+
+    # Challenges
+    def add_challenge(self, doc_hash: str, key: BankKey, challenge: Dict[str, Any], source: str = SOURCE_LLM):
+        with self._lock:
+            self._insert(doc_hash, key, challenge, source)
+
+    def _insert(self, doc_hash: str, key: BankKey, challenge: Dict[str, Any], source: str):
+        topic, challenge_type, difficulty, variant = key
+        self._conn.execute(
+            'INSERT OR REPLACE INTO challenges VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (doc_hash, topic, challenge_type, difficulty, variant, json.dumps(challenge), time.time(),
+             normalize_topic(topic), source)
+        )
+        self._stats['stored'] += 1
+
+    def store_generated(self, doc_hash: Optional[str], challenges: List[Dict[str, Any]]):
+        """Write challenges generated live back to the bank as new variants for the document"""
+        if not doc_hash:
+            return
+        for challenge in challenges:
+            key = (challenge['topic'], challenge['type'], challenge['difficulty'])
+            with self._lock:
+                variant = self._conn.execute(
+                    'SELECT COALESCE(MAX(variant) + 1, 0) FROM challenges WHERE doc_hash = ? AND topic = ? '
+                    'AND challenge_type = ? AND difficulty = ?', (doc_hash, *key)
+                ).fetchone()[0]
+                self._insert(doc_hash, (*key, variant), challenge, SOURCE_LLM)
+
+    # Lookups
+    def lookup(self, topic: str, difficulty: str, challenge_types: Iterable[str] = CHALLENGE_TYPES,
+               doc_hash: Optional[str] = None, source: str = SOURCE_LLM,
+               exclude: Optional[Callable[[Dict[str, Any]], bool]] = None,
+               cross_document: bool = False,
+               min_variants: int = CHALLENGE_BANK_MIN_VARIANTS) -> Dict[str, Dict[str, Any]]:
+        """
+        One challenge per requested type for the topic, keyed by type: a random
+        variant generated from doc_hash. With cross_document, a type doc_hash has
+        nothing for is served from the variants of every other document instead.
+        A type is only served from a group holding at least min_variants variants;
+        variants for which exclude() is true (e.g. ones the student has already
+        seen) are skipped. Each served challenge is a copy with a fresh id.
+        """
+        challenge_types = list(challenge_types)
+        query = ('SELECT challenge_type, doc_hash, payload FROM challenges '
+                 'WHERE topic_key = ? AND difficulty = ? AND source = ?')
+        params = [normalize_topic(topic), difficulty, source]
+        if not cross_document:
+            query += ' AND doc_hash = ?'
+            params.append(doc_hash)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        candidates = {}
+        for challenge_type, row_hash, payload in rows:
+            candidates.setdefault(challenge_type, {}).setdefault(row_hash == doc_hash, []).append(payload)
+
+        found = {}
+        for challenge_type in challenge_types:
+            by_match = candidates.get(challenge_type)
+            if not by_match:
+                continue
+            challenge = None
+            for group in (by_match.get(True, []), by_match.get(False, [])):
+                if len(group) < min_variants:
+                    continue
+                for payload in random.sample(group, len(group)):
+                    candidate = json.loads(payload)
+                    if not exclude or not exclude(candidate):
+                        challenge = candidate
+                        break
+                if challenge:
+                    break
+            if not challenge:
+                continue
+            # Bank rows are shared; challenge state is keyed by id, so every serving needs its own
+            challenge['id'] = f"{challenge_type}_{uuid.uuid4().hex[:8]}"
+            challenge['topic'] = topic
+            found[challenge_type] = challenge
+
+        hits = len(found)
+        misses = len(challenge_types) - hits
+        prefix = 'static_' if source == SOURCE_STATIC else ''
+        with self._lock:
+            self._stats[f'{prefix}hits'] += hits
+            self._stats[f'{prefix}misses'] += misses
+        if hits:
+            CHALLENGE_BANK_LOOKUPS.inc(hits, source=source, result='hit')
+        if misses:
+            CHALLENGE_BANK_LOOKUPS.inc(misses, source=source, result='miss')
+        return found
+
+    def static_challenges(self, topic: str, difficulty: str,
+                          challenge_types: Iterable[str] = CHALLENGE_TYPES) -> List[Dict[str, Any]]:
+        """Static template challenges for the topic, rendering and storing the ones not loaded yet"""
+        challenge_types = list(challenge_types)
+        found = self.lookup(topic, difficulty, challenge_types, doc_hash=STATIC_DOC_HASH, source=SOURCE_STATIC,
+                            min_variants=1)
+        missing = [t for t in challenge_types if t not in found]
+        if missing:
+            for challenge in self._render_static(topic, difficulty, missing):
+                found[challenge['type']] = challenge
+        return [found[t] for t in challenge_types if t in found]
+
+    def _render_static(self, topic: str, difficulty: str, challenge_types: Iterable[str]) -> List[Dict[str, Any]]:
+        rendered = []
+        for challenge_type in challenge_types:
+            try:
+                challenge = generate_static_challenge(challenge_type, difficulty, topic, 0)
+            except Exception as e:
+                logger.error(f"Error rendering static {challenge_type} challenge for {topic}: {e}")
+                continue
+            if not challenge:
+                continue
+            self.add_challenge(STATIC_DOC_HASH, (topic, challenge_type, difficulty, 0), challenge, SOURCE_STATIC)
+            rendered.append(challenge)
+        return rendered
+
+    def load_static_templates(self, topics: Iterable[str] = TOPIC_KEYWORDS,
+                              difficulties: Iterable[str] = DIFFICULTIES) -> int:
+        """Render the static templates for common topics into the bank; returns how many were added"""
+        difficulties = list(difficulties)
+        with self._lock:
+            loaded = set(self._conn.execute(
+                'SELECT topic_key, difficulty, challenge_type FROM challenges WHERE source = ?', (SOURCE_STATIC,)
+            ).fetchall())
+        added = 0
+        for topic in topics:
+            for difficulty in difficulties:
+                missing = [t for t in CHALLENGE_TYPES if (normalize_topic(topic), difficulty, t) not in loaded]
+                added += len(self._render_static(topic, difficulty, missing))
+        if added:
+            logger.info(f"Loaded {added} static template challenges into the challenge bank")
+        return added
+
+    def existing_keys(self, doc_hash: str) -> Set[BankKey]:
+        """Keys already generated for a document"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT topic, challenge_type, difficulty, variant FROM challenges WHERE doc_hash = ?', (doc_hash,)
+            ).fetchall()
+        return {tuple(row) for row in rows}
+
+    def get_challenges(self, doc_hash: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT payload FROM challenges WHERE doc_hash = ? ORDER BY topic, challenge_type, difficulty, variant',
+                (doc_hash,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_source = dict(self._conn.execute('SELECT source, COUNT(*) FROM challenges GROUP BY source').fetchall())
+            topics = self._conn.execute('SELECT COUNT(DISTINCT topic_key) FROM challenges').fetchone()[0]
+            by_status = dict(self._conn.execute('SELECT status, COUNT(*) FROM documents GROUP BY status').fetchall())
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        return dict(
+            stats,
+            path=self.path,
+            challenges=sum(by_source.values()),
+            challenges_by_source=by_source,
+            topics=topics,
+            documents=by_status,
+            hit_rate=stats['hits'] / lookups if lookups else 0.0
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -14,6 +14,26 @@ from fallback_hints import (
 import logging
 logger = logging.getLogger(__name__)
 
+# Programming keywords and the topics they indicate (also the topics whose static
+# templates are preloaded into the challenge bank)
+TOPIC_KEYWORDS = {
+    'Sorting Algorithms': ['sort', 'bubble', 'quick', 'merge', 'heap', 'insertion'],
+    'Search Algorithms': ['search', 'binary', 'linear', 'find', 'lookup'],
+    'Data Structures': ['list', 'array', 'dict', 'set', 'tuple', 'stack', 'queue', 'tree', 'graph'],
+    'Object-Oriented Programming': ['class', 'object', 'inheritance', 'polymorphism', 'encapsulation'],
+    'Functions and Methods': ['def ', 'function', 'method', 'return', 'parameter', 'argument'],
+    'Control Flow': ['for ', 'while ', 'if ', 'else', 'elif', 'loop', 'iteration', 'condition'],
+    'String Processing': ['string', 'str(', 'text', 'character', 'substring', 'split', 'join'],
+    'File Operations': ['file', 'open(', 'read(', 'write(', 'close', 'with open'],
+    'Error Handling': ['try:', 'except', 'error', 'exception', 'finally', 'raise'],
+    'Variables and Types': ['variable', 'int', 'float', 'bool', 'assignment', 'declare'],
+    'List Operations': ['append', 'extend', 'insert', 'remove', 'pop', 'index', 'slice'],
+    'Dictionary Operations': ['keys()', 'values()', 'items()', 'get()', 'update'],
+    'Mathematical Operations': ['math', 'calculation', 'arithmetic', 'sum', 'average', 'max', 'min'],
+    'Recursion': ['recursive', 'recursion', 'base case', 'recursive call'],
+    'Algorithm Complexity': ['complexity', 'big o', 'time', 'space', 'efficiency', 'optimization']
+}
+
 
 def generate_fallback_challenges(topics: List[str], difficulty: str = "medium") -> List[Dict[str, Any]]:
     """Generate exactly 2 challenges of each type using static templates for specific topics"""
@@ -51,30 +71,11 @@ def generate_fallback_challenges(topics: List[str], difficulty: str = "medium")
 def extract_basic_topics(content: str) -> List[str]:
     """Extract meaningful programming topics from content"""
     
-    # Enhanced programming keywords and their corresponding topics
-    topic_keywords = {
-        'Sorting Algorithms': ['sort', 'bubble', 'quick', 'merge', 'heap', 'insertion'],
-        'Search Algorithms': ['search', 'binary', 'linear', 'find', 'lookup'],
-        'Data Structures': ['list', 'array', 'dict', 'set', 'tuple', 'stack', 'queue', 'tree', 'graph'],
-        'Object-Oriented Programming': ['class', 'object', 'inheritance', 'polymorphism', 'encapsulation'],
-        'Functions and Methods': ['def ', 'function', 'method', 'return', 'parameter', 'argument'],
-        'Control Flow': ['for ', 'while ', 'if ', 'else', 'elif', 'loop', 'iteration', 'condition'],
-        'String Processing': ['string', 'str(', 'text', 'character', 'substring', 'split', 'join'],
-        'File Operations': ['file', 'open(', 'read(', 'write(', 'close', 'with open'],
-        'Error Handling': ['try:', 'except', 'error', 'exception', 'finally', 'raise'],
-        'Variables and Types': ['variable', 'int', 'float', 'bool', 'assignment', 'declare'],
-        'List Operations': ['append', 'extend', 'insert', 'remove', 'pop', 'index', 'slice'],
-        'Dictionary Operations': ['keys()', 'values()', 'items()', 'get()', 'update'],
-        'Mathematical Operations': ['math', 'calculation', 'arithmetic', 'sum', 'average', 'max', 'min'],
-        'Recursion': ['recursive', 'recursion', 'base case', 'recursive call'],
-        'Algorithm Complexity': ['complexity', 'big o', 'time', 'space', 'efficiency', 'optimization']
-    }
-    
     found_topics = []
     content_lower = content.lower()
     
     # Find topics based on keywords
-    for topic, keywords in topic_keywords.items():
+    for topic, keywords in TOPIC_KEYWORDS.items():
         for keyword in keywords:
             if keyword.lower() in content_lower:
                 found_topics.append(topic)
@@ -2,27 +2,236 @@
 Code evaluation module for assessing user-submitted code.
 
 This module provides functions to evaluate user-submitted code against test cases
-and generate helpful feedback when solutions are incorrect.
+and generate helpful feedback when solutions are incorrect. Submitted code never
+runs in the web process: syntax checks happen here, execution happens in the
+sandboxed evaluation pool (see sandbox.py and worker_pools.py).
 """
 
-import sys
-import io
-import traceback
-import ast
+import os
 import re
-from contextlib import redirect_stdout, redirect_stderr
+import ast
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from sandbox import EvaluationError, EvaluationCrashed, EvaluationBusy, EVAL_WALL_SECONDS, result_digest
+from worker_pools import evaluation_pool, EVAL_WORKERS
+from evaluation_cache import evaluation_cache, normalized_code_hash, EVAL_CACHE_ENABLED
+from profiler import profiler
+
+# Configuration
+GRADING_BUDGET_SECONDS = float(os.getenv('GRADING_BUDGET_SECONDS', 5))
+GRADING_THREADS = int(os.getenv('GRADING_THREADS', 2 * EVAL_WORKERS))
+# Longest piece of a submission's output that results and feedback show back to the student
+ECHO_OUTPUT_CHARS = int(os.getenv('ECHO_OUTPUT_CHARS', 200))
+
+# Extra time the pool allows a task on top of the per-test wall-clock limits
+EVAL_GRACE_SECONDS = 2.0
+
+# Fewest test cases worth a worker of their own; every chunk defines the function again
+MIN_CASES_PER_CHUNK = 4
+
+UNCHANGED_FEEDBACK = "You haven't made any changes to the code. Try to find and fix the bug."
+
+# Threads that wait on grading (cache lookups, spreading test cases over the workers).
+# They are separate from the LLM I/O pool, so grading never queues behind slow LLM
+# calls, and separate from the evaluation pool's dispatch threads, which grading
+# itself submits to. How much sandbox work runs at once is bounded by the pool.
+_grading_executor = ThreadPoolExecutor(max_workers=GRADING_THREADS, thread_name_prefix='grading')
+
+
+def _echo(value):
+    """A submission's output as shown back: control characters removed, at most ECHO_OUTPUT_CHARS long"""
+    text = re.sub(r'[\x00-\x08\x0b-\x1f\x7f-\x9f]', '', value if isinstance(value, str) else str(value))
+    return text if len(text) <= ECHO_OUTPUT_CHARS else text[:ECHO_OUTPUT_CHARS] + '...'
+
+def _echo_value(value):
+    """A returned value as shown back: small plain values as they are, anything else through _echo"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if not isinstance(value, str) and len(str(value)) <= ECHO_OUTPUT_CHARS:
+        return value
+    return _echo(value)
+
+def _without_output(results, feedback=None):
+    """A copy of the results fit for the cache: nothing the submission printed or returned is kept"""
+    cacheable = dict(results)
+    if feedback is not None:
+        cacheable['feedback'] = feedback
+    if 'test_results' in results:
+        cacheable['test_results'] = [
+            {**{key: value for key, value in result.items() if key != 'stdout'}, 'actual': None}
+            for result in results['test_results']
+        ]
+    return cacheable
+
+def _task_timeout(test_count, case_timeout=EVAL_WALL_SECONDS):
+    """Backstop for a whole task: defining the code plus every test case, each under its own limit"""
+    return case_timeout * (test_count + 1) + EVAL_GRACE_SECONDS
+
+def _split_test_cases(test_cases, fail_fast):
+    """Contiguous chunks of test cases, at most a few per evaluation worker"""
+    # Smaller chunks let a fail-fast run stop sooner
+    parts = min(evaluation_pool.max_workers * (2 if fail_fast else 1), -(-len(test_cases) // MIN_CASES_PER_CHUNK))
+    size = max(1, -(-len(test_cases) // max(1, parts)))
+    return [test_cases[i:i + size] for i in range(0, len(test_cases), size)] or [[]]
+
+def _unrun_result(test_case, error=None):
+    result = {
+        'input': test_case.get('input'),
+        'expected': test_case.get('expected'),
+        'actual': None,
+        'passed': False,
+        'error': error
+    }
+    if error is None:
+        result['skipped'] = True
+    return result
+
+def _worker_case(test_case):
+    """What a worker gets to see of a test case: its arguments, never the expected value"""
+    return {key: test_case[key] for key in ('input', 'args') if key in test_case}
+
+def _graded_results(chunk, outcome):
+    """A worker's results for a chunk of test cases, checked against the expected values here.
+    
+    Student code runs in the worker and may have forged its reply, so the reply is only
+    trusted for what the code could produce anyway: the values it returned.
+    """
+    results = outcome.get('test_results')
+    if not isinstance(results, list) or len(results) > len(chunk) or not all(isinstance(r, dict) for r in results):
+        raise EvaluationCrashed("The evaluation worker sent malformed results")
+    graded = []
+    for test_case, result in zip(chunk, results):
+        error = result.get('error')
+        graded_result = {
+            'input': test_case.get('input', test_case.get('args')),
+            'expected': test_case.get('expected'),
+            'actual': _echo_value(result.get('actual')),
+            'passed': error is None and result.get('digest') == result_digest(test_case.get('expected')),
+            'error': error
+        }
+        if 'stdout' in result:
+            graded_result['stdout'] = _echo(result['stdout'])
+        for key in ('traceback', 'seconds'):
+            if key in result:
+                graded_result[key] = result[key]
+        graded.append(graded_result)
+    return graded
+
+def _run_test_cases(user_code, function_name, test_cases, case_timeout, fail_fast):
+    """Run the test cases on the evaluation workers in parallel chunks, keeping their order.
+    
+    A chunk whose worker times out or crashes fails only its own test cases. With fail_fast,
+    the results stop at the first failing test case and the rest are marked as skipped.
+    The outcome's 'repeatable' is False when a time limit or a worker failure shaped it.
+    """
+    chunks = _split_test_cases(test_cases, fail_fast)
+    args = (user_code, function_name)
+    if len(chunks) == 1:
+        # Nothing to spread out; skip the hop through a dispatch thread
+        futures = [None]
+    else:
+        futures = [
+            evaluation_pool.submit('run_test_cases', *args, [_worker_case(c) for c in chunk], case_timeout,
+                                   fail_fast, timeout=_task_timeout(len(chunk), case_timeout))
+            for chunk in chunks
+        ]
+    
+    test_results = []
+    stopped = False
+    repeatable = True
+    for chunk, future in zip(chunks, futures):
+        if stopped:
+            if future is not None:
+                future.cancel()
+            test_results.extend(_unrun_result(test_case) for test_case in chunk)
+            continue
+        try:
+            if future is None:
+                outcome = evaluation_pool.run('run_test_cases', *args, [_worker_case(c) for c in chunk],
+                                              case_timeout, fail_fast, timeout=_task_timeout(len(chunk), case_timeout))
+            else:
+                outcome = future.result()
+            if not isinstance(outcome, dict):
+                raise EvaluationCrashed("The evaluation worker sent malformed results")
+            chunk_results = [] if outcome.get('error') else _graded_results(chunk, outcome)
+        except EvaluationBusy:
+            for pending in futures:
+                if pending is not None:
+                    pending.cancel()
+            raise
+        except EvaluationError as e:
+            outcome = {'error': None, 'timed_out': True}
+            chunk_results = [_unrun_result(test_case, str(e)) for test_case in chunk]
+        
+        repeatable = repeatable and not outcome.get('timed_out')
+        if outcome.get('error'):
+            # The function could not be defined; every chunk reports the same error
+            for pending in futures:
+                if pending is not None:
+                    pending.cancel()
+            return {'error': str(outcome['error']), 'test_results': [], 'repeatable': repeatable}
+        
+        if fail_fast:
+            failed_at = next((i for i, result in enumerate(chunk_results) if not result['passed']), None)
+            if failed_at is not None:
+                stopped = True
+                chunk_results = chunk_results[:failed_at + 1]
+        test_results.extend(chunk_results)
+        test_results.extend(_unrun_result(test_case, None if stopped else "The test case was not run")
+                            for test_case in chunk[len(chunk_results):])
+    
+    return {'error': None, 'test_results': test_results, 'repeatable': repeatable}
+
+def _cached_evaluation(challenge_id, test_cases, user_code, options, evaluate):
+    """Return cached results for the submission, or run evaluate() and cache what it returns"""
+    cache_key = None
+    if challenge_id and EVAL_CACHE_ENABLED:
+        cache_key = evaluation_cache.key(challenge_id, test_cases, user_code, **options)
+        cached = evaluation_cache.get(cache_key)
+        if cached is not None:
+            cached['cached'] = True
+            return cached
+    
+    results, repeatable = evaluate()
+    # Feedback that quotes the submission's output comes with a version that does not, for the cache
+    plain_feedback = results.pop('plain_feedback', None)
+    if repeatable:
+        evaluation_cache.put(cache_key, _without_output(results, plain_feedback))
+    return results
 
-def evaluate_coding_solution(user_code, test_cases, challenge_hint=None):
+def evaluate_coding_solution(user_code, test_cases, challenge_hint=None, fail_fast=False, case_timeout=None,
+                             challenge_id=None, function_name=None):
     """Evaluate a user-submitted coding solution against test cases.
     
+    Larger test suites are spread across the evaluation workers; results keep the order
+    of test_cases and each one records its run time in 'seconds'. When challenge_id is
+    given, results are cached for code with the same syntax tree and returned with
+    'cached': True.
+    
     Args:
         user_code: The user-submitted code as a string
         test_cases: List of test cases, each with 'input' and 'expected' fields
         challenge_hint: The hint provided with the challenge
+        fail_fast: Stop at the first failing test case; later ones are marked 'skipped'
+        case_timeout: Wall-clock seconds allowed per test case (default EVAL_WALL_SECONDS)
+        challenge_id: Id of the challenge, enabling the evaluation cache
+        function_name: Function the test cases call (default: the first one defined)
         
     Returns:
         A dictionary with evaluation results
+    
+    Raises:
+        EvaluationBusy: No evaluation worker became free in time
     """
+    options = {'kind': 'coding', 'fail_fast': fail_fast, 'case_timeout': case_timeout,
+               'hint': challenge_hint, 'function_name': function_name}
+    return _cached_evaluation(challenge_id, test_cases, user_code, options, lambda: _evaluate_coding_solution(
+        user_code, test_cases, challenge_hint, fail_fast, case_timeout, function_name
+    ))
+
+def _evaluate_coding_solution(user_code, test_cases, challenge_hint, fail_fast, case_timeout, function_name):
+    """Evaluate a coding solution; returns the results and whether they may be cached"""
     results = {
         'status': 'incorrect',
         'feedback': '',
@@ -36,89 +245,44 @@ def evaluate_coding_solution(user_code, test_cases, challenge_hint=None):
     except SyntaxError as e:
         results['error'] = f"Syntax error: {str(e)}"
         results['feedback'] = f"Your code has a syntax error: {str(e)}. Check line {e.lineno}, column {e.offset}."
-        return results
+        return results, True
     
     # Extract the function name from the code
-    function_name = None
-    try:
-        tree = ast.parse(user_code)
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                function_name = node.name
-                break
-    except:
-        pass
+    if function_name is None:
+        try:
+            tree = ast.parse(user_code)
+            for node in ast.walk(tree):
+                if isinstance(node, ast.FunctionDef):
+                    function_name = node.name
+                    break
+        except:
+            pass
     
     if not function_name:
         results['error'] = "Could not find a function definition in your code."
         results['feedback'] = "Make sure your code defines a function."
-        return results
+        return results, True
     
-    # Create a namespace to execute the code
-    namespace = {}
-    
-    # Execute the code to define the function
+    # Define the function and run each test case in the sandbox
     try:
-        exec(user_code, namespace)
-    except Exception as e:
-        results['error'] = f"Error defining function: {str(e)}"
-        results['feedback'] = f"There was an error in your code: {str(e)}"
-        return results
-    
-    # Get the function object
-    if function_name not in namespace:
-        results['error'] = f"Function '{function_name}' not found."
-        results['feedback'] = f"Could not find the function '{function_name}' in your code."
-        return results
-    
-    function = namespace[function_name]
-    
-    # Run each test case
-    all_passed = True
-    for i, test_case in enumerate(test_cases):
-        test_input = test_case.get('input')
-        expected_output = test_case.get('expected')
-        
-        test_result = {
-            'input': test_input,
-            'expected': expected_output,
-            'actual': None,
-            'passed': False,
-            'error': None
-        }
-        
-        # Capture stdout and stderr
-        stdout_buffer = io.StringIO()
-        stderr_buffer = io.StringIO()
-        
-        try:
-            with redirect_stdout(stdout_buffer), redirect_stderr(stderr_buffer):
-                # Execute the function with the test input
-                actual_output = function(test_input)
-                
-            # Check if there was any output to stdout
-            stdout_output = stdout_buffer.getvalue().strip()
-            if stdout_output:
-                test_result['stdout'] = stdout_output
-            
-            # Check if the output matches the expected output
-            test_result['actual'] = actual_output
-            
-            # Compare the actual output with the expected output
-            if str(actual_output).strip() == str(expected_output).strip():
-                test_result['passed'] = True
-            else:
-                all_passed = False
-                
-        except Exception as e:
-            all_passed = False
-            test_result['error'] = str(e)
-            test_result['traceback'] = traceback.format_exc()
-        
-        results['test_results'].append(test_result)
+        outcome = _run_test_cases(user_code, function_name, test_cases, case_timeout or EVAL_WALL_SECONDS, fail_fast)
+    except EvaluationBusy:
+        # Not the submission's fault; the caller decides whether to retry
+        raise
+    except EvaluationError as e:
+        results['error'] = str(e)
+        results['feedback'] = f"Your code could not be evaluated: {str(e)}"
+        return results, False
+    
+    if outcome['error']:
+        results['error'] = outcome['error']
+        results['feedback'] = f"There was an error in your code: {outcome['error']}"
+        return results, outcome['repeatable']
+    
+    results['test_results'] = outcome['test_results']
     
     # Set the overall status
-    if all_passed:
+    if all(result['passed'] for result in results['test_results']):
         results['status'] = 'correct'
         results['feedback'] = "All test cases passed! Great job!"
     else:
@@ -126,20 +290,41 @@ def evaluate_coding_solution(user_code, test_cases, challenge_hint=None):
         results['feedback'] = generate_feedback_for_incorrect_solution(
             user_code, results['test_results'], challenge_hint
         )
+        results['plain_feedback'] = generate_feedback_for_incorrect_solution(
+            user_code, results['test_results'], challenge_hint, show_output=False
+        )
     
-    return results
+    return results, outcome['repeatable']
 
-def evaluate_debugging_solution(user_code, buggy_code, bug_comment=None):
+def evaluate_debugging_solution(user_code, buggy_code, bug_comment=None, expected_output=None,
+                                function_name=None, challenge_id=None, time_limit=None):
     """Evaluate a user-submitted debugging solution.
     
     Args:
         user_code: The user-submitted fixed code
         buggy_code: The original buggy code
         bug_comment: Description of the bug
+        expected_output: What the fixed program prints, or what function_name returns when
+            called without arguments; without it, a fix that runs cleanly is 'ungradable'
+        function_name: Function to call when the program itself prints nothing
+        challenge_id: Id of the challenge, enabling the evaluation cache
+        time_limit: Wall-clock seconds the program may run (default EVAL_WALL_SECONDS)
         
     Returns:
-        A dictionary with evaluation results
+        A dictionary with evaluation results; 'status' is 'correct', 'incorrect', or
+        'ungradable' when the fix runs but there is nothing to check its output against
+    
+    Raises:
+        EvaluationBusy: No evaluation worker became free in time
     """
+    options = {'kind': 'debugging', 'buggy_code': buggy_code, 'function_name': function_name, 'time_limit': time_limit}
+    return _cached_evaluation(challenge_id, [{'expected': expected_output}], user_code, options, lambda: (
+        _evaluate_debugging_solution(user_code, buggy_code, expected_output, function_name,
+                                     time_limit or EVAL_WALL_SECONDS)
+    ))
+
+def _evaluate_debugging_solution(user_code, buggy_code, expected_output, function_name, time_limit):
+    """Evaluate a debugging solution; returns the results and whether they may be cached"""
     results = {
         'status': 'incorrect',
         'feedback': '',
@@ -152,39 +337,159 @@ def evaluate_debugging_solution(user_code, buggy_code, bug_comment=None):
     except SyntaxError as e:
         results['error'] = f"Syntax error: {str(e)}"
         results['feedback'] = f"Your code has a syntax error: {str(e)}. Check line {e.lineno}, column {e.offset}."
-        return results
+        return results, True
     
     # Check if the code has been modified
+    if _unchanged(user_code, buggy_code):
+        results['feedback'] = UNCHANGED_FEEDBACK
+        return results, True
+    
+    # Try to execute the code in the sandbox
+    try:
+        outcome = evaluation_pool.run('run_program', user_code, function_name, time_limit,
+                                      timeout=_task_timeout(0, time_limit))
+        if not isinstance(outcome, dict) or not isinstance(outcome.get('stdout'), str):
+            raise EvaluationCrashed("The evaluation worker sent a malformed result")
+    except EvaluationBusy:
+        # Not the submission's fault; the caller decides whether to retry
+        raise
+    except EvaluationError as e:
+        results['error'] = str(e)
+        results['feedback'] = f"Your code could not be evaluated: {str(e)}"
+        return results, False
+    
+    produced = outcome['stdout'].strip()
+    if not produced and outcome.get('returned') is not None:
+        produced = str(outcome.get('returned'))
+    
+    if outcome.get('error'):
+        results['error'] = f"Error executing code: {outcome['error']}"
+        results['feedback'] = f"Your code still has an error: {outcome['error']}"
+    elif expected_output is not None:
+        if not produced:
+            results['feedback'] = f"Your code runs, but it produces no output; the expected output is '{expected_output}'."
+        elif _outputs_match(produced, expected_output):
+            results['status'] = 'correct'
+            results['feedback'] = "Your fix produces the expected output. Good job!"
+        else:
+            results['feedback'] = f"Your code runs, but it produced '{_echo(produced)}' instead of '{expected_output}'."
+            results['plain_feedback'] = f"Your code runs, but it does not produce the expected output '{expected_output}'."
+    else:
+        # Running without errors says nothing about whether the bug is gone
+        results['status'] = 'ungradable'
+        results['feedback'] = ("Your code runs without errors, but this challenge has no expected output "
+                               "to check it against. Compare your fix with the explanation.")
+    
+    return results, not outcome.get('timed_out')
+
+def _unchanged(user_code, buggy_code):
+    """Whether the fix is the buggy code again, ignoring comments and formatting"""
     if user_code.strip() == buggy_code.strip():
-        results['feedback'] = "You haven't made any changes to the code. Try to find and fix the bug."
-        return results
+        return True
+    user_hash = normalized_code_hash(user_code)
+    return user_hash is not None and user_hash == normalized_code_hash(buggy_code)
+
+def _main_function_name(code):
+    """Name of the first top-level function in code, which may itself contain syntax errors"""
+    match = re.search(r'^def\s+(\w+)\s*\(', code or '', re.MULTILINE)
+    return match.group(1) if match else None
+
+def _normalize_output(text):
+    """Output text with whitespace collapsed and Python literals in canonical form"""
+    text = ' '.join(str(text).split())
+    if len(text) <= 1000:
+        try:
+            value = ast.literal_eval(text)
+            return value if isinstance(value, str) else repr(value)
+        except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+            pass
+    return text
+
+def _outputs_match(produced, expected_output):
+    return _normalize_output(produced) == _normalize_output(expected_output)
+
+def literal_expected_output(expected_output):
+    """A challenge's expected_output if it is a concrete value output can be compared with, else None.
     
-    # Try to execute the code
+    Generated challenges often describe the expected behaviour in prose instead
+    ("The function should return the sum"); those cannot be checked literally.
+    """
+    if expected_output is None or isinstance(expected_output, (dict, list)):
+        return None
+    text = str(expected_output).strip()
+    if not text or len(text) > 200:
+        return None
+    if len(text.split()) == 1:
+        return text
     try:
-        # Create a namespace to execute the code
-        namespace = {}
-        
-        # Execute the code
-        exec(user_code, namespace)
-        
-        # If we get here, the code executed without errors
-        # This is a simple check - in a real system, you would run tests
-        results['status'] = 'correct'
-        results['feedback'] = "Your solution runs without errors. Good job!"
+        ast.literal_eval(text)
+        return text
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+def evaluate_debugging_challenge(challenge, user_code, time_budget=GRADING_BUDGET_SECONDS):
+    """Grade a fix for a debugging challenge by running it in the sandbox.
+    
+    The fix is checked against the challenge's test_cases when it has them, otherwise
+    against its expected_output when that is a concrete value. Without either, a fix
+    that runs without errors is 'ungradable', never 'correct'. Time limits are scaled down so that grading fits in
+    time_budget seconds, with some room left for dispatch.
+    
+    Args:
+        challenge: The debugging challenge
+        user_code: The user-submitted fixed code
+        time_budget: Seconds grading should take at most
         
-    except Exception as e:
-        results['error'] = f"Error executing code: {str(e)}"
-        results['feedback'] = f"Your code still has an error: {str(e)}"
+    Returns:
+        A dictionary with evaluation results
+    """
+    buggy_code = challenge.get('buggy_code') or challenge.get('code_stub') or ''
+    function_name = _main_function_name(buggy_code)
+    test_cases = challenge.get('test_cases')
     
-    return results
+    if not test_cases:
+        return evaluate_debugging_solution(
+            user_code, buggy_code,
+            expected_output=literal_expected_output(challenge.get('expected_output')),
+            function_name=function_name, challenge_id=challenge.get('id'),
+            time_limit=min(EVAL_WALL_SECONDS, time_budget * 0.8)
+        )
+    
+    if _unchanged(user_code, buggy_code):
+        return {
+            'status': 'incorrect',
+            'feedback': UNCHANGED_FEEDBACK,
+            'test_results': [],
+            'error': None
+        }
+    
+    # Defining the fix plus the longest chunk of test cases has to fit in the budget
+    cases_per_chunk = max(len(chunk) for chunk in _split_test_cases(test_cases, fail_fast=True))
+    case_timeout = min(EVAL_WALL_SECONDS, max(0.1, time_budget * 0.8 / (cases_per_chunk + 1)))
+    return evaluate_coding_solution(
+        user_code, test_cases, challenge.get('hint'), fail_fast=True, case_timeout=case_timeout,
+        challenge_id=challenge.get('id'), function_name=function_name
+    )
+
+def submit_debugging_challenge(challenge, user_code, time_budget=GRADING_BUDGET_SECONDS) -> Future:
+    """Start evaluate_debugging_challenge on a grading thread; the future holds its results"""
+    context = contextvars.copy_context()
+    session = profiler.current_session()
+
+    def grade():
+        with profiler.attach_thread(session):
+            return evaluate_debugging_challenge(challenge, user_code, time_budget)
+
+    return _grading_executor.submit(context.run, grade)
 
-def generate_feedback_for_incorrect_solution(user_code, test_results, challenge_hint=None):
+def generate_feedback_for_incorrect_solution(user_code, test_results, challenge_hint=None, show_output=True):
     """Generate helpful feedback for incorrect solutions.
     
     Args:
         user_code: The user-submitted code
         test_results: Results of running the test cases
         challenge_hint: The hint provided with the challenge
+        show_output: Whether to quote what the code returned for the first failing test case
         
     Returns:
         A string with helpful feedback
@@ -206,12 +511,21 @@ def generate_feedback_for_incorrect_solution(user_code, test_results, challenge_
             feedback += "Your code is trying to divide by zero. Make sure to handle this case. "
         elif 'TypeError' in error_msg:
             feedback += "There's a type mismatch in your code. Check that you're using the right data types. "
+        elif 'time limit exceeded' in error_msg.lower():
+            feedback += "Your code took too long to finish. Look for a loop that never ends or a recursion without a base case. "
+        elif 'Memory limit exceeded' in error_msg:
+            feedback += "Your code uses too much memory. Check for lists or strings that keep growing. "
+        elif 'Output limit exceeded' in error_msg:
+            feedback += "Your code prints too much output. Remove debugging prints inside loops. "
     else:
         # Code executed but produced incorrect results
         # Find the first failing test case
-        failing_test = next((result for result in test_results if not result.get('passed')), None)
-        if failing_test:
-            feedback += f"For input '{failing_test.get('input')}', your code returned '{failing_test.get('actual')}' but the expected output is '{failing_test.get('expected')}'. "
+        failing_test = next((result for result in test_results
+                             if not result.get('passed') and not result.get('skipped')), None)
+        if failing_test and show_output:
+            feedback += f"For input '{failing_test.get('input')}', your code returned '{_echo(failing_test.get('actual'))}' but the expected output is '{failing_test.get('expected')}'. "
+        elif failing_test:
+            feedback += f"For input '{failing_test.get('input')}', your code does not return the expected output '{failing_test.get('expected')}'. "
     
     # Add code-specific feedback
     if 'for' in user_code and 'range' in user_code:
@@ -5,7 +5,9 @@ from dotenv import load_dotenv
 load_dotenv() 
 import os
 import json
+import asyncio
 import logging
+from functools import wraps
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Any
 import firebase_admin
@@ -13,6 +15,17 @@ from firebase_admin import credentials, firestore
 
 logger = logging.getLogger(__name__)
 
+def offload(func):
+    """Expose a blocking Firestore method as a coroutine that runs in a worker thread
+
+    The Firestore client is synchronous; awaiting it directly would block the
+    event loop, so concurrent requests could not overlap their database I/O.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return wrapper
+
 class FirebaseManager:
     """Manages Firebase/Firestore database operations"""
     
@@ -81,7 +94,8 @@ class FirebaseManager:
         return self.initialized and self.db is not None
     
     # User Management
-    async def create_user(self, user_data: Dict[str, Any]) -> Optional[str]:
+    @offload
+    def create_user(self, user_data: Dict[str, Any]) -> Optional[str]:
         """Create a new user in Firestore"""
         if not self.is_available():
             logger.warning("Firestore not available, cannot create user")
@@ -109,7 +123,8 @@ class FirebaseManager:
             logger.error(f"Failed to create user: {e}")
             return None
     
-    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+    @offload
+    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Get user by email address"""
         if not self.is_available():
             return None
@@ -130,7 +145,8 @@ class FirebaseManager:
             logger.error(f"Failed to get user by email: {e}")
             return None
     
-    async def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+    @offload
+    def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get user by ID"""
         if not self.is_available():
             return None
@@ -150,7 +166,8 @@ class FirebaseManager:
             logger.error(f"Failed to get user by ID: {e}")
             return None
     
-    async def update_user_login(self, user_id: str) -> bool:
+    @offload
+    def update_user_login(self, user_id: str) -> bool:
         """Update user's last login timestamp"""
         if not self.is_available():
             return False
@@ -166,7 +183,8 @@ class FirebaseManager:
             logger.error(f"Failed to update user login: {e}")
             return False
     
-    async def update_user_stats(self, user_id: str, stats_update: Dict[str, Any]) -> bool:
+    @offload
+    def update_user_stats(self, user_id: str, stats_update: Dict[str, Any]) -> bool:
         """Update user statistics"""
         if not self.is_available():
             return False
@@ -181,7 +199,8 @@ class FirebaseManager:
             return False
     
     # Challenge History Management
-    async def save_challenge_session(self, user_id: str, session_data: Dict[str, Any]) -> Optional[str]:
+    @offload
+    def save_challenge_session(self, user_id: str, session_data: Dict[str, Any]) -> Optional[str]:
         """Save a challenge session to user's history"""
         if not self.is_available():
             return None
@@ -200,7 +219,8 @@ class FirebaseManager:
             logger.error(f"Failed to save challenge session: {e}")
             return None
     
-    async def get_user_challenge_history(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+    @offload
+    def get_user_challenge_history(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get user's challenge history"""
         if not self.is_available():
             return []
@@ -222,7 +242,8 @@ class FirebaseManager:
             logger.error(f"Failed to get challenge history: {e}")
             return []
     
-    async def save_challenge_result(self, user_id: str, challenge_data: Dict[str, Any]) -> Optional[str]:
+    @offload
+    def save_challenge_result(self, user_id: str, challenge_data: Dict[str, Any]) -> Optional[str]:
         """Save individual challenge result"""
         if not self.is_available():
             return None
@@ -241,7 +262,8 @@ class FirebaseManager:
             return None
     
     # Document Management
-    async def save_document_metadata(self, user_id: str, document_data: Dict[str, Any]) -> Optional[str]:
+    @offload
+    def save_document_metadata(self, user_id: str, document_data: Dict[str, Any]) -> Optional[str]:
         """Save document metadata"""
         if not self.is_available():
             return None
@@ -259,7 +281,8 @@ class FirebaseManager:
             logger.error(f"Failed to save document metadata: {e}")
             return None
     
-    async def get_user_documents(self, user_id: str) -> List[Dict[str, Any]]:
+    @offload
+    def get_user_documents(self, user_id: str) -> List[Dict[str, Any]]:
         """Get user's uploaded documents"""
         if not self.is_available():
             return []
@@ -0,0 +1,119 @@
+"""
+Memoized evaluation results for identical submissions.
+
+In a class, many students submit the same fix, differing at most in
+whitespace, comments or formatting. Results are cached under
+(challenge id, test-suite hash, normalized code hash, evaluation options),
+where the code hash is taken over the AST dump so formatting never matters
+but any change in behaviour does. Entries live for EVAL_CACHE_TTL_SECONDS
+and the least recently used ones are evicted past EVAL_CACHE_SIZE.
+
+Only repeatable results are cached: an evaluation that hit a time limit or
+lost its worker depends on how loaded the pool was and is run again next
+time.
+"""
+
+import os
+import ast
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+from metrics import counter
+
+# Configuration
+EVAL_CACHE_ENABLED = os.getenv('EVAL_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+EVAL_CACHE_SIZE = int(os.getenv('EVAL_CACHE_SIZE', 4096))
+EVAL_CACHE_TTL_SECONDS = int(os.getenv('EVAL_CACHE_TTL_SECONDS', 3600))
+
+CacheKey = Tuple[str, str, str, str]
+
+# Metrics
+EVAL_CACHE_LOOKUPS = counter('pqgen_evaluation_cache_lookups_total', 'Evaluation cache lookups by result', ['result'])
+
+
+def normalized_code_hash(user_code: str) -> Optional[str]:
+    """Hash of the code's AST, ignoring whitespace, comments and formatting; None if it does not parse"""
+    try:
+        tree = ast.parse(user_code)
+    except (SyntaxError, ValueError):
+        return None
+    return hashlib.sha256(ast.dump(tree, include_attributes=False).encode()).hexdigest()
+
+
+def suite_hash(test_cases: List[Dict[str, Any]]) -> str:
+    """Hash of a test suite, so an edited suite never serves results of the old one"""
+    return hashlib.sha256(json.dumps(test_cases, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class EvaluationCache:
+    """Thread-safe LRU of evaluation results with a TTL"""
+
+    def __init__(self, max_entries: int = EVAL_CACHE_SIZE, ttl: int = EVAL_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stored at, results), least recently used first
+        self._stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0, 'expired': 0}
+
+    def key(self, challenge_id: str, test_cases: List[Dict[str, Any]], user_code: str,
+            **options) -> Optional[CacheKey]:
+        """Cache key for a submission, or None if it cannot be cached (e.g. a syntax error)"""
+        code_hash = normalized_code_hash(user_code)
+        if not challenge_id or code_hash is None:
+            return None
+        return (str(challenge_id), suite_hash(test_cases), code_hash, json.dumps(options, sort_keys=True))
+
+    def get(self, key: Optional[CacheKey]) -> Optional[Dict[str, Any]]:
+        """A copy of the cached results for the key, or None"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+            else:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+        EVAL_CACHE_LOOKUPS.inc(result='miss' if entry is None else 'hit')
+        return copy.deepcopy(entry[1]) if entry is not None else None
+
+    def put(self, key: Optional[CacheKey], results: Dict[str, Any]):
+        if key is None:
+            return
+        entry = (time.time(), copy.deepcopy(results))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._stats['stored'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evicted'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'enabled': EVAL_CACHE_ENABLED,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                **self._stats,
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else 0.0
+            }
+
+
+# Global cache
+evaluation_cache = EvaluationCache()
@@ -118,6 +118,7 @@ const navProfile         = document.getElementById("nav-profile");
 
   // ─── State ───────────────────────────────────────────────────────────────────
   let currentDocId = null;
+  let currentJobId = null;
   let allTopics = [];
   let allChallenges = [];
   // Make allChallenges globally accessible for favorites
@@ -302,6 +303,17 @@ const navProfile         = document.getElementById("nav-profile");
     });
   }
 
+  // ─── Cancel the previous background job (re-upload / leaving the page) ───────
+  function cancelCurrentJob() {
+    if (!currentDocId || !currentJobId) return;
+    fetch(`/api/documents/${currentDocId}/jobs/${currentJobId}`, {
+      method: 'DELETE',
+      keepalive: true
+    }).catch(() => {});
+    currentJobId = null;
+  }
+  window.addEventListener("pagehide", cancelCurrentJob);
+
   // ─── Upload & Poll for Extraction ────────────────────────────────────────────
   async function processFile(file) {
     if (!currentUser) {
@@ -317,6 +329,7 @@ const navProfile         = document.getElementById("nav-profile");
       if (fileStateEl) fileStateEl.textContent = "Uploading and processing…";
       if (uploadBtn) uploadBtn.classList.remove("hidden");
 
+      cancelCurrentJob();
       showSection("loading");
       updateProgress("Uploading file…", 0);
 
@@ -360,8 +373,9 @@ const navProfile         = document.getElementById("nav-profile");
           form.append('file', file);
           const res = await fetch('/api/upload', { method: 'POST', body: form });
           if (!res.ok) throw new Error(`Upload failed (${res.status})`);
-          const { document_id } = await res.json();
+          const { document_id, job_id } = await res.json();
           currentDocId = document_id;
+          currentJobId = job_id;
 
           // Poll for extraction progress
           while (true) {
@@ -372,12 +386,14 @@ const navProfile         = document.getElementById("nav-profile");
             updateProgress(data.message || '', 50 + (data.progress || 0) * 0.5); // Scale to 50-100%
 
             if (data.status === 'completed') {
+              currentJobId = null;
               allTopics = data.topics || [];
               renderTopicSelection();
               showSection('topics');
               break;
             }
             if (data.status === 'error') throw new Error(data.message || 'Extraction failed');
+            if (data.status === 'cancelled') return;
           }
         }
       );
@@ -448,11 +464,13 @@ const navProfile         = document.getElementById("nav-profile");
       updateGenProgress("Starting generation…", 0);
 
       // Send request to backend to start challenge generation
-      await fetch(`/api/documents/${currentDocId}/generate`, {
+      const genRes = await fetch(`/api/documents/${currentDocId}/generate`, {
         method: 'POST',
         headers: { 'Content-Type':'application/json' },
         body: JSON.stringify({ topics: chosen })
       });
+      if (!genRes.ok) throw new Error(`Generation failed to start (${genRes.status})`);
+      currentJobId = (await genRes.json()).job_id;
 
       // Poll until ready
       while (true) {
@@ -463,6 +481,7 @@ const navProfile         = document.getElementById("nav-profile");
         updateGenProgress(d.message||'', d.progress||0);
 
         if (d.status === 'challenges_ready' || d.status === 'completed') {
+          currentJobId = null;
           const finalRes = await fetch(`/api/documents/${currentDocId}/challenges`);
           const { challenges } = await finalRes.json();
           allChallenges = challenges;
@@ -480,6 +499,7 @@ const navProfile         = document.getElementById("nav-profile");
           break;
         }
         if (d.status === 'error') throw new Error(d.message || 'Generation error');
+        if (d.status === 'cancelled') return;
       }
     } catch (err) {
       showError(err.message);
@@ -1021,7 +1041,9 @@ const navProfile         = document.getElementById("nav-profile");
         state.attempts = result.attempts;
         state.solved = result.correct;
 
-        if (result.correct) {
+        if (result.ungradable) {
+          showFeedback(result.feedback, "warning");
+        } else if (result.correct) {
           showFeedback("Correct! Well done! 🎉", "success");
           // Update solved count in Firestore
           if (currentUser) {
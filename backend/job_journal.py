@@ -0,0 +1,234 @@
+"""
+On-disk journal that lets background jobs survive restarts.
+
+Every extraction/generation job is recorded in a small SQLite database together
+with the arguments needed to run it again. Generation jobs checkpoint each
+finished (topic, challenge type) step, so a job interrupted by a deploy or a
+crash is replayed and only the missing steps are regenerated.
+
+Several server processes can share one journal (e.g. gunicorn workers, or a
+new server starting while the old one drains). Each unfinished job is leased
+by the process running it, which renews the lease every
+JOURNAL_LEASE_SECONDS / 3 seconds. A job is only resumed once its lease has
+expired, and claiming it is a compare-and-swap on the lease, so exactly one
+process resumes it.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+JOB_JOURNAL_PATH = os.getenv('JOB_JOURNAL_PATH', 'job_journal.db')
+JOURNAL_RETENTION_SECONDS = int(os.getenv('JOURNAL_RETENTION_SECONDS', 7 * 24 * 3600))
+JOURNAL_LEASE_SECONDS = float(os.getenv('JOURNAL_LEASE_SECONDS', 30))
+
+UNFINISHED_STATUSES = ('queued', 'running')
+
+
+class JobJournal:
+    """SQLite-backed record of jobs and their completed steps"""
+
+    def __init__(self, path: str = JOB_JOURNAL_PATH, lease_seconds: float = JOURNAL_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._owner = None
+        self._owner_pid = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                journal_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                doc_id TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS steps (
+                journal_id TEXT NOT NULL,
+                step_key TEXT NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (journal_id, step_key)
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)')
+        # Journals written before leases existed
+        for column, kind in (('lease_owner', 'TEXT'), ('lease_expires', 'REAL')):
+            try:
+                self._conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {kind}')
+            except sqlite3.OperationalError:
+                pass  # Already there, possibly added by another process just now
+
+    @property
+    def owner(self) -> str:
+        """Lease owner id of this process"""
+        if self._owner_pid != os.getpid():
+            self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            self._owner_pid = os.getpid()
+        return self._owner
+
+    # Jobs
+    def start_job(self, kind: str, doc_id: Optional[str], payload: Dict[str, Any]) -> str:
+        """Record a new job and return its journal id"""
+        journal_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (journal_id, kind, doc_id, payload, status, created_at, updated_at, '
+                'lease_owner, lease_expires) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (journal_id, kind, doc_id, json.dumps(payload), 'queued', now, now,
+                 self.owner, now + self.lease_seconds)
+            )
+        return journal_id
+
+    def set_status(self, journal_id: Optional[str], status: str):
+        if not journal_id:
+            return
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, updated_at = ? WHERE journal_id = ?',
+                (status, time.time(), journal_id)
+            )
+
+    def finish_job(self, journal_id: Optional[str], status: str):
+        """Mark a job finished and drop its step checkpoints"""
+        if not journal_id:
+            return
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, updated_at = ? WHERE journal_id = ?',
+                (status, time.time(), journal_id)
+            )
+            self._conn.execute('DELETE FROM steps WHERE journal_id = ?', (journal_id,))
+            self._conn.execute('COMMIT')
+
+    def claim_orphaned_jobs(self) -> List[Dict[str, Any]]:
+        """Lease the unfinished jobs whose owner stopped renewing them, oldest first
+
+        Each job is returned to exactly one caller across all processes sharing the journal.
+        """
+        now = time.time()
+        claimed = []
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT journal_id, kind, doc_id, payload, status, created_at, lease_expires FROM jobs '
+                'WHERE status IN (?, ?) AND (lease_expires IS NULL OR lease_expires < ?) ORDER BY created_at',
+                (*UNFINISHED_STATUSES, now)
+            ).fetchall()
+            for row in rows:
+                # Only succeeds if no other process claimed the job since the SELECT
+                cursor = self._conn.execute(
+                    'UPDATE jobs SET lease_owner = ?, lease_expires = ? '
+                    'WHERE journal_id = ? AND lease_expires IS ?',
+                    (self.owner, now + self.lease_seconds, row[0], row[6])
+                )
+                if cursor.rowcount == 1:
+                    claimed.append(row)
+        return [
+            {
+                'journal_id': row[0],
+                'kind': row[1],
+                'doc_id': row[2],
+                'payload': json.loads(row[3]),
+                'status': row[4],
+                'created_at': row[5]
+            }
+            for row in claimed
+        ]
+
+    def release(self, journal_id: str):
+        """Give up the lease of a claimed job this process could not run, so it is claimed again"""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET lease_expires = NULL WHERE journal_id = ? AND lease_owner = ?',
+                (journal_id, self.owner)
+            )
+
+    def renew_leases(self) -> int:
+        """Extend the leases of this process's unfinished jobs"""
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET lease_expires = ? WHERE lease_owner = ? AND status IN (?, ?)',
+                (time.time() + self.lease_seconds, self.owner, *UNFINISHED_STATUSES)
+            )
+        return cursor.rowcount
+
+    def start(self, resume: Callable[[], Any]):
+        """Renew this process's leases and call resume() to pick up orphaned jobs, now and periodically"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(resume,), name='journal-leases', daemon=True)
+        self._thread.start()
+
+    def _run(self, resume: Callable[[], Any]):
+        while True:
+            try:
+                self.renew_leases()
+                resume()
+            except Exception as e:
+                logger.error(f"Journal lease renewal failed: {e}")
+            if self._stop_event.wait(self.lease_seconds / 3):
+                return
+
+    def stop(self):
+        self._stop_event.set()
+
+    # Steps
+    def record_step(self, journal_id: Optional[str], step_key: str, result: Any):
+        """Checkpoint the result of a finished step"""
+        if not journal_id:
+            return
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO steps VALUES (?, ?, ?)',
+                (journal_id, step_key, json.dumps(result))
+            )
+
+    def get_step(self, journal_id: Optional[str], step_key: str) -> Optional[Any]:
+        """Result of a previously checkpointed step, or None"""
+        if not journal_id:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT result FROM steps WHERE journal_id = ? AND step_key = ?',
+                (journal_id, step_key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def completed_steps(self, journal_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute('SELECT COUNT(*) FROM steps WHERE journal_id = ?', (journal_id,)).fetchone()
+        return row[0]
+
+    # Maintenance
+    def prune(self, older_than: int = JOURNAL_RETENTION_SECONDS) -> int:
+        """Delete finished jobs older than `older_than` seconds"""
+        cutoff = time.time() - older_than
+        with self._lock:
+            cursor = self._conn.execute(
+                'DELETE FROM jobs WHERE status NOT IN (?, ?) AND updated_at < ?',
+                (*UNFINISHED_STATUSES, cutoff)
+            )
+        return cursor.rowcount
+
+
+def step_key(topic: str, challenge_type: str) -> str:
+    """Journal key of one (topic, challenge type) generation step"""
+    return f"{topic}\x1f{challenge_type}"
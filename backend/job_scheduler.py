@@ -0,0 +1,373 @@
+"""
+Bounded priority job scheduler for background document processing.
+
+Replaces the bare ThreadPoolExecutor used by app.py. Jobs are queued by
+priority (interactive generation before topic extraction before background
+work) and, within a priority, served round-robin across users so one user
+cannot starve the others. When the queue is full, submit() raises
+QueueFullError carrying a Retry-After estimate. Jobs can be cancelled while
+queued (freeing their slot immediately) or while running (cooperatively,
+through the job's CancelToken).
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Any, Optional, Callable
+
+from cancellation import CancelToken, JobCancelled, use_cancel_token
+from metrics import histogram, counter
+from tracing import span, use_span, current_span
+from profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 3))
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', 100))
+JOB_QUEUE_PER_USER = int(os.getenv('JOB_QUEUE_PER_USER', 10))
+FINISHED_JOBS_KEPT = 1000
+
+# Priorities, lowest value is served first
+PRIORITY_INTERACTIVE = 0  # challenge generation a user is waiting on
+PRIORITY_EXTRACTION = 1   # topic extraction after an upload
+PRIORITY_BACKGROUND = 2   # everything else
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_EXTRACTION, PRIORITY_BACKGROUND)
+
+# Seed duration estimate (seconds) until real jobs have been timed
+DEFAULT_JOB_SECONDS = 30.0
+
+# Metrics
+JOB_SECONDS = histogram('pqgen_job_seconds', 'Job run time by kind', ['kind'])
+JOB_WAIT_SECONDS = histogram('pqgen_job_wait_seconds', 'Time jobs spend queued before a worker picks them up', ['kind'])
+JOBS = counter('pqgen_jobs_total', 'Finished or rejected jobs by kind and status', ['kind', 'status'])
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue (or a user's share of it) is full"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Job:
+    """A unit of background work tracked by the scheduler"""
+
+    def __init__(self, func: Callable, args: tuple, kwargs: dict, priority: int,
+                 user_key: str, doc_id: Optional[str], kind: str):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.user_key = user_key
+        self.doc_id = doc_id
+        self.kind = kind
+        self.status = 'queued'
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_token = CancelToken()
+        self.trace_parent = current_span()  # span of the request that queued the job
+        self.thread_id = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'doc_id': self.doc_id,
+            'priority': self.priority,
+            'status': self.status,
+            'error': self.error,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'cancel_reason': self.cancel_token.reason,
+            'skipped': self.cancel_token.skipped_work()
+        }
+
+
+class JobScheduler:
+    """Fixed worker pool fed by a bounded, fair priority queue"""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_queue_size: int = JOB_QUEUE_SIZE,
+                 max_queued_per_user: int = JOB_QUEUE_PER_USER):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.max_queued_per_user = max_queued_per_user
+
+        self._cond = threading.Condition()
+        # priority -> user_key -> deque of jobs; user order is the round-robin order
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._queued_count = 0
+        self._queued_per_user = {}
+        self._jobs = {}  # job_id -> Job (queued, running and recently finished)
+        self._finished = deque()
+        self._doc_jobs = {}  # doc_id -> latest job_id
+        self._running = 0
+        self._avg_seconds = {}  # kind -> moving average of run time
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._rejected = 0
+        self._shutdown = False
+
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads; jobs submitted before this wait in the queue"""
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.max_workers):
+                thread = threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    # Submission
+    def submit(self, func: Callable, *args, priority: int = PRIORITY_BACKGROUND,
+               user_key: str = 'anonymous', doc_id: Optional[str] = None,
+               kind: Optional[str] = None, **kwargs) -> Job:
+        """Queue a job, raising QueueFullError when there is no room for it"""
+        job = Job(func, args, kwargs, priority, user_key, doc_id, kind or func.__name__)
+
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Job scheduler is shut down")
+            if self._queued_count >= self.max_queue_size:
+                self._rejected += 1
+                JOBS.inc(kind=job.kind, status='rejected')
+                raise QueueFullError("Job queue is full", self._retry_after())
+            if self._queued_per_user.get(user_key, 0) >= self.max_queued_per_user:
+                self._rejected += 1
+                JOBS.inc(kind=job.kind, status='rejected')
+                raise QueueFullError("Too many queued jobs for this user", self._retry_after())
+
+            self._queues[priority].setdefault(user_key, deque()).append(job)
+            self._queued_count += 1
+            self._queued_per_user[user_key] = self._queued_per_user.get(user_key, 0) + 1
+            self._jobs[job.id] = job
+            if doc_id:
+                self._doc_jobs[doc_id] = job.id
+            self._cond.notify()
+
+        logger.info(f"Queued {job.kind} job {job.id} (priority {priority}, queue depth {self._queued_count})")
+        return job
+
+    def has_capacity(self, user_key: Optional[str] = None) -> bool:
+        """Check whether a job would currently be accepted"""
+        with self._cond:
+            if self._queued_count >= self.max_queue_size:
+                return False
+            if user_key and self._queued_per_user.get(user_key, 0) >= self.max_queued_per_user:
+                return False
+            return True
+
+    def retry_after(self) -> int:
+        with self._cond:
+            return self._retry_after()
+
+    def _retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up"""
+        return max(1, int(self._average_seconds(None) / max(1, self.max_workers)))
+
+    # Dispatch
+    def _next_job(self) -> Optional[Job]:
+        """Pop the next job: highest priority first, round-robin across users"""
+        for priority in PRIORITIES:
+            users = self._queues[priority]
+            if not users:
+                continue
+            user_key, jobs = next(iter(users.items()))
+            job = jobs.popleft()
+            if jobs:
+                users.move_to_end(user_key)
+            else:
+                del users[user_key]
+            self._release_queue_slot(user_key)
+            return job
+        return None
+
+    def _release_queue_slot(self, user_key: str):
+        """Account for a job leaving the queue (caller holds the lock)"""
+        self._queued_count -= 1
+        remaining = self._queued_per_user.get(user_key, 1) - 1
+        if remaining > 0:
+            self._queued_per_user[user_key] = remaining
+        else:
+            self._queued_per_user.pop(user_key, None)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._shutdown and self._queued_count == 0:
+                    self._cond.wait()
+                if self._shutdown and self._queued_count == 0:
+                    return
+                job = self._next_job()
+                if job is None:
+                    continue
+                job.status = 'running'
+                job.started_at = time.time()
+                job.thread_id = threading.get_ident()
+                self._running += 1
+            JOB_WAIT_SECONDS.observe(job.started_at - job.submitted_at, kind=job.kind)
+
+            try:
+                with use_cancel_token(job.cancel_token), use_span(job.trace_parent), span(
+                    'job', job_id=job.id, kind=job.kind, doc_id=job.doc_id, priority=job.priority,
+                    queue_wait_seconds=round(job.started_at - job.submitted_at, 3)
+                ), profiler.profile_job(job):
+                    job.func(*job.args, **job.kwargs)
+                job.status = 'cancelled' if job.cancel_token.is_cancelled() else 'completed'
+            except JobCancelled:
+                job.status = 'cancelled'
+            except Exception as e:
+                logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+                job.status = 'failed'
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                self._record_finished(job)
+
+    def _record_finished(self, job: Job):
+        with self._cond:
+            self._running -= 1
+            if job.status == 'completed':
+                self._completed += 1
+            elif job.status == 'cancelled':
+                self._cancelled += 1
+            else:
+                self._failed += 1
+
+            duration = job.finished_at - job.started_at
+            JOB_SECONDS.observe(duration, kind=job.kind)
+            JOBS.inc(kind=job.kind, status=job.status)
+            previous = self._avg_seconds.get(job.kind)
+            self._avg_seconds[job.kind] = duration if previous is None else 0.8 * previous + 0.2 * duration
+
+            self._remember_finished(job)
+
+    def _remember_finished(self, job: Job):
+        """Keep a bounded history of finished jobs (caller holds the lock)"""
+        self._finished.append(job.id)
+        while len(self._finished) > FINISHED_JOBS_KEPT:
+            old_id = self._finished.popleft()
+            old_job = self._jobs.pop(old_id, None)
+            if old_job and old_job.doc_id and self._doc_jobs.get(old_job.doc_id) == old_id:
+                del self._doc_jobs[old_job.doc_id]
+
+    # Cancellation
+    def cancel(self, job_id: str, reason: str = 'cancelled by user') -> Optional[Job]:
+        """Cancel a job: queued jobs are dropped at once, running jobs stop at the next checkpoint"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+
+            if job.status == 'queued':
+                users = self._queues[job.priority]
+                jobs = users.get(job.user_key)
+                if jobs is not None and job in jobs:
+                    jobs.remove(job)
+                    if not jobs:
+                        del users[job.user_key]
+                    self._release_queue_slot(job.user_key)
+                job.cancel_token.cancel(reason)
+                job.cancel_token.record_skipped(stage='queued', kind=job.kind)
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+                self._cancelled += 1
+                JOBS.inc(kind=job.kind, status='cancelled')
+                self._remember_finished(job)
+            elif job.status == 'running':
+                job.cancel_token.cancel(reason)
+                job.status = 'cancelling'
+
+        logger.info(f"Cancellation requested for job {job_id} ({job.kind}): now {job.status}")
+        return job
+
+    # Introspection
+    def _average_seconds(self, kind: Optional[str]) -> float:
+        if kind and kind in self._avg_seconds:
+            return self._avg_seconds[kind]
+        if self._avg_seconds:
+            return sum(self._avg_seconds.values()) / len(self._avg_seconds)
+        return DEFAULT_JOB_SECONDS
+
+    def _dispatch_order(self) -> List[Job]:
+        """Simulate the order in which currently queued jobs will be dispatched"""
+        order = []
+        for priority in PRIORITIES:
+            users = [list(jobs) for jobs in self._queues[priority].values()]
+            index = 0
+            while users:
+                jobs = users[index]
+                order.append(jobs.pop(0))
+                if jobs:
+                    index += 1
+                else:
+                    users.pop(index)
+                if users:
+                    index %= len(users)
+        return order
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def job_for_document(self, doc_id: str) -> Optional[Job]:
+        """Latest job submitted for a document"""
+        with self._cond:
+            job_id = self._doc_jobs.get(doc_id)
+            return self._jobs.get(job_id) if job_id else None
+
+    def queue_position(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Position (1-based) and ETA in seconds of a queued job, or None if not queued"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.status != 'queued':
+                return None
+
+            order = self._dispatch_order()
+            ahead = next((i for i, queued in enumerate(order) if queued.id == job_id), len(order))
+            free_workers = max(0, self.max_workers - self._running)
+            waves = 0 if ahead < free_workers else (ahead - free_workers) // self.max_workers + 1
+            eta = waves * self._average_seconds(None) + self._average_seconds(job.kind)
+
+            return {
+                'queue_position': ahead + 1,
+                'queue_depth': self._queued_count,
+                'eta_seconds': round(eta, 1)
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'workers': self.max_workers,
+                'running': self._running,
+                'queued': self._queued_count,
+                'max_queue_size': self.max_queue_size,
+                'queued_by_priority': {
+                    priority: sum(len(jobs) for jobs in users.values())
+                    for priority, users in self._queues.items()
+                },
+                'completed': self._completed,
+                'failed': self._failed,
+                'cancelled': self._cancelled,
+                'rejected': self._rejected,
+                'average_seconds': dict(self._avg_seconds)
+            }
+
+    def shutdown(self, wait: bool = True):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -5,7 +5,7 @@ import time
 import threading
 import logging
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 # Replace torch/transformers with openai
 try:
@@ -14,6 +14,11 @@ except ImportError:
     print("OpenAI library not found. Please install with: pip install openai")
     openai = None
 
+from cancellation import JobCancelled, current_cancel_token
+from metrics import histogram, counter, FALLBACKS, ERRORS
+from tracing import traced, set_attributes
+from cassette import get_cassette
+
 # Import PDF content analyzer
 try:
     from pdf_content_analyzer import (
@@ -48,6 +53,20 @@ DEBUG_PARSING = False  # Reduced debug logging for speed
 if DEBUG_PARSING:
     logger.setLevel(logging.DEBUG)
 
+# Metrics
+OPENAI_REQUEST_SECONDS = histogram(
+    'pqgen_openai_request_seconds', 'OpenAI request latency by request type and model', ['request_type', 'model']
+)
+OPENAI_REQUESTS = counter(
+    'pqgen_openai_requests_total', 'OpenAI requests by request type, model and outcome', ['request_type', 'model', 'outcome']
+)
+JSON_PARSE_SECONDS = histogram(
+    'pqgen_json_parse_seconds', 'Time to parse LLM JSON, labelled by the strategy that succeeded', ['strategy']
+)
+HINT_GENERATION_SECONDS = histogram(
+    'pqgen_hint_generation_seconds', 'Hint generation time by challenge type', ['challenge_type']
+)
+
 # Global OpenAI client
 openai_client = None
 
@@ -75,40 +94,130 @@ def is_model_ready():
     """Check if the OpenAI model is ready for use"""
     global openai_client
     
+    # Replayed responses need no API key
+    if get_cassette().replaying:
+        return True
+    
     if openai_client is None:
         # Try to initialize if not already done
         return initialize_openai()
     
     return True
 
-def make_openai_request(messages, model="gpt-3.5-turbo", max_tokens=1000, temperature=0.7):
-    """Make OpenAI API request with new v1.0+ syntax"""
+@traced()
+def make_openai_request(messages, model="gpt-3.5-turbo", max_tokens=1000, temperature=0.7, request_type="other"):
+    """Make OpenAI API request with new v1.0+ syntax
+
+    `request_type` (the challenge type, "topics", ...) labels the request metrics and trace
+    span, and is used to match recordings when replaying from a cassette.
+    """
     global openai_client
     
+    outcome = 'error'
+    start = time.perf_counter()
+    set_attributes(model=model, request_type=request_type, max_tokens=max_tokens)
+    cassette = get_cassette()
     try:
+        # Serve a recorded response instead of calling the API
+        if cassette.replaying:
+            set_attributes(cassette='replay')
+            content = cassette.replay(messages, model, max_tokens, temperature, request_type)
+            outcome = 'replayed' if content else 'replay_miss'
+            return content
+        
         if not openai_client:
             if not initialize_openai():
+                outcome = 'unavailable'
                 return None
         
-        # Use new v1.0+ syntax
-        response = openai_client.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
-        
-        # Extract content from response
-        if response.choices and len(response.choices) > 0:
-            content = response.choices[0].message.content
-            return content
+        # Inside a cancellable job, stream so the request can be abandoned mid-flight
+        cancel_token = current_cancel_token()
+        if cancel_token is not None:
+            content = stream_openai_request(messages, model, max_tokens, temperature, cancel_token)
         else:
-            logger.warning("Empty response from OpenAI API")
+            # Use new v1.0+ syntax (raw response exposes how many retries the client made)
+            raw_response = openai_client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+            response = raw_response.parse()
+            record_usage_attributes(response.usage, raw_response.retries_taken)
+            
+            # Extract content from response
+            content = response.choices[0].message.content if response.choices else None
+            if not content:
+                logger.warning("Empty response from OpenAI API")
+        
+        if not content:
+            outcome = 'empty'
             return None
+        
+        outcome = 'success'
+        if cassette.recording:
+            cassette.record(messages, model, max_tokens, temperature, request_type,
+                            content, time.perf_counter() - start)
+        return content
             
+    except JobCancelled:
+        outcome = 'cancelled'
+        raise
     except Exception as e:
+        ERRORS.inc(stage='openai_request')
         logger.error(f"OpenAI API error: {e}")
         return None
+    finally:
+        set_attributes(outcome=outcome)
+        OPENAI_REQUESTS.inc(request_type=request_type, model=model, outcome=outcome)
+        if outcome != 'unavailable':
+            OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - start, request_type=request_type, model=model)
+
+def stream_openai_request(messages, model, max_tokens, temperature, cancel_token):
+    """Streamed OpenAI request that closes the connection as soon as the job is cancelled"""
+    cancel_token.raise_if_cancelled()
+    
+    raw_response = openai_client.chat.completions.with_raw_response.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    stream = raw_response.parse()
+    
+    parts = []
+    usage = None
+    try:
+        for chunk in stream:
+            if cancel_token.is_cancelled():
+                logger.info("Abandoning in-flight OpenAI request: job cancelled")
+                raise JobCancelled(cancel_token.reason or 'cancelled')
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+    finally:
+        stream.close()
+        record_usage_attributes(usage, raw_response.retries_taken)
+    
+    content = "".join(parts)
+    if not content:
+        logger.warning("Empty response from OpenAI API")
+        return None
+    return content
+
+def record_usage_attributes(usage, retries: int):
+    """Attach token usage and client retry count to the current trace span"""
+    attributes = {'retries': retries}
+    if usage is not None:
+        attributes.update(
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            total_tokens=usage.total_tokens
+        )
+    set_attributes(**attributes)
 
 # Initialize OpenAI on module import
 initialize_openai()
@@ -121,12 +230,20 @@ def extract_and_parse_json(text: str, expected_keys: List[str] = None) -> Dict[s
         logger.warning("Empty text provided for JSON parsing")
         return {}
     
+    start = time.perf_counter()
+    strategy, parsed = parse_json_with_strategies(text, expected_keys)
+    JSON_PARSE_SECONDS.observe(time.perf_counter() - start, strategy=strategy)
+    return parsed
+
+def parse_json_with_strategies(text: str, expected_keys: List[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """Try each parsing strategy in turn; returns (strategy name, parsed dict)"""
+    
     # Strategy 1: Direct JSON parsing
     try:
         parsed = json.loads(text)
         if isinstance(parsed, dict):
             logger.debug("Direct JSON parsing successful")
-            return parsed
+            return 'direct', parsed
     except json.JSONDecodeError:
         pass
     
@@ -145,7 +262,7 @@ def extract_and_parse_json(text: str, expected_keys: List[str] = None) -> Dict[s
                 parsed = json.loads(match)
                 if isinstance(parsed, dict):
                     logger.debug(f"JSON extracted with pattern: {pattern[:20]}...")
-                    return parsed
+                    return 'code_block', parsed
             except json.JSONDecodeError:
                 continue
     
@@ -170,7 +287,7 @@ def extract_and_parse_json(text: str, expected_keys: List[str] = None) -> Dict[s
         parsed = json.loads(cleaned)
         if isinstance(parsed, dict):
             logger.debug("JSON repair successful")
-            return parsed
+            return 'repair', parsed
             
     except json.JSONDecodeError:
         pass
@@ -198,10 +315,10 @@ def extract_and_parse_json(text: str, expected_keys: List[str] = None) -> Dict[s
         
         if result:
             logger.debug(f"Manual key extraction successful: {list(result.keys())}")
-            return result
+            return 'manual', result
     
     logger.warning("All JSON parsing strategies failed")
-    return {}
+    return 'failed', {}
 
 def generate_multiple_choice_challenge(content: str, difficulty: str, topic: str) -> Dict[str, Any]:
     """Generate multiple choice challenge with improved prompts"""
@@ -240,7 +357,7 @@ Make sure the JSON is valid and complete."""
         }
     ]
     
-    response = make_openai_request(messages, max_tokens=800, temperature=0.7)
+    response = make_openai_request(messages, max_tokens=800, temperature=0.7, request_type="multiple-choice")
     
     if not response:
         logger.warning("Empty response from OpenAI for multiple-choice challenge")
@@ -320,6 +437,7 @@ Requirements:
 5. Include the type of bug (syntax_error, logic_error, runtime_error)
 6. Provide a clear explanation of what's wrong and how to fix it
 7. Make the code runnable and realistic (not just pseudocode)
+8. Provide 3-5 test cases that call the main function of the FIXED code: "args" is the list of arguments, "expected" is the value the fixed function returns (the buggy one must fail at least one)
 
 Common bug types to use:
 - Syntax errors: wrong operators (= vs ==), missing colons, incorrect indentation
@@ -335,6 +453,7 @@ Return ONLY a JSON object with this exact structure:
     "actual_output": "What the buggy code actually produces (or error message)",
     "correct_answer": "Clear explanation of the bug and how to fix it",
     "fix_explanation": "Detailed explanation of the bug and how to fix it",
+    "test_cases": [{{"args": [[1, 2, 3]], "expected": 6}}],
     "topic": "{topic}",
     "difficulty": "{difficulty}"
 }}
@@ -352,7 +471,7 @@ Make sure the code_stub contains REAL, RUNNABLE Python code with an actual bug r
         }
     ]
     
-    response = make_openai_request(messages, max_tokens=1000, temperature=0.8)
+    response = make_openai_request(messages, max_tokens=1000, temperature=0.8, request_type="debugging")
     
     if not response:
         logger.warning("Empty response from OpenAI for debugging challenge")
@@ -391,6 +510,16 @@ Make sure the code_stub contains REAL, RUNNABLE Python code with an actual bug r
     challenge.setdefault("fix_explanation", "Analyze the code to find and fix the bug")
     challenge.setdefault("correct_answer", challenge.get("fix_explanation", "Analyze the code to find and fix the bug"))
     
+    # Keep only well-formed test cases; without them the fix is graded against expected_output
+    test_cases = challenge.pop("test_cases", None)
+    if isinstance(test_cases, list):
+        test_cases = [
+            case for case in test_cases
+            if isinstance(case, dict) and "expected" in case and isinstance(case.get("args", []), list)
+        ]
+        if test_cases:
+            challenge["test_cases"] = test_cases
+    
     return challenge
 
 def generate_fill_in_blank_challenge(content: str, difficulty: str, topic: str) -> Dict[str, Any]:
@@ -457,7 +586,7 @@ Use exactly "____" for each blank placeholder. Focus on {scenario} concepts."""
         }
     ]
     
-    response = make_openai_request(messages, max_tokens=1000, temperature=0.7)
+    response = make_openai_request(messages, max_tokens=1000, temperature=0.7, request_type="fill-in-the-blank")
     
     if not response:
         logger.warning("Empty response from OpenAI for fill-in-the-blank challenge")
@@ -510,9 +639,11 @@ Use exactly "____" for each blank placeholder. Focus on {scenario} concepts."""
     
     return challenge
 
+@traced()
 def generate_single_challenge(content: str, challenge_type: str, difficulty: str, topic: str) -> Dict[str, Any]:
     """Generate a single challenge of the specified type"""
     
+    set_attributes(topic=topic, type=challenge_type, difficulty=difficulty)
     logger.info(f"Generating {challenge_type} challenge for topic: {topic}")
     
     try:
@@ -526,12 +657,20 @@ def generate_single_challenge(content: str, challenge_type: str, difficulty: str
             logger.warning(f"Unknown challenge type: {challenge_type}")
             return {}
     
+    except JobCancelled:
+        raise
     except Exception as e:
+        ERRORS.inc(stage='challenge_generation')
         logger.error(f"Error generating {challenge_type} challenge: {e}")
         return {}
 
 def generate_short_hint_for_challenge(challenge: Dict[str, Any]) -> str:
     """Generate a short hint for a challenge"""
+    with HINT_GENERATION_SECONDS.time(challenge_type=challenge.get("type") or "unknown"):
+        return build_short_hint(challenge)
+
+def build_short_hint(challenge: Dict[str, Any]) -> str:
+    """Pre-generated hint, a fallback_hints hint, or a generic template hint"""
     
     challenge_type = challenge.get("type", "")
     topic = challenge.get("topic", "programming")
@@ -546,7 +685,8 @@ def generate_short_hint_for_challenge(challenge: Dict[str, Any]) -> str:
             try:
                 return generate_fallback_hint_for_multiple_choice(challenge)
             except:
-                pass
+                ERRORS.inc(stage='fallback_hint')
+        FALLBACKS.inc(kind='hint_template')
         return f"Think about the key concepts in {topic}. Review the question carefully."
     
     elif challenge_type == "debugging":
@@ -554,7 +694,8 @@ def generate_short_hint_for_challenge(challenge: Dict[str, Any]) -> str:
             try:
                 return generate_fallback_hint_for_debugging(challenge)
             except:
-                pass
+                ERRORS.inc(stage='fallback_hint')
+        FALLBACKS.inc(kind='hint_template')
         
         bug_type = challenge.get("bug_type", "")
         if "syntax" in bug_type.lower():
@@ -569,21 +710,29 @@ def generate_short_hint_for_challenge(challenge: Dict[str, Any]) -> str:
             try:
                 return generate_fallback_hint_for_fib(challenge)
             except:
-                pass
+                ERRORS.inc(stage='fallback_hint')
+        FALLBACKS.inc(kind='hint_template')
         return f"Consider the syntax and concepts related to {topic}."
     
     else:
         return f"Think about the fundamental concepts of {topic}."
 
-def extract_topics_from_content(content: str, file_path: str = None) -> List[str]:
-    """Extract topics from content using enhanced methods"""
+def extract_topics_from_content(content: str, file_path: str = None,
+                                analysis: Optional[Dict[str, Any]] = None) -> List[str]:
+    """Extract topics from content using enhanced methods
+
+    A precomputed `analyze_pdf_content` result can be passed as `analysis`
+    (e.g. from the CPU process pool) to avoid analyzing the text twice.
+    """
     
     logger.info("Using dynamic PDF content analysis for topic extraction")
     
     try:
-        if PDF_ANALYZER_AVAILABLE and file_path:
+        if analysis is None and PDF_ANALYZER_AVAILABLE and file_path:
             # Use enhanced PDF analysis
             analysis = analyze_pdf_content(content)
+        
+        if analysis is not None:
             topics = analysis.get('topics', [])
             
             if topics and len(topics) > 0:
@@ -591,6 +740,7 @@ def extract_topics_from_content(content: str, file_path: str = None) -> List[str
                 return topics
         
         # Fallback to LLM-based extraction
+        FALLBACKS.inc(kind='topics_llm')
         logger.info("Using LLM-based topic extraction as fallback")
         
         prompt = f"""Analyze this programming content and extract the main topics covered.
@@ -616,7 +766,7 @@ Return ONLY a JSON array like: ["Topic 1", "Topic 2", "Topic 3"]"""
             }
         ]
         
-        response = make_openai_request(messages, max_tokens=500, temperature=0.5)
+        response = make_openai_request(messages, max_tokens=500, temperature=0.5, request_type="topics")
         
         if not response:
             logger.warning("LLM topic extraction returned no response")
@@ -659,6 +809,7 @@ Return ONLY a JSON array like: ["Topic 1", "Topic 2", "Topic 3"]"""
         return []
         
     except Exception as e:
+        ERRORS.inc(stage='topic_extraction')
         logger.error(f"Error in topic extraction: {e}")
         return []
 
@@ -0,0 +1,310 @@
+"""
+Local stand-in for the OpenAI chat-completions API, for offline load tests.
+
+Serves POST /v1/chat/completions (streamed and non-streamed) with canned
+challenge payloads that match what llm_challenge_generator asks for, after a
+latency drawn from a configurable distribution. A configurable share of
+requests fail with 500s, 429s (with Retry-After) or malformed JSON content.
+GET /stats returns request and outcome counters.
+
+Point the backend at it with:
+
+    python loadtest/mock_openai.py --port 8765 --latency-dist lognormal --latency-median 1.5
+    OPENAI_API_KEY=mock OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python app.py
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any
+
+
+# Canned payloads, keyed by the request kind detected from the system prompt
+def multiple_choice_payload(topic: str, difficulty: str) -> Dict[str, Any]:
+    return {
+        "question": f"Which statement about {topic} is correct?",
+        "options": [
+            f"{topic} can only be used inside classes",
+            f"{topic} is evaluated once per program run",
+            f"{topic} follows the rules described in the course material",
+            f"{topic} is not supported in Python 3"
+        ],
+        "correct_answer": 2,
+        "explanation": f"The material describes how {topic} works; the other options are common misconceptions.",
+        "topic": topic,
+        "difficulty": difficulty
+    }
+
+
+def debugging_payload(topic: str, difficulty: str) -> Dict[str, Any]:
+    return {
+        "question": f"Find and fix the bug in this code that should sum the even numbers of a list ({topic})",
+        "code_stub": "def sum_even(values):\n    total = 0\n    for i in range(1, len(values)):\n"
+                     "        if values[i] % 2 == 0:\n            total += values[i]\n    return total\n",
+        "bug_type": "logic_error",
+        "expected_output": "sum_even([2, 3, 4]) == 6",
+        "actual_output": "sum_even([2, 3, 4]) == 4",
+        "correct_answer": "The loop starts at index 1 and skips the first element; use range(len(values)).",
+        "fix_explanation": "Off-by-one error: range(1, len(values)) skips values[0].",
+        "topic": topic,
+        "difficulty": difficulty
+    }
+
+
+def fill_in_blank_payload(topic: str, difficulty: str) -> Dict[str, Any]:
+    return {
+        "question": f"Complete the binary search implementation ({topic}) by filling in the blanks",
+        "code_with_blanks": "def binary_search(items, target):\n    low, high = 0, len(items) - ____\n"
+                            "    while low <= high:\n        mid = (low + high) ____ 2\n"
+                            "        if items[mid] == target:\n            return mid\n"
+                            "        if items[mid] < target:\n            low = mid + 1\n"
+                            "        else:\n            high = mid - 1\n    return -1\n",
+        "blanks": [
+            {"blank_number": 1, "correct_answer": "1", "options": ["0", "1", "2", "-1"],
+             "explanation": "The last valid index is len(items) - 1."},
+            {"blank_number": 2, "correct_answer": "//", "options": ["/", "//", "%", "*"],
+             "explanation": "Integer division keeps mid a valid index."}
+        ],
+        "complete_solution": "def binary_search(items, target):\n    low, high = 0, len(items) - 1\n"
+                             "    while low <= high:\n        mid = (low + high) // 2\n"
+                             "        if items[mid] == target:\n            return mid\n"
+                             "        if items[mid] < target:\n            low = mid + 1\n"
+                             "        else:\n            high = mid - 1\n    return -1\n",
+        "topic": topic,
+        "difficulty": difficulty
+    }
+
+
+TOPICS_PAYLOAD = ["Functions", "Loops", "Exception Handling", "Classes And Objects", "List Comprehensions"]
+
+
+def detect_request(messages) -> Dict[str, str]:
+    """Work out which generator sent the request, and for which topic/difficulty"""
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content", "") for m in messages if m.get("role") == "user"), "")
+    topic_match = re.search(r'about "([^"]+)"', user)
+    difficulty_match = re.search(r'with (\w+) difficulty', user)
+    if "multiple-choice" in system:
+        kind = "multiple-choice"
+    elif "debugging" in system:
+        kind = "debugging"
+    elif "fill-in-the-blank" in system:
+        kind = "fill-in-the-blank"
+    elif "analyzing programming content" in system:
+        kind = "topics"
+    else:
+        kind = "other"
+    return {
+        "kind": kind,
+        "topic": topic_match.group(1) if topic_match else "programming",
+        "difficulty": difficulty_match.group(1) if difficulty_match else "medium"
+    }
+
+
+def canned_content(request: Dict[str, str]) -> str:
+    kind, topic, difficulty = request["kind"], request["topic"], request["difficulty"]
+    if kind == "multiple-choice":
+        payload = multiple_choice_payload(topic, difficulty)
+    elif kind == "debugging":
+        payload = debugging_payload(topic, difficulty)
+    elif kind == "fill-in-the-blank":
+        payload = fill_in_blank_payload(topic, difficulty)
+    elif kind == "topics":
+        payload = TOPICS_PAYLOAD
+    else:
+        payload = {"answer": "ok"}
+    return json.dumps(payload)
+
+
+class MockBehaviour:
+    """Latency distribution and failure rates shared by all handler threads"""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.counters = Counter()
+
+    def latency(self) -> float:
+        args = self.args
+        with self.lock:
+            if args.latency_dist == 'fixed':
+                value = args.latency_median
+            elif args.latency_dist == 'uniform':
+                value = self.random.uniform(args.latency_median - args.latency_spread,
+                                            args.latency_median + args.latency_spread)
+            elif args.latency_dist == 'exponential':
+                value = self.random.expovariate(1.0 / max(args.latency_median, 1e-6))
+            else:  # lognormal: median and sigma of the underlying normal
+                value = args.latency_median * self.random.lognormvariate(0.0, args.latency_spread)
+        return max(0.0, value)
+
+    def outcome(self) -> str:
+        """'ok', 'error' (500), 'rate_limited' (429) or 'malformed'"""
+        args = self.args
+        with self.lock:
+            roll = self.random.random()
+        for name, rate in (('error', args.error_rate), ('rate_limited', args.rate_limit_rate),
+                           ('malformed', args.malformed_rate)):
+            if roll < rate:
+                return name
+            roll -= rate
+        return 'ok'
+
+    def count(self, *keys: str):
+        with self.lock:
+            for key in keys:
+                self.counters[key] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    behaviour = None  # set by make_server()
+
+    def log_message(self, format, *args):
+        if self.behaviour.args.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: Any, headers: Dict[str, str] = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.behaviour.stats())
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        request = detect_request(body.get("messages", []))
+        outcome = self.behaviour.outcome()
+        self.behaviour.count('requests', f"kind:{request['kind']}", f"outcome:{outcome}")
+        time.sleep(self.behaviour.latency())
+
+        if outcome == 'error':
+            self._send_json(500, {"error": {"message": "Mock server error", "type": "server_error"}})
+            return
+        if outcome == 'rate_limited':
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                            headers={'Retry-After': str(self.behaviour.args.retry_after)})
+            return
+
+        content = canned_content(request)
+        if outcome == 'malformed':
+            content = content[:len(content) // 2]
+        model = body.get("model", "gpt-3.5-turbo")
+        usage = {
+            "prompt_tokens": sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4,
+            "completion_tokens": len(content) // 4
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if body.get("stream"):
+            self._stream(model, content, usage, body.get("stream_options") or {})
+        else:
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+    def _stream(self, model: str, content: str, usage: Dict[str, int], stream_options: Dict[str, Any]):
+        """Send the content as server-sent events, spreading chunks over the stream"""
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def event(choices, extra=None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": choices}
+            chunk.update(extra or {})
+            self.wfile.write(b'data: ' + json.dumps(chunk).encode() + b'\n\n')
+            self.wfile.flush()
+
+        chunks = max(1, self.behaviour.args.stream_chunks)
+        size = max(1, -(-len(content) // chunks))
+        try:
+            for start in range(0, len(content), size):
+                event([{"index": 0, "delta": {"content": content[start:start + size]}, "finish_reason": None}])
+                time.sleep(self.behaviour.args.chunk_delay)
+            event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if stream_options.get("include_usage"):
+                event([], {"usage": usage})
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client abandoned the stream (e.g. the job was cancelled)
+            self.behaviour.count('streams_abandoned')
+
+
+def make_server(args) -> ThreadingHTTPServer:
+    handler = type('Handler', (MockOpenAIHandler,), {'behaviour': MockBehaviour(args)})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat-completions server for load tests")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-dist', choices=['fixed', 'uniform', 'lognormal', 'exponential'], default='lognormal')
+    parser.add_argument('--latency-median', type=float, default=1.0,
+                        help="Median latency in seconds (mean for exponential)")
+    parser.add_argument('--latency-spread', type=float, default=0.5,
+                        help="Sigma for lognormal, half-width for uniform")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with a 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="Share of responses with truncated JSON")
+    parser.add_argument('--stream-chunks', type=int, default=8, help="Chunks per streamed response")
+    parser.add_argument('--chunk-delay', type=float, default=0.01, help="Seconds between streamed chunks")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = make_server(args)
+    print(f"Mock OpenAI server listening on http://{args.host}:{args.port}/v1 "
+          f"({args.latency_dist} latency, median {args.latency_median}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
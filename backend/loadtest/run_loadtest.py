@@ -0,0 +1,342 @@
+"""
+Scripted load-test client for the PQGen backend.
+
+Each virtual user runs the full student flow against a running server:
+upload a PDF -> poll progress until topics are ready -> generate challenges
+-> poll until they are ready -> fetch them -> submit an attempt for each.
+At the end the client reports throughput, p50/p95/p99 latency and error
+rates per endpoint, plus end-to-end flow timings.
+
+Run the backend against the mock OpenAI server (see mock_openai.py), then:
+
+    python loadtest/run_loadtest.py --base-url http://127.0.0.1:5000 --users 20 --flows 3
+
+Only the standard library is needed; a synthetic PDF is generated with
+PyMuPDF when --pdf is not given.
+"""
+
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List, Any, Optional, Tuple
+
+
+class Recorder:
+    """Thread-safe latency and status collection, grouped by endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)  # endpoint -> seconds
+        self.statuses = defaultdict(lambda: defaultdict(int))  # endpoint -> status -> count
+        self.flows = defaultdict(list)  # flow stage -> seconds
+        self.flow_results = defaultdict(int)  # 'completed' / failure reason -> count
+
+    def request(self, endpoint: str, seconds: float, status: Any):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+    def flow_stage(self, stage: str, seconds: float):
+        with self.lock:
+            self.flows[stage].append(seconds)
+
+    def flow_result(self, result: str):
+        with self.lock:
+            self.flow_results[result] += 1
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct * len(ordered) / 100.0))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else 0.0,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else 0.0
+    }
+
+
+def make_pdf(pages: int = 3) -> bytes:
+    """Synthetic course-notes PDF with enough programming content to extract topics from"""
+    import fitz
+
+    text = (
+        "1. Function Definition and parameters\n"
+        "Functions are defined with the def keyword and return values.\n"
+        "2. Loop Structures: for loops and while loops iterate over sequences.\n"
+        "3. Exception handling with try except finally blocks.\n"
+        "4. Classes, objects and inheritance in object-oriented programming.\n"
+        "5. Data structures: list, dictionary, set and tuple operations.\n"
+        "def average(values):\n    return sum(values) / len(values)\n"
+    )
+    document = fitz.open()
+    for _ in range(pages):
+        page = document.new_page()
+        page.insert_text((50, 72), text, fontsize=11)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+class Client:
+    """Minimal JSON/multipart HTTP client that records every request"""
+
+    def __init__(self, base_url: str, recorder: Recorder, timeout: float):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+
+    def call(self, method: str, path: str, endpoint: str, json_body: Any = None,
+             body: bytes = None, headers: Dict[str, str] = None) -> Tuple[Optional[int], Any]:
+        headers = dict(headers or {})
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+
+        start = time.perf_counter()
+        status, payload = None, None
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status = response.status
+                payload = response.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+            payload = e.read()
+        except Exception as e:
+            self.recorder.request(endpoint, time.perf_counter() - start, type(e).__name__)
+            return None, None
+        self.recorder.request(endpoint, time.perf_counter() - start, status)
+
+        try:
+            return status, json.loads(payload) if payload else None
+        except ValueError:
+            return status, None
+
+    def upload(self, pdf: bytes, filename: str) -> Tuple[Optional[int], Any]:
+        boundary = uuid.uuid4().hex
+        body = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/pdf\r\n\r\n'
+        ).encode() + pdf + f'\r\n--{boundary}--\r\n'.encode()
+        return self.call('POST', '/api/upload', 'POST /api/upload', body=body,
+                         headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+
+def answer_for(challenge: Dict[str, Any], correct: bool) -> Any:
+    """A right (or deliberately wrong) answer in the format submit_attempt expects"""
+    challenge_type = challenge.get('type')
+    if challenge_type == 'multiple-choice':
+        answer = int(challenge.get('correct_answer', 0))
+        return answer if correct else (answer + 1) % max(len(challenge.get('options', [])), 2)
+    if challenge_type == 'fill-in-the-blank':
+        answers = [blank.get('correct_answer') for blank in challenge.get('blanks', [])]
+        return json.dumps(answers if correct else ['?'] * len(answers))
+    return challenge.get('code_stub', '') if correct else 'no idea'
+
+
+def wait_for_status(client: Client, doc_id: str, args, until) -> Optional[Dict[str, Any]]:
+    """Poll progress until `until(progress)` holds, the job fails, or the flow times out"""
+    deadline = time.time() + args.flow_timeout
+    while time.time() < deadline:
+        status, progress = client.call('GET', f'/api/documents/{doc_id}/progress',
+                                       'GET /api/documents/:id/progress')
+        if status == 200 and progress:
+            if progress.get('status') in ('error', 'cancelled'):
+                return progress
+            if until(progress):
+                return progress
+        time.sleep(args.poll_interval)
+    return None
+
+
+def run_flow(client: Client, recorder: Recorder, pdf: bytes, args, rng: random.Random):
+    flow_start = time.perf_counter()
+
+    status, body = client.upload(pdf, f"loadtest-{uuid.uuid4().hex[:8]}.pdf")
+    if status != 200 or not body:
+        recorder.flow_result(f'upload_{status}')
+        return
+    doc_id = body['document_id']
+
+    progress = wait_for_status(client, doc_id, args, lambda p: p.get('status') == 'completed' and p.get('topics'))
+    if not progress or progress.get('status') != 'completed':
+        recorder.flow_result('extraction_' + (progress or {}).get('status', 'timeout'))
+        return
+    recorder.flow_stage('upload_to_topics', time.perf_counter() - flow_start)
+
+    topics = progress['topics'][:args.topics]
+    generate_start = time.perf_counter()
+    status, body = client.call('POST', f'/api/documents/{doc_id}/generate', 'POST /api/documents/:id/generate',
+                               json_body={'topics': [{'topic': t, 'difficulty': args.difficulty} for t in topics]})
+    if status != 200:
+        recorder.flow_result(f'generate_{status}')
+        return
+
+    progress = wait_for_status(client, doc_id, args, lambda p: p.get('status') == 'completed')
+    if not progress or progress.get('status') != 'completed':
+        recorder.flow_result('generation_' + (progress or {}).get('status', 'timeout'))
+        return
+    recorder.flow_stage('generate_to_challenges', time.perf_counter() - generate_start)
+
+    status, body = client.call('GET', f'/api/documents/{doc_id}/challenges', 'GET /api/documents/:id/challenges')
+    if status != 200 or not body:
+        recorder.flow_result(f'challenges_{status}')
+        return
+
+    for challenge in body.get('challenges', [])[:args.attempts]:
+        correct = rng.random() < args.correct_rate
+        client.call('POST', f"/api/challenges/{challenge['id']}/attempt", 'POST /api/challenges/:id/attempt',
+                    json_body={'answer': answer_for(challenge, correct)})
+
+    recorder.flow_stage('full_flow', time.perf_counter() - flow_start)
+    recorder.flow_result('completed')
+
+
+def virtual_user(index: int, client: Client, recorder: Recorder, pdf: bytes, args, stop_at: Optional[float]):
+    rng = random.Random(args.seed + index if args.seed is not None else None)
+    time.sleep(rng.uniform(0, args.ramp_up))
+    flows = 0
+    while True:
+        if stop_at is not None and time.time() >= stop_at:
+            break
+        if stop_at is None and flows >= args.flows:
+            break
+        try:
+            run_flow(client, recorder, pdf, args, rng)
+        except Exception as e:
+            recorder.flow_result(f'exception_{type(e).__name__}')
+        flows += 1
+
+
+def build_report(recorder: Recorder, elapsed: float, args) -> Dict[str, Any]:
+    endpoints = {}
+    total_requests = 0
+    total_errors = 0
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        statuses = dict(recorder.statuses[endpoint])
+        errors = sum(count for status, count in statuses.items() if not (isinstance(status, int) and status < 400))
+        total_requests += len(latencies)
+        total_errors += errors
+        endpoints[endpoint] = dict(
+            summarize(latencies),
+            throughput_rps=len(latencies) / elapsed if elapsed else 0.0,
+            error_rate=errors / len(latencies) if latencies else 0.0,
+            statuses={str(status): count for status, count in statuses.items()}
+        )
+
+    completed = recorder.flow_results.get('completed', 0)
+    return {
+        'config': {
+            'base_url': args.base_url,
+            'users': args.users,
+            'flows_per_user': args.flows if not args.duration else None,
+            'duration': args.duration,
+            'topics': args.topics
+        },
+        'elapsed_seconds': elapsed,
+        'requests': total_requests,
+        'throughput_rps': total_requests / elapsed if elapsed else 0.0,
+        'error_rate': total_errors / total_requests if total_requests else 0.0,
+        'flows_completed': completed,
+        'flows_per_minute': completed * 60.0 / elapsed if elapsed else 0.0,
+        'flow_results': dict(recorder.flow_results),
+        'flow_stages': {stage: summarize(values) for stage, values in recorder.flows.items()},
+        'endpoints': endpoints
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\nElapsed {report['elapsed_seconds']:.1f}s, {report['requests']} requests, "
+          f"{report['throughput_rps']:.1f} req/s, error rate {report['error_rate']:.2%}")
+    print(f"Flows completed: {report['flows_completed']} ({report['flows_per_minute']:.1f}/min); "
+          f"results: {report['flow_results']}\n")
+
+    header = f"{'endpoint':<40} {'count':>7} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'err%':>7}"
+    print(header)
+    print('-' * len(header))
+    for endpoint, stats in report['endpoints'].items():
+        print(f"{endpoint:<40} {stats['count']:>7} {stats['throughput_rps']:>7.1f} "
+              f"{stats['p50'] * 1000:>6.0f}ms {stats['p95'] * 1000:>6.0f}ms {stats['p99'] * 1000:>6.0f}ms "
+              f"{stats['max'] * 1000:>6.0f}ms {stats['error_rate'] * 100:>6.1f}%")
+
+    if report['flow_stages']:
+        print(f"\n{'flow stage':<40} {'count':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for stage, stats in report['flow_stages'].items():
+            print(f"{stage:<40} {stats['count']:>7} {stats['p50']:>7.2f}s {stats['p95']:>7.2f}s {stats['p99']:>7.2f}s")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Drive upload -> generate -> attempt flows against the backend")
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument('--flows', type=int, default=1, help="Flows per user (ignored with --duration)")
+    parser.add_argument('--duration', type=float, default=None, help="Run for this many seconds instead")
+    parser.add_argument('--ramp-up', type=float, default=2.0, help="Spread user start times over this many seconds")
+    parser.add_argument('--pdf', default=None, help="PDF to upload (default: a generated one)")
+    parser.add_argument('--pages', type=int, default=3, help="Pages in the generated PDF")
+    parser.add_argument('--topics', type=int, default=2, help="Topics to generate challenges for")
+    parser.add_argument('--difficulty', default='medium')
+    parser.add_argument('--attempts', type=int, default=3, help="Challenges to attempt per flow")
+    parser.add_argument('--correct-rate', type=float, default=0.7, help="Share of attempts answered correctly")
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--flow-timeout', type=float, default=300.0)
+    parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', dest='json_path', default=None, help="Also write the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.pdf:
+        with open(args.pdf, 'rb') as f:
+            pdf = f.read()
+    else:
+        pdf = make_pdf(args.pages)
+
+    recorder = Recorder()
+    client = Client(args.base_url, recorder, args.timeout)
+    stop_at = time.time() + args.duration if args.duration else None
+
+    print(f"Running {args.users} users against {args.base_url} "
+          f"({f'{args.duration}s' if args.duration else f'{args.flows} flows each'})")
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=virtual_user, args=(i, client, recorder, pdf, args, stop_at), daemon=True)
+        for i in range(args.users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    report = build_report(recorder, elapsed, args)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json_path}")
+    return 0 if report['flows_completed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""
+Dependency-free metrics registry with Prometheus text exposition.
+
+Counters, gauges and histograms are created once at module level next to the
+code they measure and updated from any thread. Gauges can be backed by a
+function that is sampled at scrape time (queue depth, pool usage, store
+sizes). Work that runs in the CPU process pool records into a sample buffer
+(`collect_samples`) which the parent process replays into its own registry,
+so process-pool timings show up on the parent's /metrics endpoint.
+"""
+
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Callable, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default histogram buckets in seconds, from fast regex passes to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Per-thread sample buffer used by collect_samples()
+_sink = threading.local()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class: a named family of time series keyed by label values"""
+
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _record(self, op: str, key: Tuple[str, ...], value: float):
+        """Apply an update, or buffer it when running under collect_samples()"""
+        samples = getattr(_sink, 'samples', None)
+        if samples is not None:
+            samples.append((self.name, op, key, value))
+        else:
+            self._apply(op, key, value)
+
+    def _apply(self, op: str, key: Tuple[str, ...], value: float):
+        raise NotImplementedError
+
+    def _label_text(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        self._record('inc', self._key(labels), amount)
+
+    def _apply(self, op: str, key: Tuple[str, ...], value: float):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{self._label_text(key)} {_format_value(value)}' for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, optionally sampled from a function at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+        self._function = None
+
+    def set(self, value: float, **labels):
+        self._record('set', self._key(labels), value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        self._record('inc', self._key(labels), amount)
+
+    def dec(self, amount: float = 1.0, **labels):
+        self._record('inc', self._key(labels), -amount)
+
+    def set_function(self, function: Callable[[], Any]) -> 'Gauge':
+        """Sample the gauge from `function` at scrape time
+
+        Without labels the function returns a number; with labels it returns a
+        dict mapping a label value (or a tuple of label values) to a number.
+        """
+        self._function = function
+        return self
+
+    def _apply(self, op: str, key: Tuple[str, ...], value: float):
+        with self._lock:
+            if op == 'set':
+                self._values[key] = value
+            else:
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def _sampled_values(self) -> Dict[Tuple[str, ...], float]:
+        try:
+            sampled = self._function()
+        except Exception as e:
+            logger.warning(f"Failed to sample gauge {self.name}: {e}")
+            return {}
+        if not self.labelnames:
+            return {(): float(sampled)}
+        values = {}
+        for key, value in sampled.items():
+            key = key if isinstance(key, tuple) else (key,)
+            values[tuple(str(part) for part in key)] = float(value)
+        return values
+
+    def _render_samples(self) -> List[str]:
+        if self._function is not None:
+            items = sorted(self._sampled_values().items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f'{self.name}{self._label_text(key)} {_format_value(value)}' for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (latencies in seconds) in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        self._record('observe', self._key(labels), value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Time a block (or, used as a decorator, a function call)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _apply(self, op: str, key: Tuple[str, ...], value: float):
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[-1] if series else 0
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            for bound, bucket_count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{self._label_text(key, ("le", _format_value(bound)))} {bucket_count}')
+            lines.append(f'{self.name}_bucket{self._label_text(key, ("le", "+Inf"))} {series[-1]}')
+            lines.append(f'{self.name}_sum{self._label_text(key)} {_format_value(series[-2])}')
+            lines.append(f'{self.name}_count{self._label_text(key)} {series[-1]}')
+        return lines
+
+
+class MetricsRegistry:
+    """Named collection of metrics; creating an existing metric returns it"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        with self._lock:
+            return self._metrics.get(name)
+
+    def replay(self, samples: List[Tuple[str, str, Tuple[str, ...], float]]):
+        """Apply samples buffered by collect_samples(), e.g. in another process"""
+        for name, op, key, value in samples:
+            metric = self.get(name)
+            if metric is None:
+                logger.warning(f"Dropping sample for unknown metric {name}")
+                continue
+            metric._apply(op, tuple(key), value)
+
+    def render(self) -> str:
+        """Prometheus text exposition of every registered metric"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def collect_samples():
+    """Buffer metric updates made by this thread instead of applying them"""
+    previous = getattr(_sink, 'samples', None)
+    samples = []
+    _sink.samples = samples
+    try:
+        yield samples
+    finally:
+        _sink.samples = previous
+
+
+# Global registry
+registry = MetricsRegistry()
+
+
+# Convenience functions
+def counter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+    return registry.counter(name, help_text, labelnames)
+
+def gauge(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return registry.gauge(name, help_text, labelnames)
+
+def histogram(name: str, help_text: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return registry.histogram(name, help_text, labelnames, buckets)
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+# Shared counters used across modules
+FALLBACKS = counter('pqgen_fallbacks_total', 'Times a fallback path was used instead of the primary one', ['kind'])
+ERRORS = counter('pqgen_errors_total', 'Errors by pipeline stage', ['stage'])
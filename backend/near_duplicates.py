@@ -0,0 +1,218 @@
+"""
+Near-duplicate detection for generated challenges.
+
+Randomized prompts regularly produce almost the same question for different
+topics. Each challenge's question, options and code are reduced to a set of
+token 3-gram shingles and summarized by a MinHash signature; an LSH index
+over signature bands finds candidates in time independent of how many
+challenges are indexed, and candidates are confirmed by the estimated
+Jaccard similarity.
+
+Signatures use one-permutation hashing: every shingle hash is placed in one
+of NUM_BINS bins by its top bits and each bin keeps its minimum, so a
+signature costs a single pass over the shingles (tens of microseconds)
+instead of one pass per hash function. Empty bins are filled from the next
+non-empty bin ("rotation" densification) so short texts still compare like
+full MinHash signatures.
+"""
+
+import os
+import re
+import zlib
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple, Hashable
+
+from metrics import counter, histogram
+
+# Configuration
+DUPLICATE_THRESHOLD = float(os.getenv('DUPLICATE_THRESHOLD', 0.7))
+DUPLICATE_MAX_REGENERATIONS = int(os.getenv('DUPLICATE_MAX_REGENERATIONS', 2))
+SERVED_HISTORY_USERS = int(os.getenv('SERVED_HISTORY_USERS', 10000))
+SERVED_HISTORY_PER_USER = int(os.getenv('SERVED_HISTORY_PER_USER', 500))
+
+NUM_BINS = 64
+LSH_BANDS = 16  # 4 bins per band: pairs above ~0.5 similarity almost always share a band
+SHINGLE_SIZE = 3
+
+# Fields holding the text a student actually sees
+TEXT_FIELDS = ('question', 'options', 'code_stub', 'buggy_code', 'code_with_blanks', 'code_template', 'code_snippet')
+
+_MASK64 = (1 << 64) - 1
+_VALUE_BITS = 58  # the top 6 bits of a mixed hash pick the bin
+_VALUE_MASK = (1 << _VALUE_BITS) - 1
+_EMPTY = 1 << _VALUE_BITS
+_TOKEN = re.compile(r'\w+|[^\w\s]')
+
+Signature = Tuple[int, ...]
+
+# Metrics
+DUPLICATE_CHECK_SECONDS = histogram(
+    'pqgen_duplicate_check_seconds', 'Time to sign a challenge and query the near-duplicate index',
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+)
+DUPLICATES = counter('pqgen_challenge_duplicates_total', 'Near-duplicate challenges by outcome', ['outcome'])
+
+
+def challenge_text(challenge: Dict[str, Any]) -> str:
+    parts = []
+    for field in TEXT_FIELDS:
+        value = challenge.get(field)
+        if isinstance(value, list):
+            parts.extend(str(item) for item in value)
+        elif value:
+            parts.append(str(value))
+    return '\n'.join(parts)
+
+
+def signature(text: str) -> Signature:
+    """MinHash signature of the text's token 3-grams"""
+    tokens = _TOKEN.findall(text.lower())
+    bins = [_EMPTY] * NUM_BINS
+    for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1)):
+        h = (zlib.crc32(' '.join(tokens[i:i + SHINGLE_SIZE]).encode()) * 0x9E3779B97F4A7C15) & _MASK64
+        b = h >> _VALUE_BITS
+        value = h & _VALUE_MASK
+        if value < bins[b]:
+            bins[b] = value
+
+    # Densify: an empty bin borrows the next non-empty bin's value, offset by the distance
+    if _EMPTY in bins:
+        filled = [i for i, value in enumerate(bins) if value != _EMPTY]
+        if not filled:
+            return tuple(bins)
+        result = list(bins)
+        nxt = filled[0] + NUM_BINS
+        for i in range(NUM_BINS - 1, -1, -1):
+            if bins[i] != _EMPTY:
+                nxt = i
+            else:
+                distance = nxt - i
+                result[i] = bins[nxt % NUM_BINS] + distance * _EMPTY
+        return tuple(result)
+    return tuple(bins)
+
+
+def challenge_signature(challenge: Dict[str, Any]) -> Signature:
+    return signature(challenge_text(challenge))
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    return sum(x == y for x, y in zip(a, b)) / NUM_BINS
+
+
+class MinHashIndex:
+    """LSH index of signatures; thread-safe, optionally bounded to the newest max_entries"""
+
+    def __init__(self, threshold: float = DUPLICATE_THRESHOLD, max_entries: Optional[int] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._rows = NUM_BINS // LSH_BANDS
+        self._lock = threading.Lock()
+        self._signatures = OrderedDict()  # key -> signature, oldest first
+        self._buckets = [{} for _ in range(LSH_BANDS)]  # band -> band values -> keys
+
+    def _bands(self, sig: Signature):
+        rows = self._rows
+        return [sig[band * rows:(band + 1) * rows] for band in range(LSH_BANDS)]
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _find(self, sig: Signature, threshold: float) -> Optional[Tuple[Hashable, float]]:
+        candidates = set()
+        for band, values in enumerate(self._bands(sig)):
+            candidates.update(self._buckets[band].get(values, ()))
+        best = None
+        for key in candidates:
+            score = similarity(sig, self._signatures[key])
+            if score >= threshold and (best is None or score > best[1]):
+                best = (key, score)
+        return best
+
+    def find_duplicate(self, sig: Signature, threshold: Optional[float] = None) -> Optional[Tuple[Hashable, float]]:
+        """(key, similarity) of the most similar indexed signature at or above the threshold, or None"""
+        with self._lock:
+            return self._find(sig, self.threshold if threshold is None else threshold)
+
+    def add(self, key: Hashable, sig: Signature):
+        with self._lock:
+            self._add(key, sig)
+
+    def add_if_distinct(self, key: Hashable, sig: Signature) -> Optional[Tuple[Hashable, float]]:
+        """Index the signature unless it duplicates one already indexed; returns that duplicate"""
+        with self._lock:
+            duplicate = self._find(sig, self.threshold)
+            if duplicate is None:
+                self._add(key, sig)
+            return duplicate
+
+    def _add(self, key: Hashable, sig: Signature):
+        if key in self._signatures:
+            self._remove(key)
+        self._signatures[key] = sig
+        for band, values in enumerate(self._bands(sig)):
+            self._buckets[band].setdefault(values, set()).add(key)
+        if self.max_entries and len(self._signatures) > self.max_entries:
+            self._remove(next(iter(self._signatures)))
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            if key in self._signatures:
+                self._remove(key)
+
+    def _remove(self, key: Hashable):
+        sig = self._signatures.pop(key)
+        for band, values in enumerate(self._bands(sig)):
+            bucket = self._buckets[band].get(values)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][values]
+
+
+def check_challenge(index: MinHashIndex, challenge: Dict[str, Any]) -> Optional[Tuple[Hashable, float]]:
+    """Add the challenge to the index unless it near-duplicates an indexed one; returns the duplicate"""
+    start = time.perf_counter()
+    duplicate = index.add_if_distinct(challenge.get('id'), challenge_signature(challenge))
+    DUPLICATE_CHECK_SECONDS.observe(time.perf_counter() - start)
+    return duplicate
+
+
+class ServedChallenges:
+    """Signatures of the challenges each user was served, for the newest users"""
+
+    def __init__(self, max_users: int = SERVED_HISTORY_USERS, per_user: int = SERVED_HISTORY_PER_USER):
+        self.max_users = max_users
+        self.per_user = per_user
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # user key -> MinHashIndex
+
+    def _index(self, user_key: str, create: bool) -> Optional[MinHashIndex]:
+        with self._lock:
+            index = self._users.get(user_key)
+            if index is None and create:
+                index = self._users[user_key] = MinHashIndex(max_entries=self.per_user)
+                if len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            if index is not None:
+                self._users.move_to_end(user_key)
+            return index
+
+    def record(self, user_key: Optional[str], challenges: List[Dict[str, Any]]):
+        if not user_key:
+            return
+        index = self._index(user_key, create=True)
+        for challenge in challenges:
+            index.add(challenge.get('id'), challenge_signature(challenge))
+
+    def was_served(self, user_key: Optional[str], challenge: Dict[str, Any]) -> bool:
+        """Whether the user already saw this challenge or a near-duplicate of it"""
+        index = self._index(user_key, create=False) if user_key else None
+        return bool(index) and index.find_duplicate(challenge_signature(challenge)) is not None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'users': len(self._users), 'challenges': sum(len(index) for index in self._users.values())}
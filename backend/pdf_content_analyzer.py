@@ -3,6 +3,8 @@ import logging
 import os
 from typing import List, Dict, Any, Optional, Tuple
 
+from metrics import histogram, ERRORS
+
 # PDF processing libraries
 try:
     import pdfplumber
@@ -29,6 +31,10 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Metrics
+PDF_EXTRACTION_SECONDS = histogram('pqgen_pdf_extraction_seconds', 'PDF text extraction time per backend', ['backend'])
+ANALYZE_PDF_CONTENT_SECONDS = histogram('pqgen_analyze_pdf_content_seconds', 'Time spent in analyze_pdf_content')
+
 def extract_text_from_pdf(pdf_path: str) -> str:
     """
     Extract text from PDF using multiple methods for maximum compatibility
@@ -42,57 +48,65 @@ def extract_text_from_pdf(pdf_path: str) -> str:
     # Method 1: Try pdfplumber (best for structured text)
     if PDFPLUMBER_AVAILABLE:
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
+            with PDF_EXTRACTION_SECONDS.time(backend='pdfplumber'):
+                with pdfplumber.open(pdf_path) as pdf:
+                    for page in pdf.pages:
+                        page_text = page.extract_text()
+                        if page_text:
+                            text += page_text + "\n"
             
             if text.strip():
                 logger.info(f"Successfully extracted {len(text)} characters using pdfplumber")
                 return text
         except Exception as e:
+            ERRORS.inc(stage='pdf_extraction_pdfplumber')
             logger.warning(f"pdfplumber extraction failed: {e}")
     
     # Method 2: Try PyMuPDF (good for complex layouts)
     if PYMUPDF_AVAILABLE and not text.strip():
         try:
-            pdf_document = fitz.open(pdf_path)
-            for page_num in range(pdf_document.page_count):
-                page = pdf_document[page_num]
-                page_text = page.get_text()
-                if page_text:
-                    text += page_text + "\n"
-            pdf_document.close()
+            with PDF_EXTRACTION_SECONDS.time(backend='pymupdf'):
+                pdf_document = fitz.open(pdf_path)
+                for page_num in range(pdf_document.page_count):
+                    page = pdf_document[page_num]
+                    page_text = page.get_text()
+                    if page_text:
+                        text += page_text + "\n"
+                pdf_document.close()
             
             if text.strip():
                 logger.info(f"Successfully extracted {len(text)} characters using PyMuPDF")
                 return text
         except Exception as e:
+            ERRORS.inc(stage='pdf_extraction_pymupdf')
             logger.warning(f"PyMuPDF extraction failed: {e}")
     
     # Method 3: Try PyPDF2 (fallback)
     if PYPDF2_AVAILABLE and not text.strip():
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
+            with PDF_EXTRACTION_SECONDS.time(backend='pypdf2'):
+                with open(pdf_path, 'rb') as file:
+                    pdf_reader = PyPDF2.PdfReader(file)
+                    for page in pdf_reader.pages:
+                        page_text = page.extract_text()
+                        if page_text:
+                            text += page_text + "\n"
             
             if text.strip():
                 logger.info(f"Successfully extracted {len(text)} characters using PyPDF2")
                 return text
         except Exception as e:
+            ERRORS.inc(stage='pdf_extraction_pypdf2')
             logger.warning(f"PyPDF2 extraction failed: {e}")
     
     if not text.strip():
+        ERRORS.inc(stage='pdf_extraction')
         logger.error("All PDF extraction methods failed")
         return ""
     
     return text
 
+@ANALYZE_PDF_CONTENT_SECONDS.time()
 def analyze_pdf_content(text: str) -> Dict[str, Any]:
     """
     Enhanced analysis of PDF content with improved topic extraction
@@ -186,7 +200,7 @@ def extract_topics_from_headings(text: str) -> List[str]:
         r'^#+\s+(.+)$',  # Markdown headings
         r'^\d+\.\s*(.+)$',  # Numbered sections
         r'^\d+\.\d+\s*(.+)$',  # Sub-numbered sections
-        r'^[A-Z][A-Z\s]{5,}$',  # ALL CAPS headings
+        r'^([A-Z][A-Z\s]{5,})$',  # ALL CAPS headings
         r'^(.+):$',  # Colon-terminated headings
         r'^\*\*(.+)\*\*$',  # Bold headings
         r'^(.+)\n[=-]{3,}$',  # Underlined headings
@@ -626,6 +640,53 @@ def clean_topic_text(text: str) -> str:
     
     return text.strip()
 
+def get_topic_snippet(text: str, topic: str, window_chars: int = 2000) -> str:
+    """
+    Return up to `window_chars` of `text` centered on the first occurrence of `topic`.
+    If `topic` isn't found, return the first `window_chars` of the text.
+    """
+    lower = text.lower()
+    idx = lower.find(topic.lower())
+    if idx != -1:
+        half = window_chars // 2
+        start = max(0, idx - half)
+        end = min(len(text), idx + half)
+        return text[start:end]
+    return text[:window_chars]
+
+def validate_topics(raw_topics: List[str], content: str) -> List[str]:
+    """
+    Validate and clean extracted topics
+    """
+    valid_topics = []
+    
+    for topic in raw_topics:
+        if not topic or not isinstance(topic, str):
+            continue
+            
+        topic = topic.strip()
+        
+        # Skip empty or very short topics
+        if len(topic) < 3:
+            continue
+            
+        # Skip very long topics (likely not actual topics)
+        if len(topic) > 50:
+            continue
+            
+        # Skip topics that are just numbers or special characters
+        if topic.isdigit() or not any(c.isalpha() for c in topic):
+            continue
+            
+        # Clean up the topic
+        topic = topic.replace('_', ' ').title()
+        
+        # Add if not already present
+        if topic not in valid_topics:
+            valid_topics.append(topic)
+    
+    return valid_topics[:10]  # Limit to 10 topics
+
 # Backward compatibility functions (maintain original API)
 def get_topics_from_pdf_analysis(pdf_path: str) -> List[str]:
     """
@@ -0,0 +1,363 @@
+"""
+On-demand sampling profiler for background jobs.
+
+An admin can profile the whole process for N seconds, or one document's next
+(or currently running) job. A sampler thread snapshots the stacks of the
+profiled threads with sys._current_frames(). Work the job sends to the CPU
+process pool is sampled inside the worker process and merged back. Each
+session writes a collapsed-stack file (flamegraph.pl / speedscope input) and a
+top-functions summary to PROFILE_OUTPUT_DIR.
+
+When no session is active, the hooks in the scheduler and worker pools cost a
+dict lookup and an attribute check.
+"""
+
+import os
+import sys
+import time
+import uuid
+import logging
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+PROFILE_OUTPUT_DIR = os.getenv('PROFILE_OUTPUT_DIR', 'profiles')
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.01))
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', 300))
+PROFILE_SESSIONS_KEPT = 50
+TOP_FUNCTIONS = 25
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def thread_cpu_time(thread_id: int) -> Optional[float]:
+    """CPU seconds used so far by a thread, or None where per-thread clocks are unavailable"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+
+def collapse_stack(frame, root: str) -> str:
+    """Collapsed-stack line for a frame: root first, innermost frame last"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.append(root)
+    return ';'.join(reversed(labels))
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a conflicting profile session is already active"""
+
+
+class StackSampler:
+    """Background thread that periodically samples the stacks of selected threads"""
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL, thread_ids: Optional[set] = None):
+        self.interval = interval
+        self.thread_ids = thread_ids  # None samples every thread but the sampler
+        self.counts = Counter()
+        self.samples = 0
+        self.idle = 0
+        self._cpu_times = {}  # thread id -> CPU time at the previous sample
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        return self.counts
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if self.thread_ids is not None and thread_id not in self.thread_ids:
+                    continue
+                # Only count threads that used CPU since the last sample; a thread
+                # blocked in a queue, socket or lock is not a hotspot
+                cpu_time = thread_cpu_time(thread_id)
+                previous = self._cpu_times.get(thread_id)
+                self._cpu_times[thread_id] = cpu_time
+                if cpu_time is not None and (previous is None or cpu_time <= previous):
+                    self.idle += 1
+                    continue
+                self.counts[collapse_stack(frame, names.get(thread_id, str(thread_id)))] += 1
+            self.samples += 1
+
+
+def sample_call(fn: Callable, *args, interval: float = PROFILE_SAMPLE_INTERVAL):
+    """Run `fn(*args)` on this thread while sampling it; returns (result, stack counts)"""
+    sampler = StackSampler(interval, {threading.get_ident()})
+    sampler.start()
+    try:
+        result = fn(*args)
+    finally:
+        counts = sampler.stop()
+    # Root the worker's stacks at 'cpu-pool' whatever the forked thread was called
+    return result, {'cpu-pool;' + stack.split(';', 1)[-1]: count for stack, count in counts.items()}
+
+
+class ProfileSession:
+    """One profiling run and its accumulated stack samples"""
+
+    def __init__(self, mode: str, interval: float, doc_id: Optional[str] = None,
+                 kind: Optional[str] = None, seconds: Optional[float] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode  # 'process' or 'document'
+        self.doc_id = doc_id
+        self.kind = kind
+        self.seconds = seconds
+        self.interval = interval
+        self.status = 'armed'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.job_id = None
+        self.files = {}
+        self.top_functions = []
+        self.stacks = Counter()
+        self.sampler = None
+        self._lock = threading.Lock()
+
+    def add_stacks(self, stacks: Dict[str, int]):
+        with self._lock:
+            self.stacks.update(stacks)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.stacks.values())
+        return {
+            'session_id': self.id,
+            'mode': self.mode,
+            'doc_id': self.doc_id,
+            'kind': self.kind,
+            'job_id': self.job_id,
+            'seconds': self.seconds,
+            'interval': self.interval,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'samples': total,
+            'idle_samples': self.sampler.idle if self.sampler else 0,
+            'files': self.files,
+            'top_functions': self.top_functions
+        }
+
+
+class ProfilerManager:
+    """Starts, attaches and finishes profile sessions"""
+
+    def __init__(self, output_dir: str = PROFILE_OUTPUT_DIR):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # session_id -> ProfileSession
+        self._armed = {}  # doc_id -> session waiting for the document's next job
+        self._thread_sessions = {}  # thread id -> document session sampling that thread
+        self._process_session = None
+
+    # Starting sessions
+    def profile_process(self, seconds: float, interval: float = PROFILE_SAMPLE_INTERVAL) -> ProfileSession:
+        """Sample every thread (and CPU pool task) for `seconds`"""
+        seconds = min(seconds, PROFILE_MAX_SECONDS)
+        with self._lock:
+            if self._process_session is not None:
+                raise ProfilerBusyError("A process-wide profile is already running")
+            session = ProfileSession('process', interval, seconds=seconds)
+            self._remember(session)
+            self._start_sampling(session, thread_ids=None)
+            self._process_session = session
+        timer = threading.Timer(seconds, self._finish, args=(session,))
+        timer.daemon = True
+        timer.start()
+        logger.info(f"Started process-wide profile {session.id} for {seconds}s")
+        return session
+
+    def profile_document(self, doc_id: str, kind: Optional[str] = None,
+                         interval: float = PROFILE_SAMPLE_INTERVAL, running_job=None) -> ProfileSession:
+        """Profile a document's running job, or arm a session for its next job"""
+        with self._lock:
+            if doc_id in self._armed:
+                raise ProfilerBusyError("A profile is already armed for this document")
+            session = ProfileSession('document', interval, doc_id=doc_id, kind=kind)
+            self._remember(session)
+            if running_job is not None and running_job.thread_id is not None:
+                self._attach_job(session, running_job)
+            else:
+                self._armed[doc_id] = session
+        logger.info(f"Profile {session.id} {session.status} for document {doc_id}")
+        return session
+
+    def _remember(self, session: ProfileSession):
+        self._sessions[session.id] = session
+        while len(self._sessions) > PROFILE_SESSIONS_KEPT:
+            self._sessions.popitem(last=False)
+
+    def _start_sampling(self, session: ProfileSession, thread_ids: Optional[set]):
+        session.status = 'running'
+        session.started_at = time.time()
+        session.sampler = StackSampler(session.interval, thread_ids)
+        session.sampler.start()
+
+    def _attach_job(self, session: ProfileSession, job):
+        """Start sampling a job's worker thread (caller holds the lock)"""
+        session.job_id = job.id
+        session.kind = job.kind
+        self._thread_sessions[job.thread_id] = session
+        self._start_sampling(session, {job.thread_id})
+        # Safety net in case the job ends before the session is attached
+        timer = threading.Timer(PROFILE_MAX_SECONDS, self._expire, args=(session,))
+        timer.daemon = True
+        timer.start()
+
+    # Hooks used by the scheduler and worker pools
+    def current_session(self) -> Optional[ProfileSession]:
+        """Session that should sample work started from this thread, if any"""
+        if not self._thread_sessions and self._process_session is None:
+            return None
+        return self._thread_sessions.get(threading.get_ident()) or self._process_session
+
+    @contextmanager
+    def profile_job(self, job):
+        """Wrap a scheduler job: start an armed session for it and finish it afterwards"""
+        if self._armed and job.doc_id in self._armed:
+            with self._lock:
+                session = self._armed.get(job.doc_id)
+                if session is not None and session.kind in (None, job.kind):
+                    del self._armed[job.doc_id]
+                    self._attach_job(session, job)
+        try:
+            yield
+        finally:
+            if self._thread_sessions:
+                with self._lock:
+                    session = self._thread_sessions.get(job.thread_id)
+                    if session is None or session.job_id != job.id:
+                        session = None
+                if session is not None:
+                    self._expire(session)
+
+    @contextmanager
+    def attach_thread(self, session: Optional[ProfileSession]):
+        """Sample the current thread for `session` while it runs a helper task (I/O pool)"""
+        if session is None or session.sampler is None or session.sampler.thread_ids is None:
+            yield
+            return
+        thread_id = threading.get_ident()
+        with self._lock:
+            session.sampler.thread_ids.add(thread_id)
+            self._thread_sessions[thread_id] = session
+        try:
+            yield
+        finally:
+            with self._lock:
+                session.sampler.thread_ids.discard(thread_id)
+                if self._thread_sessions.get(thread_id) is session:
+                    del self._thread_sessions[thread_id]
+
+    # Finishing
+    def _expire(self, session: ProfileSession):
+        """Detach a document session from its threads and finish it"""
+        with self._lock:
+            self._thread_sessions = {
+                thread_id: other for thread_id, other in self._thread_sessions.items()
+                if other is not session
+            }
+        self._finish(session)
+
+    def _finish(self, session: ProfileSession):
+        with session._lock:
+            if session.status != 'running':
+                return
+            session.status = 'finishing'
+        session.add_stacks(session.sampler.stop())
+        session.status = 'finished'
+        session.finished_at = time.time()
+        with self._lock:
+            if self._process_session is session:
+                self._process_session = None
+        try:
+            self._write_output(session)
+        except Exception as e:
+            logger.error(f"Failed to write profile {session.id}: {e}")
+        logger.info(f"Profile {session.id} finished with {sum(session.stacks.values())} samples")
+
+    def _write_output(self, session: ProfileSession):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with session._lock:
+            stacks = dict(session.stacks)
+        session.top_functions = top_functions(stacks)
+
+        collapsed_path = os.path.join(self.output_dir, f"{session.id}.collapsed")
+        with open(collapsed_path, 'w') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        summary_path = os.path.join(self.output_dir, f"{session.id}.top.txt")
+        target = f"document {session.doc_id} ({session.kind})" if session.mode == 'document' else f"process for {session.seconds}s"
+        total = sum(stacks.values())
+        with open(summary_path, 'w') as f:
+            f.write(f"Profile {session.id}: {target}, {total} samples every {session.interval * 1000:g} ms\n\n")
+            f.write(f"{'self%':>7} {'total%':>7} {'self':>7} {'total':>7}  function\n")
+            for entry in session.top_functions:
+                f.write(
+                    f"{entry['self_percent']:>7.1f} {entry['total_percent']:>7.1f} "
+                    f"{entry['self']:>7} {entry['total']:>7}  {entry['function']}\n"
+                )
+        session.files = {'collapsed': collapsed_path, 'summary': summary_path}
+
+    # Introspection
+    def get_session(self, session_id: str) -> Optional[ProfileSession]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def sessions(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [session.to_dict() for session in reversed(sessions)]
+
+
+def top_functions(stacks: Dict[str, int], limit: int = TOP_FUNCTIONS) -> List[Dict[str, Any]]:
+    """Functions ranked by self samples, with inclusive (total) samples alongside"""
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')[1:]  # drop the thread name root
+        if not frames:
+            continue
+        self_counts[frames[-1]] += count
+        for frame in set(frames):
+            total_counts[frame] += count
+
+    total = max(sum(stacks.values()), 1)
+    return [
+        {
+            'function': function,
+            'self': count,
+            'total': total_counts[function],
+            'self_percent': round(100.0 * count / total, 1),
+            'total_percent': round(100.0 * total_counts[function] / total, 1)
+        }
+        for function, count in self_counts.most_common(limit)
+    ]
+
+
+# Global profiler
+profiler = ProfilerManager()
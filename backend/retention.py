@@ -0,0 +1,343 @@
+"""
+Retention policy for in-memory document state and uploaded files.
+
+The per-document stores in app.py (documents, progress, topics, challenges and
+challenge states) are plain dicts that would otherwise grow forever. This module
+expires their entries after a configurable per-store TTL, keeps the resident
+documents under a memory budget with an LRU over whole documents, and runs a
+background sweeper that also deletes expired files from the upload folder and
+garbage-collects unreferenced blobs.
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Configuration (seconds / megabytes, overridable through the environment)
+DOCUMENT_TTL_SECONDS = int(os.getenv('DOCUMENT_TTL_SECONDS', 6 * 3600))
+PROGRESS_TTL_SECONDS = int(os.getenv('PROGRESS_TTL_SECONDS', 2 * 3600))
+TOPICS_TTL_SECONDS = int(os.getenv('TOPICS_TTL_SECONDS', 6 * 3600))
+CHALLENGES_TTL_SECONDS = int(os.getenv('CHALLENGES_TTL_SECONDS', 6 * 3600))
+CHALLENGE_STATE_TTL_SECONDS = int(os.getenv('CHALLENGE_STATE_TTL_SECONDS', 12 * 3600))
+UPLOAD_TTL_SECONDS = int(os.getenv('UPLOAD_TTL_SECONDS', 6 * 3600))
+MEMORY_BUDGET_MB = int(os.getenv('RETENTION_MEMORY_BUDGET_MB', 512))
+SWEEP_INTERVAL_SECONDS = int(os.getenv('RETENTION_SWEEP_INTERVAL_SECONDS', 60))
+
+# Stores keyed by document id; challenge_states is keyed by challenge id
+DOCUMENT_STORES = ('documents', 'document_progress', 'document_topics', 'document_challenges')
+CHALLENGE_STATE_STORE = 'challenge_states'
+
+DEFAULT_TTLS = {
+    'documents': DOCUMENT_TTL_SECONDS,
+    'document_progress': PROGRESS_TTL_SECONDS,
+    'document_topics': TOPICS_TTL_SECONDS,
+    'document_challenges': CHALLENGES_TTL_SECONDS,
+    'challenge_states': CHALLENGE_STATE_TTL_SECONDS,
+}
+
+
+def estimate_size(obj: Any, seen: Optional[set] = None) -> int:
+    """Approximate the deep in-memory size of a JSON-like object in bytes"""
+    if seen is None:
+        seen = set()
+
+    obj_id = id(obj)
+    if obj_id in seen:
+        return 0
+    seen.add(obj_id)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, seen) + estimate_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += estimate_size(item, seen)
+
+    return size
+
+
+class RetentionManager:
+    """Expires and evicts per-document state so memory stays bounded"""
+
+    def __init__(self, stores: Dict[str, dict], upload_folder: str,
+                 ttls: Optional[Dict[str, int]] = None,
+                 memory_budget_bytes: int = MEMORY_BUDGET_MB * 1024 * 1024,
+                 upload_ttl: int = UPLOAD_TTL_SECONDS,
+                 sweep_interval: int = SWEEP_INTERVAL_SECONDS,
+                 blob_store=None):
+        self.stores = stores
+        self.upload_folder = upload_folder
+        self.blob_store = blob_store
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.upload_ttl = upload_ttl
+        self.sweep_interval = sweep_interval
+
+        self._lock = threading.RLock()
+        self._lru = OrderedDict()  # doc_id -> last access time, oldest first
+        self._touched = {name: {} for name in stores}  # store -> key -> last access
+        self._doc_challenges = {}  # doc_id -> [challenge ids]
+        self._challenge_docs = {}  # challenge id -> doc_id
+        self._sizes = {}  # doc_id -> estimated resident bytes
+        self._pinned = {}  # doc_id -> number of running jobs using it
+        self._evictions = {name: 0 for name in stores}
+        self._evictions_by_reason = {'ttl': 0, 'memory': 0}
+        self._uploads_deleted = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # Access tracking
+    def touch(self, store: str, key: str):
+        """Record an access to `key` in `store`, refreshing its TTL and LRU position"""
+        now = time.time()
+        with self._lock:
+            self._touched.setdefault(store, {})[key] = now
+            if store in DOCUMENT_STORES:
+                self._lru[key] = now
+                self._lru.move_to_end(key)
+
+    def touch_document(self, doc_id: str):
+        """Record an access to every resident store entry of a document"""
+        now = time.time()
+        with self._lock:
+            for store in DOCUMENT_STORES:
+                if doc_id in self.stores.get(store, {}):
+                    self._touched[store][doc_id] = now
+            for cid in self._doc_challenges.get(doc_id, []):
+                if cid in self.stores.get(CHALLENGE_STATE_STORE, {}):
+                    self._touched[CHALLENGE_STATE_STORE][cid] = now
+            if doc_id in self._lru or doc_id in self.stores.get('documents', {}):
+                self._lru[doc_id] = now
+                self._lru.move_to_end(doc_id)
+
+    def touch_challenge(self, challenge_id: str):
+        """Record an attempt at a challenge, refreshing the document that owns it and all its challenges"""
+        with self._lock:
+            doc_id = self._challenge_docs.get(challenge_id)
+            if doc_id is None:
+                self.touch(CHALLENGE_STATE_STORE, challenge_id)
+            else:
+                self.touch_document(doc_id)
+
+    def track_challenges(self, doc_id: str, challenge_ids: Iterable[str]):
+        """Associate challenge ids with a document so they are evicted together"""
+        now = time.time()
+        with self._lock:
+            ids = list(challenge_ids)
+            for cid in self._doc_challenges.get(doc_id, []):
+                self._challenge_docs.pop(cid, None)
+            self._doc_challenges[doc_id] = ids
+            for cid in ids:
+                self._challenge_docs[cid] = doc_id
+                self._touched[CHALLENGE_STATE_STORE][cid] = now
+
+    def pin(self, doc_id: str):
+        """Protect a document from eviction while a job is working on it"""
+        with self._lock:
+            self._pinned[doc_id] = self._pinned.get(doc_id, 0) + 1
+
+    def unpin(self, doc_id: str):
+        """Release a pin taken with pin()"""
+        with self._lock:
+            count = self._pinned.get(doc_id, 0) - 1
+            if count > 0:
+                self._pinned[doc_id] = count
+            else:
+                self._pinned.pop(doc_id, None)
+
+    # Memory budget
+    def update_size(self, doc_id: str):
+        """Recompute the resident size of a document and enforce the memory budget"""
+        seen = set()
+        size = 0
+        for store in DOCUMENT_STORES:
+            value = self.stores.get(store, {}).get(doc_id)
+            if value is not None:
+                size += estimate_size(value, seen)
+        states = self.stores.get(CHALLENGE_STATE_STORE, {})
+        with self._lock:
+            challenge_ids = list(self._doc_challenges.get(doc_id, []))
+        for cid in challenge_ids:
+            state = states.get(cid)
+            if state is not None:
+                size += estimate_size(state, seen)
+
+        with self._lock:
+            self._sizes[doc_id] = size
+        self.enforce_budget()
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def enforce_budget(self) -> int:
+        """Evict least recently used documents until under the memory budget"""
+        evicted = 0
+        while True:
+            with self._lock:
+                if sum(self._sizes.values()) <= self.memory_budget_bytes:
+                    break
+                victim = next((doc_id for doc_id in self._lru if doc_id not in self._pinned), None)
+            if victim is None:
+                logger.warning("Retention memory budget exceeded but every resident document is pinned")
+                break
+            self.evict_document(victim, reason='memory')
+            evicted += 1
+        return evicted
+
+    # Eviction
+    def evict_document(self, doc_id: str, reason: str = 'ttl'):
+        """Remove a document from every store and delete its uploaded file"""
+        doc_info = self.stores.get('documents', {}).get(doc_id)
+
+        with self._lock:
+            for store in DOCUMENT_STORES:
+                if self.stores.get(store, {}).pop(doc_id, None) is not None:
+                    self._evictions[store] += 1
+                self._touched[store].pop(doc_id, None)
+            for cid in self._doc_challenges.pop(doc_id, []):
+                self._challenge_docs.pop(cid, None)
+                if self.stores.get(CHALLENGE_STATE_STORE, {}).pop(cid, None) is not None:
+                    self._evictions[CHALLENGE_STATE_STORE] += 1
+                self._touched[CHALLENGE_STATE_STORE].pop(cid, None)
+            self._lru.pop(doc_id, None)
+            self._sizes.pop(doc_id, None)
+            self._evictions_by_reason[reason] = self._evictions_by_reason.get(reason, 0) + 1
+
+        if doc_info and doc_info.get('file_path'):
+            self._delete_upload(doc_info['file_path'])
+
+        logger.info(f"Evicted document {doc_id} ({reason})")
+
+    def _delete_upload(self, path: str):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+                with self._lock:
+                    self._uploads_deleted += 1
+        except OSError as e:
+            logger.warning(f"Failed to delete upload {path}: {e}")
+
+    def sweep(self) -> Dict[str, int]:
+        """Expire entries past their store TTL and delete stale uploads"""
+        now = time.time()
+        expired_docs = []
+        expired_entries = []
+
+        with self._lock:
+            for store, touched in self._touched.items():
+                ttl = self.ttls.get(store)
+                if not ttl:
+                    continue
+                for key, last_access in list(touched.items()):
+                    if now - last_access < ttl:
+                        continue
+                    if store == CHALLENGE_STATE_STORE:
+                        expired_entries.append((store, key))
+                    elif key in self._pinned:
+                        continue
+                    elif store == 'documents':
+                        expired_docs.append(key)
+                    else:
+                        expired_entries.append((store, key))
+
+        for doc_id in expired_docs:
+            self.evict_document(doc_id, reason='ttl')
+
+        for store, key in expired_entries:
+            with self._lock:
+                if self.stores.get(store, {}).pop(key, None) is not None:
+                    self._evictions[store] += 1
+                self._touched[store].pop(key, None)
+
+        # Documents that lost all their entries no longer count against the budget
+        for doc_id in {key for store, key in expired_entries if store in DOCUMENT_STORES}:
+            if doc_id in self.stores.get('documents', {}):
+                self.update_size(doc_id)
+
+        uploads_removed = self._sweep_uploads(now)
+        blobs_removed = self.blob_store.collect_garbage(now) if self.blob_store else 0
+
+        return {
+            'documents_expired': len(expired_docs),
+            'entries_expired': len(expired_entries),
+            'uploads_removed': uploads_removed,
+            'blobs_removed': blobs_removed
+        }
+
+    def _sweep_uploads(self, now: float) -> int:
+        """Delete upload files that outlived the upload TTL and belong to no resident document"""
+        if not os.path.isdir(self.upload_folder):
+            return 0
+
+        resident_paths = {
+            os.path.abspath(info.get('file_path', ''))
+            for info in list(self.stores.get('documents', {}).values())
+            if isinstance(info, dict)
+        }
+
+        removed = 0
+        for entry in os.scandir(self.upload_folder):
+            if not entry.is_file():
+                continue
+            if os.path.abspath(entry.path) in resident_paths:
+                continue
+            try:
+                # ctime, not mtime: linking an old blob in for a new upload updates only ctime
+                if now - entry.stat().st_ctime < self.upload_ttl:
+                    continue
+            except OSError:
+                continue
+            self._delete_upload(entry.path)
+            removed += 1
+        return removed
+
+    # Background sweeper
+    def start(self):
+        """Start the background sweeper thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='retention-sweeper', daemon=True)
+        self._thread.start()
+        logger.info(f"Retention sweeper started (interval {self.sweep_interval}s, budget {self.memory_budget_bytes // (1024 * 1024)} MB)")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop_event.wait(self.sweep_interval):
+            try:
+                result = self.sweep()
+                if any(result.values()):
+                    logger.info(f"Retention sweep: {result}")
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}")
+
+    # Reporting
+    def stats(self) -> Dict[str, Any]:
+        """Eviction counters and resident sizes for every managed store"""
+        with self._lock:
+            return {
+                'resident_entries': {name: len(store) for name, store in self.stores.items()},
+                'resident_documents': len(self._lru),
+                'resident_bytes': sum(self._sizes.values()),
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'pinned_documents': len(self._pinned),
+                'evictions': dict(self._evictions),
+                'evictions_by_reason': dict(self._evictions_by_reason),
+                'uploads_deleted': self._uploads_deleted,
+                'ttls': dict(self.ttls),
+                'upload_ttl': self.upload_ttl
+            }
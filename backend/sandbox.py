@@ -0,0 +1,526 @@
+"""
+Resource-limited execution of student code inside evaluation workers.
+
+Evaluation workers (see EvaluationPool in worker_pools.py) are separate
+processes, so student code never runs in the web process. Each worker caps
+its address space with RLIMIT_AS (EVAL_MEMORY_MB beyond what the worker
+already maps), cannot write files larger than the output cap, may start at
+most EVAL_MAX_PROCESSES processes (RLIMIT_NPROC), and closes the file
+descriptors it inherited from the server. Workers start with a scrubbed
+environment in an empty directory, and drop whatever environment and import
+path remains before serving tasks, so student code cannot read the server's
+secrets or import its modules. Every test case then runs inside limited(),
+which arms:
+
+- a CPU-time timer (ITIMER_PROF, EVAL_CPU_SECONDS) that interrupts busy
+  loops,
+- a wall-clock timer (EVAL_WALL_SECONDS) that interrupts code blocked in
+  sleep() and the like,
+- captured stdout/stderr that stop accepting text past EVAL_OUTPUT_BYTES,
+  and an empty stdin so input() fails instead of blocking.
+
+Limit violations are raised as BaseException subclasses so student code
+cannot swallow them with `except Exception`. Code that swallows them anyway,
+or disables the signals, is killed when its task overruns the wall-clock
+backstop the pool sends with every task.
+
+Workers are not forked from the web process. A template process (a fresh
+interpreter running template_main) imports the stdlib modules submissions
+commonly use once, then forks a worker in well under a millisecond whenever
+the pool asks for one, handing the worker's socket back over the control
+socket. A worker serves up to EVAL_MAX_TASKS_PER_WORKER tasks before it is
+retired.
+
+A worker never runs student code itself. For every task it forks a task
+process that closes the worker's socket before the task starts and hands
+its result back through a pipe of its own (run_isolated), so student code
+can neither write to the pool's socket nor touch the next submission's
+channel; a task process that writes anything beyond its one result frame
+is reported as crashed. The task process leads a session of its own, so
+every process student code starts is killed along with it, and it dies
+with its worker. Since the task process may still forge its own
+result, it is only trusted with what the submission could produce anyway:
+test cases reach it without their expected values, and the web process
+decides whether each one passed (see result_digest).
+
+Pool and worker talk in length-prefixed JSON frames: a request is
+[request id, task name, args, timeout], a reply is
+[request id, status, payload, recycle]. A reply for another request, or
+bytes after a reply, make the pool replace the worker. Tasks are looked up
+by name in TASKS, and the web process never unpickles anything a worker
+sends.
+"""
+
+import io
+import os
+import sys
+import json
+import hashlib
+import time
+import select
+import signal
+import socket
+import ctypes
+import struct
+import resource
+import importlib
+import traceback
+from contextlib import contextmanager
+from typing import Any, Optional
+
+# Configuration
+EVAL_CPU_SECONDS = float(os.getenv('EVAL_CPU_SECONDS', 2))
+EVAL_WALL_SECONDS = float(os.getenv('EVAL_WALL_SECONDS', 3))
+EVAL_MEMORY_MB = int(os.getenv('EVAL_MEMORY_MB', 256))
+EVAL_OUTPUT_BYTES = int(os.getenv('EVAL_OUTPUT_BYTES', 64 * 1024))
+EVAL_MAX_TASKS_PER_WORKER = int(os.getenv('EVAL_MAX_TASKS_PER_WORKER', 50))
+# Processes student code may start on top of those the user already runs
+EVAL_MAX_PROCESSES = int(os.getenv('EVAL_MAX_PROCESSES', 32))
+EVAL_MAX_OPEN_FILES = 64
+MAX_MESSAGE_BYTES = 4 * 1024 * 1024
+MAX_TRACEBACK_CHARS = 2000
+
+# How long a task process may take to exit after sending its result
+TASK_EXIT_SECONDS = 0.2
+
+# Environment variables a worker keeps; everything else is dropped before any task runs
+WORKER_ENV_KEYS = ('PATH',)
+
+PR_SET_PDEATHSIG = 1
+
+# Imported once by the template so forked workers start with them loaded
+PRELOAD_MODULES = (
+    'math', 'cmath', 'random', 're', 'string', 'collections', 'itertools', 'functools', 'operator',
+    'heapq', 'bisect', 'array', 'copy', 'json', 'typing', 'dataclasses', 'enum', 'statistics',
+    'decimal', 'fractions', 'datetime', 'time', 'textwrap', 'unicodedata'
+)
+
+_FRAME = struct.Struct('!I')
+
+
+class EvaluationError(Exception):
+    """Raised in the web process when a submission could not be evaluated"""
+
+
+class EvaluationTimeout(EvaluationError):
+    """The task overran its wall-clock backstop and was killed"""
+
+
+class EvaluationCrashed(EvaluationError):
+    """The task died while evaluating (e.g. os._exit() or the kernel OOM killer) or tampered with its result"""
+
+
+class EvaluationBusy(EvaluationError):
+    """No evaluation worker became free in time"""
+
+
+class LimitExceeded(BaseException):
+    """Raised inside a worker when student code breaks a limit"""
+
+
+class TimeLimitExceeded(LimitExceeded):
+    pass
+
+
+class OutputLimitExceeded(LimitExceeded):
+    pass
+
+
+class CappedOutput(io.StringIO):
+    """stdout/stderr replacement that refuses text past a size limit"""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+        self.size = 0
+
+    def write(self, text: str) -> int:
+        self.size += len(text)
+        if self.size > self.limit:
+            raise OutputLimitExceeded(f"Output limit exceeded ({self.limit // 1024} KB)")
+        return super().write(text)
+
+
+# (CPU seconds, wall seconds) of the innermost limited() block, for the error messages
+_active_limits = (EVAL_CPU_SECONDS, EVAL_WALL_SECONDS)
+
+
+def _on_cpu_limit(signum, frame):
+    raise TimeLimitExceeded(f"CPU time limit exceeded ({_active_limits[0]:g}s)")
+
+
+def _on_wall_limit(signum, frame):
+    raise TimeLimitExceeded(f"Time limit exceeded ({_active_limits[1]:g}s)")
+
+
+def _address_space_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def _install_handlers():
+    signal.signal(signal.SIGPROF, _on_cpu_limit)
+    signal.signal(signal.SIGALRM, _on_wall_limit)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Writes beyond RLIMIT_FSIZE fail with EFBIG instead of killing the worker
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+
+
+def _user_process_count() -> int:
+    """Processes and threads running as this user, which is what RLIMIT_NPROC counts"""
+    uid = os.getuid()
+    count = 0
+    try:
+        entries = list(os.scandir('/proc'))
+    except OSError:
+        return 0
+    for entry in entries:
+        if entry.name.isdigit():
+            try:
+                if entry.stat().st_uid == uid:
+                    count += len(os.listdir(os.path.join(entry.path, 'task')))
+            except OSError:
+                pass
+    return count
+
+
+def confine_worker(keep_fds=(), memory_mb: int = EVAL_MEMORY_MB):
+    """Apply the process-wide limits; called once when a worker starts"""
+    # Nothing of the server's environment or source tree is left for student code
+    for key in list(os.environ):
+        if key not in WORKER_ENV_KEYS:
+            del os.environ[key]
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path[:] = [path for path in sys.path if path and os.path.abspath(path) != backend_dir]
+
+    # Sockets and files of the web process must not be reachable from student code,
+    # and writes to the raw stdio descriptors must not end up in the server log
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    low = 3
+    for fd in sorted(set(keep_fds)):
+        os.closerange(low, fd)
+        low = fd + 1
+    os.closerange(low, os.sysconf('SC_OPEN_MAX'))
+
+    memory = _address_space_bytes() + memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (EVAL_OUTPUT_BYTES, EVAL_OUTPUT_BYTES))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (EVAL_MAX_OPEN_FILES, EVAL_MAX_OPEN_FILES))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    # The count is per user, so the limit leaves room for what the user already runs
+    processes = _user_process_count() + EVAL_MAX_PROCESSES
+    resource.setrlimit(resource.RLIMIT_NPROC, (processes, processes))
+
+    _install_handlers()
+
+
+@contextmanager
+def limited(cpu_seconds: float = EVAL_CPU_SECONDS, wall_seconds: float = EVAL_WALL_SECONDS,
+            output_bytes: int = EVAL_OUTPUT_BYTES):
+    """Run the block under CPU, wall-clock and output limits; yields the captured output"""
+    global _active_limits
+    _active_limits = (cpu_seconds, wall_seconds)
+    output = CappedOutput(output_bytes)
+    saved = sys.stdin, sys.stdout, sys.stderr
+    signal.setitimer(signal.ITIMER_PROF, cpu_seconds)
+    signal.setitimer(signal.ITIMER_REAL, wall_seconds)
+    sys.stdin, sys.stdout, sys.stderr = io.StringIO(), output, output
+    try:
+        yield output
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        # Student code may have replaced the handlers; the next block needs them back
+        _install_handlers()
+        sys.stdin, sys.stdout, sys.stderr = saved
+
+
+def describe_error(error: BaseException) -> str:
+    """Message reported to the student for an exception raised by their code"""
+    if isinstance(error, LimitExceeded):
+        return str(error)
+    if isinstance(error, MemoryError):
+        return f"Memory limit exceeded ({EVAL_MEMORY_MB} MB)"
+    if isinstance(error, SystemExit):
+        return "Your code called exit()"
+    return f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+
+
+def portable(value: Any, limit: int = 1000) -> Any:
+    """A value the worker can send back: plain data as is, anything else as a bounded repr"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= limit else value[:limit] + '...'
+    if isinstance(value, (list, tuple)) and len(value) <= 100:
+        return [portable(item, limit) for item in value]
+    if isinstance(value, dict) and len(value) <= 100 and all(isinstance(k, str) for k in value):
+        return {k: portable(v, limit) for k, v in value.items()}
+    try:
+        text = repr(value)
+    except BaseException:
+        text = f"<{type(value).__name__}>"
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def result_digest(value: Any) -> str:
+    """Digest of a value's text, compared with the digest of a test case's expected value"""
+    return hashlib.sha256(str(value).strip().encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def write_message(fd: int, message: Any):
+    """Send one frame: a 4-byte big-endian length followed by compact JSON"""
+    body = json.dumps(message, separators=(',', ':')).encode()
+    data = memoryview(_FRAME.pack(len(body)) + body)
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def _read_exactly(fd: int, size: int, deadline: Optional[float]) -> bytes:
+    chunks = []
+    while size:
+        if deadline is not None:
+            poller = select.poll()
+            poller.register(fd, select.POLLIN)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not poller.poll(remaining * 1000):
+                raise TimeoutError("No reply before the deadline")
+        chunk = os.read(fd, min(size, 1024 * 1024))
+        if not chunk:
+            raise EOFError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_message(fd: int, timeout: Optional[float] = None) -> Any:
+    """Receive one frame; raises EOFError, TimeoutError, or ValueError for a malformed frame"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    size, = _FRAME.unpack(_read_exactly(fd, _FRAME.size, deadline))
+    if size > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Message of {size} bytes exceeds the {MAX_MESSAGE_BYTES} byte limit")
+    return json.loads(_read_exactly(fd, size, deadline))
+
+
+# Tasks, run inside workers
+
+def run_test_cases(user_code: str, function_name: str, test_cases: list,
+                   case_seconds: float = EVAL_WALL_SECONDS, stop_on_error: bool = False) -> dict:
+    """Define the user's function and run it on each test case, each step within case_seconds
+
+    A test case passes its 'input' as the only argument, or its 'args' as the argument list.
+    Test cases carry no expected values: each result has the 'actual' value for display and
+    its 'digest' (result_digest) for the web process to compare.
+
+    Returns an 'error' (None if the function could be defined), the per-test 'test_results'
+    with their run time, and whether any of it 'timed_out'. With stop_on_error, the results
+    end at the first test that raises.
+    """
+    cpu_seconds = min(EVAL_CPU_SECONDS, case_seconds)
+    namespace = {}
+    try:
+        with limited(cpu_seconds, case_seconds):
+            exec(compile(user_code, '<submission>', 'exec'), namespace)
+    except BaseException as e:
+        return {'error': f"Error defining function: {describe_error(e)}", 'test_results': [],
+                'timed_out': isinstance(e, TimeLimitExceeded)}
+
+    function = namespace.get(function_name)
+    if not callable(function):
+        return {'error': f"Function '{function_name}' not found.", 'test_results': [], 'timed_out': False}
+
+    test_results = []
+    timed_out = False
+    for test_case in test_cases:
+        result = {'actual': None, 'digest': None, 'error': None}
+        start = time.perf_counter()
+        try:
+            with limited(cpu_seconds, case_seconds) as output:
+                if 'args' in test_case:
+                    actual = function(*test_case['args'])
+                else:
+                    actual = function(test_case.get('input'))
+                # Converting the result runs user code too (__str__), so it stays under the limits
+                result['digest'] = result_digest(actual)
+                result['actual'] = portable(actual)
+            if output.getvalue().strip():
+                result['stdout'] = output.getvalue().strip()
+        except BaseException as e:
+            result['error'] = describe_error(e)
+            result['traceback'] = traceback.format_exc()[-MAX_TRACEBACK_CHARS:]
+            timed_out = timed_out or isinstance(e, TimeLimitExceeded)
+        result['seconds'] = round(time.perf_counter() - start, 6)
+        test_results.append(result)
+        if stop_on_error and result['error']:
+            break
+    return {'error': None, 'test_results': test_results, 'timed_out': timed_out}
+
+
+def run_program(user_code: str, call: Optional[str] = None, wall_seconds: float = EVAL_WALL_SECONDS) -> dict:
+    """Run a whole program within wall_seconds; returns its 'error' (None if it ran to completion) and its 'stdout'
+
+    If the program prints nothing and `call` names a function it defines that takes no
+    arguments, that function is called and its 'returned' value is reported too, along with
+    whether the run 'timed_out'.
+    """
+    namespace = {'__name__': '__main__'}
+    output = None
+    returned = None
+    timed_out = False
+    try:
+        with limited(min(EVAL_CPU_SECONDS, wall_seconds), wall_seconds) as output:
+            exec(compile(user_code, '<submission>', 'exec'), namespace)
+            function = namespace.get(call) if call else None
+            if callable(function) and not output.getvalue().strip() and _takes_no_arguments(function):
+                returned = portable(function())
+        error = None
+    except BaseException as e:
+        error = describe_error(e)
+        timed_out = isinstance(e, TimeLimitExceeded)
+    return {'error': error, 'stdout': output.getvalue() if output else '', 'returned': returned,
+            'timed_out': timed_out}
+
+
+def _takes_no_arguments(function) -> bool:
+    code = getattr(function, '__code__', None)
+    defaults = getattr(function, '__defaults__', None) or ()
+    return code is not None and code.co_argcount - len(defaults) <= 0 and not code.co_kwonlyargcount
+
+
+TASKS = {
+    'run_test_cases': run_test_cases,
+    'run_program': run_program
+}
+
+
+def _task_main(task: str, args: list, result_fd: int):
+    """Body of a task process: run the task and write its [status, payload] frame"""
+    try:
+        reply = ['ok', TASKS[task](*args)]
+    except BaseException as e:
+        # Limits are handled by the task function; this is a failure of the task itself
+        reply = ['error', describe_error(e)]
+    try:
+        write_message(result_fd, reply)
+    except (TypeError, ValueError) as e:
+        write_message(result_fd, ['error', f"Result could not be encoded: {e}"])
+
+
+def _ends_cleanly(fd: int, deadline: float) -> bool:
+    """Whether the writer closes fd before the deadline without writing anything more"""
+    try:
+        _read_exactly(fd, 1, deadline)
+    except EOFError:
+        return True
+    except TimeoutError:
+        pass
+    return False
+
+
+def _die_with_parent(parent: int):
+    """Have the kernel kill this process when its parent exits (Linux only)"""
+    try:
+        ctypes.CDLL(None, use_errno=True).prctl(PR_SET_PDEATHSIG, signal.SIGKILL)
+    except (OSError, AttributeError):
+        return
+    if os.getppid() != parent:
+        os._exit(0)
+
+
+def run_isolated(task: str, args: list, timeout: float, close_fds=()) -> list:
+    """Run a task in a forked task process and return its [status, payload]
+
+    The task process closes close_fds (the worker's socket) before running the
+    task and reports through a fresh pipe. It leads a new session, so killing
+    its process group afterwards also kills any process the task started. The
+    status is 'ok' or 'error' as the task reported it, 'timeout' if no result
+    arrived within timeout seconds, or 'crashed' if the task process died
+    without a result, wrote more than one frame, or could not be started.
+    """
+    read_end, write_end = os.pipe()
+    worker = os.getpid()
+    try:
+        pid = os.fork()
+    except OSError as e:
+        # The user's processes reached RLIMIT_NPROC
+        os.close(read_end)
+        os.close(write_end)
+        return ['crashed', f"The evaluation process could not be started: {e}"]
+    if pid == 0:
+        try:
+            os.setsid()
+            _die_with_parent(worker)
+            for fd in (read_end, *close_fds):
+                os.close(fd)
+            _task_main(task, args, write_end)
+        finally:
+            os._exit(0)
+
+    os.close(write_end)
+    deadline = time.monotonic() + timeout
+    try:
+        try:
+            reply = read_message(read_end, timeout)
+        except TimeoutError:
+            reply = ['timeout', f"Evaluation did not finish within {timeout:g}s"]
+        except (EOFError, OSError, ValueError):
+            reply = ['crashed', "The evaluation process stopped unexpectedly"]
+        else:
+            if not (isinstance(reply, list) and len(reply) == 2 and reply[0] in ('ok', 'error')):
+                reply = ['crashed', "The evaluation process sent a malformed result"]
+            elif not _ends_cleanly(read_end, max(deadline, time.monotonic() + TASK_EXIT_SECONDS)):
+                # The task exits right after its result; anything else came from student code
+                reply = ['crashed', "The evaluation process sent more than one result"]
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        os.waitpid(pid, 0)
+        return reply
+    finally:
+        os.close(read_end)
+
+
+def worker_main(fd: int, max_tasks: int = EVAL_MAX_TASKS_PER_WORKER, memory_mb: int = EVAL_MEMORY_MB):
+    """Evaluation worker loop: run [request id, task, args, timeout] requests from the pool one at a time"""
+    confine_worker(keep_fds=[fd], memory_mb=memory_mb)
+    # The pool stops a worker by killing its process group; the task process dies with it
+    os.setpgid(0, 0)
+    for served in range(1, max_tasks + 1):
+        try:
+            request_id, task, args, timeout = read_message(fd)
+        except (EOFError, OSError, ValueError, TypeError):
+            return
+        status, payload = run_isolated(task, args, timeout, close_fds=[fd])
+        write_message(fd, [request_id, status, payload, served == max_tasks])
+
+
+def template_main(control_fd: int):
+    """Fork server for evaluation workers, started as its own interpreter by the pool
+
+    Each byte received on the control socket asks for one worker; the reply is
+    the worker's pid with the pool's end of a fresh socket pair attached.
+    """
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    # Workers are reaped automatically; the pool kills them by pid
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    control = socket.socket(fileno=control_fd)
+    while control.recv(1):
+        pool_end, worker_end = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                worker_main(worker_end.detach())
+            finally:
+                os._exit(0)
+        worker_end.close()
+        socket.send_fds(control, [struct.pack('!i', pid)], [pool_end.fileno()])
+        pool_end.close()
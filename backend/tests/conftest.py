@@ -0,0 +1,78 @@
+"""
+Shared fixtures for the backend tests.
+
+Run from the backend directory with `python -m pytest tests`. Modules are
+imported from the backend directory, as the server does.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'loadtest'))
+os.environ.setdefault('SECRET_KEY', 'test')
+
+# Uploads, the job journal and the challenge bank are written relative to the
+# working directory; keep them out of the source tree
+WORK_DIR = tempfile.mkdtemp(prefix='pqgen-tests-')
+os.chdir(WORK_DIR)
+
+
+@pytest.fixture(scope='session')
+def evaluation_pool():
+    """The global evaluation pool, started once for the whole run"""
+    from worker_pools import evaluation_pool as pool
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Flask test client of the app, without starting its background services"""
+    import app
+    monkeypatch.setattr(app, 'services_started', True)
+    return app.app.test_client()
+
+
+@pytest.fixture
+def admin_headers(monkeypatch):
+    """Authorization headers of a user listed in ADMIN_EMAILS, and of one who is not"""
+    import auth
+    monkeypatch.setattr(auth, 'ADMIN_EMAILS', {'admin@example.com'})
+
+    def headers(email):
+        token = auth.generate_jwt_token({'id': email, 'username': email, 'email': email})
+        return {'Authorization': f'Bearer {token}'}
+
+    return headers('admin@example.com'), headers('student@example.com')
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """Start the load-test mock OpenAI server with extra flags; the app's client is pointed at it"""
+    import mock_openai
+    import llm_challenge_generator
+
+    def start(*flags):
+        args = mock_openai.parse_args(['--port', '0', '--latency-dist', 'fixed', '--latency-median', '0',
+                                       '--chunk-delay', '0', '--seed', '1', *flags])
+        server = mock_openai.make_server(args)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        monkeypatch.setenv('OPENAI_API_KEY', 'mock')
+        monkeypatch.setenv('OPENAI_BASE_URL', f'{url}/v1')
+        monkeypatch.setattr(llm_challenge_generator, 'openai_client', None)
+        return url
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,41 @@
+import pytest
+
+import auth
+
+ADMIN_ROUTES = [
+    '/metrics', '/api/admin/retention', '/api/admin/blobs', '/api/admin/challenge-bank',
+    '/api/admin/evaluation-cache', '/api/admin/answer-keys', '/api/admin/jobs', '/api/admin/traces/missing',
+    '/api/admin/profile', '/api/admin/profile/missing'
+]
+
+
+@pytest.mark.parametrize('route', ADMIN_ROUTES)
+def test_admin_routes_require_a_login(client, route):
+    assert client.get(route).status_code == 401
+
+
+@pytest.mark.parametrize('route', ADMIN_ROUTES)
+def test_admin_routes_reject_users_who_are_not_admins(client, admin_headers, route):
+    _, student = admin_headers
+    response = client.get(route, headers=student)
+    assert response.status_code == 403
+
+
+def test_starting_a_profile_requires_an_admin(client, admin_headers):
+    _, student = admin_headers
+    assert client.post('/api/admin/profile', json={'seconds': 1}).status_code == 401
+    assert client.post('/api/admin/profile', json={'seconds': 1}, headers=student).status_code == 403
+
+
+def test_admins_reach_the_admin_routes(client, admin_headers):
+    admin, _ = admin_headers
+    assert client.get('/api/admin/profile', headers=admin).status_code == 200
+    assert client.get('/api/admin/profile/missing', headers=admin).status_code == 404
+    assert client.get('/api/admin/answer-keys', headers=admin).status_code == 200
+    assert client.get('/metrics', headers=admin).status_code == 200
+
+
+def test_admin_api_token_is_accepted_in_place_of_a_login(client, monkeypatch):
+    monkeypatch.setattr(auth, 'ADMIN_API_TOKEN', 'ops-token')
+    assert client.get('/api/admin/profile', headers={'Authorization': 'Bearer ops-token'}).status_code == 200
+    assert client.get('/api/admin/profile', headers={'Authorization': 'Bearer wrong-token'}).status_code == 401
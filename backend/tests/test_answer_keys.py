@@ -0,0 +1,80 @@
+from answer_keys import (
+    AnswerKeyIndex, compile_answer_key, grade_fill_in_the_blank, grade_multiple_choice, normalize_answer
+)
+
+NUMERIC_OPTIONS = {'id': 'mc-numbers', 'type': 'multiple-choice', 'options': ['1', '2', '3', '4'], 'correct_answer': 1}
+TEXT_OPTIONS = {'id': 'mc-text', 'type': 'multiple-choice', 'options': ['A list', 'A dict', 'A set'], 'correct_answer': 1}
+BLANKS = {
+    'id': 'fib',
+    'type': 'fill-in-the-blank',
+    'blanks': [
+        {'blank_number': 1, 'correct_answer': 'len(data)', 'options': ['size(data)', 'len(data)']},
+        {'id': 'BLANK_2', 'correct_answers': ['None', 'null']},
+        {'blank_number': 3, 'correct_answer': '0', 'options': ['1', '0']}
+    ]
+}
+
+
+def test_normalize_answer():
+    assert normalize_answer('  len( data ) ') == 'len(data)'
+    assert normalize_answer('"None"') == 'none'
+    assert normalize_answer('x not  in y') == 'x not in y'
+    assert normalize_answer('x not in y') != normalize_answer('x notin y')
+
+
+def test_numeric_option_text_is_matched_as_text():
+    key = compile_answer_key(NUMERIC_OPTIONS)
+    assert grade_multiple_choice(key, '2') == 1
+    assert grade_multiple_choice(key, ' 2 ') == 1
+
+
+def test_multiple_choice_indices():
+    key = compile_answer_key(NUMERIC_OPTIONS)
+    assert grade_multiple_choice(key, 2) == 2
+    assert grade_multiple_choice(key, {'index': 1}) == 1
+    assert grade_multiple_choice(key, 4) is None
+    assert grade_multiple_choice(key, {'index': -1}) is None
+    assert grade_multiple_choice(key, True) is None
+
+
+def test_multiple_choice_text_and_index_strings():
+    key = compile_answer_key(TEXT_OPTIONS)
+    assert grade_multiple_choice(key, ' a DICT ') == 1
+    assert grade_multiple_choice(key, '1') == 1
+    assert grade_multiple_choice(key, 'a tuple') is None
+    assert grade_multiple_choice(key, None) is None
+
+
+def test_blanks_accept_alternatives_whitespace_and_case():
+    key = compile_answer_key(BLANKS)
+    assert grade_fill_in_the_blank(key, '["len( data )", " NULL ", "0"]') == (3, 3)
+    assert grade_fill_in_the_blank(key, {'1': 'LEN(data)', 'BLANK_2': 'none', '3': '0'}) == (3, 3)
+
+
+def test_numeric_blank_answer_is_a_value_not_an_index():
+    key = compile_answer_key(BLANKS)
+    # 0 is the right value for blank 3, although option 0 reads "1"
+    assert grade_fill_in_the_blank(key, {'3': 0}) == (1, 3)
+    assert grade_fill_in_the_blank(key, {'3': 1}) == (0, 3)
+
+
+def test_blank_options_by_explicit_index():
+    key = compile_answer_key(BLANKS)
+    assert grade_fill_in_the_blank(key, [{'index': 1}, 'None', {'index': 1}]) == (3, 3)
+    assert grade_fill_in_the_blank(key, [{'index': 0}, 'None', {'index': 5}]) == (1, 3)
+
+
+def test_malformed_blank_answers():
+    key = compile_answer_key(BLANKS)
+    assert grade_fill_in_the_blank(key, 'not json') is None
+    assert grade_fill_in_the_blank(key, 42) is None
+    assert grade_fill_in_the_blank(key, []) == (0, 3)
+
+
+def test_index_compiles_missing_keys_on_demand_and_evicts():
+    index = AnswerKeyIndex(max_entries=1)
+    assert index.publish([TEXT_OPTIONS, {'id': 'debug', 'type': 'debugging'}]) == 1
+    assert index.get(TEXT_OPTIONS)['correct'] == 1
+    assert index.get(NUMERIC_OPTIONS)['option_count'] == 4
+    stats = index.stats()
+    assert (stats['hits'], stats['compiled_on_demand'], stats['evicted'], stats['keys']) == (1, 1, 1, 1)
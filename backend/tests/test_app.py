@@ -0,0 +1,93 @@
+import os
+import sys
+import subprocess
+
+from conftest import BACKEND_DIR
+
+
+def run_python(code, tmp_path, **env):
+    return subprocess.run(
+        [sys.executable, '-c', code], cwd=tmp_path, capture_output=True, text=True, timeout=60,
+        env={**os.environ, 'PYTHONPATH': BACKEND_DIR, 'SECRET_KEY': 'test', **env}
+    )
+
+
+def test_importing_the_app_starts_no_threads_or_processes(tmp_path):
+    result = run_python(
+        "import threading, app\n"
+        "print(app.services_started, threading.active_count(), app.cpu_pool._executor,"
+        " app.evaluation_pool._template._process)\n",
+        tmp_path
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1].split() == ['False', '1', 'None', 'None']
+
+
+def test_interrupted_job_is_resumed_by_one_process_only(tmp_path):
+    # Two servers start on a journal holding a job whose owner died
+    seed = (
+        "from job_journal import JobJournal\n"
+        "JobJournal('journal.db', lease_seconds=0).start_job('extract_topics', 'doc', "
+        "{'document': {'file_path': 'missing.pdf'}})\n"
+    )
+    assert run_python(seed, tmp_path).returncode == 0
+    claim = (
+        "from job_journal import JobJournal\n"
+        "print(len(JobJournal('journal.db').claim_orphaned_jobs()))\n"
+    )
+    processes = [
+        subprocess.Popen([sys.executable, '-c', claim], cwd=tmp_path, stdout=subprocess.PIPE, text=True,
+                         env={**os.environ, 'PYTHONPATH': BACKEND_DIR})
+        for _ in range(4)
+    ]
+    claimed = [int(process.communicate(timeout=60)[0]) for process in processes]
+    assert sorted(claimed) == [0, 0, 0, 1]
+
+
+def test_benchmark_functions_load_without_the_app(tmp_path):
+    result = run_python(
+        "import sys\n"
+        f"sys.path.insert(0, {os.path.join(BACKEND_DIR, 'benchmarks')!r})\n"
+        "import run_benchmarks\n"
+        "functions = run_benchmarks.load_functions()\n"
+        "print('app' in sys.modules, functions['validate_topics'](['loops', 'x', 'loops'], ''))\n",
+        tmp_path
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == "False ['Loops']"
+    assert os.listdir(tmp_path) == []
+
+
+def test_cancelling_a_queued_job_through_the_api(client):
+    import app
+    job = app.scheduler.submit(print, doc_id='doc-cancel', kind='generate_challenges')
+    route = f'/api/documents/doc-cancel/jobs/{job.id}'
+
+    assert client.delete(f'/api/documents/other-doc/jobs/{job.id}').status_code == 404
+    response = client.delete(route)
+    assert response.status_code == 200
+    assert response.get_json()['job']['status'] == 'cancelled'
+    assert app.document_progress['doc-cancel']['status'] == 'cancelled'
+    assert client.delete(route).status_code == 409
+
+
+def test_identical_upload_reuses_the_extracted_topics(client):
+    import io
+    import fitz
+    import app
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), 'Loops and recursion')
+        data = doc.tobytes()
+
+    first = client.post('/api/upload', data={'file': (io.BytesIO(data), 'notes.pdf')}).get_json()
+    assert first['deduplicated'] is False
+    app.scheduler.cancel(first['job_id'])
+    app.blob_store.save_result(first['content_hash'], {'topics': ['Loops', 'Recursion']})
+
+    second = client.post('/api/upload', data={'file': (io.BytesIO(data), 'copy.pdf')}).get_json()
+    assert second['deduplicated'] is True
+    assert second['job_id'] is None
+    assert app.document_topics[second['document_id']] == ['Loops', 'Recursion']
+    assert app.document_progress[second['document_id']]['status'] == 'completed'
+    assert os.path.samefile(app.documents[first['document_id']]['file_path'],
+                            app.documents[second['document_id']]['file_path'])
@@ -0,0 +1,121 @@
+import sys
+import json
+import time
+import asyncio
+import itertools
+import threading
+
+import pytest
+
+import auth
+
+
+@pytest.fixture
+def asgi(monkeypatch):
+    """The ASGI application, without starting the app's background services"""
+    import app
+    monkeypatch.setattr(app, 'start_services', lambda: None)
+    monkeypatch.setattr(app, 'services_started', True)
+    monkeypatch.setattr(auth, 'is_database_available', lambda: False)
+    monkeypatch.setattr(auth.auth_manager, 'users', {})
+    sys.modules.pop('asgi', None)
+    import asgi as module
+    yield module
+    sys.modules.pop('asgi', None)
+
+
+async def call(asgi, method, path, payload=None, chunks=()):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'scheme': 'http', 'http_version': '1.1',
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 5000)
+    }
+    # Messages are produced only as the application receives them
+    messages = itertools.chain(
+        ({'type': 'http.request', 'body': chunk, 'more_body': True} for chunk in chunks),
+        [{'type': 'http.request', 'body': body, 'more_body': False}]
+    )
+    sent = []
+
+    async def receive():
+        return next(messages, {'type': 'http.disconnect'})
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi.application(scope, receive, send)
+    data = b''.join(message.get('body', b'') for message in sent[1:])
+    return sent[0]['status'], json.loads(data) if data else None
+
+
+def test_sync_views_are_served_through_the_thread_pool(asgi):
+    status, body = asyncio.run(call(asgi, 'GET', '/api/admin/jobs'))
+    assert status == 401
+    assert body == {'error': 'Authentication required'}
+
+
+def test_async_views_run_on_the_event_loop(asgi, monkeypatch):
+    monkeypatch.setattr(asgi, '_call_wsgi_view', None)  # any fallback to the thread pool would fail
+    user = {'username': 'ada', 'email': 'ada@example.com', 'password': 'Secret123!'}
+
+    async def register_and_login():
+        registered = await call(asgi, 'POST', '/api/auth/register', user)
+        logged_in = await call(asgi, 'POST', '/api/auth/login', {'email': user['email'], 'password': user['password']})
+        return registered, logged_in
+
+    (status, registered), (login_status, logged_in) = asyncio.run(register_and_login())
+    assert status == 201, registered
+    assert login_status == 200, logged_in
+    assert auth.verify_jwt_token(logged_in['token'])['email'] == 'ada@example.com'
+
+
+def test_concurrent_logins_overlap(asgi, monkeypatch):
+    auth.auth_manager.users['user_1'] = {
+        'id': 'user_1', 'username': 'ada', 'email': 'ada@example.com', 'password_hash': 'hash', 'is_active': True
+    }
+    in_flight, overlapped = [], threading.Event()
+
+    def slow_checkpw(password, password_hash):
+        in_flight.append(1)
+        if len(in_flight) > 1:
+            overlapped.set()
+        overlapped.wait(2)
+        return True
+
+    monkeypatch.setattr(auth.bcrypt, 'checkpw', slow_checkpw)
+
+    async def logins():
+        credentials = {'email': 'ada@example.com', 'password': 'Secret123!'}
+        return await asyncio.gather(*(call(asgi, 'POST', '/api/auth/login', credentials) for _ in range(2)))
+
+    start = time.time()
+    results = asyncio.run(logins())
+    assert [status for status, _ in results] == [200, 200]
+    assert overlapped.is_set()
+    assert time.time() - start < 2
+
+
+def counted_chunks(sent, count, size=1000):
+    for _ in range(count):
+        sent.append(size)
+        yield b'x' * size
+
+
+def test_oversized_body_is_rejected_while_reading(asgi, monkeypatch):
+    monkeypatch.setitem(asgi.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    sent = []
+    status, body = asyncio.run(call(asgi, 'POST', '/api/upload', chunks=counted_chunks(sent, 10)))
+    assert status == 413
+    assert 'Upload too large' in body['error']
+    assert len(sent) == 2  # reading stopped at the chunk that crossed the limit
+
+
+def test_batch_uploads_get_the_batch_limit(asgi, monkeypatch):
+    monkeypatch.setitem(asgi.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    monkeypatch.setattr(asgi, '_call_wsgi_view', lambda scope, body, send: asgi._send_response(
+        send, 200, [('Content-Type', 'application/json')], [json.dumps({'read': len(body.read())}).encode()]
+    ))
+    status, body = asyncio.run(call(asgi, 'POST', '/api/upload/batch', chunks=counted_chunks([], 10)))
+    assert (status, body) == (200, {'read': 10000})
@@ -0,0 +1,119 @@
+from concurrent.futures import Future
+
+import pytest
+
+BUGGY_SUM = "def total(numbers):\n    result = 0\n    for n in numbers[1:]:\n        result += n\n    return result\n"
+FIXED_SUM = BUGGY_SUM.replace('numbers[1:]', 'numbers')
+
+
+@pytest.fixture
+def challenges(monkeypatch):
+    """A document with one challenge of each kind, and fresh states for them"""
+    import app
+    document = [
+        {'id': 'mc', 'type': 'multiple-choice', 'question': 'Which loop?', 'options': ['for', 'goto'],
+         'correct_answer': 0},
+        {'id': 'fix', 'type': 'debugging', 'buggy_code': BUGGY_SUM, 'expected_output': '6',
+         'test_cases': [{'args': [[1, 2, 3]], 'expected': 6}]},
+        {'id': 'unchecked', 'type': 'debugging', 'buggy_code': BUGGY_SUM,
+         'expected_output': 'The function should return the sum of all numbers'},
+    ]
+    monkeypatch.setitem(app.document_challenges, 'attempts-doc', document)
+    for challenge in document:
+        monkeypatch.setitem(app.challenge_states, challenge['id'],
+                            {'status': 'unsolved', 'attempts': 0, 'max_attempts': 3, 'best_score': 0})
+    return app
+
+
+def never_graded(monkeypatch, app):
+    """Debugging fixes never finish grading, and the grading budget is tiny"""
+    monkeypatch.setattr(app, 'GRADING_BUDGET_SECONDS', 0.05)
+    monkeypatch.setattr(app, 'start_debugging_evaluation',
+                        lambda challenge, answer: Future() if challenge['type'] == 'debugging' else None)
+
+
+def attempt(client, challenge_id, answer):
+    return client.post(f'/api/challenges/{challenge_id}/attempt', json={'answer': answer})
+
+
+def test_attempts_are_counted_until_solved_or_exhausted(client, challenges):
+    assert attempt(client, 'missing', 'for').status_code == 404
+
+    body = attempt(client, 'mc', 'goto').get_json()
+    assert (body['correct'], body['attempts'], body['status']) == (False, 1, 'unsolved')
+    body = attempt(client, 'mc', 'for').get_json()
+    assert (body['correct'], body['attempts'], body['status']) == (True, 2, 'solved')
+
+    for _ in range(3):
+        attempt(client, 'fix', BUGGY_SUM)
+    body = attempt(client, 'fix', FIXED_SUM).get_json()
+    assert body['success'] is False
+    assert body['message'] == 'Maximum attempts reached'
+
+
+def test_debugging_fix_is_graded_in_the_sandbox(client, challenges, evaluation_pool):
+    body = attempt(client, 'fix', FIXED_SUM).get_json()
+    assert body['correct'] is True
+    assert body['test_results'][0]['passed'] is True
+
+
+def test_ungradable_fix_is_not_counted(client, challenges, evaluation_pool):
+    body = attempt(client, 'unchecked', 'x = 1').get_json()
+    assert body['ungradable'] is True
+    assert body['correct'] is False
+    assert body['attempts'] == 0
+    assert challenges.challenge_states['unchecked']['last_submission'] == 'x = 1'
+
+
+def test_slow_grading_is_not_counted(client, challenges, monkeypatch):
+    never_graded(monkeypatch, challenges)
+    response = attempt(client, 'fix', FIXED_SUM)
+    assert response.status_code == 503
+    assert response.get_json()['attempts'] == 0
+    assert challenges.challenge_states['fix']['attempts'] == 0
+
+
+def submit_batch(client, *attempts):
+    return client.post('/api/challenges/attempts', json={'attempts': list(attempts)})
+
+
+def test_batch_grades_every_attempt_and_summarizes(client, challenges, evaluation_pool):
+    response = submit_batch(
+        client,
+        {'challenge_id': 'mc', 'answer': 'for'},
+        {'challenge_id': 'fix', 'answer': FIXED_SUM},
+        {'challenge_id': 'mc', 'answer': 'goto'},
+        {'challenge_id': 'missing', 'answer': 'for'},
+        'not an attempt',
+    )
+    assert response.status_code == 200
+    body = response.get_json()
+    results = body['results']
+    assert [result['success'] for result in results] == [True, True, False, False, False]
+    assert results[2]['error'] == 'Duplicate attempt in batch'
+    assert results[3]['error'] == results[4]['error'] == 'Challenge not found'
+    assert body['summary'] == {'submitted': 5, 'recorded': 2, 'correct': 2, 'score': 100.0}
+    assert challenges.challenge_states['mc']['attempts'] == 1
+
+
+def test_batch_is_not_counted_when_any_fix_misses_the_grading_budget(client, challenges, monkeypatch):
+    never_graded(monkeypatch, challenges)
+    response = submit_batch(client, {'challenge_id': 'mc', 'answer': 'for'}, {'challenge_id': 'fix', 'answer': FIXED_SUM})
+    assert response.status_code == 503
+    assert challenges.challenge_states['mc'] == {'status': 'unsolved', 'attempts': 0, 'max_attempts': 3, 'best_score': 0}
+
+
+def test_batch_skips_exhausted_challenges(client, challenges, monkeypatch):
+    monkeypatch.setitem(challenges.challenge_states['mc'], 'attempts', 3)
+    result = submit_batch(client, {'challenge_id': 'mc', 'answer': 'for'}).get_json()['results'][0]
+    assert result['success'] is False
+    assert result['message'] == 'Maximum attempts reached'
+
+
+def test_malformed_or_oversized_batches_are_rejected(client, challenges, monkeypatch):
+    assert client.post('/api/challenges/attempts', json={'attempts': []}).status_code == 400
+    assert client.post('/api/challenges/attempts', data='not json').status_code == 400
+    monkeypatch.setattr(challenges, 'MAX_BATCH_ATTEMPTS', 1)
+    response = submit_batch(client, {'challenge_id': 'mc', 'answer': 'for'}, {'challenge_id': 'fix', 'answer': FIXED_SUM})
+    assert response.status_code == 413
+    assert challenges.challenge_states['mc']['attempts'] == 0
@@ -0,0 +1,139 @@
+import io
+import zipfile
+import functools
+
+import fitz
+import pytest
+
+import upload_ingest
+
+
+def pdf_bytes(text):
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), text)
+        return doc.tobytes()
+
+
+def zip_bytes(**members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def upload_batch(client, *files):
+    return client.post('/api/upload/batch', data={'files': [(io.BytesIO(data), name) for name, data in files]})
+
+
+@pytest.fixture
+def app_module():
+    import app
+    return app
+
+
+def test_pdfs_and_zipped_pdfs_are_queued_as_one_batch(client, app_module):
+    archive = zip_bytes(**{'week2/arrays.pdf': pdf_bytes('Arrays'), 'week2/readme.txt': b'notes',
+                           '__MACOSX/week2/._arrays.pdf': b'junk'})
+    response = upload_batch(client, ('loops.pdf', pdf_bytes('Loops')), ('week2.zip', archive),
+                            ('notes.txt', b'plain text'))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [doc['filename'] for doc in body['documents']] == ['loops.pdf', 'week2/arrays.pdf']
+    assert [error['filename'] for error in body['errors']] == ['notes.txt']
+    assert app_module.scheduler.get_job(body['job_id']).kind == 'extract_batch'
+
+    progress = client.get(f"/api/upload/batch/{body['batch_id']}/progress").get_json()
+    assert progress['status'] == 'processing'
+    assert progress['counts'] == {'queued': 2}
+    assert progress['job_status'] == 'queued'
+
+    # Cancelled before it started: every document is released
+    cancelled = client.delete(f"/api/upload/batch/{body['batch_id']}")
+    assert cancelled.status_code == 200
+    progress = client.get(f"/api/upload/batch/{body['batch_id']}/progress").get_json()
+    assert progress['status'] == 'cancelled'
+    assert client.delete(f"/api/upload/batch/{body['batch_id']}").status_code == 409
+
+
+def test_batch_of_known_content_needs_no_job(client, app_module):
+    data = pdf_bytes('Recursion')
+    first = upload_batch(client, ('recursion.pdf', data)).get_json()
+    client.delete(f"/api/upload/batch/{first['batch_id']}")
+    app_module.blob_store.save_result(first['documents'][0]['content_hash'], {'topics': ['Recursion', 'Base Cases']})
+
+    body = upload_batch(client, ('copy.pdf', data)).get_json()
+    assert body['job_id'] is None
+    assert body['documents'][0]['deduplicated'] is True
+    progress = client.get(f"/api/upload/batch/{body['batch_id']}/progress").get_json()
+    assert progress['status'] == 'completed'
+    assert progress['progress'] == 100
+    assert [entry['topic'] for entry in progress['merged_topics']] == ['Recursion', 'Base Cases']
+    assert client.delete(f"/api/upload/batch/{body['batch_id']}").status_code == 404
+
+
+def test_batch_without_valid_pdfs_is_rejected(client):
+    assert client.post('/api/upload/batch', data={}).status_code == 400
+
+    response = upload_batch(client, ('broken.zip', b'PK\x03\x04 not really a zip'), ('notes.txt', b'plain text'))
+    assert response.status_code == 400
+    errors = response.get_json()['errors']
+    assert [error['filename'] for error in errors] == ['broken.zip', 'notes.txt']
+    assert 'zip archive' in errors[0]['error']
+
+
+def test_archive_over_the_file_limit_is_rejected(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'iter_zip_pdfs', functools.partial(upload_ingest.iter_zip_pdfs, max_files=1))
+    archive = zip_bytes(**{'a.pdf': pdf_bytes('A'), 'b.pdf': pdf_bytes('B')})
+
+    response = upload_batch(client, ('two.zip', archive))
+    assert response.status_code == 400
+    assert 'limit is 1' in response.get_json()['errors'][0]['error']
+
+
+def test_unknown_batch_is_not_found(client):
+    assert client.get('/api/upload/batch/missing/progress').status_code == 404
+    assert client.delete('/api/upload/batch/missing').status_code == 404
+
+
+def corrupt_member_zip(good, bad):
+    """Archive holding the PDF `good` intact and the PDF `bad` with damaged compressed data"""
+    archive = zip_bytes(**{'good.pdf': good})
+    buffer = io.BytesIO(archive)
+    with zipfile.ZipFile(buffer, 'a', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('bad.pdf', bad)
+        info = zf.getinfo('bad.pdf')
+    data = bytearray(buffer.getvalue())
+    start = info.header_offset + 30 + len(info.filename) + len(info.extra)
+    middle = start + info.compress_size // 2
+    data[middle:middle + 16] = b'\xff' * 16
+    return bytes(data)
+
+
+def test_damaged_archive_member_is_rejected_on_its_own(client):
+    bad = pdf_bytes('Sorting') + bytes(range(256)) * 400
+    response = upload_batch(client, ('course.zip', corrupt_member_zip(pdf_bytes('Searching'), bad)))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [doc['filename'] for doc in body['documents']] == ['good.pdf']
+    assert [error['filename'] for error in body['errors']] == ['bad.pdf']
+    assert 'not readable' in body['errors'][0]['error']
+    client.delete(f"/api/upload/batch/{body['batch_id']}")
+
+
+def test_failed_batch_keeps_no_documents_and_releases_identical_uploads(client, app_module, monkeypatch):
+    data = pdf_bytes('Hash tables')
+
+    def broken_submit(*args, **kwargs):
+        raise RuntimeError('scheduler unavailable')
+    monkeypatch.setattr(app_module.scheduler, 'submit', broken_submit)
+    documents_before = set(app_module.documents)
+    assert upload_batch(client, ('tables.pdf', data)).status_code == 500
+    assert set(app_module.documents) == documents_before
+    monkeypatch.undo()
+
+    # The same content uploaded again leads its own extraction instead of waiting forever
+    body = client.post('/api/upload', data={'file': (io.BytesIO(data), 'tables.pdf')}).get_json()
+    assert body['deduplicated'] is False
+    assert body['job_id'] is not None
+    app_module.scheduler.cancel(body['job_id'])
@@ -0,0 +1,98 @@
+import os
+import time
+
+import pytest
+
+from blob_store import BlobStore
+
+HASH = 'ab' + '0' * 62
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / 'blobs'), gc_grace=60)
+
+
+def upload(tmp_path, name, data=b'%PDF-1.4 same content'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_identical_uploads_share_one_blob(store, tmp_path):
+    first = upload(tmp_path, 'first.pdf')
+    second = upload(tmp_path, 'second.pdf')
+
+    assert store.adopt(first, HASH) is False
+    assert store.adopt(second, HASH) is True
+    assert os.path.samefile(first, second)
+    assert os.path.samefile(first, store.blob_path(HASH))
+    assert store.refcount(HASH) == 2
+    stats = store.stats()
+    assert (stats['blobs'], stats['stored'], stats['deduplicated']) == (1, 1, 1)
+    assert stats['bytes_saved'] == os.path.getsize(second)
+
+
+def test_deleting_a_document_file_releases_its_reference(store, tmp_path):
+    first = upload(tmp_path, 'first.pdf')
+    second = upload(tmp_path, 'second.pdf')
+    store.adopt(first, HASH)
+    store.adopt(second, HASH)
+
+    os.remove(first)
+    assert store.refcount(HASH) == 1
+    os.remove(second)
+    assert store.refcount(HASH) == 0
+    assert store.refcount('cd' + '0' * 62) == 0
+
+
+def test_unreferenced_blobs_are_collected_after_the_grace_period(store, tmp_path):
+    path = upload(tmp_path, 'notes.pdf')
+    store.adopt(path, HASH)
+    store.save_text(HASH, 'extracted text')
+    store.save_result(HASH, {'topics': ['Loops']})
+
+    # Still linked from a document: never collected
+    assert store.collect_garbage(now=time.time() + 3600) == 0
+    os.remove(path)
+    assert store.collect_garbage() == 0
+    assert store.collect_garbage(now=time.time() + 61) == 1
+    assert not os.path.exists(store.blob_path(HASH))
+    assert store.load_text(HASH) is None
+    assert store.load_result(HASH) is None
+    assert os.listdir(store.folder) == []
+
+
+def test_results_are_shared_only_for_stored_blobs(store, tmp_path):
+    store.save_result(HASH, {'topics': ['Loops']})
+    store.save_text(HASH, 'extracted text')
+    assert store.load_result(HASH) is None
+    assert store.load_text(HASH) is None
+
+    store.adopt(upload(tmp_path, 'notes.pdf'), HASH)
+    store.save_result(HASH, {'topics': ['Loops']})
+    store.save_text(HASH, 'extracted text')
+    assert store.load_result(HASH) == {'topics': ['Loops']}
+    assert store.load_text(HASH) == 'extracted text'
+
+
+def test_unreadable_cached_result_is_ignored(store, tmp_path):
+    store.adopt(upload(tmp_path, 'notes.pdf'), HASH)
+    with open(store.blob_path(HASH)[:-len('.pdf')] + '.json', 'w') as f:
+        f.write('{not json')
+    assert store.load_result(HASH) is None
+
+
+def test_filesystems_without_hard_links_get_a_copy(store, tmp_path, monkeypatch):
+    def no_links(src, dest):
+        raise OSError('hard links not supported')
+    monkeypatch.setattr(os, 'link', no_links)
+
+    first = upload(tmp_path, 'first.pdf')
+    second = upload(tmp_path, 'second.pdf')
+    store.adopt(first, HASH)
+    assert store.adopt(second, HASH) is True
+    assert not os.path.samefile(first, store.blob_path(HASH))
+    with open(second, 'rb') as f:
+        assert f.read() == b'%PDF-1.4 same content'
+    assert store.stats()['copied'] == 2
@@ -0,0 +1,108 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import build_challenge_bank
+from build_challenge_bank import RateLimiter, main
+from challenge_bank import ChallengeBank
+
+
+@pytest.fixture
+def course(tmp_path):
+    """A course directory: two copies of one PDF, one PDF without topics, and a hidden file"""
+    directory = tmp_path / 'course'
+    (directory / 'week1').mkdir(parents=True)
+    (directory / 'week1' / 'loops.pdf').write_bytes(b'%PDF loops')
+    (directory / 'loops-copy.pdf').write_bytes(b'%PDF loops')
+    (directory / 'blank.pdf').write_bytes(b'%PDF blank')
+    (directory / '.loops.pdf').write_bytes(b'%PDF hidden')
+    return directory
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Fake extraction and generation; `failing` holds challenge types whose generation fails"""
+    calls = []
+    failing = set()
+
+    def generate(snippet, challenge_type, difficulty, topic):
+        with lock:
+            calls.append((topic, challenge_type, difficulty))
+        if challenge_type in failing:
+            raise RuntimeError('model unavailable')
+        return {'question': f'{challenge_type} about {topic}'}
+
+    lock = threading.Lock()
+    monkeypatch.setattr(build_challenge_bank, 'is_model_ready', lambda: True)
+    monkeypatch.setattr(build_challenge_bank, 'extract_text_from_pdf', lambda path: open(path).read())
+    monkeypatch.setattr(build_challenge_bank, 'analyze_pdf_content',
+                        lambda text: {'topics': ['For Loops', 'While Loops'] if 'loops' in text else []})
+    monkeypatch.setattr(build_challenge_bank, 'generate_single_challenge', generate)
+    monkeypatch.setattr(build_challenge_bank, 'generate_short_hint_for_challenge', lambda challenge: 'A hint')
+    return calls, failing
+
+
+def run(course, tmp_path, *extra):
+    report_path = tmp_path / 'report.json'
+    code = main([str(course), '--bank', str(tmp_path / 'bank.db'), '--types', 'debugging,multiple-choice',
+                 '--variants', '2', '--rate', '0', '--json', str(report_path), *extra])
+    with open(report_path) as f:
+        return code, json.load(f)['counts']
+
+
+def test_build_generates_every_key_once_per_distinct_pdf(course, tmp_path, llm):
+    calls, _ = llm
+    code, counts = run(course, tmp_path)
+
+    assert code == 0
+    assert len(calls) == 2 * 2 * 2  # topics x types x variants
+    assert counts['documents'] == 3
+    assert counts['documents_duplicate'] == 1
+    assert counts['documents_empty'] == 1
+    assert counts['documents_completed'] == 1
+    bank = ChallengeBank(str(tmp_path / 'bank.db'))
+    try:
+        assert bank.stats()['challenges'] == 8
+    finally:
+        bank.close()
+
+    # A second run finds the document complete and generates nothing
+    code, counts = run(course, tmp_path)
+    assert code == 0
+    assert counts['documents_skipped'] == 1
+    assert len(calls) == 8
+
+
+def test_failed_build_resumes_with_the_missing_challenges(course, tmp_path, llm):
+    calls, failing = llm
+    failing.add('debugging')
+    code, counts = run(course, tmp_path)
+    assert code == 1
+    assert (counts['generated'], counts['failed'], counts['documents_partial']) == (4, 4, 1)
+
+    failing.clear()
+    calls.clear()
+    code, counts = run(course, tmp_path)
+    assert code == 0
+    assert (counts['generated'], counts['existing']) == (4, 4)
+    assert {challenge_type for _, challenge_type, _ in calls} == {'debugging'}
+
+
+def test_build_needs_a_directory_and_a_model(course, tmp_path, llm, monkeypatch):
+    assert main([str(tmp_path / 'missing'), '--bank', str(tmp_path / 'bank.db')]) == 2
+    monkeypatch.setattr(build_challenge_bank, 'is_model_ready', lambda: False)
+    assert main([str(course), '--bank', str(tmp_path / 'bank.db')]) == 2
+
+
+def test_rate_limiter_spaces_calls_across_threads(monkeypatch):
+    clock = [100.0]
+    slept = []
+    monkeypatch.setattr(build_challenge_bank, 'time', SimpleNamespace(monotonic=lambda: clock[0], sleep=slept.append))
+
+    limiter = RateLimiter(per_minute=120)
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.5, 1.0]
+    assert slept == [0.5, 1.0]
+    assert limiter.waited == 1.5
+    assert RateLimiter(per_minute=0).acquire() == 0.0
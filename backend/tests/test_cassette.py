@@ -0,0 +1,107 @@
+import gzip
+import json
+import time
+
+import pytest
+
+import cassette
+import llm_challenge_generator
+from cancellation import CancelToken, JobCancelled, use_cancel_token
+from cassette import Cassette, configure_cassette
+
+MESSAGES = [{'role': 'user', 'content': 'Write a debugging challenge'}]
+
+
+@pytest.fixture
+def use_cassette(monkeypatch):
+    """Install a global cassette for the test; the environment's is restored afterwards"""
+    monkeypatch.setattr(cassette, 'cassette', cassette.cassette)
+    return configure_cassette
+
+
+def recorded(path, *entries):
+    """Cassette at path in record mode, holding (messages, request_type, content, latency) entries"""
+    tape = Cassette(str(path), 'record', 0)
+    for messages, request_type, content, latency in entries:
+        tape.record(messages, 'gpt-test', 100, 0.7, request_type, content, latency)
+    return tape
+
+
+def test_recordings_replay_from_a_gzipped_cassette(tmp_path):
+    path = tmp_path / 'tape.jsonl.gz'
+    recorded(path, (MESSAGES, 'debugging', 'recorded answer', 0.5))
+
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        assert json.loads(f.readline())['content'] == 'recorded answer'
+    tape = Cassette(str(path), 'replay', 0)
+    assert tape.replay(MESSAGES, 'gpt-test', 100, 0.7, 'debugging') == 'recorded answer'
+    assert tape.stats()['hits'] == 1
+
+
+def test_unmatched_prompt_falls_back_to_the_same_type_and_model(tmp_path):
+    path = tmp_path / 'tape.jsonl'
+    recorded(path, (MESSAGES, 'debugging', 'recorded answer', 0))
+    tape = Cassette(str(path), 'replay', 0)
+
+    other_prompt = [{'role': 'user', 'content': 'A different scenario'}]
+    assert tape.replay(other_prompt, 'gpt-test', 100, 0.7, 'debugging') == 'recorded answer'
+    assert tape.replay(other_prompt, 'gpt-test', 100, 0.7, 'topics') is None
+    assert tape.replay(other_prompt, 'other-model', 100, 0.7, 'debugging') is None
+    assert tape.stats()['loose_hits'] == 1
+    assert tape.stats()['misses'] == 2
+
+
+def test_repeated_requests_cycle_through_the_recordings(tmp_path):
+    path = tmp_path / 'tape.jsonl'
+    recorded(path, (MESSAGES, 'debugging', 'first', 0), (MESSAGES, 'debugging', 'second', 0))
+    tape = Cassette(str(path), 'replay', 0)
+
+    replies = [tape.replay(MESSAGES, 'gpt-test', 100, 0.7, 'debugging') for _ in range(3)]
+    assert replies == ['first', 'second', 'first']
+
+
+def test_missing_cassette_misses_every_request(tmp_path):
+    tape = Cassette(str(tmp_path / 'absent.jsonl'), 'replay', 0)
+    assert tape.replay(MESSAGES, 'gpt-test', 100, 0.7, 'debugging') is None
+
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match='Unknown cassette mode'):
+        Cassette(str(tmp_path / 'tape.jsonl'), 'rewind')
+
+
+def test_replay_waits_the_scaled_recorded_latency(tmp_path):
+    path = tmp_path / 'tape.jsonl'
+    recorded(path, (MESSAGES, 'debugging', 'slow answer', 2.0))
+    tape = Cassette(str(path), 'replay', 0.1)
+
+    start = time.monotonic()
+    assert tape.replay(MESSAGES, 'gpt-test', 100, 0.7, 'debugging') == 'slow answer'
+    assert 0.2 <= time.monotonic() - start < 1.5
+
+
+def test_cancelling_the_job_interrupts_a_replay_delay(tmp_path):
+    path = tmp_path / 'tape.jsonl'
+    recorded(path, (MESSAGES, 'debugging', 'slow answer', 60))
+    tape = Cassette(str(path), 'replay', 1)
+    token = CancelToken()
+    token.cancel('stopped by test')
+
+    with use_cancel_token(token), pytest.raises(JobCancelled):
+        tape.replay(MESSAGES, 'gpt-test', 100, 0.7, 'debugging')
+
+
+def test_openai_requests_are_recorded_then_replayed_offline(use_cassette, mock_server, monkeypatch, tmp_path):
+    path = str(tmp_path / 'tape.jsonl.gz')
+    mock_server()
+    use_cassette('record', path, 0)
+    live = llm_challenge_generator.make_openai_request(MESSAGES, model='gpt-test', request_type='debugging')
+    assert live
+
+    # No API key and nothing listening: only the cassette can answer
+    monkeypatch.delenv('OPENAI_API_KEY')
+    monkeypatch.setenv('OPENAI_BASE_URL', 'http://127.0.0.1:9/v1')
+    monkeypatch.setattr(llm_challenge_generator, 'openai_client', None)
+    use_cassette('replay', path, 0)
+    assert llm_challenge_generator.is_model_ready()
+    assert llm_challenge_generator.make_openai_request(MESSAGES, model='gpt-test', request_type='debugging') == live
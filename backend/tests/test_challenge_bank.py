@@ -0,0 +1,80 @@
+import pytest
+
+from challenge_bank import ChallengeBank
+
+
+@pytest.fixture
+def bank(tmp_path):
+    bank = ChallengeBank(str(tmp_path / 'bank.db'))
+    yield bank
+    bank.close()
+
+
+def generated(topic, variant, challenge_type='multiple-choice', difficulty='medium'):
+    return {'id': f'c{variant}', 'type': challenge_type, 'topic': topic, 'difficulty': difficulty,
+            'question': f'{topic} question {variant}'}
+
+
+def store_variants(bank, doc_hash, count, topic='Binary Search'):
+    bank.store_generated(doc_hash, [generated(topic, f'{doc_hash}-{i}') for i in range(count)])
+
+
+def test_serves_only_the_same_documents_variants(bank):
+    store_variants(bank, 'doc-a', 3)
+    store_variants(bank, 'doc-b', 3)
+    for _ in range(10):
+        found = bank.lookup('binary search', 'medium', ['multiple-choice'], doc_hash='doc-a')
+        assert found['multiple-choice']['question'].startswith('Binary Search question doc-a-')
+
+
+def test_other_documents_are_not_served_by_default(bank):
+    store_variants(bank, 'doc-b', 3)
+    assert bank.lookup('binary search', 'medium', doc_hash='doc-a') == {}
+
+
+def test_other_documents_are_served_when_the_caller_opts_in(bank):
+    store_variants(bank, 'doc-b', 3)
+    found = bank.lookup('binary search', 'medium', ['multiple-choice'], doc_hash='doc-a', cross_document=True)
+    assert found['multiple-choice']['question'].startswith('Binary Search question doc-b-')
+
+
+def test_same_document_wins_when_sharing_across_documents(bank):
+    store_variants(bank, 'doc-a', 3)
+    store_variants(bank, 'doc-b', 3)
+    for _ in range(10):
+        found = bank.lookup('binary search', 'medium', ['multiple-choice'], doc_hash='doc-a', cross_document=True)
+        assert found['multiple-choice']['question'].startswith('Binary Search question doc-a-')
+
+
+def test_key_is_not_served_until_it_has_enough_variants(bank):
+    store_variants(bank, 'doc-a', 2)
+    assert bank.lookup('binary search', 'medium', doc_hash='doc-a', min_variants=3) == {}
+    store_variants(bank, 'doc-a', 1)
+    assert 'multiple-choice' in bank.lookup('binary search', 'medium', doc_hash='doc-a', min_variants=3)
+
+
+def test_store_generated_adds_a_new_variant_each_time(bank):
+    store_variants(bank, 'doc-a', 3)
+    variants = sorted(key[3] for key in bank.existing_keys('doc-a'))
+    assert variants == [0, 1, 2]
+
+
+def test_excluded_variants_are_skipped(bank):
+    store_variants(bank, 'doc-a', 3)
+    found = bank.lookup('binary search', 'medium', ['multiple-choice'], doc_hash='doc-a',
+                        exclude=lambda challenge: not challenge['question'].endswith('-2'))
+    assert found['multiple-choice']['question'] == 'Binary Search question doc-a-2'
+
+
+def test_served_challenges_get_fresh_ids(bank):
+    store_variants(bank, 'doc-a', 3)
+    first = bank.lookup('binary search', 'medium', ['multiple-choice'], doc_hash='doc-a')['multiple-choice']
+    second = bank.lookup('binary search', 'medium', ['multiple-choice'], doc_hash='doc-a')['multiple-choice']
+    assert first['id'] != second['id']
+
+
+def test_static_templates_are_served_from_a_single_variant(bank):
+    first = bank.static_challenges('loops', 'easy', ['multiple-choice'])
+    second = bank.static_challenges('loops', 'easy', ['multiple-choice'])
+    assert len(first) == len(second) == 1
+    assert bank.stats()['static_hits'] == 1
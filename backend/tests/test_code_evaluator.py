@@ -0,0 +1,224 @@
+import threading
+from concurrent.futures import Future
+
+import code_evaluator
+from code_evaluator import (
+    evaluate_coding_solution, evaluate_debugging_challenge, submit_debugging_challenge, literal_expected_output,
+    UNCHANGED_FEEDBACK
+)
+from sandbox import EvaluationError, EvaluationTimeout, result_digest
+from worker_pools import io_pool
+
+TEST_CASES = [{'input': 3, 'expected': 6}, {'input': 4, 'expected': 8}]
+
+# Sends a reply claiming every test passed, then exits before the real reply
+FORGE_PASSING_RESULT = """
+import os, json, struct
+def double(x):
+    results = [{'actual': 0, 'passed': True, 'error': None, 'digest': 'forged'}] * 2
+    body = json.dumps(['ok', {'error': None, 'test_results': results, 'timed_out': False}]).encode()
+    for fd in range(3, 64):
+        try:
+            os.write(fd, struct.pack('!I', len(body)) + body)
+        except OSError:
+            pass
+    os._exit(0)
+"""
+
+
+def test_correct_solution_passes(evaluation_pool):
+    results = evaluate_coding_solution("def double(x):\n    return x * 2", TEST_CASES)
+    assert results['status'] == 'correct'
+    assert [r['passed'] for r in results['test_results']] == [True, True]
+    assert [r['expected'] for r in results['test_results']] == [6, 8]
+
+
+def test_wrong_solution_fails(evaluation_pool):
+    results = evaluate_coding_solution("def double(x):\n    return x + 2", TEST_CASES)
+    assert results['status'] == 'incorrect'
+    assert [r['actual'] for r in results['test_results']] == [5, 6]
+
+
+def test_forged_result_is_not_graded_correct(evaluation_pool):
+    results = evaluate_coding_solution(FORGE_PASSING_RESULT, TEST_CASES)
+    assert results['status'] == 'incorrect'
+    assert not any(r['passed'] for r in results['test_results'])
+
+
+def test_expected_values_never_reach_the_worker(evaluation_pool):
+    code = (
+        "import sys\n"
+        "def double(x):\n"
+        "    frame, seen = sys._getframe(1), []\n"
+        "    while frame:\n"
+        "        seen.append(repr(frame.f_locals))\n"
+        "        frame = frame.f_back\n"
+        "    return ' '.join(seen)\n"
+    )
+    results = evaluate_coding_solution(code, [{'input': 3, 'expected': 'secret-expected-value'}])
+    assert results['test_results'][0]['error'] is None
+    assert 'secret-expected-value' not in results['test_results'][0]['actual']
+
+
+def test_fail_fast_stops_at_the_first_failure(evaluation_pool):
+    test_cases = [{'input': i, 'expected': i * 2} for i in range(12)]
+    test_cases[5]['expected'] = -1
+    results = evaluate_coding_solution("def double(x):\n    return x * 2", test_cases, fail_fast=True)
+    assert results['status'] == 'incorrect'
+    assert [r['passed'] for r in results['test_results'][:6]] == [True] * 5 + [False]
+    assert all(r.get('skipped') for r in results['test_results'][6:])
+    assert len(results['test_results']) == 12
+
+
+BUGGY_SUM = "def total(numbers):\n    result = 0\n    for n in numbers[1:]:\n        result += n\n    return result\n"
+
+
+def debugging_challenge(**fields):
+    return {'id': None, 'type': 'debugging', 'buggy_code': BUGGY_SUM, **fields}
+
+
+def test_fix_printing_nothing_is_incorrect_against_a_literal_output(evaluation_pool):
+    results = evaluate_debugging_challenge(debugging_challenge(expected_output='6'), "x = 1")
+    assert results['status'] == 'incorrect'
+    assert 'no output' in results['feedback']
+
+
+def test_fix_producing_the_expected_output_is_correct(evaluation_pool):
+    fixed = BUGGY_SUM.replace('numbers[1:]', 'numbers') + "print(total([1, 2, 3]))\n"
+    results = evaluate_debugging_challenge(debugging_challenge(expected_output='6'), fixed)
+    assert results['status'] == 'correct'
+
+
+def test_fix_producing_other_output_is_incorrect(evaluation_pool):
+    results = evaluate_debugging_challenge(debugging_challenge(expected_output='6'), BUGGY_SUM + "print(total([1, 2, 3]))\n")
+    assert results['status'] == 'incorrect'
+    assert "produced '5'" in results['feedback']
+
+
+def test_echoed_output_is_capped_and_stripped_of_control_characters(evaluation_pool):
+    noisy = BUGGY_SUM + "print('\\x1b[2J' + 'x' * 1000)\n"
+    results = evaluate_debugging_challenge(debugging_challenge(expected_output='6'), noisy)
+    assert results['status'] == 'incorrect'
+    assert "produced '[2J" + 'x' * (code_evaluator.ECHO_OUTPUT_CHARS - 3) + "...'" in results['feedback']
+    assert '\x1b' not in results['feedback']
+
+    results = evaluate_coding_solution("def double(x):\n    return '\\a' + 'y' * 1000\n", TEST_CASES[:1])
+    actual = results['test_results'][0]['actual']
+    assert actual == 'y' * code_evaluator.ECHO_OUTPUT_CHARS + '...'
+    assert f"returned '{actual}'" in results['feedback']
+
+
+def test_buggy_code_with_a_comment_counts_as_unchanged(evaluation_pool):
+    challenge = debugging_challenge(expected_output='The function should return the sum of all numbers')
+    results = evaluate_debugging_challenge(challenge, "# fixed\n" + BUGGY_SUM.replace('    ', '  '))
+    assert results['status'] == 'incorrect'
+    assert results['feedback'] == UNCHANGED_FEEDBACK
+
+
+def test_fix_without_anything_to_check_is_ungradable(evaluation_pool):
+    challenge = debugging_challenge(expected_output='The function should return the sum of all numbers')
+    results = evaluate_debugging_challenge(challenge, "x = 1")
+    assert results['status'] == 'ungradable'
+
+
+def test_fix_is_graded_by_test_cases_when_the_challenge_has_them(evaluation_pool):
+    challenge = debugging_challenge(test_cases=[{'args': [[1, 2, 3]], 'expected': 6}, {'args': [[5]], 'expected': 5}])
+    fixed = BUGGY_SUM.replace('numbers[1:]', 'numbers')
+    assert evaluate_debugging_challenge(challenge, fixed)['status'] == 'correct'
+    assert evaluate_debugging_challenge(challenge, "def total(numbers):\n    return 0")['status'] == 'incorrect'
+
+
+def test_literal_expected_output():
+    assert literal_expected_output('6') == '6'
+    assert literal_expected_output('[1, 2, 3]') == '[1, 2, 3]'
+    assert literal_expected_output('The function should return the sum') is None
+    assert literal_expected_output(None) is None
+
+
+def test_grading_does_not_queue_behind_the_llm_pool(evaluation_pool):
+    release = threading.Event()
+    for _ in range(io_pool.max_workers + 4):
+        io_pool.submit(release.wait, 30)
+    try:
+        challenge = debugging_challenge(expected_output='6')
+        pending = submit_debugging_challenge(challenge, BUGGY_SUM.replace('[1:]', '') + "print(total([1, 2, 3]))")
+        assert pending.result(timeout=10)['status'] == 'correct'
+    finally:
+        release.set()
+
+
+class ChunkedPool:
+    """Stands in for the evaluation pool: doubles each input, fails the chunks holding `fail_on`"""
+
+    def __init__(self, max_workers, fail_on=None, error=None):
+        self.max_workers = max_workers
+        self.fail_on = fail_on
+        self.error = error
+        self.chunks = []
+
+    def _outcome(self, cases):
+        self.chunks.append([case['input'] for case in cases])
+        if self.error:
+            return {'error': self.error, 'test_results': [], 'timed_out': False}
+        if any(case['input'] == self.fail_on for case in cases):
+            raise EvaluationTimeout("Evaluation timed out")
+        return {'error': None, 'timed_out': False, 'test_results': [
+            {'actual': case['input'] * 2, 'digest': result_digest(case['input'] * 2), 'error': None, 'seconds': 0.01}
+            for case in cases
+        ]}
+
+    def run(self, command, code, function_name, cases, case_timeout, fail_fast, timeout):
+        return self._outcome(cases)
+
+    def submit(self, command, code, function_name, cases, case_timeout, fail_fast, timeout):
+        future = Future()
+        try:
+            future.set_result(self._outcome(cases))
+        except EvaluationError as e:
+            future.set_exception(e)
+        return future
+
+
+def test_large_suites_are_split_into_ordered_chunks(monkeypatch):
+    pool = ChunkedPool(max_workers=3)
+    monkeypatch.setattr(code_evaluator, 'evaluation_pool', pool)
+    test_cases = [{'input': i, 'expected': i * 2} for i in range(14)]
+
+    results = evaluate_coding_solution("def double(x):\n    return x * 2", test_cases)
+    assert results['status'] == 'correct'
+    assert pool.chunks == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9], [10, 11, 12, 13]]
+    assert [r['input'] for r in results['test_results']] == list(range(14))
+    assert all(r['seconds'] == 0.01 for r in results['test_results'])
+
+
+def test_chunks_are_never_smaller_than_the_minimum(monkeypatch):
+    monkeypatch.setattr(code_evaluator, 'evaluation_pool', ChunkedPool(max_workers=8))
+    assert [len(chunk) for chunk in code_evaluator._split_test_cases(list(range(10)), fail_fast=False)] == [4, 4, 2]
+    assert [len(chunk) for chunk in code_evaluator._split_test_cases(list(range(40)), fail_fast=True)] == [4] * 10
+    assert code_evaluator._split_test_cases([], fail_fast=False) == [[]]
+
+
+def test_failed_chunk_fails_only_its_own_cases(monkeypatch):
+    pool = ChunkedPool(max_workers=2, fail_on=9)
+    monkeypatch.setattr(code_evaluator, 'evaluation_pool', pool)
+    test_cases = [{'input': i, 'expected': i * 2} for i in range(12)]
+
+    results = evaluate_coding_solution("def double(x):\n    return x * 2", test_cases, challenge_id='chunked')
+    assert results['status'] == 'incorrect'
+    assert [r['passed'] for r in results['test_results']] == [True] * 6 + [False] * 6
+    assert all('timed out' in r['error'] for r in results['test_results'][6:])
+    # A timed-out run is not cached: the same submission is evaluated again
+    again = evaluate_coding_solution("def double(x):\n    return x * 2", test_cases, challenge_id='chunked')
+    assert 'cached' not in again
+    assert len(pool.chunks) == 4
+
+
+def test_code_that_cannot_be_defined_fails_the_whole_suite(monkeypatch):
+    pool = ChunkedPool(max_workers=2, error='NameError: name undefined_name is not defined')
+    monkeypatch.setattr(code_evaluator, 'evaluation_pool', pool)
+    test_cases = [{'input': i, 'expected': i * 2} for i in range(12)]
+
+    results = evaluate_coding_solution("def double(x):\n    return x * 2\nundefined_name", test_cases)
+    assert results['status'] == 'incorrect'
+    assert results['test_results'] == []
+    assert 'NameError' in results['error']
@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import pytest
+
+import evaluation_cache as evaluation_cache_module
+from code_evaluator import evaluate_coding_solution
+from evaluation_cache import EvaluationCache, evaluation_cache, normalized_code_hash, suite_hash
+
+TEST_CASES = [{'input': 3, 'expected': 6}, {'input': 4, 'expected': 8}]
+SOLUTION = "def double(x):\n    return x * 2\n"
+REFORMATTED = "# doubles its argument\ndef double( x ):\n\n    return x*2  # times two\n"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(evaluation_cache_module, 'time', SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_code_hash_ignores_formatting_but_not_behaviour():
+    assert normalized_code_hash(SOLUTION) == normalized_code_hash(REFORMATTED)
+    assert normalized_code_hash(SOLUTION) != normalized_code_hash(SOLUTION.replace('* 2', '+ 2'))
+    assert normalized_code_hash("def double(x) return x") is None
+    assert normalized_code_hash("x = 1\0") is None
+
+
+def test_key_covers_challenge_suite_and_options():
+    cache = EvaluationCache()
+    key = cache.key('c1', TEST_CASES, SOLUTION, fail_fast=False)
+    assert cache.key('c1', TEST_CASES, REFORMATTED, fail_fast=False) == key
+    assert cache.key('c2', TEST_CASES, SOLUTION, fail_fast=False) != key
+    assert cache.key('c1', TEST_CASES[:1], SOLUTION, fail_fast=False) != key
+    assert cache.key('c1', TEST_CASES, SOLUTION, fail_fast=True) != key
+    assert cache.key(None, TEST_CASES, SOLUTION) is None
+    assert cache.key('c1', TEST_CASES, "def broken(:") is None
+    assert suite_hash([{'expected': 6, 'input': 3}]) == suite_hash([{'input': 3, 'expected': 6}])
+
+
+def test_cached_results_are_copies(clock):
+    cache = EvaluationCache()
+    cache.put(('k',), {'status': 'correct', 'test_results': [{'passed': True}]})
+    cache.get(('k',))['test_results'][0]['passed'] = False
+    assert cache.get(('k',))['test_results'][0]['passed'] is True
+    cache.put(None, {'status': 'correct'})
+    assert cache.get(None) is None
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = EvaluationCache(ttl=60)
+    cache.put(('k',), {'status': 'correct'})
+    clock[0] += 60
+    assert cache.get(('k',)) == {'status': 'correct'}
+    clock[0] += 1
+    assert cache.get(('k',)) is None
+    assert cache.stats()['expired'] == 1
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = EvaluationCache(max_entries=2)
+    cache.put(('a',), {'n': 1})
+    cache.put(('b',), {'n': 2})
+    cache.get(('a',))
+    cache.put(('c',), {'n': 3})
+    assert cache.get(('b',)) is None
+    assert cache.get(('a',)) == {'n': 1}
+    stats = cache.stats()
+    assert (stats['entries'], stats['evicted'], stats['hits'], stats['misses']) == (2, 1, 2, 1)
+    assert stats['hit_rate'] == round(2 / 3, 4)
+
+
+def test_reformatted_resubmission_is_served_from_the_cache(evaluation_pool):
+    evaluation_cache.clear()
+    first = evaluate_coding_solution(SOLUTION, TEST_CASES, challenge_id='cache-test')
+    assert first['status'] == 'correct'
+    assert 'cached' not in first
+
+    again = evaluate_coding_solution(REFORMATTED, TEST_CASES, challenge_id='cache-test')
+    assert again['cached'] is True
+    assert [r['passed'] for r in again['test_results']] == [r['passed'] for r in first['test_results']]
+
+    # Without a challenge id, or with another suite, the code is evaluated again
+    assert 'cached' not in evaluate_coding_solution(REFORMATTED, TEST_CASES)
+    other_suite = [{'input': 5, 'expected': 10}]
+    assert 'cached' not in evaluate_coding_solution(REFORMATTED, other_suite, challenge_id='cache-test')
+
+
+def test_time_limited_results_are_not_cached(evaluation_pool):
+    evaluation_cache.clear()
+    slow = "def double(x):\n    while True:\n        pass\n"
+    first = evaluate_coding_solution(slow, TEST_CASES[:1], challenge_id='slow-test', case_timeout=0.2)
+    assert first['status'] == 'incorrect'
+    again = evaluate_coding_solution(slow, TEST_CASES[:1], challenge_id='slow-test', case_timeout=0.2)
+    assert 'cached' not in again
+
+
+def test_cached_results_keep_no_output_of_the_submission(evaluation_pool):
+    evaluation_cache.clear()
+    wrong = "def double(x):\n    print('debug', x)\n    return x + 100\n"
+    first = evaluate_coding_solution(wrong, TEST_CASES, challenge_id='output-test')
+    assert first['test_results'][0]['actual'] == 103
+    assert "returned '103'" in first['feedback']
+    assert 'plain_feedback' not in first
+
+    again = evaluate_coding_solution(wrong, TEST_CASES, challenge_id='output-test')
+    assert again['cached'] is True
+    assert [r['actual'] for r in again['test_results']] == [None, None]
+    assert not any('stdout' in r for r in again['test_results'])
+    assert '103' not in again['feedback']
+    assert "does not return the expected output '6'" in again['feedback']
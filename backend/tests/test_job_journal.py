@@ -0,0 +1,72 @@
+import time
+import sqlite3
+
+import pytest
+
+from job_journal import JobJournal
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / 'journal.db')
+
+
+def test_job_with_a_live_lease_is_not_claimed(journal_path):
+    running = JobJournal(journal_path)
+    running.start_job('generate_challenges', 'doc', {'topics': ['loops']})
+    assert JobJournal(journal_path).claim_orphaned_jobs() == []
+
+
+def test_expired_job_is_claimed_by_exactly_one_process(journal_path):
+    JobJournal(journal_path, lease_seconds=0.05).start_job('extract_topics', 'doc', {'document': {}})
+    time.sleep(0.1)
+    first, second = JobJournal(journal_path), JobJournal(journal_path)
+    claimed = first.claim_orphaned_jobs() + second.claim_orphaned_jobs()
+    assert [(entry['kind'], entry['doc_id']) for entry in claimed] == [('extract_topics', 'doc')]
+    # The claim is leased to its new owner, so nobody else picks it up again
+    assert JobJournal(journal_path).claim_orphaned_jobs() == []
+
+
+def test_renewed_lease_keeps_the_job(journal_path):
+    owner = JobJournal(journal_path, lease_seconds=0.2)
+    owner.start_job('extract_topics', 'doc', {})
+    for _ in range(3):
+        time.sleep(0.1)
+        assert owner.renew_leases() == 1
+        assert JobJournal(journal_path).claim_orphaned_jobs() == []
+
+
+def test_finished_job_is_never_claimed(journal_path):
+    owner = JobJournal(journal_path, lease_seconds=0.05)
+    owner.finish_job(owner.start_job('extract_topics', 'doc', {}), 'completed')
+    time.sleep(0.1)
+    assert JobJournal(journal_path).claim_orphaned_jobs() == []
+
+
+def test_released_job_is_claimed_again(journal_path):
+    JobJournal(journal_path, lease_seconds=0.05).start_job('extract_topics', 'doc', {})
+    time.sleep(0.1)
+    claimer = JobJournal(journal_path)
+    journal_id = claimer.claim_orphaned_jobs()[0]['journal_id']
+    claimer.release(journal_id)
+    assert [entry['journal_id'] for entry in JobJournal(journal_path).claim_orphaned_jobs()] == [journal_id]
+
+
+def test_journal_without_lease_columns_is_migrated(journal_path):
+    conn = sqlite3.connect(journal_path)
+    conn.execute('CREATE TABLE jobs (journal_id TEXT PRIMARY KEY, kind TEXT NOT NULL, doc_id TEXT, '
+                 'payload TEXT NOT NULL, status TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)')
+    conn.execute("INSERT INTO jobs VALUES ('old', 'extract_topics', 'doc', '{}', 'running', 1, 1)")
+    conn.commit()
+    conn.close()
+    assert [entry['journal_id'] for entry in JobJournal(journal_path).claim_orphaned_jobs()] == ['old']
+
+
+def test_checkpointed_steps_are_kept_until_the_job_finishes(journal_path):
+    journal = JobJournal(journal_path)
+    journal_id = journal.start_job('generate_challenges', 'doc', {})
+    journal.record_step(journal_id, 'loops\x1fdebugging', {'title': 'Off by one'})
+    assert journal.get_step(journal_id, 'loops\x1fdebugging') == {'title': 'Off by one'}
+    assert journal.completed_steps(journal_id) == 1
+    journal.finish_job(journal_id, 'completed')
+    assert journal.get_step(journal_id, 'loops\x1fdebugging') is None
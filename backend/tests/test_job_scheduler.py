@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+from cancellation import checkpoint
+from job_scheduler import (
+    JobScheduler, QueueFullError, PRIORITY_INTERACTIVE, PRIORITY_EXTRACTION, PRIORITY_BACKGROUND
+)
+
+
+def wait_until_finished(scheduler, job, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if job.status in ('completed', 'failed', 'cancelled'):
+            return job
+        threading.Event().wait(0.01)
+    raise AssertionError(f"job still {job.status}")
+
+
+def test_jobs_run_once_the_scheduler_is_started():
+    scheduler = JobScheduler(max_workers=1)
+    ran = threading.Event()
+    job = scheduler.submit(ran.set)
+    assert not ran.wait(0.1) and job.status == 'queued'
+
+    scheduler.start()
+    try:
+        assert ran.wait(5)
+        assert wait_until_finished(scheduler, job).status == 'completed'
+    finally:
+        scheduler.shutdown()
+
+
+def test_higher_priority_first_then_round_robin_across_users():
+    scheduler = JobScheduler(max_workers=1)
+    order = []
+    for user, name, priority in [
+        ('alice', 'a-background', PRIORITY_BACKGROUND),
+        ('alice', 'a1', PRIORITY_EXTRACTION),
+        ('alice', 'a2', PRIORITY_EXTRACTION),
+        ('bob', 'b1', PRIORITY_EXTRACTION),
+        ('carol', 'c-interactive', PRIORITY_INTERACTIVE),
+    ]:
+        scheduler.submit(order.append, name, priority=priority, user_key=user)
+
+    scheduler.start()
+    scheduler.shutdown(wait=True)
+    assert order == ['c-interactive', 'a1', 'b1', 'a2', 'a-background']
+
+
+def test_full_queue_rejects_with_a_retry_after():
+    scheduler = JobScheduler(max_workers=1, max_queue_size=2, max_queued_per_user=5)
+    scheduler.submit(print, user_key='alice')
+    scheduler.submit(print, user_key='bob')
+    with pytest.raises(QueueFullError) as rejected:
+        scheduler.submit(print, user_key='carol')
+    assert rejected.value.retry_after >= 1
+    assert scheduler.stats()['rejected'] == 1
+
+
+def test_one_user_cannot_take_the_whole_queue():
+    scheduler = JobScheduler(max_workers=1, max_queue_size=10, max_queued_per_user=2)
+    scheduler.submit(print, user_key='alice')
+    scheduler.submit(print, user_key='alice')
+    assert not scheduler.has_capacity('alice')
+    with pytest.raises(QueueFullError):
+        scheduler.submit(print, user_key='alice')
+    assert scheduler.has_capacity('bob')
+
+
+def test_failed_job_records_its_error():
+    scheduler = JobScheduler(max_workers=1)
+
+    def broken():
+        raise ValueError("boom")
+
+    job = scheduler.submit(broken)
+    scheduler.start()
+    try:
+        assert wait_until_finished(scheduler, job).status == 'failed'
+        assert job.error == 'boom'
+        assert scheduler.stats()['failed'] == 1
+    finally:
+        scheduler.shutdown()
+
+
+def test_queue_position_follows_the_dispatch_order():
+    scheduler = JobScheduler(max_workers=1)
+    first = scheduler.submit(print, user_key='alice')
+    second = scheduler.submit(print, user_key='alice')
+    other = scheduler.submit(print, user_key='bob')
+    assert scheduler.queue_position(first.id)['queue_position'] == 1
+    assert scheduler.queue_position(other.id)['queue_position'] == 2
+    assert scheduler.queue_position(second.id)['queue_position'] == 3
+
+
+def test_cancelling_a_queued_job_frees_its_slot():
+    scheduler = JobScheduler(max_workers=1, max_queue_size=1)
+    job = scheduler.submit(print, doc_id='doc')
+    assert scheduler.cancel(job.id).status == 'cancelled'
+    assert job.cancel_token.skipped_work() == [{'stage': 'queued', 'kind': 'print'}]
+    assert scheduler.has_capacity()
+    assert scheduler.job_for_document('doc') is job
+
+
+def test_cancelling_a_running_job_stops_it_at_the_next_checkpoint():
+    scheduler = JobScheduler(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait(5)
+        checkpoint()
+        raise AssertionError("ran past the checkpoint")
+
+    job = scheduler.submit(work)
+    scheduler.start()
+    try:
+        assert started.wait(5)
+        assert scheduler.cancel(job.id).status == 'cancelling'
+        release.set()
+        assert wait_until_finished(scheduler, job).status == 'cancelled'
+        assert job.cancel_token.reason == 'cancelled by user'
+    finally:
+        scheduler.shutdown()
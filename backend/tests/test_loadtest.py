@@ -0,0 +1,57 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import llm_challenge_generator
+import run_loadtest
+from cancellation import CancelToken, use_cancel_token
+
+
+def get_json(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.load(response)
+
+
+def test_generator_gets_a_usable_challenge_from_the_mock(mock_server):
+    url = mock_server()
+    challenge = llm_challenge_generator.generate_single_challenge('Loops repeat code.', 'multiple-choice', 'easy', 'Loops')
+    assert challenge['type'] == 'multiple-choice'
+    assert len(challenge['options']) == 4
+    assert get_json(f'{url}/stats')['kind:multiple-choice'] == 1
+
+
+def test_streamed_requests_inside_a_job_are_reassembled(mock_server):
+    url = mock_server('--stream-chunks', '5')
+    with use_cancel_token(CancelToken()):
+        challenge = llm_challenge_generator.generate_single_challenge('Lists hold items.', 'debugging', 'medium', 'Lists')
+    assert challenge['type'] == 'debugging'
+    assert 'def sum_even' in challenge['code_stub']
+    assert get_json(f'{url}/stats')['outcome:ok'] == 1
+
+
+def test_mock_rate_limits_with_retry_after(mock_server):
+    url = mock_server('--rate-limit-rate', '1', '--retry-after', '7')
+    body = json.dumps({'messages': [{'role': 'user', 'content': 'hi'}]}).encode()
+    request = urllib.request.Request(f'{url}/v1/chat/completions', data=body,
+                                     headers={'Content-Type': 'application/json'})
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request, timeout=5)
+    assert error.value.code == 429
+    assert error.value.headers['Retry-After'] == '7'
+
+
+def test_load_test_percentiles_use_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    summary = run_loadtest.summarize(values)
+    assert (summary['p50'], summary['p95'], summary['p99'], summary['max']) == (50.0, 95.0, 99.0, 100.0)
+    assert run_loadtest.summarize([])['p99'] == 0.0
+
+
+def test_load_test_answers_match_the_submit_format():
+    challenge = {'type': 'multiple-choice', 'options': ['a', 'b', 'c'], 'correct_answer': 2}
+    assert run_loadtest.answer_for(challenge, correct=True) == 2
+    assert run_loadtest.answer_for(challenge, correct=False) == 0
+    blanks = {'type': 'fill-in-the-blank', 'blanks': [{'correct_answer': 'for'}]}
+    assert json.loads(run_loadtest.answer_for(blanks, correct=True)) == ['for']
@@ -0,0 +1,89 @@
+import pytest
+
+from metrics import MetricsRegistry, collect_samples, counter
+from worker_pools import CPUPool
+
+WORKER_CALLS = counter('pqgen_test_worker_calls_total', 'Calls made in a CPU pool worker by the tests')
+
+
+def count_in_worker():
+    WORKER_CALLS.inc()
+    return 'done'
+
+
+def test_counter_renders_per_label_series():
+    metrics = MetricsRegistry()
+    requests = metrics.counter('requests_total', 'Requests', ['route'])
+    requests.inc(route='/upload')
+    requests.inc(2, route='/upload')
+    requests.inc(route='/metrics')
+    assert metrics.render().splitlines() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{route="/metrics"} 1',
+        'requests_total{route="/upload"} 3',
+    ]
+
+
+def test_counters_cannot_decrease_and_labels_must_match():
+    requests = MetricsRegistry().counter('requests_total', 'Requests', ['route'])
+    with pytest.raises(ValueError):
+        requests.inc(-1, route='/')
+    with pytest.raises(ValueError):
+        requests.inc(stage='extract')
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = MetricsRegistry()
+    latency = metrics.histogram('stage_seconds', 'Stage latency', ['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, stage='extract')
+    lines = metrics.render().splitlines()
+    assert 'stage_seconds_bucket{stage="extract",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="extract",le="1"} 2' in lines
+    assert 'stage_seconds_bucket{stage="extract",le="+Inf"} 3' in lines
+    assert 'stage_seconds_sum{stage="extract"} 5.55' in lines
+    assert latency.count(stage='extract') == 3
+
+
+def test_gauge_is_sampled_at_scrape_time():
+    metrics = MetricsRegistry()
+    depth = {'value': 1}
+    metrics.gauge('queue_depth', 'Queued jobs').set_function(lambda: depth['value'])
+    depth['value'] = 7
+    assert 'queue_depth 7' in metrics.render().splitlines()
+
+
+def test_registering_a_name_twice_returns_the_same_metric():
+    metrics = MetricsRegistry()
+    assert metrics.counter('jobs_total', 'Jobs') is metrics.counter('jobs_total', 'Jobs')
+    with pytest.raises(ValueError):
+        metrics.gauge('jobs_total', 'Jobs')
+
+
+def test_collected_samples_are_applied_only_on_replay():
+    metrics = MetricsRegistry()
+    jobs = metrics.counter('jobs_total', 'Jobs')
+    with collect_samples() as samples:
+        jobs.inc()
+    assert jobs.value() == 0
+    metrics.replay(samples)
+    assert jobs.value() == 1
+
+
+def test_cpu_pool_work_shows_up_in_the_parent_registry():
+    pool = CPUPool(max_workers=1)
+    try:
+        before = WORKER_CALLS.value()
+        assert pool.run(count_in_worker) == 'done'
+        assert WORKER_CALLS.value() == before + 1
+    finally:
+        pool.shutdown()
+
+
+def test_metrics_endpoint_serves_the_global_registry(client, admin_headers):
+    admin, _ = admin_headers
+    response = client.get('/metrics', headers=admin)
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    assert '# TYPE pqgen_errors_total counter' in response.get_data(as_text=True).splitlines()
@@ -0,0 +1,120 @@
+import pytest
+
+from near_duplicates import (
+    MinHashIndex, ServedChallenges, NUM_BINS, challenge_signature, challenge_text, check_challenge,
+    signature, similarity
+)
+
+QUESTION = ("Which loop prints every element of the list numbers exactly once, in order, "
+            "without using an index variable or modifying the list while iterating?")
+
+
+def challenge(challenge_id, question=QUESTION, **fields):
+    return {'id': challenge_id, 'question': question, 'options': ['for n in numbers', 'while True'], **fields}
+
+
+def test_similarity_tracks_shared_text():
+    original = signature(QUESTION)
+    assert similarity(original, signature(QUESTION)) == 1.0
+    assert similarity(original, signature(QUESTION.replace('exactly once', 'only once'))) >= 0.7
+    assert similarity(original, signature('Explain what a recursive base case is for.')) < 0.2
+    assert len(original) == NUM_BINS
+
+
+def test_short_and_empty_texts_still_sign():
+    assert similarity(signature('x = 1'), signature('x = 1')) == 1.0
+    assert len(signature('')) == NUM_BINS
+
+
+def test_challenge_text_uses_only_what_students_see():
+    text = challenge_text(challenge('c1', code_stub='for n in numbers:', hint='ignored', topic='ignored'))
+    assert text.splitlines() == [QUESTION, 'for n in numbers', 'while True', 'for n in numbers:']
+
+
+def test_index_rejects_near_duplicates_only():
+    index = MinHashIndex(threshold=0.7)
+    assert check_challenge(index, challenge('c1')) is None
+    key, score = check_challenge(index, challenge('c2', QUESTION.replace('exactly once', 'only once')))
+    assert key == 'c1' and score >= 0.7
+    assert check_challenge(index, challenge('c3', 'What does a recursive function need to stop?')) is None
+    assert len(index) == 2
+
+    index.remove('c1')
+    assert index.find_duplicate(challenge_signature(challenge('c4'))) is None
+    index.remove('c1')  # removing twice is harmless
+
+
+def test_bounded_index_forgets_its_oldest_entries():
+    index = MinHashIndex(max_entries=2)
+    for number, question in enumerate(['What is a loop?', 'What is recursion in programming?', QUESTION]):
+        index.add(number, signature(question))
+    assert len(index) == 2
+    assert index.find_duplicate(signature('What is a loop?')) is None
+    assert index.find_duplicate(signature(QUESTION)) == (2, 1.0)
+
+
+@pytest.mark.parametrize('threshold, found', [(0.99, False), (0.5, True)])
+def test_find_duplicate_threshold_can_be_overridden(threshold, found):
+    index = MinHashIndex(threshold=0.99)
+    index.add('c1', signature(QUESTION))
+    near = signature(QUESTION.replace('exactly once', 'only once'))
+    assert (index.find_duplicate(near, threshold=threshold) is not None) is found
+
+
+def test_served_challenges_are_remembered_per_user():
+    served = ServedChallenges(max_users=2, per_user=10)
+    served.record('alice', [challenge('c1')])
+    assert served.was_served('alice', challenge('other-id'))
+    assert not served.was_served('bob', challenge('c1'))
+    assert not served.was_served(None, challenge('c1'))
+
+    # Anonymous users have no history, and the oldest user is forgotten past max_users
+    served.record(None, [challenge('c1')])
+    served.record('bob', [challenge('c2')])
+    served.record('carol', [challenge('c3')])
+    assert not served.was_served('alice', challenge('c1'))
+    assert served.stats() == {'users': 2, 'challenges': 2}
+
+
+def test_duplicate_is_regenerated_until_distinct_then_dropped(monkeypatch):
+    import app
+    seen = MinHashIndex()
+    check_challenge(seen, challenge('c1'))
+    duplicate = {**challenge('c2'), 'topic': 'Loops', 'type': 'multiple-choice', 'difficulty': 'easy'}
+    replies = [[challenge('c3')], [challenge('c4', 'What does a recursive function need to stop?')]]
+    monkeypatch.setattr(app, 'is_model_ready', lambda: True)
+    monkeypatch.setattr(app, 'generate_challenge_with_improved_system', lambda *args: replies.pop(0))
+
+    assert app.regenerate_distinct_challenge('Loops and recursion', duplicate, seen)['id'] == 'c4'
+
+    # Every regeneration is another duplicate: the challenge is dropped
+    monkeypatch.setattr(app, 'generate_challenge_with_improved_system', lambda *args: [challenge('c5')])
+    assert app.regenerate_distinct_challenge('Loops and recursion', duplicate, seen) is None
+
+
+def test_only_challenges_kept_by_the_duplicate_check_are_banked(monkeypatch, tmp_path):
+    import app
+    from challenge_bank import ChallengeBank
+    bank = ChallengeBank(str(tmp_path / 'bank.db'))
+    stored = []
+    monkeypatch.setattr(bank, 'store_generated', lambda doc_hash, challenges: stored.extend(challenges))
+    monkeypatch.setattr(app, 'challenge_bank', bank)
+    monkeypatch.setattr(app.blob_store, 'load_text', lambda content_hash: 'Loops and recursion')
+    monkeypatch.setitem(app.documents, 'dup-doc', {'content_hash': 'dup-hash', 'file_path': 'unused.pdf'})
+    monkeypatch.setattr(app, 'is_model_ready', lambda: True)
+
+    # Every topic, and every regeneration, yields the same question: only the first copy is kept
+    def same_question(snippet, difficulty, topic, journal_id=None, challenge_types=()):
+        return [{**challenge(f'{topic}-{t}'), 'topic': topic, 'type': t, 'difficulty': difficulty}
+                for t in challenge_types]
+    monkeypatch.setattr(app, 'generate_challenge_with_improved_system', same_question)
+    topics = [{'topic': 'Loops', 'difficulty': 'easy'}, {'topic': 'Recursion', 'difficulty': 'easy'}]
+    try:
+        app.generate_challenges_async('dup-doc', topics, {})
+    finally:
+        bank.close()
+
+    kept = app.document_challenges.pop('dup-doc')
+    for c in kept:
+        app.challenge_states.pop(c['id'], None)
+    assert [c['id'] for c in stored] == [c['id'] for c in kept] == ['Loops-multiple-choice']
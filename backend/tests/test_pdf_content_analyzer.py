@@ -0,0 +1,15 @@
+from pdf_content_analyzer import extract_topics_from_headings, validate_topics
+
+
+def test_all_caps_headings_are_extracted():
+    text = "Some prose first\nRECURSION AND ITERATION\nmore prose here\n## Linked Lists\n"
+    assert extract_topics_from_headings(text) == ['RECURSION AND ITERATION', 'Linked Lists']
+
+
+def test_all_caps_lines_that_are_not_topics_are_skipped():
+    assert extract_topics_from_headings("CHAPTER SUMMARY\nplain text follows") == []
+
+
+def test_validate_topics_cleans_and_deduplicates():
+    raw = ['binary_search', 'x', '1234', 'Binary Search', None, 'a' * 60, 'loops']
+    assert validate_topics(raw, '') == ['Binary Search', 'Loops']
@@ -0,0 +1,113 @@
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from profiler import ProfilerManager, ProfilerBusyError, sample_call, top_functions
+
+
+def spin(seconds=0.3):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += 1
+    return total
+
+
+def fake_job(doc_id, kind):
+    return SimpleNamespace(id=f'job-{kind}', doc_id=doc_id, kind=kind, thread_id=threading.get_ident())
+
+
+def test_armed_session_profiles_the_documents_next_job(tmp_path):
+    manager = ProfilerManager(str(tmp_path))
+    session = manager.profile_document('doc', interval=0.002)
+    assert session.status == 'armed'
+
+    with manager.profile_job(fake_job('doc', 'extract_topics')):
+        spin()
+
+    assert session.status == 'finished'
+    assert session.job_id == 'job-extract_topics'
+    assert session.to_dict()['samples'] > 0
+    assert any(entry['function'].startswith('spin ') for entry in session.top_functions)
+    collapsed = open(session.files['collapsed']).read()
+    assert 'spin (test_profiler.py' in collapsed
+
+
+def test_armed_session_waits_for_a_job_of_its_kind(tmp_path):
+    manager = ProfilerManager(str(tmp_path))
+    session = manager.profile_document('doc', kind='generate_challenges', interval=0.002)
+    with manager.profile_job(fake_job('doc', 'extract_topics')):
+        pass
+    assert session.status == 'armed'
+    with manager.profile_job(fake_job('doc', 'generate_challenges')):
+        spin(0.05)
+    assert session.status == 'finished'
+
+
+def test_only_one_session_per_document_and_one_process_wide(tmp_path):
+    manager = ProfilerManager(str(tmp_path))
+    manager.profile_document('doc')
+    with pytest.raises(ProfilerBusyError):
+        manager.profile_document('doc')
+    manager.profile_process(5, interval=0.01)
+    with pytest.raises(ProfilerBusyError):
+        manager.profile_process(5)
+
+
+def test_process_profile_finishes_after_its_duration(tmp_path):
+    manager = ProfilerManager(str(tmp_path))
+    session = manager.profile_process(0.2, interval=0.002)
+    spin(0.3)
+    for _ in range(100):
+        if session.status == 'finished':
+            break
+        time.sleep(0.01)
+    assert session.status == 'finished'
+    assert set(session.files) == {'collapsed', 'summary'}
+    assert manager.sessions()[0]['session_id'] == session.id
+
+
+def test_helper_threads_join_the_session_only_while_attached(tmp_path):
+    manager = ProfilerManager(str(tmp_path))
+    session = manager.profile_document('doc', interval=0.002)
+    with manager.profile_job(fake_job('doc', 'generate_challenges')):
+        assert manager.current_session() is session
+        helper = []
+
+        def helper_task():
+            with manager.attach_thread(session):
+                helper.append(manager.current_session())
+            helper.append(manager.current_session())
+
+        thread = threading.Thread(target=helper_task)
+        thread.start()
+        thread.join()
+    assert helper == [session, None]
+    assert manager.current_session() is None
+
+
+def test_sample_call_roots_worker_stacks_at_the_cpu_pool():
+    result, stacks = sample_call(spin, 0.1, interval=0.002)
+    assert result > 0
+    assert stacks and all(stack.startswith('cpu-pool;') for stack in stacks)
+
+
+def test_top_functions_ranks_by_self_samples():
+    stacks = {'main;run;parse': 6, 'main;run;render': 3, 'main;run': 1}
+    ranked = top_functions(stacks)
+    assert [entry['function'] for entry in ranked] == ['parse', 'render', 'run']
+    assert ranked[2]['total'] == 10 and ranked[0]['self_percent'] == 60.0
+
+
+def test_profile_endpoints_start_and_report_a_session(client, admin_headers):
+    admin, _ = admin_headers
+    response = client.post('/api/admin/profile', json={'doc_id': 'profiled-doc', 'interval': 0.01}, headers=admin)
+    assert response.status_code == 202
+    session_id = response.get_json()['profile']['session_id']
+
+    response = client.get(f'/api/admin/profile/{session_id}', headers=admin)
+    assert response.get_json()['profile']['status'] == 'armed'
+    assert client.post('/api/admin/profile', json={'doc_id': 'profiled-doc'}, headers=admin).status_code == 409
+    assert client.post('/api/admin/profile', json={'seconds': -1}, headers=admin).status_code == 400
@@ -0,0 +1,162 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import retention as retention_module
+from retention import RetentionManager, DOCUMENT_STORES, estimate_size
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(retention_module, 'time', SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+@pytest.fixture
+def stores():
+    return {name: {} for name in DOCUMENT_STORES + ('challenge_states',)}
+
+
+def add_document(manager, stores, doc_id, challenge_ids):
+    stores['documents'][doc_id] = {'id': doc_id}
+    stores['document_challenges'][doc_id] = [{'id': cid} for cid in challenge_ids]
+    for cid in challenge_ids:
+        stores['challenge_states'][cid] = {'attempts': 0}
+    manager.touch('documents', doc_id)
+    manager.touch('document_challenges', doc_id)
+    manager.track_challenges(doc_id, challenge_ids)
+
+
+def test_attempts_keep_the_document_and_its_challenges_resident(clock, stores, tmp_path):
+    manager = RetentionManager(stores, str(tmp_path), ttls={'documents': 100, 'document_challenges': 100})
+    add_document(manager, stores, 'doc', ['c1', 'c2'])
+
+    for _ in range(3):
+        clock.value += 60
+        manager.touch_challenge('c1')
+        manager.sweep()
+
+    assert 'doc' in stores['documents']
+    assert 'doc' in stores['document_challenges']
+    assert set(stores['challenge_states']) == {'c1', 'c2'}
+
+
+def test_unattempted_document_still_expires(clock, stores, tmp_path):
+    manager = RetentionManager(stores, str(tmp_path), ttls={'documents': 100, 'document_challenges': 100})
+    add_document(manager, stores, 'doc', ['c1'])
+    add_document(manager, stores, 'other', ['c2'])
+
+    clock.value += 60
+    manager.touch_challenge('c1')
+    clock.value += 60
+    manager.sweep()
+
+    assert set(stores['documents']) == {'doc'}
+    assert set(stores['challenge_states']) == {'c1'}
+
+
+def test_untracked_challenge_refreshes_only_its_state(clock, stores, tmp_path):
+    manager = RetentionManager(stores, str(tmp_path), ttls={'challenge_states': 100})
+    stores['challenge_states']['loose'] = {'attempts': 0}
+    manager.touch_challenge('loose')
+
+    clock.value += 150
+    manager.sweep()
+
+    assert 'loose' not in stores['challenge_states']
+
+
+def test_memory_budget_evicts_least_recently_used_unpinned_documents(clock, stores, tmp_path):
+    manager = RetentionManager(stores, str(tmp_path), memory_budget_bytes=10 ** 9)
+    for doc_id in ('old', 'pinned', 'recent'):
+        upload = tmp_path / f'{doc_id}.pdf'
+        upload.write_bytes(b'%PDF')
+        add_document(manager, stores, doc_id, [f'{doc_id}-c'])
+        stores['documents'][doc_id]['file_path'] = str(upload)
+        manager.update_size(doc_id)
+        clock.value += 1
+    manager.pin('pinned')
+    manager.touch_document('old')
+
+    # Room for two documents: the least recently used one that is not pinned goes
+    manager.memory_budget_bytes = manager.resident_bytes() * 2 // 3 + 1
+    assert manager.enforce_budget() == 1
+    assert set(stores['documents']) == {'old', 'pinned'}
+    assert 'recent-c' not in stores['challenge_states']
+    assert not (tmp_path / 'recent.pdf').exists()
+    stats = manager.stats()
+    assert stats['evictions_by_reason']['memory'] == 1
+    assert stats['uploads_deleted'] == 1
+
+    # Nothing left that may be evicted
+    manager.memory_budget_bytes = 1
+    manager.pin('old')
+    assert manager.enforce_budget() == 0
+    manager.unpin('old')
+    assert manager.enforce_budget() == 1
+    assert set(stores['documents']) == {'pinned'}
+
+
+def test_each_store_expires_on_its_own_ttl(clock, stores, tmp_path):
+    manager = RetentionManager(stores, str(tmp_path), ttls={'documents': 1000, 'document_progress': 100})
+    add_document(manager, stores, 'doc', [])
+    stores['document_progress']['doc'] = {'status': 'completed'}
+    manager.touch('document_progress', 'doc')
+
+    clock.value += 150
+    assert manager.sweep()['entries_expired'] == 1
+    assert 'doc' not in stores['document_progress']
+    assert 'doc' in stores['documents']
+
+
+def test_pinned_document_outlives_its_ttl(clock, stores, tmp_path):
+    manager = RetentionManager(stores, str(tmp_path), ttls={'documents': 100, 'document_challenges': 100})
+    add_document(manager, stores, 'doc', ['c1'])
+    manager.pin('doc')
+
+    clock.value += 150
+    manager.sweep()
+    assert 'doc' in stores['documents']
+
+    manager.unpin('doc')
+    assert manager.sweep()['documents_expired'] == 1
+    assert stores['documents'] == {}
+    assert stores['challenge_states'] == {}
+
+
+def test_sweeper_deletes_only_stale_uploads_without_a_document(clock, stores, tmp_path):
+    manager = RetentionManager(stores, str(tmp_path), upload_ttl=100)
+    for name in ('resident.pdf', 'stale.pdf'):
+        (tmp_path / name).write_bytes(b'%PDF')
+    stores['documents']['doc'] = {'id': 'doc', 'file_path': str(tmp_path / 'resident.pdf')}
+
+    clock.value = os.stat(tmp_path / 'stale.pdf').st_ctime + 50
+    assert manager.sweep()['uploads_removed'] == 0
+    clock.value += 100
+    assert manager.sweep()['uploads_removed'] == 1
+    assert os.listdir(tmp_path) == ['resident.pdf']
+
+
+def test_sweeper_keeps_an_old_blob_just_linked_for_a_new_upload(clock, stores, tmp_path):
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    manager = RetentionManager(stores, str(uploads), upload_ttl=100)
+    blob = tmp_path / 'blob'
+    blob.write_bytes(b'%PDF')
+    os.utime(blob, (0, 0))
+
+    # The upload is on disk before its document is registered
+    os.link(blob, uploads / 'new.pdf')
+    clock.value = os.stat(uploads / 'new.pdf').st_ctime
+    assert manager.sweep()['uploads_removed'] == 0
+    assert os.listdir(uploads) == ['new.pdf']
+
+
+def test_estimate_size_counts_shared_objects_once():
+    shared = ['x' * 1000]
+    assert estimate_size({'a': shared, 'b': shared}) < estimate_size({'a': ['x' * 1000], 'b': ['y' * 1000]})
+    cyclic = []
+    cyclic.append(cyclic)
+    assert estimate_size(cyclic) > 0
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import struct
+import resource
+
+import pytest
+
+from sandbox import EvaluationCrashed, EVAL_MAX_OPEN_FILES
+
+# Writes a well-formed reply frame to every descriptor it can reach
+FORGE_FRAMES = f"""
+import os, json, struct
+for reply in (['ok', {{'error': None, 'stdout': 'forged', 'returned': None, 'timed_out': False}}],
+              ['ok', {{'error': None, 'stdout': 'forged', 'returned': None, 'timed_out': False}}, False]):
+    body = json.dumps(reply).encode()
+    for fd in range(3, {EVAL_MAX_OPEN_FILES}):
+        try:
+            os.write(fd, struct.pack('!I', len(body)) + body)
+        except OSError:
+            pass
+"""
+
+
+def run_program(pool, code, wall_seconds=1.0):
+    return pool.run('run_program', code, None, wall_seconds, timeout=wall_seconds + 2)
+
+
+def test_program_output_is_returned(evaluation_pool):
+    outcome = run_program(evaluation_pool, "print(6 * 7)")
+    assert outcome['error'] is None
+    assert outcome['stdout'].strip() == '42'
+
+
+def test_submission_cannot_reach_the_worker_socket(evaluation_pool):
+    code = (
+        "import os\n"
+        "for fd in sorted(int(name) for name in os.listdir('/proc/self/fd')):\n"
+        "    try:\n"
+        "        print(fd, os.readlink(f'/proc/self/fd/{fd}'))\n"
+        "    except OSError:\n"
+        "        pass\n"
+    )
+    outcome = run_program(evaluation_pool, code)
+    assert outcome['error'] is None
+    assert 'socket:' not in outcome['stdout']
+
+
+def test_writing_to_inherited_fds_is_reported_as_a_crash(evaluation_pool):
+    with pytest.raises(EvaluationCrashed):
+        run_program(evaluation_pool, FORGE_FRAMES)
+
+
+def test_writing_to_inherited_fds_does_not_reach_the_next_submission(evaluation_pool):
+    # Every worker gets a forging submission followed by an honest one
+    for attempt in range(evaluation_pool.max_workers * 2):
+        with pytest.raises(EvaluationCrashed):
+            run_program(evaluation_pool, FORGE_FRAMES)
+        outcome = run_program(evaluation_pool, f"print({attempt})")
+        assert outcome['stdout'].strip() == str(attempt)
+
+
+def test_exiting_without_a_result_is_reported_as_a_crash(evaluation_pool):
+    with pytest.raises(EvaluationCrashed):
+        run_program(evaluation_pool, "import os\nos._exit(0)")
+    assert run_program(evaluation_pool, "print('next')")['stdout'].strip() == 'next'
+
+
+def test_limits_are_reported_as_errors(evaluation_pool):
+    assert 'Time limit exceeded' in run_program(evaluation_pool, "import time\ntime.sleep(10)", 0.3)['error']
+    assert 'Memory limit exceeded' in run_program(evaluation_pool, "x = bytearray(10 ** 10)")['error']
+    assert 'Output limit exceeded' in run_program(evaluation_pool, "while True: print('x' * 100)")['error']
+
+
+def test_submission_cannot_see_the_server_environment_or_source(evaluation_pool, monkeypatch):
+    code = (
+        "import os, sys\n"
+        "print(sorted(os.environ))\n"
+        "print(os.listdir('.'))\n"
+        "try:\n"
+        "    import auth\n"
+        "    print('imported')\n"
+        "except ImportError:\n"
+        "    print('no server modules')\n"
+    )
+    outcome = run_program(evaluation_pool, code)
+    assert outcome['error'] is None
+    environment, files, imported = outcome['stdout'].splitlines()
+    assert environment == "['PATH']"
+    assert files == '[]'
+    assert imported == 'no server modules'
+
+
+def test_processes_started_by_a_submission_are_killed_with_it(evaluation_pool):
+    code = (
+        "import os, time\n"
+        "pid = os.fork()\n"
+        "if pid == 0:\n"
+        "    os.closerange(3, 64)\n"
+        "    os.fork()\n"
+        "    time.sleep(60)\n"
+        "    os._exit(0)\n"
+        "print(pid)\n"
+        "time.sleep(60)\n"
+    )
+    outcome = run_program(evaluation_pool, code, wall_seconds=0.5)
+    assert 'Time limit exceeded' in outcome['error']
+    child = int(outcome['stdout'].split()[0])
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        try:
+            os.kill(child, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail(f"Process {child} started by the submission outlived it")
+
+
+def test_submission_runs_under_a_process_limit(evaluation_pool):
+    code = "import resource\nprint(*resource.getrlimit(resource.RLIMIT_NPROC))"
+    soft, hard = map(int, run_program(evaluation_pool, code)['stdout'].split())
+    assert soft == hard != resource.RLIM_INFINITY
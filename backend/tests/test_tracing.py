@@ -0,0 +1,112 @@
+import json
+import uuid
+
+import pytest
+
+from cancellation import JobCancelled
+from job_scheduler import JobScheduler
+from tracing import Tracer, tracer, span, set_attributes, critical_path
+from worker_pools import IOPool
+
+
+def new_doc_id():
+    return f'doc-{uuid.uuid4().hex[:8]}'
+
+
+def spans_by_name(doc_id):
+    (trace,) = tracer.traces_for_document(doc_id)
+    return trace, {s['name']: s for s in trace['spans']}
+
+
+def test_nested_spans_form_one_trace_indexed_by_document():
+    doc_id = new_doc_id()
+    with span('upload_file'):
+        set_attributes(doc_id=doc_id)  # known only once the upload is registered
+        with span('extract_text'):
+            pass
+
+    trace, spans = spans_by_name(doc_id)
+    assert spans['extract_text']['parent_id'] == spans['upload_file']['span_id']
+    assert spans['upload_file']['parent_id'] is None
+    assert trace['span_count'] == 2
+
+
+def test_failed_and_cancelled_spans_record_their_status():
+    doc_id = new_doc_id()
+    with pytest.raises(ValueError):
+        with span('job', doc_id=doc_id):
+            with span('parse'):
+                raise ValueError('bad pdf')
+    with pytest.raises(JobCancelled):
+        with span('job', doc_id=doc_id):
+            raise JobCancelled('cancelled by user')
+
+    statuses = sorted((t['spans'][0]['status'], t['spans'][0]['error']) for t in tracer.traces_for_document(doc_id))
+    assert statuses == [('cancelled', None), ('error', 'bad pdf')]
+
+
+def test_trace_follows_work_into_the_io_pool_and_job_threads():
+    doc_id = new_doc_id()
+    io_pool, scheduler = IOPool(max_workers=1), JobScheduler(max_workers=1)
+
+    def llm_call():
+        with span('make_openai_request'):
+            pass
+
+    def job():
+        io_pool.submit(llm_call).result(timeout=5)
+
+    with span('upload_file', doc_id=doc_id):
+        queued = scheduler.submit(job)
+    scheduler.start()
+    scheduler.shutdown(wait=True)
+    assert queued.status == 'completed'
+
+    _, spans = spans_by_name(doc_id)
+    assert spans['job']['parent_id'] == spans['upload_file']['span_id']
+    assert spans['make_openai_request']['parent_id'] == spans['job']['span_id']
+
+
+def test_critical_path_follows_the_child_that_finished_last():
+    def make(span_id, parent_id, start, duration):
+        return {'span_id': span_id, 'parent_id': parent_id, 'name': span_id, 'start_time': start,
+                'duration_seconds': duration, 'attributes': {}}
+
+    spans = [
+        make('job', None, 0, 10),
+        make('topics', 'job', 0, 2),
+        make('challenges', 'job', 2, 8),
+        make('hint', 'challenges', 3, 1),
+        make('llm', 'challenges', 4, 6),
+    ]
+    assert [step['name'] for step in critical_path(spans)] == ['job', 'challenges', 'llm']
+
+
+def test_finished_spans_are_exported_as_json_lines(tmp_path):
+    export_path = tmp_path / 'spans.jsonl'
+    local = Tracer(export_path=str(export_path))
+    root = local.start_span('upload_file', doc_id='doc')
+    local.finish_span(local.start_span('extract_text', root))
+    local.finish_span(root)
+
+    exported = [json.loads(line) for line in export_path.read_text().splitlines()]
+    assert [s['name'] for s in exported] == ['extract_text', 'upload_file']
+    assert exported[0]['parent_id'] == exported[1]['span_id']
+
+
+def test_least_recently_traced_documents_are_forgotten():
+    local = Tracer(max_documents=2)
+    for doc_id in ('a', 'b', 'c'):
+        local.finish_span(local.start_span('job', doc_id=doc_id))
+    assert local.traces_for_document('a') == []
+    assert len(local.traces_for_document('c')) == 1
+
+
+def test_traces_endpoint_returns_the_documents_traces(client, admin_headers):
+    admin, _ = admin_headers
+    doc_id = new_doc_id()
+    with span('upload_file', doc_id=doc_id):
+        pass
+    response = client.get(f'/api/admin/traces/{doc_id}', headers=admin)
+    assert response.status_code == 200
+    assert [t['critical_path'][0]['name'] for t in response.get_json()['traces']] == ['upload_file']
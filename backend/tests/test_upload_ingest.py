@@ -0,0 +1,92 @@
+import io
+import os
+
+import fitz
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from upload_ingest import StreamingUpload, UploadRejected, ingest_upload, count_pdf_pages, read_page_count
+from worker_pools import CPUPool
+
+
+def pdf_bytes(pages):
+    with fitz.open() as doc:
+        for _ in range(pages):
+            doc.new_page()
+        return doc.tobytes()
+
+
+def upload(data, filename='notes.pdf'):
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def test_pdf_is_moved_into_place_with_its_hash_and_page_count(tmp_path):
+    data = pdf_bytes(3)
+    result = ingest_upload(upload(data), str(tmp_path / 'notes.pdf'))
+    assert result['page_count'] == 3
+    assert result['size_bytes'] == len(data)
+    assert open(result['file_path'], 'rb').read() == data
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.part')]
+
+
+def test_pdf_over_the_page_limit_is_rejected_and_removed(tmp_path):
+    with pytest.raises(UploadRejected) as rejected:
+        ingest_upload(upload(pdf_bytes(3)), str(tmp_path / 'notes.pdf'), max_pages=2)
+    assert (rejected.value.status_code, rejected.value.reason) == (422, 'too_many_pages')
+    assert os.listdir(tmp_path) == []
+
+
+def test_file_that_is_not_a_pdf_is_rejected(tmp_path):
+    with pytest.raises(UploadRejected) as rejected:
+        ingest_upload(upload(b'hello' * 500), str(tmp_path / 'notes.pdf'))
+    assert rejected.value.status_code == 415
+    assert os.listdir(tmp_path) == []
+
+
+def test_unreadable_pdf_is_rejected_as_corrupt(tmp_path):
+    with pytest.raises(UploadRejected) as rejected:
+        ingest_upload(upload(b'%PDF-1.4\nnot really a pdf'), str(tmp_path / 'notes.pdf'))
+    assert rejected.value.reason == 'corrupt'
+    assert os.listdir(tmp_path) == []
+
+
+def test_oversized_upload_is_aborted_while_streaming(tmp_path):
+    container = StreamingUpload(str(tmp_path), 'notes.pdf', max_bytes=1024)
+    container.write(b'%PDF-1.4\n' + b'x' * 512)
+    with pytest.raises(UploadRejected) as rejected:
+        container.write(b'x' * 1024)
+    assert rejected.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+def test_deferred_rejection_is_raised_on_finalize(tmp_path):
+    container = StreamingUpload(str(tmp_path), 'notes.pdf', max_bytes=1024, defer_errors=True)
+    container.write(b'%PDF-1.4\n' + b'x' * 2048)
+    with pytest.raises(UploadRejected):
+        container.finalize(str(tmp_path / 'notes.pdf'))
+    assert os.listdir(tmp_path) == []
+
+
+def test_pages_are_counted_through_the_given_runner(tmp_path):
+    path = tmp_path / 'notes.pdf'
+    path.write_bytes(pdf_bytes(2))
+    calls = []
+
+    def run(fn, *args):
+        calls.append(fn)
+        return fn(*args)
+
+    assert count_pdf_pages(str(path), run) == 2
+    assert calls == [read_page_count]
+
+
+def test_pages_are_counted_in_a_worker_process(tmp_path):
+    pool = CPUPool(max_workers=1)
+    try:
+        result = ingest_upload(upload(pdf_bytes(4)), str(tmp_path / 'notes.pdf'), run=pool.run)
+        assert result['page_count'] == 4
+        with pytest.raises(UploadRejected) as rejected:
+            ingest_upload(upload(b'%PDF-1.4\nbroken'), str(tmp_path / 'broken.pdf'), run=pool.run)
+        assert rejected.value.reason == 'corrupt'
+    finally:
+        pool.shutdown()
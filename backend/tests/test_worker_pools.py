@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import socket
+import struct
+import threading
+import subprocess
+
+import pytest
+
+from sandbox import read_message, EvaluationCrashed
+from worker_pools import CPUPool, EvaluationPool
+
+
+class FakeWorker:
+    """A worker whose replies the test writes itself"""
+
+    def __init__(self, reply):
+        self._pool_end, self._worker_end = socket.socketpair()
+        self.fd = self._pool_end.fileno()
+        self.stopped = False
+        self._thread = threading.Thread(target=self._serve, args=(reply,), daemon=True)
+        self._thread.start()
+
+    def _serve(self, reply):
+        request = read_message(self._worker_end.fileno(), 5)
+        # All frames in one write, so the pool sees them together
+        data = b''
+        for frame in reply(request):
+            body = json.dumps(frame).encode()
+            data += struct.pack('!I', len(body)) + body
+        self._worker_end.sendall(data)
+
+    def stop(self):
+        self.stopped = True
+
+
+def fake_pool(monkeypatch, reply):
+    pool = EvaluationPool(max_workers=1)
+    pool._started = True
+    worker = FakeWorker(reply)
+    pool._idle.put(worker)
+    monkeypatch.setattr(pool._template, 'spawn', lambda: FakeWorker(lambda request: []))
+    return pool, worker
+
+
+def test_matching_reply_is_returned(monkeypatch):
+    pool, worker = fake_pool(monkeypatch, lambda request: [[request[0], 'ok', {'answer': 42}, False]])
+    assert pool.run('run_program', timeout=1) == {'answer': 42}
+    assert not worker.stopped
+
+
+def test_reply_for_another_request_replaces_the_worker(monkeypatch):
+    pool, worker = fake_pool(monkeypatch, lambda request: [['other', 'ok', {'answer': 42}, False]])
+    with pytest.raises(EvaluationCrashed):
+        pool.run('run_program', timeout=1)
+    assert worker.stopped
+
+
+def test_bytes_after_a_reply_replace_the_worker(monkeypatch):
+    pool, worker = fake_pool(monkeypatch, lambda request: [[request[0], 'ok', {}, False], ['stray']])
+    with pytest.raises(EvaluationCrashed):
+        pool.run('run_program', timeout=1)
+    assert worker.stopped
+
+
+def worker_pid():
+    return os.getpid()
+
+
+def crash_worker():
+    os._exit(1)
+
+
+def crash_first_call(marker):
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return 'recovered'
+
+
+@pytest.fixture
+def cpu_pool():
+    pool = CPUPool(max_workers=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_cpu_pool_runs_calls_in_another_process(cpu_pool):
+    assert cpu_pool.run(worker_pid) != os.getpid()
+
+
+def test_call_that_kills_its_worker_is_retried_on_a_fresh_pool(cpu_pool, tmp_path):
+    assert cpu_pool.run(crash_first_call, str(tmp_path / 'crashed-once')) == 'recovered'
+
+
+def test_call_that_keeps_killing_workers_fails_without_running_here(cpu_pool):
+    with pytest.raises(RuntimeError, match='crashed its worker process'):
+        cpu_pool.run(crash_worker)
+    # The pool recovers for the next call
+    assert cpu_pool.run(worker_pid) != os.getpid()
+    assert cpu_pool.stats()['failed'] == 1
+
+
+DRIVER = """
+import sys
+import multiprocessing
+with open(sys.argv[1], 'a') as runs:
+    runs.write(multiprocessing.current_process().name + '\\n')
+
+if __name__ == '__main__':
+    from worker_pools import CPUPool
+    pool = CPUPool(max_workers=2)
+    pool.start()
+    pool.shutdown()
+"""
+
+
+def test_forkserver_does_not_run_the_entry_script(tmp_path):
+    driver, runs = tmp_path / 'driver.py', tmp_path / 'runs'
+    driver.write_text(DRIVER)
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, str(driver), str(runs)], check=True, timeout=60,
+                   env={**os.environ, 'PYTHONPATH': backend_dir})
+    # Workers import the entry script as multiprocessing always does; the forkserver must not
+    processes = runs.read_text().split()
+    assert processes[0] == 'MainProcess'
+    assert all(name.startswith('ForkServerProcess') for name in processes[1:])
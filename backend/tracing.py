@@ -0,0 +1,246 @@
+"""
+Lightweight tracing for the document pipeline.
+
+A trace is a tree of timed spans (upload_file -> job -> extract_topics_async,
+generate_challenges -> job -> generate_challenges_async -> generate_topic_challenges
+-> generate_single_challenge -> make_openai_request). The current span lives in
+a context variable, so it follows calls into the I/O pool; the job scheduler
+carries it across to its worker threads. Finished spans go to an in-process
+ring buffer (and optionally a JSONL file) and can be viewed per document at
+/api/admin/traces/<doc_id>, together with each trace's critical path.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, List, Any, Optional, Callable
+
+from cancellation import JobCancelled
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TRACE_BUFFER_SPANS = int(os.getenv('TRACE_BUFFER_SPANS', 20000))
+TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH', '')  # JSONL export, disabled when empty
+TRACED_DOCUMENTS = int(os.getenv('TRACED_DOCUMENTS', 500))
+
+
+class Span:
+    """One timed operation within a trace"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_time = time.time()
+        self.end_time = None
+        self.duration = None
+        self.status = 'running'
+        self.error = None
+        self._start = time.perf_counter()
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, status: str = 'ok', error: Optional[str] = None):
+        self.duration = time.perf_counter() - self._start
+        self.end_time = self.start_time + self.duration
+        self.status = status
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        duration = self.duration if self.duration is not None else time.perf_counter() - self._start
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_time': self.start_time,
+            'duration_seconds': round(duration, 6),
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes
+        }
+
+
+class Tracer:
+    """Collects spans into a bounded ring buffer indexed by document"""
+
+    def __init__(self, buffer_size: int = TRACE_BUFFER_SPANS, export_path: str = TRACE_EXPORT_PATH,
+                 max_documents: int = TRACED_DOCUMENTS):
+        self.export_path = export_path
+        self.max_documents = max_documents
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._finished = deque(maxlen=buffer_size)
+        self._active = {}  # span_id -> Span still running
+        self._doc_traces = OrderedDict()  # doc_id -> list of trace ids, least recently traced first
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        span = Span(name, trace_id, parent.span_id if parent else None, attributes)
+        with self._lock:
+            self._active[span.span_id] = span
+            self._index(span)
+        return span
+
+    def finish_span(self, span: Span, status: str = 'ok', error: Optional[str] = None):
+        span.finish(status, error)
+        with self._lock:
+            self._active.pop(span.span_id, None)
+            self._index(span)
+            self._finished.append(span)
+        if self.export_path:
+            self._export(span)
+
+    def _index(self, span: Span):
+        """Remember which traces belong to a document (caller holds the lock)"""
+        doc_id = span.attributes.get('doc_id')
+        if not doc_id:
+            return
+        trace_ids = self._doc_traces.setdefault(doc_id, [])
+        if span.trace_id not in trace_ids:
+            trace_ids.append(span.trace_id)
+        self._doc_traces.move_to_end(doc_id)
+        while len(self._doc_traces) > self.max_documents:
+            self._doc_traces.popitem(last=False)
+
+    def _export(self, span: Span):
+        try:
+            line = json.dumps(span.to_dict(), default=str)
+            with self._export_lock:
+                with open(self.export_path, 'a') as f:
+                    f.write(line + '\n')
+        except Exception as e:
+            logger.warning(f"Failed to export span {span.name}: {e}")
+
+    def traces_for_document(self, doc_id: str) -> List[Dict[str, Any]]:
+        """Spans of every trace that touched `doc_id`, with each trace's critical path"""
+        with self._lock:
+            trace_ids = list(self._doc_traces.get(doc_id, []))
+            spans = [span for span in self._finished if span.trace_id in trace_ids]
+            spans.extend(span for span in self._active.values() if span.trace_id in trace_ids)
+            span_dicts = [span.to_dict() for span in spans]
+
+        traces = []
+        for trace_id in trace_ids:
+            trace_spans = sorted(
+                (span for span in span_dicts if span['trace_id'] == trace_id),
+                key=lambda span: span['start_time']
+            )
+            if not trace_spans:
+                continue
+            start = trace_spans[0]['start_time']
+            end = max(span['start_time'] + span['duration_seconds'] for span in trace_spans)
+            traces.append({
+                'trace_id': trace_id,
+                'start_time': start,
+                'duration_seconds': round(end - start, 6),
+                'span_count': len(trace_spans),
+                'critical_path': critical_path(trace_spans),
+                'spans': trace_spans
+            })
+        return traces
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'buffered_spans': len(self._finished),
+                'buffer_size': self._finished.maxlen,
+                'active_spans': len(self._active),
+                'traced_documents': len(self._doc_traces),
+                'export_path': self.export_path or None
+            }
+
+
+def critical_path(spans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Follow, from each root, the child that finished last: the chain that bounded the trace"""
+    span_ids = {span['span_id'] for span in spans}
+    children = {}
+    for span in spans:
+        parent_id = span['parent_id'] if span['parent_id'] in span_ids else None
+        children.setdefault(parent_id, []).append(span)
+
+    def end_of(span):
+        return span['start_time'] + span['duration_seconds']
+
+    path = []
+    current = max(children.get(None, []), key=end_of, default=None)
+    while current is not None:
+        path.append({
+            'name': current['name'],
+            'span_id': current['span_id'],
+            'duration_seconds': current['duration_seconds'],
+            'attributes': current['attributes']
+        })
+        current = max(children.get(current['span_id'], []), key=end_of, default=None)
+    return path
+
+
+# Global tracer
+tracer = Tracer()
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def current_span() -> Optional[Span]:
+    """Span active in the current context, if any"""
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a child of the current span (or a new trace) around the block"""
+    new_span = tracer.start_span(name, _current_span.get(), **attributes)
+    reset = _current_span.set(new_span)
+    status, error = 'ok', None
+    try:
+        yield new_span
+    except JobCancelled:
+        status = 'cancelled'
+        raise
+    except Exception as e:
+        status, error = 'error', str(e)
+        raise
+    finally:
+        _current_span.reset(reset)
+        tracer.finish_span(new_span, status, error)
+
+
+@contextmanager
+def use_span(parent: Optional[Span]):
+    """Continue a trace from another thread, e.g. the request that queued a job"""
+    reset = _current_span.set(parent)
+    try:
+        yield parent
+    finally:
+        _current_span.reset(reset)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator: wrap every call of the function in a span"""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_attributes(**attributes):
+    """Attach attributes to the current span; a no-op outside a trace"""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attributes(**attributes)
@@ -0,0 +1,311 @@
+"""
+Streaming upload ingestion.
+
+Werkzeug normally spools every uploaded file into a temporary file (or
+memory) while parsing the multipart body, and file.save() then copies it a
+second time. StreamingUploadRequest replaces that container with a
+StreamingUpload that writes each parsed chunk straight to a partial file in
+the upload folder, hashing it with SHA-256 in the same pass. The size limit
+and the PDF magic-byte check are enforced while the body is still being
+read, so an oversized or non-PDF upload is aborted after its first chunks
+instead of being written out in full; the page-count limit is checked once
+the file is complete, before any job is queued. Counting pages parses the
+PDF, so callers pass the CPU pool to keep that off the request thread.
+
+Zip archives (batch uploads only) are streamed the same way under a larger
+limit; iter_zip_pdfs() then streams each PDF member through the same checks.
+A batch view sets request.defer_upload_errors so that one bad file is
+discarded and reported on its own instead of aborting the whole request.
+"""
+
+import os
+import zlib
+import uuid
+import zipfile
+import hashlib
+import logging
+from typing import Dict, Any, Optional, Iterator, Tuple, Callable
+
+from flask import Request, current_app
+from werkzeug.datastructures import FileStorage
+
+from metrics import counter, histogram
+
+try:
+    import fitz  # PyMuPDF
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MAX_UPLOAD_MB = int(os.getenv('MAX_UPLOAD_MB', 50))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+MAX_PDF_PAGES = int(os.getenv('MAX_PDF_PAGES', 500))
+MAX_BATCH_UPLOAD_MB = int(os.getenv('MAX_BATCH_UPLOAD_MB', 500))
+MAX_BATCH_UPLOAD_BYTES = MAX_BATCH_UPLOAD_MB * 1024 * 1024
+MAX_BATCH_FILES = int(os.getenv('MAX_BATCH_FILES', 100))
+# Room for multipart boundaries and form fields on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 1024 * 1024
+
+# Accepted file kinds: (magic bytes, window the magic must appear in, description).
+# A PDF header may follow up to 1024 bytes of junk; a zip starts with a local file header.
+UPLOAD_KINDS = {
+    'pdf': (b'%PDF-', 1024, 'a PDF document'),
+    'zip': (b'PK\x03\x04', 4, 'a zip archive'),
+}
+
+# Metrics
+UPLOAD_BYTES = counter('pqgen_upload_bytes_total', 'Bytes of accepted uploaded files')
+UPLOAD_REJECTIONS = counter('pqgen_upload_rejections_total', 'Uploads rejected before queueing', ['reason'])
+UPLOAD_PAGES = histogram('pqgen_upload_pages', 'Page count of accepted uploads',
+                         buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+
+class UploadRejected(Exception):
+    """Raised when an upload breaks a size, type or page limit"""
+
+    def __init__(self, message: str, status_code: int = 400, reason: str = 'invalid'):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+        UPLOAD_REJECTIONS.inc(reason=reason)
+
+
+class StreamingUpload:
+    """
+    Writable container for one uploaded file part.
+
+    Chunks from the multipart parser are appended to a hidden partial file in
+    the upload folder and fed to a SHA-256 hash as they arrive. Reads and
+    seeks are delegated to the underlying file so Werkzeug's FileStorage can
+    wrap it like its own spooled file.
+    """
+
+    def __init__(self, folder: str, filename: Optional[str] = None, max_bytes: int = MAX_UPLOAD_BYTES,
+                 kind: str = 'pdf', defer_errors: bool = False):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.kind = kind
+        self.defer_errors = defer_errors
+        self.error = None  # deferred rejection, raised by finalize()
+        self._magic, self._magic_window, self._description = UPLOAD_KINDS[kind]
+        self.path = os.path.join(folder, f".{uuid.uuid4().hex}.part")
+        self.size = 0
+        self.verified = False
+        self.finalized = False
+        self._hash = hashlib.sha256()
+        self._head = b''
+        self._file = open(self.path, 'wb+')
+
+    def write(self, chunk: bytes) -> int:
+        if self.error:
+            return len(chunk)  # rejected: the rest of the part is read but not kept
+
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            return self._reject(UploadRejected(
+                f"File exceeds the {self.max_bytes // (1024 * 1024)} MB upload limit", 413, 'too_large'
+            ), chunk)
+
+        if not self.verified:
+            self._head += chunk[:self._magic_window - len(self._head)]
+            if self._magic in self._head:
+                self.verified = True
+            elif len(self._head) >= self._magic_window:
+                return self._reject(self._wrong_type(), chunk)
+
+        self._hash.update(chunk)
+        return self._file.write(chunk)
+
+    def _reject(self, error: UploadRejected, chunk: bytes) -> int:
+        if not self.defer_errors:
+            self._abort()
+            raise error
+        # Keep the (empty) file open: the parser still seeks it once the part ends
+        self.error = error
+        self._file.seek(0)
+        self._file.truncate()
+        return len(chunk)
+
+    def _wrong_type(self) -> UploadRejected:
+        return UploadRejected(f'File is not {self._description}', 415, f'not_{self.kind}')
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def finalize(self, dest_path: str) -> str:
+        """Move the completed upload to its final path"""
+        if self.error:
+            self._abort()
+            raise self.error
+        if not self.verified:
+            self._abort()
+            raise self._wrong_type()
+        self._file.close()
+        os.replace(self.path, dest_path)
+        self.path = dest_path
+        self.finalized = True
+        return dest_path
+
+    def close(self):
+        """Close the file, deleting it unless it was finalized"""
+        if not self._file.closed:
+            self._file.close()
+        if not self.finalized:
+            self._remove()
+
+    def _abort(self):
+        self._file.close()
+        self._remove()
+
+    def _remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove partial upload {self.path}: {e}")
+
+    def __getattr__(self, name):
+        # read, readline, seek, tell, ... for FileStorage
+        if name == '_file':
+            raise AttributeError(name)
+        return getattr(self._file, name)
+
+
+class StreamingUploadRequest(Request):
+    """Request whose file parts stream into StreamingUpload containers in UPLOAD_FOLDER"""
+
+    # Set by views that report bad files individually instead of failing the request
+    defer_upload_errors = False
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
+        if filename and filename.lower().endswith('.zip'):
+            return StreamingUpload(folder, filename, MAX_BATCH_UPLOAD_BYTES, kind='zip',
+                                   defer_errors=self.defer_upload_errors)
+        return StreamingUpload(folder, filename, defer_errors=self.defer_upload_errors)
+
+
+def read_page_count(path: str) -> int:
+    """Page count read from the PDF's page tree; picklable, so it can run in a worker process"""
+    try:
+        with fitz.open(path) as doc:
+            return doc.page_count
+    except Exception as e:
+        # PyMuPDF's own exceptions do not all survive pickling
+        raise ValueError(str(e)) from None
+
+
+def count_pdf_pages(path: str, run: Optional[Callable] = None) -> Optional[int]:
+    """
+    Page count of the PDF, or None when PyMuPDF is unavailable. `run(fn, *args)`
+    executes the parse (e.g. CPUPool.run); without it the PDF is parsed inline.
+    """
+    if not PYMUPDF_AVAILABLE:
+        return None
+    try:
+        return run(read_page_count, path) if run else read_page_count(path)
+    except Exception as e:
+        raise UploadRejected(f'File is not a readable PDF: {e}', 400, 'corrupt')
+
+
+class _ZipMember:
+    """Lazily opened archive member whose read errors reject just that member as corrupt"""
+
+    # Damaged compressed data, bad CRCs, truncated members, encryption, unknown compression
+    ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError, ValueError)
+
+    def __init__(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo):
+        self._archive = archive
+        self._info = info
+        self._file = None
+
+    def read(self, size: int = -1) -> bytes:
+        try:
+            if self._file is None:
+                self._file = self._archive.open(self._info)
+            return self._file.read(size)
+        except self.ERRORS as e:
+            raise UploadRejected(f'Archive member is not readable: {e}', 400, 'corrupt')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def iter_zip_pdfs(file_storage, max_files: int = MAX_BATCH_FILES) -> Iterator[Tuple[str, FileStorage]]:
+    """
+    Yield (member name, FileStorage) for every PDF in an uploaded zip archive.
+    Each member is decompressed lazily as it is ingested, so the size and
+    magic-byte checks of ingest_upload() apply to it as to a direct upload;
+    a damaged member raises UploadRejected when it is read.
+    """
+    stream = file_storage.stream
+    if isinstance(stream, StreamingUpload) and stream.error:
+        stream.close()
+        raise stream.error
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile as e:
+        raise UploadRejected(f'File is not a readable zip archive: {e}', 400, 'corrupt')
+
+    with archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and info.filename.lower().endswith('.pdf')
+            and not info.filename.startswith('__MACOSX/') and not os.path.basename(info.filename).startswith('.')
+        ]
+        if len(members) > max_files:
+            raise UploadRejected(f'Archive holds {len(members)} PDFs; the limit is {max_files}', 413, 'too_many_files')
+
+        # Declared member sizes can lie; the streaming size limit is what protects the disk
+        for info in members:
+            member = _ZipMember(archive, info)
+            try:
+                yield info.filename, FileStorage(stream=member, filename=os.path.basename(info.filename))
+            finally:
+                member.close()
+
+
+def ingest_upload(file_storage, dest_path: str, max_pages: int = MAX_PDF_PAGES,
+                  run: Optional[Callable] = None) -> Dict[str, Any]:
+    """
+    Finish an uploaded file: move it to dest_path and enforce the page limit,
+    counting pages through `run` as count_pdf_pages() does.
+    Returns the path, SHA-256 content hash, size in bytes and page count.
+    """
+    stream = file_storage.stream
+    if not isinstance(stream, StreamingUpload):
+        # Files not parsed by StreamingUploadRequest are copied through a container
+        container = StreamingUpload(os.path.dirname(dest_path) or '.', file_storage.filename)
+        try:
+            for chunk in iter(lambda: stream.read(64 * 1024), b''):
+                container.write(chunk)
+        except Exception:
+            container.close()
+            raise
+        stream = container
+
+    stream.finalize(dest_path)
+
+    try:
+        page_count = count_pdf_pages(dest_path, run)
+        if page_count is not None and page_count > max_pages:
+            raise UploadRejected(f'PDF has {page_count} pages; the limit is {max_pages}', 422, 'too_many_pages')
+    except UploadRejected:
+        os.remove(dest_path)
+        raise
+
+    UPLOAD_BYTES.inc(stream.size)
+    if page_count is not None:
+        UPLOAD_PAGES.observe(page_count)
+    return {
+        'file_path': dest_path,
+        'content_hash': stream.sha256,
+        'size_bytes': stream.size,
+        'page_count': page_count
+    }
@@ -0,0 +1,454 @@
+"""
+Worker pools that keep CPU-bound document processing away from LLM calls.
+
+PDF parsing and the regex-heavy content analysis hold the GIL, so they run in
+a process pool (`cpu_pool`) sized to the machine. OpenAI requests spend their
+time waiting on the network, so they run in a separate, much wider thread pool
+(`io_pool`). Student code submitted for grading runs in `evaluation_pool`, a
+set of sandboxed worker processes (see sandbox.py) forked from a warm
+template process, each running every submission in a task process of its own.
+All pools record utilization so the job queue can be tuned.
+"""
+
+import os
+import time
+import select
+import secrets
+import logging
+import threading
+import sys
+import queue
+import socket
+import shutil
+import signal
+import struct
+import tempfile
+import subprocess
+import contextvars
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Callable, Optional
+
+from pdf_content_analyzer import extract_text_from_pdf, analyze_pdf_content
+from cancellation import JobCancelled
+from metrics import counter, histogram, registry, collect_samples
+from profiler import profiler, sample_call
+from sandbox import (
+    read_message, write_message, EvaluationTimeout, EvaluationCrashed, EvaluationBusy, EvaluationError
+)
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CPU_POOL_WORKERS = int(os.getenv('CPU_POOL_WORKERS', os.cpu_count() or 2))
+IO_POOL_WORKERS = int(os.getenv('IO_POOL_WORKERS', 16))
+EVAL_WORKERS = int(os.getenv('EVAL_WORKERS', min(4, os.cpu_count() or 2)))
+EVAL_QUEUE_TIMEOUT = float(os.getenv('EVAL_QUEUE_TIMEOUT', 10))
+
+# How long past a task's timeout the worker itself may take to answer
+EVAL_REPLY_GRACE_SECONDS = 1.0
+
+# Metrics
+EVALUATION_SECONDS = histogram(
+    'pqgen_evaluation_seconds', 'Time to evaluate a submission in the evaluation pool', ['outcome'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+EVALUATION_WORKERS_REPLACED = counter(
+    'pqgen_evaluation_workers_replaced_total', 'Evaluation workers killed or retired', ['reason']
+)
+
+
+class _PoolStats:
+    """Utilization counters shared by both pool types"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._stats_lock = threading.Lock()
+        self._pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._busy_seconds = 0.0
+        self._started_at = time.time()
+
+    def _task_submitted(self):
+        with self._stats_lock:
+            self._pending += 1
+            self._submitted += 1
+
+    def _task_finished(self, seconds: float, outcome: str):
+        """Record a finished task; outcome is 'completed', 'failed' or 'cancelled'"""
+        with self._stats_lock:
+            self._pending -= 1
+            self._busy_seconds += seconds
+            if outcome == 'completed':
+                self._completed += 1
+            elif outcome == 'cancelled':
+                self._cancelled += 1
+            else:
+                self._failed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            busy = min(self._pending, self.max_workers)
+            elapsed = max(time.time() - self._started_at, 1e-9)
+            return {
+                'name': self.name,
+                'workers': self.max_workers,
+                'busy': busy,
+                'queued': self._pending - busy,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'cancelled': self._cancelled,
+                'busy_seconds': round(self._busy_seconds, 3),
+                'utilization': round(busy / self.max_workers, 3),
+                'average_utilization': round(self._busy_seconds / (elapsed * self.max_workers), 3)
+            }
+
+
+def _run_in_worker(fn: Callable, args: tuple, sample_interval: Optional[float] = None):
+    """Run `fn(*args)` in a worker process
+
+    Returns the result, the metric samples it recorded and, when the caller is
+    being profiled, the sampled stacks.
+    """
+    with collect_samples() as samples:
+        if sample_interval:
+            result, stacks = sample_call(fn, *args, interval=sample_interval)
+        else:
+            result, stacks = fn(*args), None
+    return result, samples, stacks
+
+
+class CPUPool(_PoolStats):
+    """Process pool for GIL-bound work; functions and arguments must be picklable
+
+    Workers are forked from a forkserver process rather than from the web
+    process, which runs many threads by the time a broken pool is rebuilt.
+    A call whose worker dies is retried once on a fresh pool and then fails;
+    it never runs in the web process, where the same crash would take down
+    the server.
+    """
+
+    def __init__(self, max_workers: int = CPU_POOL_WORKERS):
+        super().__init__('cpu', max_workers)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker processes now rather than on the first call"""
+        executor = self._get_executor()
+        warmups = [executor.submit(os.getpid) for _ in range(self.max_workers)]
+        for future in warmups:
+            future.result()
+        logger.info(f"CPU pool started with {self.max_workers} processes")
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                context = multiprocessing.get_context('forkserver')
+                # The forkserver imports these once instead of every worker; never '__main__',
+                # which would re-run the entry script's top level inside the forkserver
+                context.set_forkserver_preload(['worker_pools', 'pdf_content_analyzer', 'upload_ingest'])
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+            return self._executor
+
+    def _reset_executor(self, broken: Optional[ProcessPoolExecutor] = None):
+        """Shut the executor down; with `broken`, only if it is still the current one"""
+        with self._executor_lock:
+            if self._executor is not None and (broken is None or self._executor is broken):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """Run `fn(*args)` in a worker process and wait for the result"""
+        self._task_submitted()
+        start = time.time()
+        outcome = 'failed'
+        try:
+            session = profiler.current_session()
+            for attempt in range(2):
+                executor = self._get_executor()
+                try:
+                    result, samples, stacks = executor.submit(
+                        _run_in_worker, fn, args, session.interval if session else None
+                    ).result(timeout=timeout)
+                    break
+                except BrokenProcessPool as e:
+                    # A worker died (e.g. a crashing PDF library), possibly running another call
+                    self._reset_executor(executor)
+                    if attempt:
+                        logger.error(f"CPU pool broke twice while running {fn.__name__}; giving up")
+                        raise RuntimeError(f"{fn.__name__} crashed its worker process") from e
+                    logger.error(f"CPU pool broken while running {fn.__name__}; retrying on a fresh pool")
+            registry.replay(samples)
+            if stacks:
+                session.add_stacks(stacks)
+            outcome = 'completed'
+            return result
+        finally:
+            self._task_finished(time.time() - start, outcome)
+
+    def shutdown(self):
+        self._reset_executor()
+
+
+class IOPool(_PoolStats):
+    """Wide thread pool for network-bound LLM calls"""
+
+    def __init__(self, max_workers: int = IO_POOL_WORKERS):
+        super().__init__('io', max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-io')
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queue `fn(*args, **kwargs)` on the I/O pool, carrying over the caller's context"""
+        self._task_submitted()
+        context = contextvars.copy_context()
+        session = profiler.current_session()
+
+        def timed_call():
+            start = time.time()
+            outcome = 'failed'
+            try:
+                with profiler.attach_thread(session):
+                    result = fn(*args, **kwargs)
+                outcome = 'completed'
+                return result
+            except JobCancelled:
+                outcome = 'cancelled'
+                raise
+            finally:
+                self._task_finished(time.time() - start, outcome)
+
+        def on_done(future):
+            # A task cancelled before it started never runs timed_call
+            if future.cancelled():
+                self._task_finished(0.0, 'cancelled')
+
+        future = self._executor.submit(context.run, timed_call)
+        future.add_done_callback(on_done)
+        return future
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _WorkerTemplate:
+    """The fork server evaluation workers are created from (sandbox.template_main)
+
+    A fresh interpreter rather than a fork of the web process: it carries none
+    of the server's memory, threads or sockets, and forking it stays cheap no
+    matter how large the server grows. It also gets none of the server's
+    environment (API keys, JWT and admin secrets) beyond PATH, the import path
+    of sandbox.py and the EVAL_* limits, and runs in an empty directory of its
+    own rather than next to the server's source and .env file.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._control = None
+        self._process = None
+        self._workdir = None
+
+    def _start(self):
+        backend_dir = os.path.dirname(os.path.abspath(__file__))
+        env = {key: value for key, value in os.environ.items() if key.startswith('EVAL_')}
+        env.update(PATH=os.environ.get('PATH', os.defpath), PYTHONPATH=backend_dir)
+        self._workdir = tempfile.mkdtemp(prefix='pqgen-eval-')
+        self._control, template_end = socket.socketpair()
+        self._process = subprocess.Popen(
+            [sys.executable, '-c', 'import sys, sandbox; sandbox.template_main(int(sys.argv[1]))',
+             str(template_end.fileno())],
+            cwd=self._workdir,
+            env=env,
+            pass_fds=[template_end.fileno()],
+            stdin=subprocess.DEVNULL
+        )
+        template_end.close()
+
+    def spawn(self) -> '_EvaluationWorker':
+        with self._lock:
+            for attempt in range(2):
+                if self._process is None or self._process.poll() is not None:
+                    if self._process is not None:
+                        logger.error(f"Evaluation template exited with {self._process.returncode}; restarting it")
+                    self._start()
+                try:
+                    self._control.sendall(b'w')
+                    data, fds, _, _ = socket.recv_fds(self._control, 4, 1)
+                    if fds:
+                        return _EvaluationWorker(struct.unpack('!i', data)[0], fds[0])
+                except OSError:
+                    pass
+                self._stop_process()
+            raise EvaluationCrashed("Could not start an evaluation worker")
+
+    def _stop_process(self):
+        if self._process is not None:
+            self._control.close()
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+            shutil.rmtree(self._workdir, ignore_errors=True)
+
+    def stop(self):
+        with self._lock:
+            self._stop_process()
+
+
+class _EvaluationWorker:
+    """One sandboxed worker process and the pool's end of its socket"""
+
+    def __init__(self, pid: int, fd: int):
+        self.pid = pid
+        self.fd = fd
+
+    def stop(self):
+        os.close(self.fd)
+        try:
+            # The worker leads a process group of its own; the template reaps the
+            # worker, so if it already exited this is a no-op. Its task process
+            # runs in a session of its own and dies with the worker (see run_isolated)
+            os.killpg(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+def _has_pending_data(fd: int) -> bool:
+    """Whether fd has bytes waiting to be read, which a worker never sends unasked"""
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
+    return bool(poller.poll(0))
+
+
+class EvaluationPool(_PoolStats):
+    """Pre-forked, resource-limited worker processes for running student code
+
+    Each worker runs one task at a time, in a task process of its own that the
+    worker kills once the task's timeout passes. A worker that does not answer
+    within EVAL_REPLY_GRACE_SECONDS after that is replaced, so the caller only
+    ever waits for its own timeout and the pool keeps its size. Workers also
+    retire after serving EVAL_MAX_TASKS_PER_WORKER tasks.
+    """
+
+    def __init__(self, max_workers: int = EVAL_WORKERS):
+        super().__init__('evaluation', max_workers)
+        self._template = _WorkerTemplate()
+        self._idle = queue.Queue()
+        # Threads that wait on workers for submit(); they only block on sockets
+        self._dispatch = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='evaluation')
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the template and the worker processes"""
+        with self._start_lock:
+            if self._started:
+                return
+            for _ in range(self.max_workers):
+                self._idle.put(self._template.spawn())
+            self._started = True
+        logger.info(f"Evaluation pool started with {self.max_workers} processes")
+
+    def _replace(self, worker: _EvaluationWorker, reason: str):
+        worker.stop()
+        EVALUATION_WORKERS_REPLACED.inc(reason=reason)
+        self._idle.put(self._template.spawn())
+
+    def run(self, task: str, *args, timeout: float):
+        """Run the sandbox task `task` (a key of sandbox.TASKS) with JSON-serializable args
+
+        Raises EvaluationError if the task cannot finish in time.
+        """
+        self.start()
+        self._task_submitted()
+        start = time.time()
+        outcome = 'failed'
+        try:
+            try:
+                worker = self._idle.get(timeout=EVAL_QUEUE_TIMEOUT)
+            except queue.Empty:
+                outcome = 'busy'
+                raise EvaluationBusy("All evaluation workers are busy; try again in a moment")
+
+            request_id = secrets.token_hex(8)
+            try:
+                write_message(worker.fd, [request_id, task, args, timeout])
+                reply_id, status, payload, recycle = read_message(worker.fd, timeout + EVAL_REPLY_GRACE_SECONDS)
+            except TimeoutError:
+                outcome = 'timeout'
+                self._replace(worker, 'timeout')
+                raise EvaluationTimeout(f"Evaluation did not finish within {timeout:g}s")
+            except (EOFError, OSError, ValueError, TypeError):
+                outcome = 'crashed'
+                self._replace(worker, 'crashed')
+                raise EvaluationCrashed("The evaluation worker stopped unexpectedly")
+
+            if reply_id != request_id or (not recycle and _has_pending_data(worker.fd)):
+                # Whatever the worker says next cannot be matched to a request; a
+                # retiring worker closes its socket, which also reads as pending
+                outcome = 'crashed'
+                self._replace(worker, 'desync')
+                raise EvaluationCrashed("The evaluation worker sent an unexpected reply")
+            if recycle:
+                self._replace(worker, 'recycled')
+            else:
+                self._idle.put(worker)
+            if status == 'timeout':
+                outcome = 'timeout'
+                raise EvaluationTimeout(payload)
+            if status == 'crashed':
+                outcome = 'crashed'
+                raise EvaluationCrashed(payload)
+            if status != 'ok':
+                raise EvaluationError(payload)
+            outcome = 'completed'
+            return payload
+        finally:
+            elapsed = time.time() - start
+            EVALUATION_SECONDS.observe(elapsed, outcome=outcome)
+            self._task_finished(elapsed, 'completed' if outcome == 'completed' else 'failed')
+
+    def submit(self, task: str, *args, timeout: float) -> Future:
+        """Queue run(task, *args) so several tasks can use the workers at once"""
+        return self._dispatch.submit(self.run, task, *args, timeout=timeout)
+
+    def shutdown(self):
+        self._dispatch.shutdown(wait=False, cancel_futures=True)
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+        self._template.stop()
+
+
+# Global pools
+cpu_pool = CPUPool()
+io_pool = IOPool()
+evaluation_pool = EvaluationPool()
+
+
+# Convenience functions
+def extract_text(file_path: str) -> str:
+    """Extract PDF text in the CPU pool"""
+    return cpu_pool.run(extract_text_from_pdf, file_path)
+
+def analyze_content(text: str) -> Dict[str, Any]:
+    """Analyze document text in the CPU pool"""
+    return cpu_pool.run(analyze_pdf_content, text)
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Utilization of all pools"""
+    return {
+        'cpu': cpu_pool.stats(),
+        'io': io_pool.stats(),
+        'evaluation': evaluation_pool.stats()
+    }